@@ -12,14 +12,21 @@ from ...utils.config_reader import get_formula_enable, get_table_enable
 from ...utils.model_utils import crop_img, get_res_list_from_layout_res, clean_vram
 from ...utils.ocr_utils import merge_det_boxes, update_det_boxes, sorted_boxes
 from ...utils.ocr_utils import get_adjusted_mfdetrec_res, get_ocr_result_list, OcrConfidence, get_rotate_crop_image
-from ...utils.pdf_image_tools import get_crop_np_img
+from ...utils.os_env_config import get_yolo_batch_max_pixels
+from ...utils.pdf_image_tools import get_crop_np_img, get_region_np_img, expand_to_rgb
 
-YOLO_LAYOUT_BASE_BATCH_SIZE = 1
-MFD_BASE_BATCH_SIZE = 1
+YOLO_LAYOUT_BASE_BATCH_SIZE = 4
+MFD_BASE_BATCH_SIZE = 4
+# layout/mfd一个batch的letterbox像素总数上限，约为两张1888x1888的mfd输入
+YOLO_BASE_BATCH_PIXELS = 2 * 1888 * 1888
 MFR_BASE_BATCH_SIZE = 16
 OCR_DET_BASE_BATCH_SIZE = 16
 TABLE_ORI_CLS_BATCH_SIZE = 16
 TABLE_Wired_Wireless_CLS_BATCH_SIZE = 16
+# 开启页面金字塔时，OCR识别的文本行按行高选择重新渲染的dpi，使行高接近识别模型的输入高度
+OCR_REC_TARGET_HEIGHT = 48
+OCR_REC_MIN_DPI = 200
+OCR_REC_MAX_DPI = 600
 
 
 class BatchAnalyze:
@@ -43,28 +50,39 @@ class BatchAnalyze:
         )
         atom_model_manager = AtomModelSingleton()
 
-        pil_images = [image for image, _, _ in images_with_extra_info]
+        pil_images = [image for image, _, _, _ in images_with_extra_info]
 
-        np_images = [np.asarray(image) for image, _, _ in images_with_extra_info]
+        # 灰度页面为单通道数组，在各模型的输入处扩展为三通道
+        np_images = [np.asarray(image) for image, _, _, _ in images_with_extra_info]
+
+        # 开启页面金字塔时为各页的区域渲染器，公式、表格和OCR识别的裁剪从pdf按更高的dpi重新渲染
+        region_renderers = [renderer for _, _, _, renderer in images_with_extra_info]
+
+        # 页面按letterbox尺寸分桶，在显存预算内使用尽可能大的batch
+        yolo_batch_pixels = get_yolo_batch_max_pixels() or self.batch_ratio * YOLO_BASE_BATCH_PIXELS
 
         # doclayout_yolo
 
         images_layout_res += self.model.layout_model.batch_predict(
-            pil_images, YOLO_LAYOUT_BASE_BATCH_SIZE
+            pil_images, self.batch_ratio * YOLO_LAYOUT_BASE_BATCH_SIZE, max_batch_pixels=yolo_batch_pixels
         )
 
         if self.formula_enable:
             # 公式检测
             images_mfd_res = self.model.mfd_model.batch_predict(
-                np_images, MFD_BASE_BATCH_SIZE
+                np_images, self.batch_ratio * MFD_BASE_BATCH_SIZE, max_batch_pixels=yolo_batch_pixels
             )
 
-            # 公式识别
-            images_formula_list = self.model.mfr_model.batch_predict(
-                images_mfd_res,
-                np_images,
-                batch_size=self.batch_ratio * MFR_BASE_BATCH_SIZE,
-            )
+            # 公式识别，没有检测到公式时不加载公式识别模型
+            if any(len(mfd_res.boxes.xyxy) > 0 for mfd_res in images_mfd_res):
+                images_formula_list = self.model.mfr_model.batch_predict(
+                    images_mfd_res,
+                    np_images,
+                    batch_size=self.batch_ratio * MFR_BASE_BATCH_SIZE,
+                    region_renderers=region_renderers,
+                )
+            else:
+                images_formula_list = [[] for _ in np_images]
             mfr_count = 0
             for image_index in range(len(np_images)):
                 images_layout_res[image_index] += images_formula_list[image_index]
@@ -76,7 +94,7 @@ class BatchAnalyze:
         ocr_res_list_all_page = []
         table_res_list_all_page = []
         for index in range(len(np_images)):
-            _, ocr_enable, _lang = images_with_extra_info[index]
+            _, ocr_enable, _lang, renderer = images_with_extra_info[index]
             layout_res = images_layout_res[index]
             np_img = np_images[index]
 
@@ -97,10 +115,14 @@ class BatchAnalyze:
                     crop_xmin, crop_ymin = int(table_res['poly'][0]), int(table_res['poly'][1])
                     crop_xmax, crop_ymax = int(table_res['poly'][4]), int(table_res['poly'][5])
                     bbox = (int(crop_xmin / scale), int(crop_ymin / scale), int(crop_xmax / scale), int(crop_ymax / scale))
-                    return get_crop_np_img(bbox, np_img, scale=scale)
+                    return expand_to_rgb(get_crop_np_img(bbox, np_img, scale=scale))
 
-                wireless_table_img = get_crop_table_img(scale = 1)
-                wired_table_img = get_crop_table_img(scale = 10/3)
+                if renderer is not None:
+                    table_bbox = [int(table_res['poly'][i]) for i in [0, 1, 4, 5]]
+                    wireless_table_img = wired_table_img = get_region_np_img(table_bbox, np_img, renderer)
+                else:
+                    wireless_table_img = get_crop_table_img(scale = 1)
+                    wired_table_img = get_crop_table_img(scale = 10/3)
 
                 table_res_list_all_page.append({'table_res':table_res,
                                                 'lang':_lang,
@@ -108,8 +130,8 @@ class BatchAnalyze:
                                                 'wired_table_img':wired_table_img,
                                               })
 
-        # 表格识别 table recognition
-        if self.table_enable:
+        # 表格识别 table recognition，没有表格时不加载表格相关模型
+        if self.table_enable and len(table_res_list_all_page) > 0:
 
             # 图片旋转批量处理
             img_orientation_cls_model = atom_model_manager.get_atom_model(
@@ -368,11 +390,13 @@ class BatchAnalyze:
         need_ocr_lists_by_lang = {}  # Dict of lists for each language
         img_crop_lists_by_lang = {}  # Dict of lists for each language
 
-        for layout_res in images_layout_res:
+        for layout_res, renderer in zip(images_layout_res, region_renderers):
             for layout_res_item in layout_res:
                 if layout_res_item['category_id'] in [15]:
                     if 'np_img' in layout_res_item and 'lang' in layout_res_item:
                         lang = layout_res_item['lang']
+                        if renderer is not None:
+                            self._rerender_ocr_crop(layout_res_item, renderer)
 
                         # Initialize lists for this language if not exist
                         if lang not in need_ocr_lists_by_lang:
@@ -426,3 +450,22 @@ class BatchAnalyze:
                     total_processed += len(img_crop_list)
 
         return images_layout_res
+
+    @staticmethod
+    def _rerender_ocr_crop(layout_res_item, renderer):
+        """按行高选择dpi，从pdf重新渲染文本行，小字号的文本行得到更清晰的识别输入"""
+        poly = np.asarray(layout_res_item['poly'], dtype=np.float32).reshape(4, 2)
+        xmin, ymin = np.floor(poly.min(axis=0))
+        xmax, ymax = np.ceil(poly.max(axis=0))
+        text_height = ymax - ymin
+        if text_height <= 0 or xmax <= xmin:
+            return
+        dpi = renderer.dpi * OCR_REC_TARGET_HEIGHT / text_height
+        dpi = min(max(dpi, OCR_REC_MIN_DPI), OCR_REC_MAX_DPI)
+        if dpi <= renderer.dpi:
+            return
+        region_img, factor = renderer.render((xmin, ymin, xmax, ymax), dpi)
+        points = (poly - [max(xmin, 0), max(ymin, 0)]) * factor
+        crop = get_rotate_crop_image(cv2.cvtColor(region_img, cv2.COLOR_RGB2BGR), points.astype(np.float32))
+        if crop.shape[0] > 0 and crop.shape[1] > 0:
+            layout_res_item['np_img'] = crop
@@ -0,0 +1,201 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from loguru import logger
+
+from mineru.utils.os_env_config import get_inference_broker_enable, get_inference_broker_max_wait
+
+
+class _Request:
+    __slots__ = ('pages', 'future', 'submit_time', 'offset', 'done_pages', 'results', 'failed')
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.future = Future()
+        self.submit_time = time.monotonic()
+        # offset: 已取出送入batch的页数，done_pages: 已得到结果的页数
+        self.offset = 0
+        self.done_pages = 0
+        self.results = [None] * len(pages)
+        self.failed = False
+
+
+class InferenceBroker:
+    def __init__(self, max_batch_size: int, max_wait: float) -> None:
+        """进程内共享的推理调度器，把多个并发任务的页面合并成batch后调用batch_image_analyze
+
+        每页的语言和ocr设置在batch内逐页处理，只有公式/表格开关相同的页面才能合并
+
+        Args:
+            max_batch_size (int): 一个batch的最大页数
+            max_wait (float): 最早的请求等待超过该秒数后，即使未凑满也开始推理
+        """
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()
+        self._thread = None
+
+    def submit(self, images_with_extra_info: list, formula_enable, table_enable) -> Future:
+        """提交一组(image, ocr_enable, lang, region_renderer)页面，返回结果列表的Future，顺序与输入一致
+
+        尚未开始推理的请求可以通过Future.cancel()取消
+        """
+        request = _Request(images_with_extra_info)
+        if len(images_with_extra_info) == 0:
+            request.future.set_result([])
+            return request.future
+        with self._cond:
+            queue = self._queues.setdefault((formula_enable, table_enable), deque())
+            queue.append(request)
+            if self._thread is None:
+                # 首次提交，或调度线程意外退出后重新启动
+                thread = threading.Thread(target=self._run, name="mineru-inference-broker", daemon=True)
+                try:
+                    thread.start()
+                except BaseException:
+                    queue.remove(request)
+                    raise
+                self._thread = thread
+            self._cond.notify()
+        return request.future
+
+    def _drop_finished(self, queue):
+        while queue and (queue[0].failed or (queue[0].offset == 0 and queue[0].future.cancelled())):
+            queue.popleft()
+
+    def _take_batch(self, queue):
+        pieces, size = [], 0
+        while queue and size < self.max_batch_size:
+            request = queue[0]
+            if request.failed or (request.offset == 0 and not request.future.set_running_or_notify_cancel()):
+                queue.popleft()
+                continue
+            end = min(len(request.pages), request.offset + self.max_batch_size - size)
+            pieces.append((request, request.offset, end))
+            size += end - request.offset
+            request.offset = end
+            if end == len(request.pages):
+                queue.popleft()
+        return pieces
+
+    def _next_batch(self):
+        """阻塞直到某一组凑满max_batch_size页，或其中最早的请求等待超过max_wait"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                next_deadline = None
+                for key, queue in list(self._queues.items()):
+                    self._drop_finished(queue)
+                    if not queue:
+                        del self._queues[key]
+                        continue
+                    pending_pages = sum(len(request.pages) - request.offset for request in queue)
+                    deadline = queue[0].submit_time + self.max_wait
+                    if pending_pages >= self.max_batch_size or deadline <= now:
+                        pieces = self._take_batch(queue)
+                        if pieces:
+                            # 被处理的组移到末尾，多组同时就绪时轮流处理
+                            self._queues.move_to_end(key)
+                            return key, pieces
+                        continue
+                    next_deadline = deadline if next_deadline is None else min(next_deadline, deadline)
+                self._cond.wait(None if next_deadline is None else max(next_deadline - now, 0))
+
+    def _run(self):
+        pieces = []
+        try:
+            while True:
+                key, pieces = self._next_batch()
+                try:
+                    self._process_batch(key, pieces)
+                except Exception as e:
+                    # 分发结果等环节的意外错误只影响这个batch中的请求
+                    logger.exception(f"inference broker: failed to process batch: {e}")
+                    for request, _, _ in pieces:
+                        self._fail(request, e)
+                pieces = []
+        except BaseException as e:
+            # 调度线程意外退出时，所有未完成的请求都以该异常结束，避免等待的任务永远挂起；下一次submit时重新启动线程
+            logger.exception(f"inference broker: thread stopped: {e!r}")
+            with self._cond:
+                self._thread = None
+                requests = [request for request, _, _ in pieces]
+                for queue in self._queues.values():
+                    requests.extend(queue)
+                self._queues.clear()
+            for request in requests:
+                self._fail(request, e)
+
+    def _process_batch(self, key, pieces):
+        images_with_extra_info = [
+            page for request, start, end in pieces for page in request.pages[start:end]
+        ]
+        logger.debug(
+            f"inference broker: batch of {len(images_with_extra_info)} pages from {len(pieces)} requests"
+        )
+        try:
+            results = self._analyze(images_with_extra_info, key)
+        except Exception as e:
+            if len(pieces) == 1:
+                self._fail(pieces[0][0], e)
+                return
+            # 合并的batch出错时逐个请求重试，避免一个任务的错误影响同一batch中的其他任务
+            logger.warning(f"inference broker: batch failed ({e}), retry each request separately")
+            for piece in pieces:
+                request, start, end = piece
+                try:
+                    self._deliver([piece], self._analyze(request.pages[start:end], key))
+                except Exception as piece_error:
+                    self._fail(request, piece_error)
+            return
+        self._deliver(pieces, results)
+
+    @staticmethod
+    def _analyze(images_with_extra_info, key):
+        from .pipeline_analyze import batch_image_analyze
+
+        formula_enable, table_enable = key
+        return batch_image_analyze(images_with_extra_info, formula_enable, table_enable)
+
+    def _fail(self, request, error):
+        with self._cond:
+            if request.failed or request.future.done():
+                return
+            request.failed = True
+            # 尚未开始的请求先标记为运行中，已被取消的不再设置异常
+            if request.offset == 0 and not request.future.set_running_or_notify_cancel():
+                return
+            request.future.set_exception(error)
+
+    @staticmethod
+    def _deliver(pieces, results):
+        position = 0
+        for request, start, end in pieces:
+            request.results[start:end] = results[position:position + end - start]
+            position += end - start
+            request.done_pages += end - start
+            if request.done_pages == len(request.pages) and not request.failed:
+                request.future.set_result(request.results)
+
+
+_inference_broker = None
+_inference_broker_lock = threading.Lock()
+
+
+def get_inference_broker():
+    """按MINERU_INFERENCE_BROKER返回进程内共享的推理调度器，未开启时返回None"""
+    global _inference_broker
+    if not get_inference_broker_enable():
+        return None
+    with _inference_broker_lock:
+        if _inference_broker is None:
+            _inference_broker = InferenceBroker(
+                int(os.environ.get('MINERU_MIN_BATCH_INFERENCE_SIZE', 384)),
+                get_inference_broker_max_wait() / 1000,
+            )
+        return _inference_broker
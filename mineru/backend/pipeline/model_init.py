@@ -1,19 +1,10 @@
 import os
+import threading
+import time
 
-import torch
 from loguru import logger
 
 from .model_list import AtomicModel
-from ...model.layout.doclayoutyolo import DocLayoutYOLOModel
-from ...model.mfd.yolo_v8 import YOLOv8MFDModel
-from ...model.mfr.unimernet.Unimernet import UnimernetModel
-from ...model.mfr.pp_formulanet_plus_m.predict_formula import FormulaRecognizer
-from mineru.model.ocr.pytorch_paddle import PytorchPaddleOCR
-from ...model.ori_cls.paddle_ori_cls import PaddleOrientationClsModel
-from ...model.table.cls.paddle_table_cls import PaddleTableClsModel
-# from ...model.table.rec.RapidTable import RapidTableModel
-from ...model.table.rec.slanet_plus.main import RapidTableModel
-from ...model.table.rec.unet_table.main import UnetTableModel
 from ...utils.enum_class import ModelPath
 from ...utils.models_download_utils import auto_download_and_get_model_root_path
 
@@ -36,11 +27,13 @@ def img_orientation_cls_model_init():
         lang="ch_lite",
         enable_merge_det_boxes=False
     )
+    from ...model.ori_cls.paddle_ori_cls import PaddleOrientationClsModel
     cls_model = PaddleOrientationClsModel(ocr_engine)
     return cls_model
 
 
 def table_cls_model_init():
+    from ...model.table.cls.paddle_table_cls import PaddleTableClsModel
     return PaddleTableClsModel()
 
 
@@ -53,6 +46,7 @@ def wired_table_model_init(lang=None):
         lang=lang,
         enable_merge_det_boxes=False
     )
+    from ...model.table.rec.unet_table.main import UnetTableModel
     table_model = UnetTableModel(ocr_engine)
     return table_model
 
@@ -66,12 +60,16 @@ def wireless_table_model_init(lang=None):
         lang=lang,
         enable_merge_det_boxes=False
     )
+    # from ...model.table.rec.RapidTable import RapidTableModel
+    from ...model.table.rec.slanet_plus.main import RapidTableModel
     table_model = RapidTableModel(ocr_engine)
     return table_model
 
 
 def mfd_model_init(weight, device='cpu'):
+    from ...model.mfd.yolo_v8 import YOLOv8MFDModel
     if str(device).startswith('npu'):
+        import torch
         device = torch.device(device)
     mfd_model = YOLOv8MFDModel(weight, device)
     return mfd_model
@@ -79,8 +77,10 @@ def mfd_model_init(weight, device='cpu'):
 
 def mfr_model_init(weight_dir, device='cpu'):
     if MFR_MODEL == "unimernet_small":
+        from ...model.mfr.unimernet.Unimernet import UnimernetModel
         mfr_model = UnimernetModel(weight_dir, device)
     elif MFR_MODEL == "pp_formulanet_plus_m":
+        from ...model.mfr.pp_formulanet_plus_m.predict_formula import FormulaRecognizer
         mfr_model = FormulaRecognizer(weight_dir, device)
     else:
         logger.error('MFR model name not allow')
@@ -89,7 +89,9 @@ def mfr_model_init(weight_dir, device='cpu'):
 
 
 def doclayout_yolo_model_init(weight, device='cpu'):
+    from ...model.layout.doclayoutyolo import DocLayoutYOLOModel
     if str(device).startswith('npu'):
+        import torch
         device = torch.device(device)
     model = DocLayoutYOLOModel(weight, device)
     return model
@@ -99,6 +101,7 @@ def ocr_model_init(det_db_box_thresh=0.3,
                    det_db_unclip_ratio=1.8,
                    enable_merge_det_boxes=True
                    ):
+    from mineru.model.ocr.pytorch_paddle import PytorchPaddleOCR
     if lang is not None and lang != '':
         model = PytorchPaddleOCR(
             det_db_box_thresh=det_db_box_thresh,
@@ -117,9 +120,16 @@ def ocr_model_init(det_db_box_thresh=0.3,
     return model
 
 
+# 同一个模型实例不能在多个线程中同时推理：推理调度器线程、模型线程池和生成middle_json时的post_ocr共用这把锁。
+# 推理过程中会按需渲染pdf区域(获取pdfium锁)，因此持有pdfium锁时不能再获取这把锁
+model_inference_lock = threading.RLock()
+
+
 class AtomModelSingleton:
     _instance = None
     _models = {}
+    # 可重入锁：部分模型初始化时会再获取ocr模型
+    _lock = threading.RLock()
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -146,8 +156,13 @@ class AtomModelSingleton:
         else:
             key = atom_model_name
 
-        if key not in self._models:
-            self._models[key] = atom_model_init(model_name=atom_model_name, **kwargs)
+        if key in self._models:
+            return self._models[key]
+        with self._lock:
+            if key not in self._models:
+                model_init_start = time.time()
+                self._models[key] = atom_model_init(model_name=atom_model_name, **kwargs)
+                logger.info(f'{atom_model_name} model init cost: {round(time.time() - model_init_start, 2)}')
         return self._models[key]
 
 def atom_model_init(model_name: str, **kwargs):
@@ -199,72 +214,104 @@ def atom_model_init(model_name: str, **kwargs):
 
 class MineruPipelineModel:
     def __init__(self, **kwargs):
+        """各子模型在第一次使用时才加载，需要提前加载时调用preload()"""
         self.formula_config = kwargs.get('formula_config')
         self.apply_formula = self.formula_config.get('enable', True)
         self.table_config = kwargs.get('table_config')
         self.apply_table = self.table_config.get('enable', True)
         self.lang = kwargs.get('lang', None)
         self.device = kwargs.get('device', 'cpu')
-        logger.info(
-            'DocAnalysis init, this may take some times......'
+        self._atom_model_manager = AtomModelSingleton()
+
+    @property
+    def mfd_model(self):
+        # 初始化公式检测模型
+        return self._atom_model_manager.get_atom_model(
+            atom_model_name=AtomicModel.MFD,
+            mfd_weights=str(
+                os.path.join(auto_download_and_get_model_root_path(ModelPath.yolo_v8_mfd), ModelPath.yolo_v8_mfd)
+            ),
+            device=self.device,
         )
-        atom_model_manager = AtomModelSingleton()
 
-        if self.apply_formula:
-            # 初始化公式检测模型
-            self.mfd_model = atom_model_manager.get_atom_model(
-                atom_model_name=AtomicModel.MFD,
-                mfd_weights=str(
-                    os.path.join(auto_download_and_get_model_root_path(ModelPath.yolo_v8_mfd), ModelPath.yolo_v8_mfd)
-                ),
-                device=self.device,
-            )
+    @property
+    def mfr_model(self):
+        # 初始化公式解析模型
+        if MFR_MODEL == "unimernet_small":
+            mfr_model_path = ModelPath.unimernet_small
+        elif MFR_MODEL == "pp_formulanet_plus_m":
+            mfr_model_path = ModelPath.pp_formulanet_plus_m
+        else:
+            logger.error('MFR model name not allow')
+            exit(1)
 
-            # 初始化公式解析模型
-            if MFR_MODEL == "unimernet_small":
-                mfr_model_path = ModelPath.unimernet_small
-            elif MFR_MODEL == "pp_formulanet_plus_m":
-                mfr_model_path = ModelPath.pp_formulanet_plus_m
-            else:
-                logger.error('MFR model name not allow')
-                exit(1)
-
-            self.mfr_model = atom_model_manager.get_atom_model(
-                atom_model_name=AtomicModel.MFR,
-                mfr_weight_dir=str(os.path.join(auto_download_and_get_model_root_path(mfr_model_path), mfr_model_path)),
-                device=self.device,
-            )
+        return self._atom_model_manager.get_atom_model(
+            atom_model_name=AtomicModel.MFR,
+            mfr_weight_dir=str(os.path.join(auto_download_and_get_model_root_path(mfr_model_path), mfr_model_path)),
+            device=self.device,
+        )
 
+    @property
+    def layout_model(self):
         # 初始化layout模型
-        self.layout_model = atom_model_manager.get_atom_model(
+        return self._atom_model_manager.get_atom_model(
             atom_model_name=AtomicModel.Layout,
             doclayout_yolo_weights=str(
                 os.path.join(auto_download_and_get_model_root_path(ModelPath.doclayout_yolo), ModelPath.doclayout_yolo)
             ),
             device=self.device,
         )
+
+    @property
+    def ocr_model(self):
         # 初始化ocr
-        self.ocr_model = atom_model_manager.get_atom_model(
+        return self._atom_model_manager.get_atom_model(
             atom_model_name=AtomicModel.OCR,
             det_db_box_thresh=0.3,
             lang=self.lang
         )
-        # init table model
-        if self.apply_table:
-            self.wired_table_model = atom_model_manager.get_atom_model(
-                atom_model_name=AtomicModel.WiredTable,
-                lang=self.lang,
-            )
-            self.wireless_table_model = atom_model_manager.get_atom_model(
-                atom_model_name=AtomicModel.WirelessTable,
-                lang=self.lang,
-            )
-            self.table_cls_model = atom_model_manager.get_atom_model(
-                atom_model_name=AtomicModel.TableCls,
-            )
-            self.img_orientation_cls_model = atom_model_manager.get_atom_model(
-                atom_model_name=AtomicModel.ImgOrientationCls,
-                lang=self.lang,
-            )
 
-        logger.info('DocAnalysis init done!')
\ No newline at end of file
+    @property
+    def wired_table_model(self):
+        return self._atom_model_manager.get_atom_model(
+            atom_model_name=AtomicModel.WiredTable,
+            lang=self.lang,
+        )
+
+    @property
+    def wireless_table_model(self):
+        return self._atom_model_manager.get_atom_model(
+            atom_model_name=AtomicModel.WirelessTable,
+            lang=self.lang,
+        )
+
+    @property
+    def table_cls_model(self):
+        return self._atom_model_manager.get_atom_model(
+            atom_model_name=AtomicModel.TableCls,
+        )
+
+    @property
+    def img_orientation_cls_model(self):
+        return self._atom_model_manager.get_atom_model(
+            atom_model_name=AtomicModel.ImgOrientationCls,
+            lang=self.lang,
+        )
+
+    def preload(self):
+        """加载所有已启用的子模型，适合常驻服务在接收请求前预热"""
+        logger.info(
+            'DocAnalysis init, this may take some times......'
+        )
+        if self.apply_formula:
+            _ = self.mfd_model
+            _ = self.mfr_model
+        _ = self.layout_model
+        _ = self.ocr_model
+        if self.apply_table:
+            _ = self.wired_table_model
+            _ = self.wireless_table_model
+            _ = self.table_cls_model
+            _ = self.img_orientation_cls_model
+        logger.info('DocAnalysis init done!')
+        return self
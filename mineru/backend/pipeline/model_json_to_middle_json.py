@@ -2,12 +2,12 @@
 import os
 import time
 
+import pypdfium2 as pdfium
 from loguru import logger
 from tqdm import tqdm
 
 from mineru.backend.utils import cross_page_table_merge
 from mineru.utils.config_reader import get_device, get_llm_aided_config, get_formula_enable
-from mineru.backend.pipeline.model_init import AtomModelSingleton
 from mineru.backend.pipeline.para_split import para_split
 from mineru.utils.block_pre_proc import prepare_block_bboxes, process_groups
 from mineru.utils.block_sort import sort_blocks_by_bbox
@@ -18,6 +18,10 @@ from mineru.utils.llm_aided import llm_aided_title
 from mineru.utils.model_utils import clean_memory
 from mineru.backend.pipeline.pipeline_magic_model import MagicModel
 from mineru.utils.ocr_utils import OcrConfidence
+from mineru.utils.os_env_config import get_page_pyramid_enable
+from mineru.utils.pdf_image_tools import REGION_RENDER_DPI
+from mineru.utils.pdf_reader import page_to_image
+from mineru.utils.pdfium_guard import pdfium_lock, close_pdf_doc
 from mineru.utils.span_block_fix import fill_spans_in_blocks, fix_discarded_block, fix_block_spans
 from mineru.utils.span_pre_proc import remove_outside_spans, remove_overlaps_low_confidence_spans, \
     remove_overlaps_min_spans, txt_spans_extract
@@ -152,11 +156,18 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
         return None
 
     """对image/table/interline_equation截图"""
-    for span in spans:
-        if span['type'] in [ContentType.IMAGE, ContentType.TABLE, ContentType.INTERLINE_EQUATION]:
-            span = cut_image_and_table(
-                span, page_pil_img, page_img_md5, page_index, image_writer, scale=scale
-            )
+    cut_spans = [
+        span for span in spans
+        if span['type'] in [ContentType.IMAGE, ContentType.TABLE, ContentType.INTERLINE_EQUATION]
+    ]
+    cut_pil_img, cut_scale = page_pil_img, scale
+    if cut_spans and get_page_pyramid_enable() and isinstance(page, pdfium.PdfPage):
+        # 开启页面金字塔时页面图片的dpi较低，有需要截图的区块时按默认dpi重新渲染该页
+        cut_pil_img, cut_scale = page_to_image(page, dpi=REGION_RENDER_DPI)
+    for span in cut_spans:
+        cut_image_and_table(
+            span, cut_pil_img, page_img_md5, page_index, image_writer, scale=cut_scale
+        )
 
     """span填充进block"""
     block_with_spans, spans = fill_spans_in_blocks(all_bboxes, spans, 0.5)
@@ -173,25 +184,58 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
     return page_info
 
 
-def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=None, ocr_enable=False, formula_enabled=True):
+def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=None, ocr_enable=False, formula_enabled=True, post_ocr_enable=True, page_id_offset=0, cross_page_enable=True, table_merge_enable=None):
+    """由模型结果生成middle_json
+
+    page_id_offset: pdf_doc是整个文档中的一段页面时，该段第一页在整个文档中的页码，page_idx和图片文件名按整个文档的页码生成
+    cross_page_enable: 是否执行分段、表格跨页合并等跨页处理，分段解析时在合并后统一执行
+    table_merge_enable: 是否执行表格跨页合并，None时由MINERU_TABLE_MERGE_ENABLE决定
+    """
+    middle_json = build_page_infos(model_list, images_list, pdf_doc, image_writer, ocr_enable, formula_enabled, page_id_offset)
+
+    """后置ocr处理"""
+    post_ocr(middle_json["pdf_info"], lang, post_ocr_enable)
+
+    finish_middle_json(middle_json, pdf_doc, len(model_list), cross_page_enable, table_merge_enable)
+    return middle_json
+
+
+def build_page_infos(model_list, images_list, pdf_doc, image_writer, ocr_enable=False, formula_enabled=True, page_id_offset=0):
+    """逐页生成page_info(文本提取、切图等CPU工作)，需要后置ocr的span保留np_img，由post_ocr识别"""
     middle_json = {"pdf_info": [], "_backend":"pipeline", "_version_name": __version__}
     formula_enabled = get_formula_enable(formula_enabled)
     for page_index, page_model_info in tqdm(enumerate(model_list), total=len(model_list), desc="Processing pages"):
-        page = pdf_doc[page_index]
-        image_dict = images_list[page_index]
-        page_info = page_model_info_to_page_info(
-            page_model_info, image_dict, page, image_writer, page_index, ocr_enable=ocr_enable, formula_enabled=formula_enabled
-        )
-        if page_info is None:
-            page_w, page_h = map(int, page.get_size())
-            page_info = make_page_info_dict([], page_index, page_w, page_h, [])
+        # 逐页持有pdfium锁(取页、文本提取、重新渲染)，页与页之间让出给其他线程的渲染；
+        # 后置ocr等推理不在锁内执行，避免与持有推理锁、等待pdfium锁的区域渲染互相等待
+        with pdfium_lock:
+            page = pdf_doc[page_index]
+            image_dict = images_list[page_index]
+            page_info = page_model_info_to_page_info(
+                page_model_info, image_dict, page, image_writer, page_index + page_id_offset, ocr_enable=ocr_enable, formula_enabled=formula_enabled
+            )
+            if page_info is None:
+                page_w, page_h = map(int, page.get_size())
+                page_info = make_page_info_dict([], page_index + page_id_offset, page_w, page_h, [])
         middle_json["pdf_info"].append(page_info)
+    return middle_json
 
-    """后置ocr处理"""
-    need_ocr_list = []
-    img_crop_list = []
+
+def finish_middle_json(middle_json, pdf_doc, page_count, cross_page_enable=True, table_merge_enable=None):
+    """后置ocr之后的跨页处理，并关闭pdf文档"""
+    """分段、表格跨页合并、llm优化"""
+    if cross_page_enable:
+        cross_page_process(middle_json["pdf_info"], table_merge_enable)
+
+    """清理内存"""
+    close_pdf_doc(pdf_doc)
+    if os.getenv('MINERU_DONOT_CLEAN_MEM') is None and page_count >= 10:
+        clean_memory(get_device())
+
+
+def get_post_ocr_spans(pdf_info):
+    """收集无法直接提取文本、需要做ocr识别的span"""
     text_block_list = []
-    for page_info in middle_json["pdf_info"]:
+    for page_info in pdf_info:
         for block in page_info['preproc_blocks']:
             if block['type'] in ['table', 'image']:
                 for sub_block in block['blocks']:
@@ -201,37 +245,54 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
                 text_block_list.append(block)
         for block in page_info['discarded_blocks']:
             text_block_list.append(block)
-    for block in text_block_list:
-        for line in block['lines']:
-            for span in line['spans']:
-                if 'np_img' in span:
-                    need_ocr_list.append(span)
-                    img_crop_list.append(span['np_img'])
-                    span.pop('np_img')
-    if len(img_crop_list) > 0:
-        atom_model_manager = AtomModelSingleton()
-        ocr_model = atom_model_manager.get_atom_model(
-            atom_model_name='ocr',
-            det_db_box_thresh=0.3,
-            lang=lang
-        )
+    return [span for block in text_block_list for line in block['lines'] for span in line['spans'] if 'np_img' in span]
+
+
+def post_ocr(pdf_info, lang=None, ocr_model_enable=True):
+    """对无法直接提取文本的span做ocr识别，ocr_model_enable为False时不加载模型，这些span的内容置空"""
+    need_ocr_list = get_post_ocr_spans(pdf_info)
+    img_crop_list = [span.pop('np_img') for span in need_ocr_list]
+    if len(img_crop_list) == 0:
+        return
+    if not ocr_model_enable:
+        logger.warning(f'{len(need_ocr_list)} spans need ocr but ocr model is disabled, leave them empty')
+        for span in need_ocr_list:
+            span['content'] = ''
+            span['score'] = 0.0
+        return
+
+    from mineru.backend.pipeline.model_init import AtomModelSingleton, model_inference_lock
+    atom_model_manager = AtomModelSingleton()
+    ocr_model = atom_model_manager.get_atom_model(
+        atom_model_name='ocr',
+        det_db_box_thresh=0.3,
+        lang=lang
+    )
+    # ocr模型可能正在被推理调度器或其他任务使用
+    with model_inference_lock:
         ocr_res_list = ocr_model.ocr(img_crop_list, det=False, tqdm_enable=True)[0]
-        assert len(ocr_res_list) == len(
-            need_ocr_list), f'ocr_res_list: {len(ocr_res_list)}, need_ocr_list: {len(need_ocr_list)}'
-        for index, span in enumerate(need_ocr_list):
-            ocr_text, ocr_score = ocr_res_list[index]
-            if ocr_score > OcrConfidence.min_confidence:
-                span['content'] = ocr_text
-                span['score'] = float(f"{ocr_score:.3f}")
-            else:
-                span['content'] = ''
-                span['score'] = 0.0
-
+    assert len(ocr_res_list) == len(
+        need_ocr_list), f'ocr_res_list: {len(ocr_res_list)}, need_ocr_list: {len(need_ocr_list)}'
+    for index, span in enumerate(need_ocr_list):
+        ocr_text, ocr_score = ocr_res_list[index]
+        if ocr_score > OcrConfidence.min_confidence:
+            span['content'] = ocr_text
+            span['score'] = float(f"{ocr_score:.3f}")
+        else:
+            span['content'] = ''
+            span['score'] = 0.0
+
+
+def cross_page_process(pdf_info, table_merge_enable=None):
+    """由各页的preproc_blocks重新生成para_blocks，可对已保存的middle_json重复执行
+
+    table_merge_enable: 是否执行表格跨页合并，None时由MINERU_TABLE_MERGE_ENABLE决定
+    """
     """分段"""
-    para_split(middle_json["pdf_info"])
+    para_split(pdf_info)
 
     """表格跨页合并"""
-    cross_page_table_merge(middle_json["pdf_info"])
+    cross_page_table_merge(pdf_info, table_merge_enable)
 
     """llm优化"""
     llm_aided_config = get_llm_aided_config()
@@ -242,16 +303,9 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
         if title_aided_config is not None:
             if title_aided_config.get('enable', False):
                 llm_aided_title_start_time = time.time()
-                llm_aided_title(middle_json["pdf_info"], title_aided_config)
+                llm_aided_title(pdf_info, title_aided_config)
                 logger.info(f'llm aided title time: {round(time.time() - llm_aided_title_start_time, 2)}')
 
-    """清理内存"""
-    pdf_doc.close()
-    if os.getenv('MINERU_DONOT_CLEAN_MEM') is None and len(model_list) >= 10:
-        clean_memory(get_device())
-
-    return middle_json
-
 
 def make_page_info_dict(blocks, page_id, page_w, page_h, discarded_blocks):
     return_dict = {
@@ -1,15 +1,21 @@
+import asyncio
 import os
 import time
 from typing import List, Tuple
 from PIL import Image
 from loguru import logger
 
-from .model_init import MineruPipelineModel
+from .inference_broker import get_inference_broker
+from .model_init import MineruPipelineModel, model_inference_lock
 from mineru.utils.config_reader import get_device
 from ...utils.enum_class import ImageType
 from ...utils.pdf_classify import classify
-from ...utils.pdf_image_tools import load_images_from_pdf
+from ...utils.pdf_image_tools import load_images_from_pdf, load_images_from_image, is_pdf_bytes, PdfRegionSource, PageRegionRenderer
 from ...utils.model_utils import get_vram, clean_memory
+from ...utils.os_env_config import get_async_page_batch_size, get_page_pyramid_enable, get_page_pyramid_base_dpi, \
+    get_grayscale_pages_enable
+from ...utils.pdfium_guard import close_pdf_doc
+from ...utils.run_async import get_cpu_executor, run_in_model_executor
 
 
 os.environ['PYTORCH_ENABLE_MPS_FALLBACK'] = '1'  # 让mps可以fallback
@@ -67,6 +73,61 @@ def custom_model_init(
     return custom_model
 
 
+def _load_pdf(pdf_bytes, parse_method):
+    """确定OCR设置并渲染页面
+
+    开启页面金字塔时整页按较低的dpi渲染，同时返回用于按需重新渲染区域的PdfRegionSource，否则为None
+    """
+    if not is_pdf_bytes(pdf_bytes):
+        # 图片输入直接解码，没有文本层，始终使用ocr
+        images_list, image_doc = load_images_from_image(
+            pdf_bytes, image_type=ImageType.PIL, grayscale=get_grayscale_pages_enable()
+        )
+        return images_list, image_doc, True, None
+
+    _ocr_enable = False
+    if parse_method == 'auto':
+        if classify(pdf_bytes) == 'ocr':
+            _ocr_enable = True
+    elif parse_method == 'ocr':
+        _ocr_enable = True
+
+    # load_images_start = time.time()
+    grayscale = get_grayscale_pages_enable()
+    if get_page_pyramid_enable():
+        region_source = PdfRegionSource(pdf_bytes)
+        images_list, pdf_doc = load_images_from_pdf(
+            pdf_bytes, dpi=get_page_pyramid_base_dpi(), image_type=ImageType.PIL, grayscale=grayscale
+        )
+    else:
+        region_source = None
+        images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL, grayscale=grayscale)
+    # load_images_time = round(time.time() - load_images_start, 2)
+    # logger.debug(f"load images cost: {load_images_time}, speed: {round(len(images_list) / load_images_time, 3)} images/s")
+    return images_list, pdf_doc, _ocr_enable, region_source
+
+
+def _close_loaded_pdf(load_future):
+    """加载在取消前已经开始时，等加载完成后关闭打开的文档"""
+    if load_future.cancelled() or load_future.exception() is not None:
+        return
+    _, pdf_doc, _, region_source = load_future.result()
+    close_pdf_doc(pdf_doc)
+    if region_source is not None:
+        region_source.close()
+
+
+def _page_region_renderer(region_source, page_idx, img_dict):
+    if region_source is None:
+        return None
+    return region_source.renderer(page_idx, img_dict['scale'])
+
+
+def _make_page_dict(page_idx, pil_img, result):
+    page_info_dict = {'page_no': page_idx, 'width': pil_img.width, 'height': pil_img.height}
+    return {'layout_dets': result, 'page_info': page_info_dict}
+
+
 def doc_analyze(
         pdf_bytes_list,
         lang_list,
@@ -81,28 +142,18 @@ def doc_analyze(
     min_batch_inference_size = int(os.environ.get('MINERU_MIN_BATCH_INFERENCE_SIZE', 384))
 
     # 收集所有页面信息
-    all_pages_info = []  # 存储(dataset_index, page_index, img, ocr, lang, width, height)
+    all_pages_info = []  # 存储(dataset_index, page_index, img, ocr, lang, region_renderer)
 
     all_image_lists = []
     all_pdf_docs = []
     ocr_enabled_list = []
+    region_sources = []
     for pdf_idx, pdf_bytes in enumerate(pdf_bytes_list):
-        # 确定OCR设置
-        _ocr_enable = False
-        if parse_method == 'auto':
-            if classify(pdf_bytes) == 'ocr':
-                _ocr_enable = True
-        elif parse_method == 'ocr':
-            _ocr_enable = True
-
-        ocr_enabled_list.append(_ocr_enable)
         _lang = lang_list[pdf_idx]
-
-        # 收集每个数据集中的页面
-        # load_images_start = time.time()
-        images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL)
-        # load_images_time = round(time.time() - load_images_start, 2)
-        # logger.debug(f"load images cost: {load_images_time}, speed: {round(len(images_list) / load_images_time, 3)} images/s")
+        images_list, pdf_doc, _ocr_enable, region_source = _load_pdf(pdf_bytes, parse_method)
+        ocr_enabled_list.append(_ocr_enable)
+        if region_source is not None:
+            region_sources.append(region_source)
         all_image_lists.append(images_list)
         all_pdf_docs.append(pdf_doc)
         for page_idx in range(len(images_list)):
@@ -110,10 +161,11 @@ def doc_analyze(
             all_pages_info.append((
                 pdf_idx, page_idx,
                 img_dict['img_pil'], _ocr_enable, _lang,
+                _page_region_renderer(region_source, page_idx, img_dict),
             ))
 
     # 准备批处理
-    images_with_extra_info = [(info[2], info[3], info[4]) for info in all_pages_info]
+    images_with_extra_info = [(info[2], info[3], info[4], info[5]) for info in all_pages_info]
     batch_size = min_batch_inference_size
     batch_images = [
         images_with_extra_info[i:i + batch_size]
@@ -121,16 +173,30 @@ def doc_analyze(
     ]
 
     # 执行批处理
-    results = []
-    processed_images_count = 0
-    for index, batch_image in enumerate(batch_images):
-        processed_images_count += len(batch_image)
-        logger.info(
-            f'Batch {index + 1}/{len(batch_images)}: '
-            f'{processed_images_count} pages/{len(images_with_extra_info)} pages'
-        )
-        batch_results = batch_image_analyze(batch_image, formula_enable, table_enable)
-        results.extend(batch_results)
+    broker = get_inference_broker()
+    try:
+        if broker is not None:
+            # 由进程内共享的调度器与其他并发任务的页面合并成batch
+            results = broker.submit(images_with_extra_info, formula_enable, table_enable).result()
+        else:
+            results = []
+            processed_images_count = 0
+            for index, batch_image in enumerate(batch_images):
+                processed_images_count += len(batch_image)
+                logger.info(
+                    f'Batch {index + 1}/{len(batch_images)}: '
+                    f'{processed_images_count} pages/{len(images_with_extra_info)} pages'
+                )
+                batch_results = batch_image_analyze(batch_image, formula_enable, table_enable)
+                results.extend(batch_results)
+    except BaseException:
+        # 推理失败时关闭已打开的文档，成功时由result_to_middle_json关闭
+        for pdf_doc in all_pdf_docs:
+            close_pdf_doc(pdf_doc)
+        raise
+    finally:
+        for region_source in region_sources:
+            region_source.close()
 
     # 构建返回结果
     infer_results = []
@@ -139,19 +205,63 @@ def doc_analyze(
         infer_results.append([])
 
     for i, page_info in enumerate(all_pages_info):
-        pdf_idx, page_idx, pil_img, _, _ = page_info
-        result = results[i]
+        pdf_idx, page_idx, pil_img, _, _, _ = page_info
+        infer_results[pdf_idx].append(_make_page_dict(page_idx, pil_img, results[i]))
 
-        page_info_dict = {'page_no': page_idx, 'width': pil_img.width, 'height': pil_img.height}
-        page_dict = {'layout_dets': result, 'page_info': page_info_dict}
+    return infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list
 
-        infer_results[pdf_idx].append(page_dict)
 
-    return infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list
+async def aio_doc_analyze(
+        pdf_bytes,
+        lang,
+        parse_method: str = 'auto',
+        formula_enable=True,
+        table_enable=True,
+):
+    """doc_analyze的异步版本，处理单个pdf
+
+    页面渲染在CPU线程池中执行，推理按MINERU_ASYNC_PAGE_BATCH_SIZE分批提交到推理调度器(未开启时提交到模型线程池)，
+    并发解析的多个文档的批次合并或交替执行，任务被取消时尚未开始的批次直接放弃
+    """
+    load_future = get_cpu_executor().submit(_load_pdf, pdf_bytes, parse_method)
+    try:
+        images_list, pdf_doc, _ocr_enable, region_source = await asyncio.wrap_future(load_future)
+    except asyncio.CancelledError:
+        # 已经开始的加载无法中断，完成后关闭打开的文档
+        load_future.add_done_callback(_close_loaded_pdf)
+        raise
+    images_with_extra_info = [
+        (img_dict['img_pil'], _ocr_enable, lang, _page_region_renderer(region_source, page_idx, img_dict))
+        for page_idx, img_dict in enumerate(images_list)
+    ]
+
+    batch_size = get_async_page_batch_size()
+    broker = get_inference_broker()
+    results = []
+    try:
+        for start in range(0, len(images_with_extra_info), batch_size):
+            batch_image = images_with_extra_info[start:start + batch_size]
+            if broker is not None:
+                results.extend(await asyncio.wrap_future(broker.submit(batch_image, formula_enable, table_enable)))
+            else:
+                results.extend(await run_in_model_executor(batch_image_analyze, batch_image, formula_enable, table_enable))
+    except BaseException:
+        # 推理失败或被取消时关闭文档，关闭需要等待pdfium锁，不在事件循环中执行
+        get_cpu_executor().submit(close_pdf_doc, pdf_doc)
+        raise
+    finally:
+        if region_source is not None:
+            get_cpu_executor().submit(region_source.close)
+
+    infer_result = [
+        _make_page_dict(page_idx, images_with_extra_info[page_idx][0], result)
+        for page_idx, result in enumerate(results)
+    ]
+    return infer_result, images_list, pdf_doc, _ocr_enable
 
 
 def batch_image_analyze(
-        images_with_extra_info: List[Tuple[Image.Image, bool, str]],
+        images_with_extra_info: List[Tuple[Image.Image, bool, str, PageRegionRenderer | None]],
         formula_enable=True,
         table_enable=True):
 
@@ -202,7 +312,8 @@ def batch_image_analyze(
         enable_ocr_det_batch = True
 
     batch_model = BatchAnalyze(model_manager, batch_ratio, formula_enable, table_enable, enable_ocr_det_batch)
-    results = batch_model(images_with_extra_info)
+    with model_inference_lock:
+        results = batch_model(images_with_extra_info)
 
     clean_memory(get_device())
 
@@ -5,15 +5,21 @@ from loguru import logger
 from mineru.utils.table_merge import merge_table
 
 
-def cross_page_table_merge(pdf_info: list[dict]):
+def cross_page_table_merge(pdf_info: list[dict], table_merge_enable: bool = None):
     """Merge tables that span across multiple pages in a PDF document.
 
     Args:
         pdf_info (list[dict]): A list of dictionaries containing information about each page in the PDF.
+        table_merge_enable (bool, optional): Whether to merge tables. Defaults to None, which follows
+            MINERU_TABLE_MERGE_ENABLE.
 
     Returns:
         None
     """
+    if table_merge_enable is not None:
+        if table_merge_enable:
+            merge_table(pdf_info)
+        return
     is_merge_table = os.getenv('MINERU_TABLE_MERGE_ENABLE', 'true')
     if is_merge_table.lower() in ['true', '1', 'yes']:
         merge_table(pdf_info)
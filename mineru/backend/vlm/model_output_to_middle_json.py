@@ -12,6 +12,7 @@ from mineru.utils.cut_image import cut_image_and_table
 from mineru.utils.enum_class import ContentType
 from mineru.utils.hash_utils import bytes_md5
 from mineru.utils.pdf_image_tools import get_crop_img
+from mineru.utils.pdfium_guard import pdfium_lock, close_pdf_doc
 from mineru.version import __version__
 
 
@@ -22,7 +23,7 @@ if llm_aided_config:
     if title_aided_config.get('enable', False):
         try:
             from mineru.utils.llm_aided import llm_aided_title
-            from mineru.backend.pipeline.model_init import AtomModelSingleton
+            from mineru.backend.pipeline.model_init import AtomModelSingleton, model_inference_lock
             heading_level_import_success = True
         except Exception as e:
             logger.warning("The heading level feature cannot be used. If you need to use the heading level feature, "
@@ -36,7 +37,8 @@ def blocks_to_page_info(page_blocks, image_dict, page, image_writer, page_index)
     # page_pil_img = image_dict["img_pil"]
     page_pil_img = image_dict["img_pil"]
     page_img_md5 = bytes_md5(page_pil_img.tobytes())
-    width, height = map(int, page.get_size())
+    with pdfium_lock:
+        width, height = map(int, page.get_size())
 
     magic_model = MagicModel(page_blocks, width, height)
     image_blocks = magic_model.get_image_blocks()
@@ -65,7 +67,8 @@ def blocks_to_page_info(page_blocks, image_dict, page, image_writer, page_index)
                 title_np_img, 50, 50, 50, 50, cv2.BORDER_CONSTANT, value=[255, 255, 255]
             )
             title_img = cv2.cvtColor(title_np_img, cv2.COLOR_RGB2BGR)
-            ocr_det_res = ocr_model.ocr(title_img, rec=False)[0]
+            with model_inference_lock:
+                ocr_det_res = ocr_model.ocr(title_img, rec=False)[0]
             if len(ocr_det_res) > 0:
                 # 计算所有res的平均高度
                 avg_height = np.mean([box[2][1] - box[0][1] for box in ocr_det_res])
@@ -102,7 +105,9 @@ def blocks_to_page_info(page_blocks, image_dict, page, image_writer, page_index)
 def result_to_middle_json(model_output_blocks_list, images_list, pdf_doc, image_writer):
     middle_json = {"pdf_info": [], "_backend":"vlm", "_version_name": __version__}
     for index, page_blocks in enumerate(model_output_blocks_list):
-        page = pdf_doc[index]
+        # 标题ocr需要获取推理锁，只在访问pdf页面时持有pdfium锁
+        with pdfium_lock:
+            page = pdf_doc[index]
         image_dict = images_list[index]
         page_info = blocks_to_page_info(page_blocks, image_dict, page, image_writer, index)
         middle_json["pdf_info"].append(page_info)
@@ -119,5 +124,5 @@ def result_to_middle_json(model_output_blocks_list, images_list, pdf_doc, image_
         logger.info(f'llm aided title time: {round(time.time() - llm_aided_title_start_time, 2)}')
 
     # 关闭pdf文档
-    pdf_doc.close()
+    close_pdf_doc(pdf_doc)
     return middle_json
\ No newline at end of file
@@ -1,5 +1,6 @@
 # Copyright (c) Opendatalab. All rights reserved.
 import os
+import time
 import click
 from pathlib import Path
 from loguru import logger
@@ -9,8 +10,11 @@ from mineru.utils.cli_parser import arg_parse
 from mineru.utils.config_reader import get_device
 from mineru.utils.guess_suffix_or_lang import guess_suffix_by_path
 from mineru.utils.model_utils import get_vram
+from mineru.utils.os_env_config import get_ingest_batch_pages
+from mineru.utils.pdf_page_id import get_end_page_id
 from ..version import __version__
 from .common import do_parse, read_fn, pdf_suffixes, image_suffixes
+from .ingest import ParseManifest, count_pages, pack_by_pages
 
 
 backends = ['pipeline', 'vlm-transformers', 'vlm-vllm-engine', 'vlm-lmdeploy-engine', 'vlm-http-client']
@@ -149,13 +153,48 @@ if is_mac_os_version_supported():
     """,
     default='huggingface',
 )
+@click.option(
+    '-w',
+    '--workers',
+    'workers',
+    type=int,
+    help="""
+    Number of worker processes, each worker loads its own models and documents are assigned to the least loaded worker.
+    Default is 1, which parses in the current process. Adapted only for the case where the backend is set to "pipeline".
+    """,
+    default=1,
+)
+@click.option(
+    '--worker-devices',
+    'worker_devices',
+    type=str,
+    help='Comma separated devices assigned to workers in turn, e.g., "cuda:0,cuda:1". Default is the device of --device.',
+    default=None,
+)
+@click.option(
+    '--worker-cpus',
+    'worker_cpus',
+    type=str,
+    help='CPU cores each worker is pinned to, separated by ";" between workers, e.g., "0-3;4-7", or "auto" to split the available cores evenly.',
+    default=None,
+)
+@click.option(
+    '--split-pages',
+    'split_pages',
+    type=int,
+    help="""
+    With multiple workers, split pdfs with more pages than this into page ranges parsed in parallel,
+    the ranges are merged before cross-page processing. Default is 0, which does not split.
+    """,
+    default=0,
+)
 
 
 def main(
         ctx,
         input_path, output_dir, method, backend, lang, server_url,
         start_page_id, end_page_id, formula_enable, table_enable,
-        device_mode, virtual_vram, model_source, **kwargs
+        device_mode, virtual_vram, model_source, workers, worker_devices, worker_cpus, split_pages, **kwargs
 ):
 
     kwargs.update(arg_parse(ctx))
@@ -183,17 +222,27 @@ def main(
 
     os.makedirs(output_dir, exist_ok=True)
 
-    def parse_doc(path_list: list[Path]):
+    def parse_doc(path_list: list[Path], pages_list: list[int]):
+        """解析一个batch，整体失败时逐个文件重新解析，避免一个文件的错误影响同一batch中的其他文件"""
+        file_name_list = []
+        pdf_bytes_list = []
+        lang_list = []
+        batch_pages = []
+        for path, pages in zip(path_list, pages_list):
+            try:
+                pdf_bytes = read_fn(path, image_to_pdf=False)
+            except Exception as e:
+                logger.exception(e)
+                manifest.record(path, 'failed', error=f"{type(e).__name__}: {e}", pages=pages)
+                continue
+            file_name_list.append(str(Path(path).stem))
+            pdf_bytes_list.append(pdf_bytes)
+            lang_list.append(lang)
+            batch_pages.append((path, pages))
+        if not pdf_bytes_list:
+            return
+        start_time = time.time()
         try:
-            file_name_list = []
-            pdf_bytes_list = []
-            lang_list = []
-            for path in path_list:
-                file_name = str(Path(path).stem)
-                pdf_bytes = read_fn(path)
-                file_name_list.append(file_name)
-                pdf_bytes_list.append(pdf_bytes)
-                lang_list.append(lang)
             do_parse(
                 output_dir=output_dir,
                 pdf_file_names=file_name_list,
@@ -210,15 +259,75 @@ def main(
             )
         except Exception as e:
             logger.exception(e)
+            if len(batch_pages) == 1:
+                path, pages = batch_pages[0]
+                manifest.record(path, 'failed', error=f"{type(e).__name__}: {e}", elapsed=time.time() - start_time, pages=pages)
+                return
+            logger.warning(f"failed to parse a batch of {len(batch_pages)} files, parse them one by one")
+            del pdf_bytes_list
+            for path, pages in batch_pages:
+                parse_doc([path], [pages])
+            return
+        # batch内的文件一起推理，耗时按页数分摊
+        elapsed = time.time() - start_time
+        total_pages = sum(pages for _, pages in batch_pages) or 1
+        for path, pages in batch_pages:
+            manifest.record(path, 'ok', elapsed=elapsed * pages / total_pages, pages=pages)
+
+    def parse_doc_with_workers(path_list: list[Path]):
+        from .coordinator import run_parse_tasks
+        results = run_parse_tasks(
+            path_list, output_dir, lang,
+            dict(
+                backend=backend,
+                parse_method=method,
+                formula_enable=formula_enable,
+                table_enable=table_enable,
+                server_url=server_url,
+                **kwargs,
+            ),
+            start_page_id=start_page_id,
+            end_page_id=end_page_id,
+            workers=workers,
+            devices=worker_devices.split(',') if worker_devices else None,
+            cpu_sets=worker_cpus,
+            split_pages=split_pages,
+        )
+        for path, result in zip(path_list, results):
+            manifest.record(path, result.status, error=result.error, elapsed=result.elapsed, pages=result.pages)
 
     if os.path.isdir(input_path):
         doc_path_list = []
         for doc_path in Path(input_path).glob('*'):
             if guess_suffix_by_path(doc_path) in pdf_suffixes + image_suffixes:
                 doc_path_list.append(doc_path)
-        parse_doc(doc_path_list)
     else:
-        parse_doc([Path(input_path)])
+        doc_path_list = [Path(input_path)]
+
+    # 已有输出的文件直接跳过，重新运行时只处理未完成或失败的文件
+    manifest = ParseManifest(output_dir)
+    pending_path_list = []
+    for doc_path in sorted(doc_path_list):
+        if manifest.is_done(doc_path, os.path.join(output_dir, doc_path.stem, method)):
+            manifest.record(doc_path, 'skipped')
+        else:
+            pending_path_list.append(doc_path)
+
+    if workers > 1 and backend == 'pipeline':
+        parse_doc_with_workers(pending_path_list)
+    else:
+        def get_pages(path):
+            return max(1, get_end_page_id(end_page_id, count_pages(path)) - start_page_id + 1)
+
+        # 按页数分批读入，只有当前batch的文件内容和渲染结果驻留在内存中
+        for path_list, pages_list in pack_by_pages(pending_path_list, get_ingest_batch_pages(), get_pages):
+            parse_doc(path_list, pages_list)
+
+    summary = manifest.summary(doc_path_list)
+    logger.info(
+        f"{summary['ok']} files parsed, {summary['failed']} failed, {summary['skipped']} skipped, "
+        f"see {manifest.path}"
+    )
 
 if __name__ == '__main__':
     main()
@@ -1,23 +1,26 @@
 # Copyright (c) Opendatalab. All rights reserved.
+import asyncio
 import io
-import json
 import os
-import copy
+import shutil
 from pathlib import Path
 
 from loguru import logger
-import pypdfium2 as pdfium
 
-from mineru.data.data_reader_writer import FileBasedDataWriter
-from mineru.utils.draw_bbox import draw_layout_bbox, draw_span_bbox, draw_line_sort_bbox
+from mineru.data.data_reader_writer import AsyncImageWriter, FileBasedDataWriter
+from mineru.model.mfr.formula_cache import log_formula_cache_summary
+from mineru.utils.draw_bbox import draw_layout_bbox, draw_span_bbox, draw_line_sort_bbox, submit_draw_task, \
+    wait_draw_tasks
 from mineru.utils.enum_class import MakeMode
 from mineru.utils.guess_suffix_or_lang import guess_suffix_by_bytes
-from mineru.utils.pdf_image_tools import images_bytes_to_pdf_bytes
+from mineru.utils.middle_json_io import dump_json_output, iter_dump_chunks, MiddleJsonReader, MIDDLE_JSON_FORMATS
+from mineru.utils.os_env_config import get_middle_json_format
 # VLM模块改为延迟导入，避免在打包时（已排除VLM）出错
 # from mineru.backend.vlm.vlm_middle_json_mkcontent import union_make as vlm_union_make
 # from mineru.backend.vlm.vlm_analyze import doc_analyze as vlm_doc_analyze
 # from mineru.backend.vlm.vlm_analyze import aio_doc_analyze as aio_vlm_doc_analyze
 from mineru.utils.pdf_page_id import get_end_page_id
+from mineru.utils.run_async import get_cpu_executor, run_in_cpu_executor, run_in_model_executor
 
 if os.getenv("MINERU_LMDEPLOY_DEVICE", "") == "maca":
     import torch
@@ -29,13 +32,17 @@ image_suffixes = ["png", "jpeg", "jp2", "webp", "gif", "bmp", "jpg", "tiff"]
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-def read_fn(path):
+def read_fn(path, image_to_pdf=True):
+    """读取pdf或图片，image_to_pdf为False时图片保持原始数据，由do_parse直接解码，不经过pdf转换和重新渲染"""
     if not isinstance(path, Path):
         path = Path(path)
     with open(str(path), "rb") as input_file:
         file_bytes = input_file.read()
         file_suffix = guess_suffix_by_bytes(file_bytes, path)
         if file_suffix in image_suffixes:
+            if not image_to_pdf:
+                return file_bytes
+            from mineru.utils.pdf_image_tools import images_bytes_to_pdf_bytes
             return images_bytes_to_pdf_bytes(file_bytes)
         elif file_suffix in pdf_suffixes:
             return file_bytes
@@ -52,41 +59,49 @@ def prepare_env(output_dir, pdf_file_name, parse_method):
 
 
 def convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id=0, end_page_id=None):
-    pdf = pdfium.PdfDocument(pdf_bytes)
-    output_pdf = pdfium.PdfDocument.new()
-    try:
-        end_page_id = get_end_page_id(end_page_id, len(pdf))
-
-        # 逐页导入,失败则跳过
-        output_index = 0
-        for page_index in range(start_page_id, end_page_id + 1):
-            try:
-                output_pdf.import_pages(pdf, pages=[page_index])
-                output_index += 1
-            except Exception as page_error:
-                output_pdf.del_page(output_index)
-                logger.warning(f"Failed to import page {page_index}: {page_error}, skipping this page.")
-                continue
-
-        # 将新PDF保存到内存缓冲区
-        output_buffer = io.BytesIO()
-        output_pdf.save(output_buffer)
-
-        # 获取字节数据
-        output_bytes = output_buffer.getvalue()
-    except Exception as e:
-        logger.warning(f"Error in converting PDF bytes: {e}, Using original PDF bytes.")
-        output_bytes = pdf_bytes
-    pdf.close()
-    output_pdf.close()
+    import pypdfium2 as pdfium
+    from mineru.utils.pdfium_guard import pdfium_lock
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        output_pdf = pdfium.PdfDocument.new()
+        try:
+            end_page_id = get_end_page_id(end_page_id, len(pdf))
+
+            # 逐页导入,失败则跳过
+            output_index = 0
+            for page_index in range(start_page_id, end_page_id + 1):
+                try:
+                    output_pdf.import_pages(pdf, pages=[page_index])
+                    output_index += 1
+                except Exception as page_error:
+                    output_pdf.del_page(output_index)
+                    logger.warning(f"Failed to import page {page_index}: {page_error}, skipping this page.")
+                    continue
+
+            # 将新PDF保存到内存缓冲区
+            output_buffer = io.BytesIO()
+            output_pdf.save(output_buffer)
+
+            # 获取字节数据
+            output_bytes = output_buffer.getvalue()
+        except Exception as e:
+            logger.warning(f"Error in converting PDF bytes: {e}, Using original PDF bytes.")
+            output_bytes = pdf_bytes
+        pdf.close()
+        output_pdf.close()
     return output_bytes
 
 
 def _prepare_pdf_bytes(pdf_bytes_list, start_page_id, end_page_id):
-    """准备处理PDF字节数据"""
+    """准备处理PDF字节数据，图片输入只截取多帧图片的帧"""
+    from mineru.utils.pdf_image_tools import is_pdf_bytes, slice_image_frames
+
     result = []
     for pdf_bytes in pdf_bytes_list:
-        new_pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
+        if is_pdf_bytes(pdf_bytes):
+            new_pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
+        else:
+            new_pdf_bytes = slice_image_frames(pdf_bytes, start_page_id, end_page_id)
         result.append(new_pdf_bytes)
     return result
 
@@ -108,16 +123,28 @@ def _process_output(
         f_make_md_mode,
         middle_json,
         model_output=None,
-        is_pipeline=True
+        is_pipeline=True,
+        image_writer=None,
+        image_dir=None,
 ):
     f_draw_line_sort_bbox = False
     from mineru.backend.pipeline.pipeline_middle_json_mkcontent import union_make as pipeline_union_make
-    """处理输出文件"""
+    from mineru.utils.pdf_image_tools import is_pdf_bytes, images_bytes_to_pdf_bytes
+    """处理输出文件，返回提交的后台可视化任务，由调用方用wait_draw_tasks等待"""
+    draw_tasks = []
+    if (f_draw_layout_bbox or f_draw_span_bbox or f_dump_orig_pdf) and not is_pdf_bytes(pdf_bytes):
+        # 图片输入只在可视化和保存原文件时转换为pdf，页面尺寸与解析时一致
+        pdf_bytes = images_bytes_to_pdf_bytes(pdf_bytes)
+
     if f_draw_layout_bbox:
-        draw_layout_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf")
+        draw_tasks.append(
+            submit_draw_task(draw_layout_bbox, pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf")
+        )
 
     if f_draw_span_bbox:
-        draw_span_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
+        draw_tasks.append(
+            submit_draw_task(draw_span_bbox, pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
+        )
 
     if f_dump_orig_pdf:
         md_writer.write(
@@ -126,9 +153,12 @@ def _process_output(
         )
 
     if f_draw_line_sort_bbox:
-        draw_line_sort_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_line_sort.pdf")
+        draw_tasks.append(
+            submit_draw_task(draw_line_sort_bbox, pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_line_sort.pdf")
+        )
 
-    image_dir = str(os.path.basename(local_image_dir))
+    if image_dir is None:
+        image_dir = str(os.path.basename(local_image_dir))
 
     if f_dump_md:
         if is_pipeline:
@@ -157,24 +187,24 @@ def _process_output(
             except ImportError:
                 raise ImportError("VLM backend is not available. Please install VLM dependencies or use pipeline backend.")
         content_list = make_func(pdf_info, MakeMode.CONTENT_LIST, image_dir)
-        md_writer.write_string(
+        # 逐条编码写入，结果与json.dumps(content_list, ensure_ascii=False, indent=4)一致
+        md_writer.write_chunks(
             f"{pdf_file_name}_content_list.json",
-            json.dumps(content_list, ensure_ascii=False, indent=4),
+            iter_dump_chunks(content_list, 'json'),
         )
 
     if f_dump_middle_json:
-        md_writer.write_string(
-            f"{pdf_file_name}_middle.json",
-            json.dumps(middle_json, ensure_ascii=False, indent=4),
-        )
+        dump_json_output(md_writer, f"{pdf_file_name}_middle", middle_json)
 
     if f_dump_model_output:
-        md_writer.write_string(
-            f"{pdf_file_name}_model.json",
-            json.dumps(model_output, ensure_ascii=False, indent=4),
-        )
+        dump_json_output(md_writer, f"{pdf_file_name}_model", model_output)
+
+    if isinstance(image_writer, AsyncImageWriter):
+        # 等待后台的图片编码和写入全部完成
+        image_writer.close()
 
     logger.info(f"local output dir is {local_md_dir}")
+    return draw_tasks
 
 
 def _process_pipeline(
@@ -194,7 +224,7 @@ def _process_pipeline(
         f_dump_content_list,
         f_make_md_mode,
 ):
-    """处理pipeline后端逻辑"""
+    """处理pipeline后端逻辑，返回提交的后台可视化任务"""
     from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json
     from mineru.backend.pipeline.pipeline_analyze import doc_analyze as pipeline_doc_analyze
 
@@ -205,31 +235,372 @@ def _process_pipeline(
         )
     )
 
+    draw_tasks = []
     for idx, model_list in enumerate(infer_results):
-        model_json = copy.deepcopy(model_list)
         pdf_file_name = pdf_file_names[idx]
         local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
-        image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
+        md_writer = FileBasedDataWriter(local_md_dir)
 
-        images_list = all_image_lists[idx]
-        pdf_doc = all_pdf_docs[idx]
-        _lang = lang_list[idx]
-        _ocr_enable = ocr_enabled_list[idx]
+        # 失败时也写完已提交的图片并释放线程池
+        with AsyncImageWriter(FileBasedDataWriter(local_image_dir)) as image_writer:
+            # model_list会在生成middle_json时被修改，先把模型输出写出，避免整份deepcopy
+            if f_dump_model_output:
+                dump_json_output(md_writer, f"{pdf_file_name}_model", model_list)
 
-        middle_json = pipeline_result_to_middle_json(
-            model_list, images_list, pdf_doc, image_writer,
-            _lang, _ocr_enable, p_formula_enable
-        )
+            images_list = all_image_lists[idx]
+            pdf_doc = all_pdf_docs[idx]
+            _lang = lang_list[idx]
+            _ocr_enable = ocr_enabled_list[idx]
 
-        pdf_info = middle_json["pdf_info"]
-        pdf_bytes = pdf_bytes_list[idx]
+            middle_json = pipeline_result_to_middle_json(
+                model_list, images_list, pdf_doc, image_writer,
+                _lang, _ocr_enable, p_formula_enable
+            )
 
-        _process_output(
-            pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
+            pdf_info = middle_json["pdf_info"]
+            pdf_bytes = pdf_bytes_list[idx]
+
+            draw_tasks += _process_output(
+                pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
+                md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
+                f_dump_md, f_dump_content_list, f_dump_middle_json, False,
+                f_make_md_mode, middle_json, is_pipeline=True, image_writer=image_writer
+            )
+    return draw_tasks
+
+
+async def _async_process_pipeline(
+        output_dir,
+        pdf_file_names,
+        pdf_bytes_list,
+        p_lang_list,
+        parse_method,
+        p_formula_enable,
+        p_table_enable,
+        f_draw_layout_bbox,
+        f_draw_span_bbox,
+        f_dump_md,
+        f_dump_middle_json,
+        f_dump_model_output,
+        f_dump_orig_pdf,
+        f_dump_content_list,
+        f_make_md_mode,
+):
+    """异步处理pipeline后端逻辑，各文档并发处理，任一文档失败或被取消时取消其余文档，返回提交的后台可视化任务"""
+    tasks = [
+        asyncio.ensure_future(_async_process_pipeline_doc(
+            output_dir, pdf_file_names[idx], pdf_bytes, p_lang_list[idx],
+            parse_method, p_formula_enable, p_table_enable,
+            f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
+            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode
+        ))
+        for idx, pdf_bytes in enumerate(pdf_bytes_list)
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+        return [draw_task for draw_tasks in results for draw_task in draw_tasks]
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _async_process_pipeline_doc(
+        output_dir,
+        pdf_file_name,
+        pdf_bytes,
+        p_lang,
+        parse_method,
+        p_formula_enable,
+        p_table_enable,
+        f_draw_layout_bbox,
+        f_draw_span_bbox,
+        f_dump_md,
+        f_dump_middle_json,
+        f_dump_model_output,
+        f_dump_orig_pdf,
+        f_dump_content_list,
+        f_make_md_mode,
+):
+    from mineru.backend.pipeline.model_json_to_middle_json import (
+        build_page_infos, finish_middle_json, get_post_ocr_spans, post_ocr
+    )
+    from mineru.backend.pipeline.pipeline_analyze import aio_doc_analyze as aio_pipeline_doc_analyze
+    from mineru.utils.pdfium_guard import close_pdf_doc
+
+    model_list, images_list, pdf_doc, _ocr_enable = await aio_pipeline_doc_analyze(
+        pdf_bytes, p_lang, parse_method=parse_method,
+        formula_enable=p_formula_enable, table_enable=p_table_enable
+    )
+
+    image_writer = None
+    try:
+        local_image_dir, local_md_dir = await run_in_cpu_executor(prepare_env, output_dir, pdf_file_name, parse_method)
+        image_writer = AsyncImageWriter(FileBasedDataWriter(local_image_dir))
+        md_writer = FileBasedDataWriter(local_md_dir)
+
+        # model_list会在生成middle_json时被修改，先把模型输出写出，避免整份deepcopy
+        if f_dump_model_output:
+            await run_in_cpu_executor(dump_json_output, md_writer, f"{pdf_file_name}_model", model_list)
+
+        # 文本提取、切图等CPU工作在CPU线程池中执行，只有对无法提取文本的span做ocr时占用模型线程池
+        middle_json = await run_in_cpu_executor(
+            build_page_infos, model_list, images_list, pdf_doc, image_writer, _ocr_enable, p_formula_enable
+        )
+        if get_post_ocr_spans(middle_json["pdf_info"]):
+            await run_in_model_executor(post_ocr, middle_json["pdf_info"], p_lang)
+        await run_in_cpu_executor(finish_middle_json, middle_json, pdf_doc, len(model_list))
+
+        return await run_in_cpu_executor(
+            _process_output,
+            middle_json["pdf_info"], pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
-            f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
-            f_make_md_mode, middle_json, model_json, is_pipeline=True
+            f_dump_md, f_dump_content_list, f_dump_middle_json, False,
+            f_make_md_mode, middle_json, is_pipeline=True, image_writer=image_writer
+        )
+    except BaseException:
+        # 被取消或失败时在后台写完已提交的图片、释放线程池并关闭pdf(result_to_middle_json未执行时pdf仍打开)，
+        # 关闭pdf需要等待pdfium锁，不在事件循环中执行
+        if image_writer is not None:
+            get_cpu_executor().submit(image_writer.close)
+        get_cpu_executor().submit(close_pdf_doc, pdf_doc)
+        raise
+
+
+def do_remake(
+        json_path,
+        output_dir=None,
+        pdf_file_name=None,
+        pdf_bytes=None,
+        parse_method="auto",
+        p_lang="ch",
+        formula_enable=True,
+        resplit=False,
+        post_ocr_enable=False,
+        table_merge_enable=None,
+        image_dir=None,
+        f_draw_layout_bbox=False,
+        f_draw_span_bbox=False,
+        f_dump_md=True,
+        f_dump_middle_json=False,
+        f_dump_content_list=True,
+        f_make_md_mode=MakeMode.MM_MD,
+):
+    """不重新推理，由已保存的middle_json或model_json(需提供pdf)重新生成markdown、content_list等输出
+
+    Args:
+        json_path: 已保存的 xxx_middle.json 或 xxx_model.json，支持MINERU_MIDDLE_JSON_FORMAT的所有格式
+        output_dir: 输出目录，默认为json_path所在目录，结果直接写入该目录
+        pdf_file_name: 输出文件名前缀，默认由json_path去掉_middle/_model后缀得到
+        pdf_bytes: 与json对应的pdf，默认读取同目录下的 xxx_origin.pdf，
+            由model_json生成或需要输出bbox可视化时必须存在
+        parse_method: 由model_json生成时使用，决定是否按ocr模式处理，auto会重新对pdf分类
+        p_lang: 由model_json生成且开启post_ocr_enable时ocr模型使用的语言
+        formula_enable: 由model_json生成时是否保留公式
+        resplit: 由middle_json的preproc_blocks重新执行分段、表格跨页合并和标题优化
+        post_ocr_enable: 由model_json生成时是否加载ocr模型识别无法提取文本的span，默认置空以避免加载模型，
+            由model_json生成时阅读顺序仍需要layoutreader模型，由middle_json生成时不加载任何模型
+        table_merge_enable: resplit或由model_json生成时是否执行表格跨页合并，None时由MINERU_TABLE_MERGE_ENABLE决定
+        image_dir: markdown和content_list中引用图片的路径，默认为images
+    """
+    from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json, \
+        cross_page_process
+
+    json_path = Path(json_path)
+    if output_dir is None:
+        output_dir = str(json_path.parent)
+    if pdf_file_name is None:
+        pdf_file_name = _remake_file_stem(json_path)
+    if pdf_bytes is None:
+        origin_pdf_path = json_path.parent / f"{pdf_file_name}_origin.pdf"
+        if origin_pdf_path.exists():
+            pdf_bytes = origin_pdf_path.read_bytes()
+
+    with MiddleJsonReader(json_path) as reader:
+        data = reader.load()
+
+    local_md_dir = str(output_dir)
+    local_image_dir = os.path.join(local_md_dir, "images")
+    os.makedirs(local_md_dir, exist_ok=True)
+    md_writer = FileBasedDataWriter(local_md_dir)
+    image_writer = None
+
+    if isinstance(data, list):
+        # model_json，需要由pdf重新切图
+        if pdf_bytes is None:
+            raise ValueError(f"Remaking from model json requires the source pdf: {json_path}")
+        from mineru.utils.enum_class import ImageType
+        from mineru.utils.pdf_classify import classify
+        from mineru.utils.pdf_image_tools import load_images_from_pdf
+
+        if parse_method == "auto":
+            ocr_enable = classify(pdf_bytes) == "ocr"
+        else:
+            ocr_enable = parse_method == "ocr"
+        from mineru.utils.pdfium_guard import close_pdf_doc
+
+        images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL)
+        if len(images_list) != len(data):
+            close_pdf_doc(pdf_doc)
+            raise ValueError(
+                f"The pdf has {len(images_list)} pages but the model json has {len(data)} pages: {json_path}"
+            )
+        os.makedirs(local_image_dir, exist_ok=True)
+        with AsyncImageWriter(FileBasedDataWriter(local_image_dir)) as image_writer:
+            middle_json = pipeline_result_to_middle_json(
+                data, images_list, pdf_doc, image_writer,
+                p_lang, ocr_enable, formula_enable, post_ocr_enable=post_ocr_enable,
+                table_merge_enable=table_merge_enable,
+            )
+    else:
+        middle_json = data
+        if resplit:
+            if middle_json.get("_backend", "pipeline") == "pipeline":
+                cross_page_process(middle_json["pdf_info"], table_merge_enable)
+            else:
+                logger.warning(f"resplit only supports pipeline middle json, skip: {json_path}")
+
+    if (f_draw_layout_bbox or f_draw_span_bbox) and pdf_bytes is None:
+        logger.warning(f"{pdf_file_name}_origin.pdf not found, skip drawing bbox")
+        f_draw_layout_bbox = f_draw_span_bbox = False
+
+    draw_tasks = _process_output(
+        middle_json["pdf_info"], pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
+        md_writer, f_draw_layout_bbox, f_draw_span_bbox, False,
+        f_dump_md, f_dump_content_list, f_dump_middle_json, False,
+        f_make_md_mode, middle_json, is_pipeline=middle_json.get("_backend", "pipeline") == "pipeline",
+        image_writer=image_writer, image_dir=image_dir,
+    )
+    wait_draw_tasks(draw_tasks)
+    return middle_json
+
+
+def _remake_file_stem(json_path):
+    name = Path(json_path).name
+    for suffix in sorted(set(MIDDLE_JSON_FORMATS.values()), key=len, reverse=True):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    for tag in ("_middle", "_model"):
+        if name.endswith(tag):
+            return name[:-len(tag)]
+    return name
+
+
+RANGE_DIR_NAME = ".ranges"
+
+
+def do_parse_range(
+        output_dir,
+        pdf_file_name,
+        pdf_bytes,
+        p_lang="ch",
+        parse_method="auto",
+        ocr_enable=False,
+        formula_enable=True,
+        table_enable=True,
+        start_page_id=0,
+        end_page_id=None,
+        page_id_offset=0,
+        f_dump_model_output=True,
+):
+    """解析pdf的一段页面，用于把一个大文档拆分给多个进程解析，由merge_range_outputs合并
+
+    图片直接写入最终输出目录的images中，page_idx和图片文件名按整个文档的页码生成，
+    该段的middle_json不做分段、表格跨页合并等跨页处理，写入输出目录的.ranges中
+
+    Args:
+        pdf_bytes: 完整的pdf，按start_page_id/end_page_id截取需要解析的一段
+        parse_method: 最终输出目录使用的解析方法
+        ocr_enable: 对整个文档分类的结果，各段不再单独分类
+        page_id_offset: start_page_id这一页在最终结果中的页码
+    """
+    from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json
+    from mineru.backend.pipeline.pipeline_analyze import doc_analyze as pipeline_doc_analyze
+
+    pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
+    infer_results, all_image_lists, all_pdf_docs, lang_list, _ = pipeline_doc_analyze(
+        [pdf_bytes], [p_lang], parse_method="ocr" if ocr_enable else "txt",
+        formula_enable=formula_enable, table_enable=table_enable
+    )
+    model_list = infer_results[0]
+
+    local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
+    range_dir = os.path.join(local_md_dir, RANGE_DIR_NAME)
+    os.makedirs(range_dir, exist_ok=True)
+    range_writer = FileBasedDataWriter(range_dir)
+    range_file_stem = f"{pdf_file_name}_{page_id_offset}"
+
+    if f_dump_model_output:
+        dump_json_output(range_writer, f"{range_file_stem}_model", [
+            dict(page_model_info, page_info=dict(page_model_info["page_info"], page_no=page_index + page_id_offset))
+            for page_index, page_model_info in enumerate(model_list)
+        ])
+
+    with AsyncImageWriter(FileBasedDataWriter(local_image_dir)) as image_writer:
+        middle_json = pipeline_result_to_middle_json(
+            model_list, all_image_lists[0], all_pdf_docs[0], image_writer,
+            lang_list[0], ocr_enable, formula_enable,
+            page_id_offset=page_id_offset, cross_page_enable=False,
         )
+    dump_json_output(range_writer, f"{range_file_stem}_middle", middle_json)
+
+
+def merge_range_outputs(
+        output_dir,
+        pdf_file_name,
+        pdf_bytes,
+        page_id_offsets,
+        parse_method="auto",
+        f_draw_layout_bbox=True,
+        f_draw_span_bbox=True,
+        f_dump_md=True,
+        f_dump_middle_json=True,
+        f_dump_model_output=True,
+        f_dump_orig_pdf=True,
+        f_dump_content_list=True,
+        f_make_md_mode=MakeMode.MM_MD,
+):
+    """按页码顺序合并do_parse_range的各段结果，对整个文档执行分段、表格跨页合并和标题优化后生成输出
+
+    Args:
+        pdf_bytes: 已按start_page_id/end_page_id截取的整个文档
+        page_id_offsets: 各段的page_id_offset
+    """
+    from mineru.backend.pipeline.model_json_to_middle_json import cross_page_process
+
+    local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
+    range_dir = os.path.join(local_md_dir, RANGE_DIR_NAME)
+    file_suffix = MIDDLE_JSON_FORMATS[get_middle_json_format()]
+
+    middle_json, model_list = None, []
+    for page_id_offset in sorted(page_id_offsets):
+        range_file_stem = os.path.join(range_dir, f"{pdf_file_name}_{page_id_offset}")
+        with MiddleJsonReader(f"{range_file_stem}_middle{file_suffix}") as reader:
+            range_middle_json = reader.load()
+        if middle_json is None:
+            middle_json = range_middle_json
+        else:
+            middle_json["pdf_info"].extend(range_middle_json["pdf_info"])
+        if f_dump_model_output:
+            with MiddleJsonReader(f"{range_file_stem}_model{file_suffix}") as reader:
+                model_list.extend(reader.load())
+
+    cross_page_process(middle_json["pdf_info"])
+
+    md_writer = FileBasedDataWriter(local_md_dir)
+    if f_dump_model_output:
+        dump_json_output(md_writer, f"{pdf_file_name}_model", model_list)
+    draw_tasks = _process_output(
+        middle_json["pdf_info"], pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
+        md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
+        f_dump_md, f_dump_content_list, f_dump_middle_json, False,
+        f_make_md_mode, middle_json, is_pipeline=True,
+    )
+    wait_draw_tasks(draw_tasks)
+    shutil.rmtree(range_dir, ignore_errors=True)
+    return middle_json
 
 
 async def _async_process_vlm(
@@ -271,12 +642,12 @@ async def _async_process_vlm(
 
         pdf_info = middle_json["pdf_info"]
 
-        _process_output(
+        wait_draw_tasks(_process_output(
             pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
             f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
             f_make_md_mode, middle_json, infer_result, is_pipeline=False
-        )
+        ))
 
 
 def _process_vlm(
@@ -318,12 +689,12 @@ def _process_vlm(
 
         pdf_info = middle_json["pdf_info"]
 
-        _process_output(
+        wait_draw_tasks(_process_output(
             pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
             f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
             f_make_md_mode, middle_json, infer_result, is_pipeline=False
-        )
+        ))
 
 
 def do_parse(
@@ -352,12 +723,15 @@ def do_parse(
     pdf_bytes_list = _prepare_pdf_bytes(pdf_bytes_list, start_page_id, end_page_id)
 
     if backend == "pipeline":
-        _process_pipeline(
+        draw_tasks = _process_pipeline(
             output_dir, pdf_file_names, pdf_bytes_list, p_lang_list,
             parse_method, formula_enable, table_enable,
             f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
             f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode
         )
+        # 等待本次提交的后台可视化文件生成完毕
+        wait_draw_tasks(draw_tasks)
+        log_formula_cache_summary()
     else:
         # 此版本仅支持Pipeline后端，不支持VLM后端
         raise ValueError(
@@ -390,16 +764,18 @@ async def aio_do_parse(
         **kwargs,
 ):
     # 预处理PDF字节数据
-    pdf_bytes_list = _prepare_pdf_bytes(pdf_bytes_list, start_page_id, end_page_id)
+    pdf_bytes_list = await run_in_cpu_executor(_prepare_pdf_bytes, pdf_bytes_list, start_page_id, end_page_id)
 
     if backend == "pipeline":
-        # pipeline模式暂不支持异步，使用同步处理方式
-        _process_pipeline(
+        draw_tasks = await _async_process_pipeline(
             output_dir, pdf_file_names, pdf_bytes_list, p_lang_list,
             parse_method, formula_enable, table_enable,
             f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
             f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode
         )
+        # 等待本次提交的后台可视化文件生成完毕
+        await run_in_cpu_executor(wait_draw_tasks, draw_tasks)
+        log_formula_cache_summary()
     else:
         # 此版本仅支持Pipeline后端，不支持VLM后端
         raise ValueError(
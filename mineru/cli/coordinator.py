@@ -0,0 +1,462 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from mineru.utils.guess_suffix_or_lang import guess_suffix_by_path
+from mineru.utils.pdf_page_id import get_end_page_id
+from .ingest import count_pages
+
+
+@dataclass
+class ParseTask:
+    index: int
+    path: str
+    name: str
+    pages: int
+    start_page_id: int = 0
+    end_page_id: int | None = None
+    attempts: int = 0
+    # 拆分大文档时的一段页面：page_id_offset为该段第一页在结果中的页码，ocr_enable为整个文档的分类结果
+    doc_index: int | None = None
+    page_id_offset: int | None = None
+    ocr_enable: bool = False
+
+
+@dataclass
+class TaskResult:
+    name: str
+    path: str
+    status: str = 'pending'
+    error: str | None = None
+    elapsed: float = 0.0
+    worker: int | None = None
+    attempts: int = 0
+    pages: int | None = None
+
+
+def parse_cpu_sets(spec: str | None, workers: int) -> list:
+    """解析每个worker绑定的CPU核，"0-3;4-7"按分号分隔每个worker的核，auto把当前可用的核平均分给各worker"""
+    if not spec:
+        return [None] * workers
+    if spec == 'auto':
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+        if len(cpus) < workers:
+            return [None] * workers
+        size = len(cpus) // workers
+        return [set(cpus[i * size:(i + 1) * size]) for i in range(workers)]
+    cpu_sets = []
+    for part in spec.split(';'):
+        cpus = set()
+        for item in part.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if '-' in item:
+                first, last = item.split('-')
+                cpus.update(range(int(first), int(last) + 1))
+            else:
+                cpus.add(int(item))
+        cpu_sets.append(cpus or None)
+    return [cpu_sets[i % len(cpu_sets)] for i in range(workers)]
+
+
+def _worker_main(worker_id, device, cpus, output_dir, lang, parse_kwargs, task_queue, result_conn):
+    # worker及其启动的子进程放在单独的进程组中，worker异常退出时由协调器清理整个进程组
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    # 在导入torch之前设置设备和线程数，每个worker进程持有一份独立的模型
+    if device:
+        os.environ['MINERU_DEVICE_MODE'] = device
+    if cpus:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        for env_name in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS']:
+            os.environ[env_name] = str(len(cpus))
+
+    from .common import do_parse, do_parse_range, read_fn
+    from mineru.utils.draw_bbox import shutdown_draw_executor
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            shutdown_draw_executor()
+            break
+        start_time = time.time()
+        error = None
+        try:
+            if task.page_id_offset is None:
+                do_parse(
+                    output_dir=output_dir,
+                    pdf_file_names=[task.name],
+                    pdf_bytes_list=[read_fn(task.path, image_to_pdf=False)],
+                    p_lang_list=[lang],
+                    start_page_id=task.start_page_id,
+                    end_page_id=task.end_page_id,
+                    **parse_kwargs,
+                )
+            else:
+                do_parse_range(
+                    output_dir,
+                    task.name,
+                    read_fn(task.path),
+                    p_lang=lang,
+                    parse_method=parse_kwargs.get('parse_method', 'auto'),
+                    ocr_enable=task.ocr_enable,
+                    formula_enable=parse_kwargs.get('formula_enable', True),
+                    table_enable=parse_kwargs.get('table_enable', True),
+                    start_page_id=task.start_page_id,
+                    end_page_id=task.end_page_id,
+                    page_id_offset=task.page_id_offset,
+                    f_dump_model_output=parse_kwargs.get('f_dump_model_output', True),
+                )
+        except Exception as e:
+            logger.exception(e)
+            error = f"{type(e).__name__}: {e}"
+        result_conn.send((task.index, error, time.time() - start_time))
+
+
+class _WorkerSlot:
+    def __init__(self, worker_id, device, cpus):
+        self.worker_id = worker_id
+        self.device = device
+        self.cpus = cpus
+        self.process = None
+        self.task_queue = None
+        # 每个worker单独的结果管道：worker在写入时被杀死只会损坏自己的管道，重启时整个丢弃
+        self.result_conn = None
+        # task index -> 任务页数
+        self.inflight = {}
+
+    @property
+    def load(self) -> int:
+        return sum(self.inflight.values())
+
+
+class ParseCoordinator:
+    def __init__(
+            self,
+            output_dir: str,
+            lang: str,
+            parse_kwargs: dict,
+            workers: int = 2,
+            devices: list | None = None,
+            cpu_sets: list | None = None,
+            max_inflight: int = 2,
+            max_retries: int = 1,
+    ) -> None:
+        """多进程解析的协调器，每个worker进程加载一份模型，任务按页数分配给负载最小的worker
+
+        worker异常退出时重启该worker，其未完成的任务重新分配，
+        同一任务导致worker退出超过max_retries次后记为失败，避免反复崩溃
+
+        Args:
+            output_dir (str): 输出目录
+            lang (str): 文档语言
+            parse_kwargs (dict): 传给do_parse的其余参数
+            workers (int): worker进程数
+            devices (list): 每个worker使用的设备，数量不足时循环使用
+            cpu_sets (list): 每个worker绑定的CPU核集合
+            max_inflight (int): 每个worker同时持有的任务数，大于1时worker处理完一个任务后无需等待分配
+            max_retries (int): 任务因worker退出而重试的次数
+        """
+        self.output_dir = output_dir
+        self.lang = lang
+        self.parse_kwargs = parse_kwargs
+        self.max_inflight = max(1, max_inflight)
+        self.max_retries = max(0, max_retries)
+        devices = devices or [None]
+        cpu_sets = cpu_sets or [None] * workers
+        self._slots = [
+            _WorkerSlot(worker_id, devices[worker_id % len(devices)], cpu_sets[worker_id])
+            for worker_id in range(max(1, workers))
+        ]
+        # spawn启动的worker不继承父进程中已初始化的CUDA等状态
+        self._context = multiprocessing.get_context('spawn')
+
+    # worker进程的入口，需要能被spawn启动的子进程按名字导入
+    worker_main = staticmethod(_worker_main)
+
+    def _start_worker(self, slot: _WorkerSlot) -> None:
+        if slot.result_conn is not None:
+            slot.result_conn.close()
+        slot.task_queue = self._context.Queue()
+        slot.inflight = {}
+        slot.result_conn, result_writer = self._context.Pipe(duplex=False)
+        slot.process = self._context.Process(
+            target=self.worker_main,
+            args=(
+                slot.worker_id, slot.device, slot.cpus, self.output_dir, self.lang,
+                self.parse_kwargs, slot.task_queue, result_writer,
+            ),
+            name=f"mineru-worker-{slot.worker_id}",
+            # worker内部渲染pdf时还会启动子进程，不能设为daemon，由_stop_workers负责退出
+            daemon=False,
+        )
+        slot.process.start()
+        # 只有worker持有写端，worker退出后读端能读到EOF
+        result_writer.close()
+        logger.info(
+            f"worker {slot.worker_id} started (pid {slot.process.pid}, device {slot.device or 'default'}"
+            f"{', cpus ' + str(sorted(slot.cpus)) if slot.cpus else ''})"
+        )
+
+    def _stop_workers(self) -> None:
+        for slot in self._slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.task_queue.put(None)
+        for slot in self._slots:
+            if slot.process is None:
+                continue
+            slot.process.join(timeout=30)
+            if slot.process.is_alive():
+                slot.process.terminate()
+                slot.process.join()
+            self._kill_process_group(slot)
+            slot.result_conn.close()
+
+    @staticmethod
+    def _kill_process_group(slot: _WorkerSlot) -> None:
+        if not hasattr(os, 'killpg'):
+            return
+        try:
+            os.killpg(slot.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    @staticmethod
+    def _receive(slot: _WorkerSlot) -> list:
+        """读出worker已经写入的全部结果"""
+        messages = []
+        try:
+            while slot.result_conn.poll():
+                messages.append(slot.result_conn.recv())
+        except (EOFError, OSError):
+            # worker已退出，最后一条结果可能只写了一半
+            pass
+        return messages
+
+    def run(self, tasks: list[ParseTask], on_task_done=None) -> list[TaskResult]:
+        """执行全部任务，返回与tasks顺序一致的结果
+
+        Args:
+            on_task_done: 每个任务结束时在当前进程中调用on_task_done(task, result)
+        """
+        results = {task.index: TaskResult(task.name, task.path) for task in tasks}
+        # 页数多的任务先分配，减少最后只剩一个大任务在运行的情况
+        pending = sorted(tasks, key=lambda task: -task.pages)
+        task_by_index = {task.index: task for task in tasks}
+        remaining = len(tasks)
+
+        def finish(index, worker_id, error, elapsed=0.0):
+            nonlocal remaining
+            result = results[index]
+            result.status = 'failed' if error else 'ok'
+            result.error, result.elapsed, result.worker = error, elapsed, worker_id
+            result.attempts = task_by_index[index].attempts
+            remaining -= 1
+            if on_task_done is not None:
+                on_task_done(task_by_index[index], result)
+
+        def collect(slot):
+            for index, error, elapsed in self._receive(slot):
+                if index in slot.inflight:
+                    del slot.inflight[index]
+                    finish(index, slot.worker_id, error, elapsed)
+
+        for slot in self._slots:
+            self._start_worker(slot)
+        try:
+            while remaining > 0:
+                while pending:
+                    available = [slot for slot in self._slots if len(slot.inflight) < self.max_inflight]
+                    if not available:
+                        break
+                    slot = min(available, key=lambda s: (s.load, len(s.inflight)))
+                    task = pending.pop(0)
+                    task.attempts += 1
+                    slot.inflight[task.index] = task.pages
+                    slot.task_queue.put(task)
+
+                multiprocessing.connection.wait(
+                    [slot.result_conn for slot in self._slots] + [slot.process.sentinel for slot in self._slots],
+                    timeout=1,
+                )
+                for slot in self._slots:
+                    collect(slot)
+
+                for slot in self._slots:
+                    if slot.process.is_alive():
+                        continue
+                    # 退出前写完的结果仍然有效
+                    collect(slot)
+                    exitcode = slot.process.exitcode
+                    logger.warning(f"worker {slot.worker_id} exited with code {exitcode}, restarting")
+                    self._kill_process_group(slot)
+                    for position, index in enumerate(slot.inflight):
+                        task = task_by_index[index]
+                        if position > 0:
+                            # worker按顺序处理任务，只有第一个任务正在执行，其余任务不计入重试次数
+                            task.attempts -= 1
+                        if task.attempts > self.max_retries:
+                            finish(index, slot.worker_id, f"worker exited with code {exitcode}")
+                        else:
+                            pending.insert(0, task)
+                    self._start_worker(slot)
+        finally:
+            self._stop_workers()
+
+        return [results[task.index] for task in sorted(tasks, key=lambda task: task.index)]
+
+
+def _split_doc(path, doc_index, name, start_page_id, end_page_id, split_pages, parse_method, task_index):
+    """把页数超过split_pages的pdf拆分为多段，不需要拆分时返回None
+
+    各段使用整个文档的分类结果，避免各段单独判断是否ocr导致结果与整体解析不一致
+    """
+    page_count = count_pages(path)
+    end_page_id = get_end_page_id(end_page_id, page_count)
+    if not split_pages or end_page_id - start_page_id + 1 <= split_pages:
+        return None
+    if parse_method == 'auto':
+        from mineru.utils.pdf_classify import classify
+        from .common import read_fn, convert_pdf_bytes_to_bytes_by_pypdfium2
+        ocr_enable = classify(convert_pdf_bytes_to_bytes_by_pypdfium2(read_fn(path), start_page_id, end_page_id)) == 'ocr'
+    else:
+        ocr_enable = parse_method == 'ocr'
+    tasks = []
+    for range_start in range(start_page_id, end_page_id + 1, split_pages):
+        range_end = min(range_start + split_pages - 1, end_page_id)
+        tasks.append(ParseTask(
+            task_index + len(tasks), str(path), name, range_end - range_start + 1, range_start, range_end,
+            doc_index=doc_index, page_id_offset=range_start - start_page_id, ocr_enable=ocr_enable,
+        ))
+    return tasks
+
+
+def run_parse_tasks(
+        doc_path_list: list,
+        output_dir: str,
+        lang: str,
+        parse_kwargs: dict,
+        start_page_id: int = 0,
+        end_page_id: int | None = None,
+        workers: int = 2,
+        devices: list | None = None,
+        cpu_sets: str | None = None,
+        split_pages: int = 0,
+) -> list[TaskResult]:
+    """把文档分配给多个worker进程解析，返回与doc_path_list顺序一致的结果
+
+    页数超过split_pages的pdf按页码拆分为多段并行解析，全部完成后合并各段的middle_json，
+    再对整个文档执行分段、表格跨页合并和标题优化，输出与不拆分时相同
+    """
+    doc_results = []
+    tasks = []
+    # doc_index -> 尚未完成的段数
+    range_counts = {}
+    for doc_index, path in enumerate(doc_path_list):
+        name = Path(path).stem
+        doc_results.append(TaskResult(name, str(path)))
+        range_tasks = None
+        if guess_suffix_by_path(path) == 'pdf':
+            try:
+                range_tasks = _split_doc(
+                    path, doc_index, name, start_page_id, end_page_id, split_pages,
+                    parse_kwargs.get('parse_method', 'auto'), len(tasks),
+                )
+            except Exception as e:
+                logger.warning(f"failed to split {path}, parse it as a whole: {e}")
+        if range_tasks:
+            range_counts[doc_index] = len(range_tasks)
+            tasks.extend(range_tasks)
+        else:
+            pages = get_end_page_id(end_page_id, count_pages(path)) - start_page_id + 1
+            tasks.append(ParseTask(
+                len(tasks), str(path), name, max(1, pages), start_page_id, end_page_id, doc_index=doc_index,
+            ))
+        doc_results[-1].pages = sum(task.pages for task in tasks if task.doc_index == doc_index)
+    if not tasks:
+        return []
+
+    # 合并在单独的线程中执行，不阻塞协调器的结果循环(分配任务、检测和重启退出的worker)
+    merge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mineru-merge')
+
+    def merge(task: ParseTask, doc_result: TaskResult, page_id_offsets: list):
+        merge_start = time.time()
+        try:
+            _merge_doc(task.path, task.name, output_dir, parse_kwargs, start_page_id, end_page_id, page_id_offsets)
+            doc_result.status = 'ok'
+        except Exception as e:
+            logger.exception(e)
+            doc_result.status, doc_result.error = 'failed', f"{type(e).__name__}: {e}"
+        doc_result.elapsed += time.time() - merge_start
+
+    def on_task_done(task: ParseTask, result: TaskResult):
+        doc_result = doc_results[task.doc_index]
+        doc_result.elapsed += result.elapsed
+        doc_result.attempts = max(doc_result.attempts, result.attempts)
+        if result.status != 'ok' and doc_result.error is None:
+            doc_result.status, doc_result.error, doc_result.worker = 'failed', result.error, result.worker
+        if task.page_id_offset is None:
+            if doc_result.error is None:
+                doc_result.status, doc_result.worker = 'ok', result.worker
+            return
+        range_counts[task.doc_index] -= 1
+        if range_counts[task.doc_index] > 0:
+            return
+        if doc_result.error is not None:
+            _remove_range_outputs(output_dir, task.name, parse_kwargs)
+            return
+        page_id_offsets = [t.page_id_offset for t in tasks if t.doc_index == task.doc_index]
+        merge_executor.submit(merge, task, doc_result, page_id_offsets)
+
+    workers = max(1, min(workers, len(tasks)))
+    coordinator = ParseCoordinator(
+        output_dir, lang, parse_kwargs,
+        workers=workers, devices=devices, cpu_sets=parse_cpu_sets(cpu_sets, workers),
+    )
+    try:
+        coordinator.run(tasks, on_task_done)
+    finally:
+        merge_executor.shutdown(wait=True)
+    for result in doc_results:
+        if result.status != 'ok':
+            logger.error(f"failed to parse {result.path}: {result.error}")
+    return doc_results
+
+
+def _merge_doc(path, name, output_dir, parse_kwargs, start_page_id, end_page_id, page_id_offsets):
+    from mineru.utils.enum_class import MakeMode
+    from .common import read_fn, convert_pdf_bytes_to_bytes_by_pypdfium2, merge_range_outputs
+
+    merge_range_outputs(
+        output_dir,
+        name,
+        convert_pdf_bytes_to_bytes_by_pypdfium2(read_fn(path), start_page_id, end_page_id),
+        page_id_offsets,
+        parse_method=parse_kwargs.get('parse_method', 'auto'),
+        f_draw_layout_bbox=parse_kwargs.get('f_draw_layout_bbox', True),
+        f_draw_span_bbox=parse_kwargs.get('f_draw_span_bbox', True),
+        f_dump_md=parse_kwargs.get('f_dump_md', True),
+        f_dump_middle_json=parse_kwargs.get('f_dump_middle_json', True),
+        f_dump_model_output=parse_kwargs.get('f_dump_model_output', True),
+        f_dump_orig_pdf=parse_kwargs.get('f_dump_orig_pdf', True),
+        f_dump_content_list=parse_kwargs.get('f_dump_content_list', True),
+        f_make_md_mode=parse_kwargs.get('f_make_md_mode', MakeMode.MM_MD),
+    )
+
+
+def _remove_range_outputs(output_dir, name, parse_kwargs):
+    from .common import RANGE_DIR_NAME
+    shutil.rmtree(
+        os.path.join(output_dir, name, parse_kwargs.get('parse_method', 'auto'), RANGE_DIR_NAME), ignore_errors=True
+    )
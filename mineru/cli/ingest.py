@@ -0,0 +1,100 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from mineru.utils.guess_suffix_or_lang import guess_suffix_by_path
+
+MANIFEST_FILE_NAME = "mineru_manifest.jsonl"
+
+
+def count_pages(path) -> int:
+    """估计文件的页数，用于按页数打包和分配任务，无法读取时按1页计算"""
+    if guess_suffix_by_path(path) != 'pdf':
+        return 1
+    try:
+        import pypdfium2 as pdfium
+        from mineru.utils.pdfium_guard import pdfium_lock
+        with pdfium_lock:
+            pdf = pdfium.PdfDocument(str(path))
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    except Exception:
+        return 1
+
+
+def pack_by_pages(path_list: list, max_pages: int, page_counter=count_pages) -> list:
+    """按文件顺序把文件打包成batch，每个batch的总页数不超过max_pages，超过max_pages的单个文件独占一个batch
+
+    Returns:
+        [(文件路径列表, 各文件页数列表)]
+    """
+    batches = []
+    batch, batch_pages = [], []
+    for path in path_list:
+        pages = page_counter(path)
+        if batch and sum(batch_pages) + pages > max_pages:
+            batches.append((batch, batch_pages))
+            batch, batch_pages = [], []
+        batch.append(path)
+        batch_pages.append(pages)
+    if batch:
+        batches.append((batch, batch_pages))
+    return batches
+
+
+class ParseManifest:
+    def __init__(self, output_dir: str) -> None:
+        """记录每个输入文件解析状态的清单，每行一条json追加写入输出目录，中断后重新运行时跳过已完成的文件
+
+        同一文件有多条记录时以最后一条为准
+        """
+        self.path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 上次运行中断时可能留下不完整的最后一行
+                        continue
+                    self._entries[entry['path']] = entry
+
+    @staticmethod
+    def _key(path) -> str:
+        return str(Path(path).resolve())
+
+    def is_done(self, path, local_md_dir: str) -> bool:
+        """清单中已成功且输出目录仍存在，或没有记录但输出的markdown已存在"""
+        entry = self._entries.get(self._key(path))
+        if entry is not None:
+            return entry['status'] in ['ok', 'skipped'] and os.path.isdir(local_md_dir)
+        return os.path.exists(os.path.join(local_md_dir, f"{Path(path).stem}.md"))
+
+    def record(self, path, status: str, error: str = None, elapsed: float = 0.0, pages: int = None) -> None:
+        entry = {
+            'path': self._key(path),
+            'status': status,
+            'error': error,
+            'elapsed': round(elapsed, 3),
+            'pages': pages,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self._lock:
+            self._entries[entry['path']] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def summary(self, path_list: list) -> dict:
+        summary = {'ok': 0, 'failed': 0, 'skipped': 0}
+        for path in path_list:
+            entry = self._entries.get(self._key(path))
+            if entry is not None and entry['status'] in summary:
+                summary[entry['status']] += 1
+        return summary
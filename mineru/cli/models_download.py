@@ -7,6 +7,7 @@ from loguru import logger
 
 from mineru.utils.enum_class import ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
+from mineru.utils.os_env_config import get_models_manifest_path
 
 
 def download_json(url):
@@ -75,14 +76,42 @@ def download_pipeline_models():
     download_finish_path = ""
     for model_path in model_paths:
         logger.info(f"Downloading model: {model_path}")
-        download_finish_path = auto_download_and_get_model_root_path(model_path, repo_mode='pipeline')
+        download_finish_path = auto_download_and_get_model_root_path(model_path, repo_mode='pipeline', refresh_manifest=True)
     logger.info(f"Pipeline models downloaded successfully to: {download_finish_path}")
+    convert_pipeline_weights(download_finish_path)
     configure_model(download_finish_path, "pipeline")
 
 
+def convert_pipeline_weights(models_root):
+    """把OCR和公式识别的.pth权重转换为safetensors，加载时以内存映射方式读取"""
+    try:
+        from mineru.utils.weights_utils import convert_to_safetensors
+        import safetensors  # noqa: F401
+    except ImportError:
+        logger.warning("safetensors is not installed, skip converting weights to safetensors")
+        return
+
+    # layout和MFD的YOLO权重是pickle保存的完整模型对象，无法转换为safetensors
+    weights_dirs = [ModelPath.pytorch_paddle, ModelPath.unimernet_small, ModelPath.pp_formulanet_plus_m]
+    for weights_dir in weights_dirs:
+        weights_dir = os.path.join(models_root, weights_dir)
+        if not os.path.isdir(weights_dir):
+            continue
+        for file_name in sorted(os.listdir(weights_dir)):
+            if not file_name.endswith('.pth'):
+                continue
+            weights_path = os.path.join(weights_dir, file_name)
+            try:
+                safetensors_path = convert_to_safetensors(weights_path)
+                if safetensors_path:
+                    logger.info(f"Converted {weights_path} to safetensors")
+            except Exception as e:
+                logger.warning(f"Failed to convert {weights_path} to safetensors: {e}")
+
+
 def download_vlm_models():
     """下载VLM模型"""
-    download_finish_path = auto_download_and_get_model_root_path("/", repo_mode='vlm')
+    download_finish_path = auto_download_and_get_model_root_path("/", repo_mode='vlm', refresh_manifest=True)
     logger.info(f"VLM models downloaded successfully to: {download_finish_path}")
     configure_model(download_finish_path, "vlm")
 
@@ -145,6 +174,7 @@ def download_models(model_source, model_type):
         else:
             click.echo(f"Unsupported model type: {model_type}", err=True)
             sys.exit(1)
+        logger.info(f"The models manifest has been updated, the path is: {get_models_manifest_path()}")
 
     except Exception as e:
         logger.exception(f"An error occurred while downloading models: {str(e)}")
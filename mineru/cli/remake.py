@@ -0,0 +1,166 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+import click
+from pathlib import Path
+from loguru import logger
+
+from mineru.utils.enum_class import MakeMode
+from mineru.utils.middle_json_io import MIDDLE_JSON_FORMATS
+from ..version import __version__
+from .common import do_remake
+
+
+def _find_json_files(input_path: Path, source: str):
+    suffixes = tuple(f"_{source}{suffix}" for suffix in set(MIDDLE_JSON_FORMATS.values()))
+    if input_path.is_file():
+        return [input_path]
+    return sorted(path for path in input_path.rglob(f"*_{source}.*") if path.name.endswith(suffixes))
+
+
+@click.command()
+@click.version_option(__version__,
+                      '--version',
+                      '-v',
+                      help='display the version and exit')
+@click.option(
+    '-p',
+    '--path',
+    'input_path',
+    type=click.Path(exists=True),
+    required=True,
+    help='a saved xxx_middle.json / xxx_model.json, or a mineru output directory which is searched recursively',
+)
+@click.option(
+    '-o',
+    '--output',
+    'output_dir',
+    type=click.Path(),
+    help='output local directory, the layout of the input directory is kept. Default is next to the input json. '
+         'Images of --source middle are not copied, use --image-dir to point to them',
+    default=None,
+)
+@click.option(
+    '--source',
+    'source',
+    type=click.Choice(['middle', 'model']),
+    help="""\b
+    which saved json to remake from:
+      middle: xxx_middle.json, no model is loaded.
+      model: xxx_model.json and xxx_origin.pdf, images are cropped again, only the layoutreader
+             model for reading order is loaded, and the ocr model if --post-ocr is set.""",
+    default='middle',
+)
+@click.option(
+    '--md-mode',
+    'md_mode',
+    type=click.Choice([MakeMode.MM_MD, MakeMode.NLP_MD]),
+    help='markdown mode, mm_markdown keeps images and nlp_markdown drops them.',
+    default=MakeMode.MM_MD,
+)
+@click.option(
+    '--image-dir',
+    'image_dir',
+    type=str,
+    help='the image path referenced by markdown and content_list. Default is "images".',
+    default=None,
+)
+@click.option(
+    '--resplit',
+    'resplit',
+    is_flag=True,
+    help='redo paragraph split, cross page table merge and llm aided title from the saved middle json.',
+    default=False,
+)
+@click.option(
+    '--table-merge',
+    'table_merge_enable',
+    type=bool,
+    help='Enable cross page table merge, only takes effect with --resplit or --source model. '
+         'Default follows MINERU_TABLE_MERGE_ENABLE.',
+    default=None,
+)
+@click.option(
+    '-m',
+    '--method',
+    'method',
+    type=click.Choice(['auto', 'txt', 'ocr']),
+    help='the parse method used to produce the model json, only for --source model.',
+    default='auto',
+)
+@click.option(
+    '-l',
+    '--lang',
+    'lang',
+    type=str,
+    help='ocr language for --post-ocr.',
+    default='ch',
+)
+@click.option(
+    '-f',
+    '--formula',
+    'formula_enable',
+    type=bool,
+    help='Enable formula, only for --source model. Default is True.',
+    default=True,
+)
+@click.option(
+    '--post-ocr',
+    'post_ocr_enable',
+    is_flag=True,
+    help='load the ocr model for spans without extractable text, only for --source model.',
+    default=False,
+)
+@click.option(
+    '--dump-middle',
+    'dump_middle_json',
+    is_flag=True,
+    help='also write the regenerated middle json.',
+    default=False,
+)
+@click.option(
+    '--draw',
+    'draw_bbox',
+    is_flag=True,
+    help='also draw the layout and span bbox pdf, requires xxx_origin.pdf.',
+    default=False,
+)
+def main(
+        input_path, output_dir, source, md_mode, image_dir, resplit, table_merge_enable,
+        method, lang, formula_enable, post_ocr_enable, dump_middle_json, draw_bbox,
+):
+    input_path = Path(input_path)
+    json_paths = _find_json_files(input_path, source)
+    if len(json_paths) == 0:
+        logger.warning(f"no {source} json found in {input_path}")
+        return
+
+    failed = 0
+    for json_path in json_paths:
+        doc_output_dir = None
+        if output_dir is not None:
+            relative_dir = json_path.parent.relative_to(input_path) if input_path.is_dir() else Path()
+            doc_output_dir = os.path.join(output_dir, str(relative_dir))
+        try:
+            do_remake(
+                json_path,
+                output_dir=doc_output_dir,
+                parse_method=method,
+                p_lang=lang,
+                formula_enable=formula_enable,
+                resplit=resplit,
+                post_ocr_enable=post_ocr_enable,
+                table_merge_enable=table_merge_enable,
+                image_dir=image_dir,
+                f_draw_layout_bbox=draw_bbox,
+                f_draw_span_bbox=draw_bbox,
+                f_dump_middle_json=dump_middle_json or source == 'model',
+                f_make_md_mode=md_mode,
+            )
+        except Exception as e:
+            failed += 1
+            logger.exception(f"remake {json_path} failed: {e}")
+    logger.info(f"remade {len(json_paths) - failed}/{len(json_paths)} documents")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,582 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+import click
+from loguru import logger
+
+from mineru.utils.config_reader import get_device
+from mineru.utils.guess_suffix_or_lang import guess_suffix_by_bytes
+from mineru.utils.middle_json_io import MiddleJsonReader, MIDDLE_JSON_FORMATS
+from mineru.utils.os_env_config import get_middle_json_format
+from ..version import __version__
+from .common import do_parse, pdf_suffixes, image_suffixes
+
+RETURN_FIELDS = ['md', 'content_list', 'middle_json']
+DEFAULT_RETURN_FIELDS = ['md', 'content_list']
+PARSE_METHODS = ['auto', 'txt', 'ocr']
+LOOPBACK_HOSTS = ['127.0.0.1', 'localhost', '::1']
+
+
+class RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_bool(value, name):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ['true', '1', 'yes']:
+        return True
+    if str(value).lower() in ['false', '0', 'no']:
+        return False
+    raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid value for {name}: {value}")
+
+
+def _parse_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid value for {name}: {value}")
+
+
+def _parse_float(value, name):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid value for {name}: {value}")
+
+
+def sanitize_name(name) -> str:
+    """把请求中的文件名转换为输出目录名：去掉目录和扩展名，拒绝无法作为目录名的结果(如'.'和'..')"""
+    base_name = str(name).replace('\\', '/').rsplit('/', 1)[-1]
+    stem = Path(base_name).stem.strip()
+    if stem in ['', '.', '..'] or any(ord(char) < 32 for char in stem):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid name: {name!r}")
+    return stem
+
+
+def parse_options(params: dict, default_timeout: float) -> dict:
+    """把请求参数转换为解析选项，参数来自json body或上传文件时的query string"""
+    method = params.get('method', 'auto')
+    if method not in PARSE_METHODS:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"method must be one of {PARSE_METHODS}")
+    return_fields = params.get('return', DEFAULT_RETURN_FIELDS)
+    if isinstance(return_fields, str):
+        return_fields = [field.strip() for field in return_fields.split(',') if field.strip()]
+    unknown_fields = set(return_fields) - set(RETURN_FIELDS)
+    if unknown_fields:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"unknown return fields {sorted(unknown_fields)}, choose from {RETURN_FIELDS}")
+    timeout = _parse_float(params.get('timeout', default_timeout), 'timeout')
+    end = params.get('end')
+    return {
+        'lang': params.get('lang', 'ch'),
+        'method': method,
+        'formula': _parse_bool(params.get('formula', True), 'formula'),
+        'table': _parse_bool(params.get('table', True), 'table'),
+        'start': _parse_int(params.get('start', 0), 'start'),
+        'end': _parse_int(end, 'end') if end not in [None, ''] else None,
+        'return': return_fields,
+        'async': _parse_bool(params.get('async', False), 'async'),
+        'timeout': timeout if timeout > 0 else default_timeout,
+    }
+
+
+def check_file_type(file_bytes: bytes, file_name: str = None) -> bytes:
+    """pdf和图片都原样交给do_parse，图片直接解码不经过pdf转换"""
+    suffix = guess_suffix_by_bytes(file_bytes, file_name)
+    if suffix in image_suffixes + pdf_suffixes:
+        return file_bytes
+    raise RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, f"unsupported file type: {suffix}")
+
+
+class ParseJob:
+    def __init__(self, name: str, pdf_bytes: bytes, options: dict, output_dir: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.pdf_bytes = pdf_bytes
+        self.options = options
+        self.output_dir = output_dir
+        # queued -> running -> done/failed，排队中可被取消(cancelled)或超时(expired)
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.deadline = self.created + options['timeout']
+        self.finished = None
+        self.done_event = threading.Event()
+
+    @property
+    def result_dir(self) -> str:
+        return os.path.join(self.output_dir, self.name, self.options['method'])
+
+    def to_dict(self, with_result=True) -> dict:
+        data = {'job_id': self.id, 'status': self.status, 'name': self.name}
+        if self.error is not None:
+            data['error'] = self.error
+        if with_result and self.result is not None:
+            data.update(self.result)
+        return data
+
+
+class ParseService:
+    def __init__(
+            self,
+            work_dir: str,
+            workers: int = 1,
+            queue_size: int = 16,
+            timeout: float = 600,
+            job_ttl: float = 3600,
+    ) -> None:
+        """常驻的解析服务，模型在进程内只加载一次，任务排队后由固定数量的工作线程执行
+
+        Args:
+            work_dir (str): 任务输出目录的根目录
+            workers (int): 同时解析的任务数，并发任务的页面由推理调度器合并成batch，
+                pdfium调用和模型推理在进程内串行执行，多个worker只能重叠文件读写等其余步骤
+            queue_size (int): 排队任务数上限，队列满时拒绝新任务
+            timeout (float): 默认的任务超时时间(秒)
+            job_ttl (float): 结束的任务保留的时间(秒)，超时后删除结果和输出文件
+        """
+        self.work_dir = work_dir
+        self.timeout = timeout
+        self.job_ttl = job_ttl
+        self.queue_size = queue_size
+        # 排队中的任务，取消或超时时立即移出，不再占用排队名额
+        self._pending = deque()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pending_cond = threading.Condition(self._lock)
+        self._running = 0
+        for index in range(max(1, workers)):
+            threading.Thread(target=self._worker, name=f"mineru-serve-worker-{index}", daemon=True).start()
+
+    def submit(self, name: str, pdf_bytes: bytes, options: dict) -> ParseJob:
+        self.purge()
+        job = ParseJob(name, pdf_bytes, options, tempfile.mkdtemp(prefix='job_', dir=self.work_dir))
+        with self._lock:
+            self._expire_pending()
+            full = len(self._pending) >= self.queue_size
+            if not full:
+                self._jobs[job.id] = job
+                self._pending.append(job)
+                self._pending_cond.notify()
+        if full:
+            shutil.rmtree(job.output_dir, ignore_errors=True)
+            raise RequestError(HTTPStatus.TOO_MANY_REQUESTS, "too many queued jobs, retry later")
+        return job
+
+    def get(self, job_id: str) -> ParseJob:
+        with self._lock:
+            self._expire_pending()
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"job {job_id} not found")
+        return job
+
+    def cancel(self, job_id: str) -> ParseJob:
+        """排队中的任务直接取消，已结束的任务删除结果，正在执行的任务无法中断，结束后丢弃结果"""
+        job = self.get(job_id)
+        with self._lock:
+            if job.status == 'queued':
+                self._finish(job, 'cancelled')
+            elif job.status == 'running':
+                job.status = 'cancelled'
+        if job.status != 'running' and job.done_event.is_set():
+            self._remove(job)
+        return job
+
+    def wait(self, job: ParseJob) -> bool:
+        """等待任务结束，超时时取消任务并返回False"""
+        if job.done_event.wait(max(job.deadline - time.time(), 0)):
+            return True
+        with self._lock:
+            if job.status in ['queued', 'running']:
+                self._finish(job, 'expired', f"timeout after {job.options['timeout']}s")
+        return job.status not in ['expired']
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire_pending()
+            return {'queued': len(self._pending), 'running': self._running, 'jobs': len(self._jobs)}
+
+    def purge(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished is not None and now - job.finished > self.job_ttl]
+        for job in expired:
+            self._remove(job)
+
+    def _remove(self, job: ParseJob) -> None:
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        shutil.rmtree(job.output_dir, ignore_errors=True)
+
+    def _expire_pending(self) -> None:
+        """结束已超过截止时间的排队任务，调用时需持有self._lock"""
+        now = time.time()
+        for job in [job for job in self._pending if now > job.deadline]:
+            self._finish(job, 'expired', f"timeout after {job.options['timeout']}s in queue")
+
+    def _finish(self, job: ParseJob, status: str, error: str = None) -> None:
+        """调用时需持有self._lock"""
+        if job.status == 'queued':
+            self._pending.remove(job)
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        job.pdf_bytes = None
+        job.done_event.set()
+
+    def _worker(self) -> None:
+        while True:
+            with self._pending_cond:
+                self._expire_pending()
+                while not self._pending:
+                    self._pending_cond.wait()
+                    self._expire_pending()
+                job = self._pending.popleft()
+                job.status = 'running'
+                self._running += 1
+            try:
+                result, error = self._run(job), None
+            except Exception as e:
+                logger.exception(f"job {job.id} failed: {e}")
+                result, error = None, str(e)
+            with self._lock:
+                self._running -= 1
+                if job.status != 'running':
+                    # 执行期间已超时或被取消，丢弃结果
+                    shutil.rmtree(job.output_dir, ignore_errors=True)
+                    if job.finished is None:
+                        self._finish(job, job.status)
+                    continue
+                job.result = result
+                self._finish(job, 'failed' if error else 'done', error)
+
+    def _run(self, job: ParseJob) -> dict:
+        options = job.options
+        return_fields = options['return']
+        do_parse(
+            output_dir=job.output_dir,
+            pdf_file_names=[job.name],
+            pdf_bytes_list=[job.pdf_bytes],
+            p_lang_list=[options['lang']],
+            backend='pipeline',
+            parse_method=options['method'],
+            formula_enable=options['formula'],
+            table_enable=options['table'],
+            f_draw_layout_bbox=False,
+            f_draw_span_bbox=False,
+            f_dump_md='md' in return_fields,
+            f_dump_middle_json='middle_json' in return_fields,
+            f_dump_model_output=False,
+            f_dump_orig_pdf=False,
+            f_dump_content_list='content_list' in return_fields,
+            start_page_id=options['start'],
+            end_page_id=options['end'],
+        )
+
+        result_dir = job.result_dir
+        result = {}
+        if 'md' in return_fields:
+            with open(os.path.join(result_dir, f"{job.name}.md"), encoding='utf-8') as f:
+                result['md'] = f.read()
+        if 'content_list' in return_fields:
+            with open(os.path.join(result_dir, f"{job.name}_content_list.json"), encoding='utf-8') as f:
+                result['content_list'] = json.load(f)
+        if 'middle_json' in return_fields:
+            middle_json_path = os.path.join(result_dir, f"{job.name}_middle{MIDDLE_JSON_FORMATS[get_middle_json_format()]}")
+            with MiddleJsonReader(middle_json_path) as reader:
+                result['middle_json'] = reader.load()
+        image_dir = os.path.join(result_dir, 'images')
+        result['images'] = sorted(os.listdir(image_dir)) if os.path.isdir(image_dir) else []
+        return result
+
+
+class ParseRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /parse                    上传pdf/图片(body为文件内容，参数在query string中)，
+                                   或提交json {"path": local_path_root下的路径, ...参数}
+    GET  /jobs/<job_id>            查询任务状态和结果
+    GET  /jobs/<job_id>/images/<name>  获取markdown中引用的图片
+    DELETE /jobs/<job_id>          取消任务或删除结果
+    GET  /health                   服务状态
+    """
+    server_version = f"mineru-serve/{__version__}"
+    service: ParseService = None
+    max_upload_size = 0
+    # 允许读取的本地目录，None时不接受本地路径
+    local_path_root: Path = None
+    # 允许的Host头(不含端口)，None时不检查
+    allowed_hosts: set = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: HTTPStatus, data: dict, headers: dict = None) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _check_host(self) -> None:
+        """校验Host头，防止DNS重绑定：恶意网页把自己的域名解析到127.0.0.1后，浏览器发出的请求Host仍是该域名"""
+        if self.allowed_hosts is None:
+            return
+        try:
+            host = urlparse(f"//{self.headers.get('Host', '')}").hostname
+        except ValueError:
+            host = None
+        if host not in self.allowed_hosts:
+            raise RequestError(HTTPStatus.FORBIDDEN, f"host not allowed: {self.headers.get('Host')}")
+
+    def _handle(self, handler) -> None:
+        try:
+            self._check_host()
+            handler()
+        except RequestError as e:
+            headers = {'Retry-After': '1'} if e.status == HTTPStatus.TOO_MANY_REQUESTS else None
+            self._send_json(e.status, {'error': str(e)}, headers)
+        except Exception as e:
+            logger.exception(e)
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)})
+
+    def _path_parts(self):
+        return [unquote(part) for part in urlparse(self.path).path.strip('/').split('/') if part]
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def do_DELETE(self):
+        self._handle(self._delete)
+
+    def _get(self):
+        parts = self._path_parts()
+        if parts == ['health']:
+            self._send_json(HTTPStatus.OK, dict(status='ok', **self.service.stats()))
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            self._send_json(HTTPStatus.OK, job.to_dict())
+        elif len(parts) == 4 and parts[0] == 'jobs' and parts[2] == 'images':
+            job = self.service.get(parts[1])
+            image_path = os.path.join(job.result_dir, 'images', os.path.basename(parts[3]))
+            if job.status != 'done' or not os.path.isfile(image_path):
+                raise RequestError(HTTPStatus.NOT_FOUND, f"image {parts[3]} not found")
+            with open(image_path, 'rb') as f:
+                body = f.read()
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', 'image/webp' if image_path.endswith('.webp') else 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"unknown path {self.path}")
+
+    def _delete(self):
+        parts = self._path_parts()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            raise RequestError(HTTPStatus.NOT_FOUND, f"unknown path {self.path}")
+        self._send_json(HTTPStatus.OK, self.service.cancel(parts[1]).to_dict(with_result=False))
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "empty request body")
+        if self.max_upload_size and length > self.max_upload_size:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"request body larger than {self.max_upload_size} bytes")
+        return self.rfile.read(length)
+
+    def _post(self):
+        if self._path_parts() != ['parse']:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"unknown path {self.path}")
+        body = self._read_body()
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip()
+        if content_type == 'application/json':
+            try:
+                params = json.loads(body)
+            except ValueError:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "invalid json body")
+            if 'path' not in params:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "json body requires 'path', or upload the file as body")
+            path = self._resolve_local_path(params['path'])
+            name = params.get('name') or path.name
+            file_bytes = path.read_bytes()
+        else:
+            params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+            name = params.get('name') or 'upload'
+            file_bytes = body
+
+        options = parse_options(params, self.service.timeout)
+        job = self.service.submit(sanitize_name(name), check_file_type(file_bytes, params.get('name') or params.get('path')), options)
+        if options['async']:
+            self._send_json(HTTPStatus.ACCEPTED, job.to_dict(with_result=False))
+            return
+        if not self.service.wait(job):
+            self._send_json(HTTPStatus.GATEWAY_TIMEOUT, job.to_dict(with_result=False))
+        elif job.status == 'done':
+            self._send_json(HTTPStatus.OK, job.to_dict())
+        else:
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, job.to_dict())
+
+    def _resolve_local_path(self, path) -> Path:
+        """相对路径相对于local_path_root，解析符号链接后仍须位于local_path_root之下"""
+        if self.local_path_root is None:
+            raise RequestError(HTTPStatus.FORBIDDEN, "local paths are not allowed, upload the file instead")
+        resolved = (self.local_path_root / str(path)).resolve()
+        if not resolved.is_relative_to(self.local_path_root):
+            raise RequestError(HTTPStatus.FORBIDDEN, f"path is outside of the allowed directory: {path}")
+        if not resolved.is_file():
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"file not found: {path}")
+        return resolved
+
+
+def create_server(
+        host: str,
+        port: int,
+        service: ParseService,
+        max_upload_size: int = 0,
+        local_path_root: str = None,
+        allowed_hosts: list = None,
+) -> ThreadingHTTPServer:
+    """创建http服务
+
+    Args:
+        local_path_root (str): 允许json请求读取的本地目录，默认不接受本地路径
+        allowed_hosts (list): 允许的Host头，默认监听回环地址时只允许回环地址和localhost，否则不检查
+    """
+    if allowed_hosts is None and host in LOOPBACK_HOSTS:
+        allowed_hosts = LOOPBACK_HOSTS
+    handler = type('BoundParseRequestHandler', (ParseRequestHandler,), {
+        'service': service,
+        'max_upload_size': max_upload_size,
+        'local_path_root': Path(local_path_root).resolve() if local_path_root is not None else None,
+        'allowed_hosts': set(allowed_hosts) if allowed_hosts is not None else None,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+@click.command()
+@click.version_option(__version__,
+                      '--version',
+                      '-v',
+                      help='display the version and exit')
+@click.option('--host', 'host', type=str, default='127.0.0.1', help='the address to listen on.')
+@click.option('--port', 'port', type=int, default=8000, help='the port to listen on.')
+@click.option(
+    '--workers',
+    'workers',
+    type=int,
+    default=1,
+    help='number of documents parsed at the same time, pages of concurrent documents are batched together. '
+         'pdfium calls and model inference are serialized inside the process.',
+)
+@click.option(
+    '--queue-size',
+    'queue_size',
+    type=int,
+    default=16,
+    help='max number of queued jobs, new requests get 429 when the queue is full.',
+)
+@click.option('--timeout', 'timeout', type=float, default=600, help='default per request timeout in seconds.')
+@click.option('--job-ttl', 'job_ttl', type=float, default=3600, help='seconds to keep the results of finished jobs.')
+@click.option('--max-upload-mb', 'max_upload_mb', type=int, default=200, help='max size of an uploaded file in MB.')
+@click.option(
+    '--work-dir',
+    'work_dir',
+    type=click.Path(),
+    default=None,
+    help='directory for job outputs. Default is a temporary directory removed on exit.',
+)
+@click.option(
+    '--allow-local-path',
+    'local_path_root',
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help='accept local file paths under this directory in json requests. Default is to accept uploads only.',
+)
+@click.option(
+    '--allowed-host',
+    'allowed_hosts',
+    type=str,
+    multiple=True,
+    help='allowed value of the Host header, can be repeated. '
+         'Default is loopback names when listening on a loopback address, otherwise any host.',
+)
+@click.option(
+    '--preload/--no-preload',
+    'preload',
+    default=True,
+    help='load the pipeline models before accepting requests.',
+)
+@click.option(
+    '-d',
+    '--device',
+    'device_mode',
+    type=str,
+    help='Device mode for model inference, e.g., "cpu", "cuda", "cuda:0", "npu", "npu:0", "mps".',
+    default=None,
+)
+@click.option(
+    '--source',
+    'model_source',
+    type=click.Choice(['huggingface', 'modelscope', 'local']),
+    help='The source of the model repository. Default is "huggingface".',
+    default='huggingface',
+)
+def main(
+        host, port, workers, queue_size, timeout, job_ttl, max_upload_mb, work_dir,
+        local_path_root, allowed_hosts, preload, device_mode, model_source,
+):
+    if os.getenv('MINERU_DEVICE_MODE', None) is None:
+        os.environ['MINERU_DEVICE_MODE'] = device_mode if device_mode is not None else get_device()
+    if os.getenv('MINERU_MODEL_SOURCE', None) is None:
+        os.environ['MINERU_MODEL_SOURCE'] = model_source
+
+    temp_work_dir = None
+    if work_dir is None:
+        work_dir = temp_work_dir = tempfile.mkdtemp(prefix='mineru_serve_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    if preload:
+        # 模型由ModelSingleton常驻在进程中，预先加载避免第一个请求等待
+        from mineru.backend.pipeline.pipeline_analyze import ModelSingleton
+        ModelSingleton().get_model(lang=None, formula_enable=True, table_enable=True)
+
+    service = ParseService(work_dir, workers=workers, queue_size=queue_size, timeout=timeout, job_ttl=job_ttl)
+    server = create_server(
+        host, port, service, max_upload_mb * 1024 * 1024, local_path_root, list(allowed_hosts) or None
+    )
+    logger.info(f"mineru-serve listening on http://{host}:{server.server_port}, work dir {work_dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if temp_work_dir is not None:
+            shutil.rmtree(temp_work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,17 @@
+import importlib
+
+from .async_image import AsyncImageWriter, ImageDedupRegistry
 from .base import DataReader, DataWriter
 from .dummy import DummyDataWriter
 from .filebase import FileBasedDataReader, FileBasedDataWriter
-from .multi_bucket_s3 import MultiBucketS3DataReader, MultiBucketS3DataWriter
-from .s3 import S3DataReader, S3DataWriter
+
+# S3相关的reader/writer依赖boto3，在第一次访问时才导入
+_LAZY_IMPORTS = {
+    "S3DataReader": ".s3",
+    "S3DataWriter": ".s3",
+    "MultiBucketS3DataReader": ".multi_bucket_s3",
+    "MultiBucketS3DataWriter": ".multi_bucket_s3",
+}
 
 __all__ = [
     "DataReader",
@@ -14,4 +23,14 @@ __all__ = [
     "MultiBucketS3DataReader",
     "MultiBucketS3DataWriter",
     "DummyDataWriter",
+    "AsyncImageWriter",
+    "ImageDedupRegistry",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
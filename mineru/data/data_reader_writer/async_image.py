@@ -0,0 +1,334 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from loguru import logger
+from PIL import Image
+
+from .base import DataWriter
+from .filebase import FileBasedDataWriter
+from mineru.utils.os_env_config import get_image_writer_threads, get_image_writer_max_pending, get_image_format, \
+    get_image_quality, get_image_max_size, get_image_dedup_mode
+
+# 去重登记表最多记住的图片数，超出后淘汰最久未用的，长期运行的服务内存不会无限增长
+DEDUP_REGISTRY_MAX_ENTRIES = 100000
+
+
+class ImageDedupRegistry:
+    def __init__(self, max_entries: int = DEDUP_REGISTRY_MAX_ENTRIES) -> None:
+        """Content addressed registry of written images, shared by all AsyncImageWriter in the process.
+
+        Images are keyed by a hash of their pixels and the encode settings, so only byte identical crops
+        encoded the same way share one file. Every key keeps a reference count of the crops using it.
+
+        Args:
+            max_entries (int, optional): the max number of remembered images, the least recently used
+                ones are forgotten first. Defaults to DEDUP_REGISTRY_MAX_ENTRIES.
+        """
+        self.mode = 'exact'
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def content_key(self, image: Image.Image, encode_settings: str = '') -> str:
+        hasher = hashlib.sha256()
+        # 格式、质量、最大边长不同的writer写出的文件内容不同，不能互相复用
+        hasher.update(f"{encode_settings}_{image.mode}_{image.size[0]}_{image.size[1]}".encode('utf-8'))
+        hasher.update(image.tobytes())
+        return hasher.hexdigest()
+
+    def _get_or_create(self, key: str) -> dict:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = {'refs': 0, 'size': 0, 'cost': 0.0, 'local_path': None}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def add_reference(self, key: str) -> int:
+        """Count one more crop referencing the image, returns the new reference count."""
+        with self._lock:
+            entry = self._get_or_create(key)
+            entry['refs'] += 1
+            return entry['refs']
+
+    def ref_count(self, key: str) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry['refs'] if entry else 0
+
+    def record_write(self, key: str, size: int, cost: float, local_path: str = None) -> None:
+        with self._lock:
+            entry = self._get_or_create(key)
+            entry.update(size=size, cost=cost, local_path=local_path)
+
+    def get_entry(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_local_path(self, key: str):
+        entry = self.get_entry(key)
+        return entry['local_path'] if entry else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+_dedup_registry = None
+_dedup_registry_lock = threading.Lock()
+
+
+def get_image_dedup_registry():
+    """按MINERU_IMAGE_DEDUP返回进程内共享的去重登记表，未开启时返回None"""
+    global _dedup_registry
+    if get_image_dedup_mode() == 'off':
+        return None
+    with _dedup_registry_lock:
+        if _dedup_registry is None:
+            _dedup_registry = ImageDedupRegistry()
+        return _dedup_registry
+
+
+class AsyncImageWriter(DataWriter):
+    def __init__(
+        self,
+        writer: DataWriter,
+        max_workers: int = None,
+        max_pending: int = None,
+        image_format: str = None,
+        quality: int = None,
+        max_size: int = None,
+        dedup_registry: ImageDedupRegistry = None,
+    ) -> None:
+        """Wrap a writer, encode and write images in a thread pool.
+
+        Args:
+            writer (DataWriter): the underlying writer, e.g. FileBasedDataWriter or S3DataWriter
+            max_workers (int, optional): threads used to encode and write. Defaults to MINERU_IMAGE_WRITER_THREADS or 4.
+            max_pending (int, optional): the max number of queued images, submitting blocks when the queue is full.
+                Defaults to MINERU_IMAGE_WRITER_MAX_PENDING or 64.
+            image_format (str, optional): 'jpeg' or 'webp'. Defaults to MINERU_IMAGE_FORMAT or 'jpeg'.
+            quality (int, optional): encoder quality, None means the PIL default. Defaults to MINERU_IMAGE_QUALITY.
+            max_size (int, optional): the longest side of the saved image, larger images are downscaled.
+                Defaults to MINERU_IMAGE_MAX_SIZE, None means no limit.
+            dedup_registry (ImageDedupRegistry, optional): name images by their content and write identical
+                images only once. Defaults to the shared registry when MINERU_IMAGE_DEDUP is 'exact'.
+        """
+        self._writer = writer
+        self._image_format = (image_format or get_image_format()).upper()
+        self._quality = quality if quality is not None else get_image_quality()
+        self._max_size = max_size if max_size is not None else get_image_max_size()
+        self._encode_settings = f"{self._image_format}_{self._quality}_{self._max_size}"
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or get_image_writer_threads(), thread_name_prefix="mineru-image-writer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending or get_image_writer_max_pending())
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._error = None
+        self._dedup = dedup_registry if dedup_registry is not None else get_image_dedup_registry()
+        self._dedup_paths = set()
+        # 去重统计只属于这个writer(一个文档)，长期运行的服务里不会累加到其他任务
+        self._dedup_stats = {'crops': 0, 'encoded_writes': 0, 'hard_links': 0}
+        self._dedup_reused_keys = []
+        self._closed = False
+
+    @property
+    def image_suffix(self) -> str:
+        return "webp" if self._image_format == "WEBP" else "jpg"
+
+    def write(self, path: str, data: bytes) -> None:
+        """Queue the bytes to be written, returns immediately.
+
+        Args:
+            path (str): the target file where to write
+            data (bytes): the data want to write
+        """
+        self._submit(path, self._writer.write, path, data)
+
+    def write_image(self, path_without_suffix: str, image: Image.Image) -> str:
+        """Queue the image to be encoded and written, returns the final path immediately.
+
+        Args:
+            path_without_suffix (str): the target path without suffix, the suffix depends on the image format
+            image (Image.Image): the image want to write, it must not be modified by the caller afterwards
+
+        Returns:
+            str: the path the image will be written to
+        """
+        if self._dedup is not None:
+            return self._write_dedup_image(image)
+        path = f"{path_without_suffix}.{self.image_suffix}"
+        self._submit(path, self._encode_and_write, path, image)
+        return path
+
+    def _write_dedup_image(self, image: Image.Image) -> str:
+        key = self._dedup.content_key(image, self._encode_settings)
+        path = f"{key}.{self.image_suffix}"
+        self._dedup.add_reference(key)
+        with self._lock:
+            self._dedup_stats['crops'] += 1
+            if path in self._dedup_paths:
+                self._dedup_reused_keys.append(key)
+                return path
+            self._dedup_paths.add(path)
+
+        # 其他文档已经写过相同内容时，本地存储直接硬链接过来
+        if self._link_local_image(key, path):
+            with self._lock:
+                self._dedup_stats['hard_links'] += 1
+                self._dedup_reused_keys.append(key)
+        else:
+            with self._lock:
+                self._dedup_stats['encoded_writes'] += 1
+            self._submit(path, self._encode_and_write_dedup, key, path, image)
+        return path
+
+    def dedup_summary(self) -> dict:
+        """The dedup statistics of the images written through this writer."""
+        with self._lock:
+            summary = dict(self._dedup_stats)
+            reused_keys = list(self._dedup_reused_keys)
+            keys = [path.rsplit('.', 1)[0] for path in self._dedup_paths]
+        summary['unique'] = len(keys)
+        # 进程内所有文档引用次数最多的一张图片，反映重复程度
+        summary['max_refs'] = max((self._dedup.ref_count(key) for key in keys), default=0) if self._dedup else 0
+        saved_bytes, saved_seconds = 0, 0.0
+        for key in reused_keys:
+            entry = self._dedup.get_entry(key) if self._dedup is not None else None
+            if entry is not None:
+                saved_bytes += entry['size']
+                saved_seconds += entry['cost']
+        summary['saved_bytes'] = saved_bytes
+        summary['saved_seconds'] = round(saved_seconds, 2)
+        return summary
+
+    def _log_dedup_summary(self) -> None:
+        if self._dedup is None or self._dedup_stats['crops'] == 0:
+            return
+        summary = self.dedup_summary()
+        logger.info(
+            f"image dedup: {summary['crops']} crops, {summary['unique']} unique, "
+            f"{summary['crops'] - summary['encoded_writes']} encodes skipped ({summary['hard_links']} hard linked), "
+            f"saved {round(summary['saved_bytes'] / 1024 / 1024, 2)} MB and {summary['saved_seconds']}s of encode/write, "
+            f"most referenced image used {summary['max_refs']} times"
+        )
+
+    def _local_path(self, path: str):
+        if not isinstance(self._writer, FileBasedDataWriter):
+            return None
+        if os.path.isabs(path) or len(self._writer.parent_dir) == 0:
+            return os.path.abspath(path)
+        return os.path.abspath(os.path.join(self._writer.parent_dir, path))
+
+    def _link_local_image(self, key: str, path: str) -> bool:
+        src_path, dst_path = self._dedup.get_local_path(key), self._local_path(path)
+        if src_path is None or dst_path is None or not os.path.exists(src_path):
+            return False
+        if os.path.exists(dst_path):
+            return True
+        try:
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            os.link(src_path, dst_path)
+            return True
+        except OSError:
+            return False
+
+    def _encode_and_write_dedup(self, key: str, path: str, image: Image.Image) -> None:
+        write_start = time.time()
+        image_bytes = self.encode(image)
+        self._writer.write(path, image_bytes)
+        self._dedup.record_write(key, len(image_bytes), time.time() - write_start, self._local_path(path))
+
+    def encode(self, image: Image.Image) -> bytes:
+        if self._max_size and max(image.size) > self._max_size:
+            image = image.copy()
+            image.thumbnail((self._max_size, self._max_size))
+        if image.mode not in ["RGB", "L"]:
+            image = image.convert("RGB")
+        save_kwargs = {}
+        if self._quality is not None:
+            save_kwargs["quality"] = self._quality
+        with BytesIO() as image_buffer:
+            image.save(image_buffer, format=self._image_format, **save_kwargs)
+            return image_buffer.getvalue()
+
+    def _encode_and_write(self, path: str, image: Image.Image) -> None:
+        self._writer.write(path, self.encode(image))
+
+    def _submit(self, path, fn, *args) -> None:
+        self._raise_if_failed()
+        # 同一路径的写入保持提交顺序
+        with self._lock:
+            previous = self._pending.get(path)
+        if previous is not None:
+            previous.result()
+
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending[path] = future
+        future.add_done_callback(lambda f: self._on_done(path, f))
+
+    def _on_done(self, path, future) -> None:
+        self._slots.release()
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+            if self._error is None and future.exception() is not None:
+                self._error = future.exception()
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def flush(self) -> None:
+        """Block until all queued images are written, re-raise the first write error if any."""
+        while True:
+            with self._lock:
+                pending = list(self._pending.values())
+            if not pending:
+                break
+            for future in pending:
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        self._raise_if_failed()
+
+    def close(self) -> None:
+        """Flush and release the thread pool, calling it again does nothing."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+        self._log_dedup_summary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # 已经在抛出异常时仍写完已提交的图片并释放线程池，写入错误只记录日志，不掩盖原来的异常
+        try:
+            self.close()
+        except Exception as e:
+            logger.warning(f"Failed to write images: {e}")
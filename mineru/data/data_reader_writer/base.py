@@ -41,6 +41,15 @@ class DataWriter(ABC):
         """
         pass
 
+    def write_chunks(self, path: str, chunks) -> None:
+        """Write the data produced chunk by chunk to the file.
+
+        Args:
+            path (str): the target file where to write
+            chunks (Iterable[bytes]): the data want to write, subclasses may stream it instead of joining
+        """
+        self.write(path, b''.join(chunks))
+
     def write_string(self, path: str, data: str) -> None:
         """Write the data to file, the data will be encoded to bytes.
 
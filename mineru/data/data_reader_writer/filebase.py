@@ -44,6 +44,11 @@ class FileBasedDataWriter(DataWriter):
         """
         self._parent_dir = parent_dir
 
+    @property
+    def parent_dir(self) -> str:
+        """The directory relative paths are joined with."""
+        return self._parent_dir
+
     def write(self, path: str, data: bytes) -> None:
         """Write file with data.
 
@@ -51,12 +56,25 @@ class FileBasedDataWriter(DataWriter):
             path (str): the path of file, if the path is relative path, it will be joined with parent_dir.
             data (bytes): the data want to write
         """
+        with open(self._prepare_path(path), 'wb') as f:
+            f.write(data)
+
+    def write_chunks(self, path: str, chunks) -> None:
+        """Write file chunk by chunk, the whole data is never held in memory.
+
+        Args:
+            path (str): the path of file, if the path is relative path, it will be joined with parent_dir.
+            chunks (Iterable[bytes]): the data want to write
+        """
+        with open(self._prepare_path(path), 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    def _prepare_path(self, path: str) -> str:
         fn_path = path
         if not os.path.isabs(fn_path) and len(self._parent_dir) > 0:
             fn_path = os.path.join(self._parent_dir, path)
 
         if not os.path.exists(os.path.dirname(fn_path)) and os.path.dirname(fn_path) != "":
             os.makedirs(os.path.dirname(fn_path), exist_ok=True)
-
-        with open(fn_path, 'wb') as f:
-            f.write(data)
+        return fn_path
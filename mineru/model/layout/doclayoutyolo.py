@@ -8,6 +8,7 @@ from PIL import Image, ImageDraw
 
 from mineru.utils.enum_class import ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
+from mineru.utils.yolo_batch_utils import bucketed_predict
 
 
 class DocLayoutYOLOModel:
@@ -59,27 +60,27 @@ class DocLayoutYOLOModel:
     def batch_predict(
         self,
         images: List[Union[np.ndarray, Image.Image]],
-        batch_size: int = 4
+        batch_size: int = 4,
+        max_batch_pixels: int = None
     ) -> List[List[Dict]]:
-        results = []
+        # 同尺寸的batch与单张推理一样使用矩形letterbox，置信度阈值与单张推理保持一致
+        conf = 0.9 * self.conf
         with tqdm(total=len(images), desc="Layout Predict") as pbar:
-            for idx in range(0, len(images), batch_size):
-                batch = images[idx: idx + batch_size]
-                if batch_size == 1:
-                    conf = 0.9 * self.conf
-                else:
-                    conf = self.conf
-                predictions = self.model.predict(
+            predictions = bucketed_predict(
+                images,
+                lambda batch: self.model.predict(
                     batch,
                     imgsz=self.imgsz,
                     conf=conf,
                     iou=self.iou,
                     verbose=False,
-                )
-                for pred in predictions:
-                    results.append(self._parse_prediction(pred))
-                pbar.update(len(batch))
-        return results
+                ),
+                self.imgsz,
+                batch_size,
+                max_batch_pixels,
+                pbar,
+            )
+        return [self._parse_prediction(pred) for pred in predictions]
 
     def visualize(
             self,
@@ -7,6 +7,7 @@ from PIL import Image, ImageDraw
 
 from mineru.utils.enum_class import ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
+from mineru.utils.yolo_batch_utils import bucketed_predict
 
 
 class YOLOv8MFDModel:
@@ -45,16 +46,18 @@ class YOLOv8MFDModel:
     def batch_predict(
         self,
         images: List[Union[np.ndarray, Image.Image]],
-        batch_size: int = 4
+        batch_size: int = 4,
+        max_batch_pixels: int = None
     ) -> List:
-        results = []
         with tqdm(total=len(images), desc="MFD Predict") as pbar:
-            for idx in range(0, len(images), batch_size):
-                batch = images[idx: idx + batch_size]
-                batch_preds = self._run_predict(batch, is_batch=True)
-                results.extend(batch_preds)
-                pbar.update(len(batch))
-        return results
+            return bucketed_predict(
+                images,
+                lambda batch: self._run_predict(batch, is_batch=True),
+                self.imgsz,
+                batch_size,
+                max_batch_pixels,
+                pbar,
+            )
 
     def visualize(
         self,
@@ -0,0 +1,159 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from loguru import logger
+
+from mineru.utils.os_env_config import get_mfr_cache_enable, get_mfr_cache_size, get_mfr_cache_db
+
+
+class FormulaCache:
+    def __init__(self, max_size: int = 10000, db_path: str = None) -> None:
+        """公式识别结果的缓存，key为预处理(裁边、缩放、填充)后的公式图片的哈希
+
+        Args:
+            max_size (int, optional): 内存中LRU缓存的条数. Defaults to 10000.
+            db_path (str, optional): sqlite文件路径，设置后缓存在进程之间和多次运行之间共享. Defaults to None.
+        """
+        self.max_size = max_size
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._conn = None
+        self._stats = {'formulas': 0, 'memory_hits': 0, 'disk_hits': 0, 'duplicates': 0}
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS formulas (key TEXT PRIMARY KEY, latex TEXT NOT NULL)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(namespace: str, image):
+        """image为预处理后的numpy数组，预处理失败(None)时返回None，不参与缓存"""
+        if image is None:
+            return None
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(f"{namespace}_{image.dtype}_{image.shape}".encode('utf-8'))
+        hasher.update(image.tobytes())
+        return hasher.hexdigest()
+
+    def _get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                latex = self._entries.get(key)
+                if latex is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = latex
+        missing = [key for key in keys if key not in found]
+        if self._conn is not None and missing:
+            disk_found = {}
+            with self._lock:
+                # sqlite单条语句的参数个数有上限，分批查询
+                for index in range(0, len(missing), 500):
+                    chunk = missing[index:index + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, latex FROM formulas WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    disk_found.update(rows)
+            self._put_memory(disk_found)
+            return found, disk_found
+        return found, {}
+
+    def _put_memory(self, items):
+        with self._lock:
+            for key, latex in items.items():
+                self._entries[key] = latex
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _put_many(self, items):
+        self._put_memory(items)
+        if self._conn is not None and items:
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO formulas (key, latex) VALUES (?, ?)", items.items())
+                self._conn.commit()
+
+    def lookup(self, keys: list):
+        """查询缓存
+
+        Returns:
+            results: 与keys对应的识别结果，未命中为None
+            todo: 需要识别的样本下标，相同key只保留第一个
+        """
+        unique_keys = list(dict.fromkeys(key for key in keys if key is not None))
+        found, disk_found = self._get_many(unique_keys)
+        found.update(disk_found)
+        results = [found.get(key) if key is not None else None for key in keys]
+        todo, seen = [], set()
+        for index, key in enumerate(keys):
+            if results[index] is not None:
+                continue
+            if key is None or key not in seen:
+                todo.append(index)
+                if key is not None:
+                    seen.add(key)
+        with self._lock:
+            self._stats['formulas'] += len(keys)
+            self._stats['disk_hits'] += sum(1 for key in keys if key in disk_found)
+            self._stats['memory_hits'] += sum(1 for key in keys if key in found and key not in disk_found)
+            self._stats['duplicates'] += sum(1 for result in results if result is None) - len(todo)
+        return results, todo
+
+    def fill(self, keys: list, results: list, todo: list, predictions: list, incomplete: list = None) -> list:
+        """把todo样本的识别结果写入缓存，并填充到results中key相同的其他样本
+
+        incomplete与predictions一一对应，为True的结果(达到生成长度上限或被重复检测提前结束)
+        只填充到本次的results，不写入缓存，避免截断的公式在之后的运行中一直被复用
+        """
+        filled, new_items = {}, {}
+        for position, (index, latex) in enumerate(zip(todo, predictions)):
+            results[index] = latex
+            if keys[index] is None:
+                continue
+            filled[keys[index]] = latex
+            if incomplete is None or not incomplete[position]:
+                new_items[keys[index]] = latex
+        for index, key in enumerate(keys):
+            if results[index] is None and key in filled:
+                results[index] = filled[key]
+        self._put_many(new_items)
+        return results
+
+    def summary(self) -> dict:
+        with self._lock:
+            summary = dict(self._stats)
+        hits = summary['memory_hits'] + summary['disk_hits'] + summary['duplicates']
+        summary['hit_rate'] = round(hits / summary['formulas'], 4) if summary['formulas'] else 0.0
+        return summary
+
+
+_formula_cache = None
+_formula_cache_lock = threading.Lock()
+
+
+def get_formula_cache():
+    """按MINERU_MFR_CACHE返回进程内共享的公式识别缓存，未开启时返回None"""
+    global _formula_cache
+    if not get_mfr_cache_enable():
+        return None
+    with _formula_cache_lock:
+        if _formula_cache is None:
+            _formula_cache = FormulaCache(get_mfr_cache_size(), get_mfr_cache_db())
+        return _formula_cache
+
+
+def log_formula_cache_summary() -> None:
+    if _formula_cache is None:
+        return
+    summary = _formula_cache.summary()
+    if summary['formulas'] == 0:
+        return
+    logger.info(
+        f"formula cache: {summary['formulas']} formulas, hit rate {summary['hit_rate']:.2%} "
+        f"({summary['memory_hits']} memory, {summary['disk_hits']} disk, {summary['duplicates']} duplicates in batch)"
+    )
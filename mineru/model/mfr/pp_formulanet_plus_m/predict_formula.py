@@ -5,6 +5,9 @@ from pathlib import Path
 
 from loguru import logger
 from tqdm import tqdm
+from mineru.model.mfr.formula_cache import FormulaCache, get_formula_cache
+from mineru.utils.pdf_image_tools import get_region_np_img
+from mineru.utils.weights_utils import weights_fingerprint
 from mineru.model.utils.tools.infer import pytorchocr_utility
 from mineru.model.utils.pytorchocr.base_ocr_v20 import BaseOCRV20
 from .processors import (
@@ -64,11 +67,17 @@ class FormulaRecognizer(BaseOCRV20):
         self.post_op = UniMERNetDecode(
             character_list=data["PostProcess"]["character_dict"]
         )
+        # 缓存key区分模型权重，更新权重后不会复用旧版本的识别结果
+        self.cache_namespace = f"pp_formulanet_plus_m_{weights_fingerprint(self.weights_path, self.infer_yaml_path)}"
 
     def predict(self, img_list, batch_size: int = 64):
+        batch_imgs = self.pre_tfs["UniMERNetImgDecode"](imgs=img_list)
+        return self.predict_decoded(batch_imgs, batch_size)
+
+    def predict_decoded(self, batch_imgs, batch_size: int = 64):
+        """识别已经过UniMERNetImgDecode(裁边、缩放、填充)的公式图片"""
         # Reduce batch size by 50% to avoid potential memory issues during inference.
         batch_size = int(0.5 * batch_size)
-        batch_imgs = self.pre_tfs["UniMERNetImgDecode"](imgs=img_list)
         batch_imgs = self.pre_tfs["UniMERNetTestTransform"](imgs=batch_imgs)
         batch_imgs = self.pre_tfs["LatexImageFormat"](imgs=batch_imgs)
         inp = self.pre_tfs["ToBatch"](imgs=batch_imgs)
@@ -89,7 +98,7 @@ class FormulaRecognizer(BaseOCRV20):
         return rec_formula
 
     def batch_predict(
-        self, images_mfd_res: list, images: list, batch_size: int = 64
+        self, images_mfd_res: list, images: list, batch_size: int = 64, region_renderers: list = None
     ) -> list:
         images_formula_list = []
         mf_image_list = []
@@ -100,6 +109,7 @@ class FormulaRecognizer(BaseOCRV20):
         for image_index in range(len(images_mfd_res)):
             mfd_res = images_mfd_res[image_index]
             image = images[image_index]
+            renderer = region_renderers[image_index] if region_renderers else None
             formula_list = []
 
             for idx, (xyxy, conf, cla) in enumerate(
@@ -113,7 +123,8 @@ class FormulaRecognizer(BaseOCRV20):
                     "latex": "",
                 }
                 formula_list.append(new_item)
-                bbox_img = image[ymin:ymax, xmin:xmax]
+                # 开启页面金字塔时公式区域从pdf重新渲染
+                bbox_img = get_region_np_img((xmin, ymin, xmax, ymax), image, renderer)
                 area = (xmax - xmin) * (ymax - ymin)
 
                 curr_idx = len(mf_image_list)
@@ -134,9 +145,20 @@ class FormulaRecognizer(BaseOCRV20):
         }
 
         if len(sorted_images) > 0:
+            decoded_images = self.pre_tfs["UniMERNetImgDecode"](imgs=sorted_images)
+            # 预处理后完全相同的公式图片直接使用缓存的结果，只识别未命中的部分
+            formula_cache = get_formula_cache()
+            if formula_cache is not None:
+                cache_keys = [FormulaCache.make_key(self.cache_namespace, img) for img in decoded_images]
+                cached_results, todo = formula_cache.lookup(cache_keys)
+                decoded_images = [decoded_images[i] for i in todo]
             # 进行预测
-            batch_size = min(batch_size, max(1, 2 ** (len(sorted_images).bit_length() - 1))) if sorted_images else 1
-            rec_formula = self.predict(sorted_images, batch_size)
+            rec_formula = []
+            if len(decoded_images) > 0:
+                batch_size = min(batch_size, max(1, 2 ** (len(decoded_images).bit_length() - 1)))
+                rec_formula = self.predict_decoded(decoded_images, batch_size)
+            if formula_cache is not None:
+                rec_formula = formula_cache.fill(cache_keys, cached_results, todo, rec_formula)
         else:
             rec_formula = []
 
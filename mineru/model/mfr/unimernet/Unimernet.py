@@ -1,7 +1,62 @@
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import torch
+from loguru import logger
 from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 
+from mineru.model.mfr.formula_cache import FormulaCache, get_formula_cache
+from mineru.utils.pdf_image_tools import get_region_np_img
+from mineru.utils.weights_utils import weights_fingerprint
+from mineru.utils.os_env_config import (
+    get_cpu_int8_quantize_enable,
+    get_mfr_adaptive_max_new_tokens_enable,
+    get_mfr_preprocess_threads,
+    get_mfr_repeat_stop_enable,
+)
+
+
+# 按行内公式区域相对字号的大小估计生成长度：每个"字号x字号"的区域约产生TOKENS_PER_FONT_SQUARE个token，
+# 再乘以安全系数，至少保留MIN_NEW_TOKENS；行间公式(多行、矩阵)的长度无法按面积估计，始终使用完整长度
+TOKENS_PER_FONT_SQUARE = 4
+MAX_NEW_TOKENS_SAFETY_FACTOR = 2.0
+MIN_NEW_TOKENS = 64
+# 预处理提前进行的batch数，当前batch生成时后续batch已在线程池中处理
+PREFETCH_BATCHES = 2
+# 计算缓存key时每次预处理的公式数，预处理结果只用于计算key，不会同时保存一次调用中所有公式的预处理结果
+CACHE_KEY_CHUNK_SIZE = 64
+
+
+def predict_max_new_tokens(boxes: list) -> list:
+    """根据公式框的尺寸预测每个公式需要的max_new_tokens
+
+    Args:
+        boxes: (height, width, category_id) 列表，category_id为13的行内公式高度用于估计字号
+
+    Returns:
+        每个公式的max_new_tokens，0表示不限制(使用模型的最大长度)
+    """
+    if len(boxes) == 0:
+        return []
+    inline_heights = [height for height, _, category_id in boxes if category_id == 13 and height > 0]
+    heights = inline_heights or [height for height, _, _ in boxes if height > 0] or [1]
+    font_height = max(float(np.median(heights)), 1.0)
+
+    budgets = []
+    for height, width, category_id in boxes:
+        if category_id == 14:
+            budgets.append(0)
+            continue
+        font_squares = max(height, 1) / font_height * max(width, 1) / font_height
+        budget = int(math.ceil(font_squares * TOKENS_PER_FONT_SQUARE * MAX_NEW_TOKENS_SAFETY_FACTOR))
+        budgets.append(max(budget, MIN_NEW_TOKENS))
+    return budgets
+
 
 class MathDataset(Dataset):
     def __init__(self, image_paths, transform=None):
@@ -30,6 +85,17 @@ class UnimernetModel(object):
         if not _device_.startswith("cpu"):
             self.model = self.model.to(dtype=torch.float16)
         self.model.eval()
+        # 缓存key区分模型权重、精度，不同版本和配置的识别结果不混用
+        fingerprint = weights_fingerprint(*[
+            os.path.join(weight_dir, file_name)
+            for file_name in ["model.safetensors", "pytorch_model.bin", "config.json", "tokenizer.json"]
+        ])
+        self.cache_namespace = f"unimernet_small_{fingerprint}_{self.model.dtype}"
+        if _device_.startswith("cpu") and get_cpu_int8_quantize_enable():
+            # 自回归解码占公式识别的大部分耗时，只量化解码器，编码器保持fp32
+            from mineru.utils.quantize_utils import quantize_dynamic_int8
+            self.model.decoder = quantize_dynamic_int8(self.model.decoder, weight_dir, tag='mfr_decoder')
+            self.cache_namespace += "_int8"
 
     def predict(self, mfd_res, image):
         formula_list = []
@@ -61,16 +127,35 @@ class UnimernetModel(object):
             res["latex"] = latex
         return formula_list
 
-    def batch_predict(self, images_mfd_res: list, images: list, batch_size: int = 64) -> list:
+    def _prepare_gray(self, image):
+        transform = self.model.transform
+        return transform.to_gray(transform.prepare_input(image))
+
+    def _cache_key(self, image):
+        return FormulaCache.make_key(self.cache_namespace, self.model.transform.prepare_input(image))
+
+    def _iter_batches(self, executor, images: list, batch_size: int, preprocess):
+        """在线程池中逐张预处理，始终提前提交PREFETCH_BATCHES个batch，按顺序返回归一化后的batch张量"""
+        pending = deque()
+        next_start = 0
+        while next_start < len(images) or pending:
+            while next_start < len(images) and len(pending) < PREFETCH_BATCHES + 1:
+                pending.append([executor.submit(preprocess, img) for img in images[next_start:next_start + batch_size]])
+                next_start += batch_size
+            futures = pending.popleft()
+            yield self.model.transform.normalize_batch([future.result() for future in futures])
+
+    def batch_predict(self, images_mfd_res: list, images: list, batch_size: int = 64, region_renderers: list = None) -> list:
         images_formula_list = []
         mf_image_list = []
         backfill_list = []
-        image_info = []  # Store (area, original_index, image) tuples
+        image_info = []  # Store (area, original_index, image, height, width, category_id) tuples
 
         # Collect images with their original indices
         for image_index in range(len(images_mfd_res)):
             mfd_res = images_mfd_res[image_index]
             image = images[image_index]
+            renderer = region_renderers[image_index] if region_renderers else None
             formula_list = []
 
             for idx, (xyxy, conf, cla) in enumerate(zip(
@@ -84,53 +169,109 @@ class UnimernetModel(object):
                     "latex": "",
                 }
                 formula_list.append(new_item)
-                bbox_img = image[ymin:ymax, xmin:xmax]
+                # 开启页面金字塔时公式区域从pdf重新渲染
+                bbox_img = get_region_np_img((xmin, ymin, xmax, ymax), image, renderer)
                 area = (xmax - xmin) * (ymax - ymin)
 
                 curr_idx = len(mf_image_list)
-                image_info.append((area, curr_idx, bbox_img))
+                image_info.append((area, curr_idx, bbox_img, ymax - ymin, xmax - xmin, new_item["category_id"]))
                 mf_image_list.append(bbox_img)
 
             images_formula_list.append(formula_list)
             backfill_list += formula_list
 
-        # Stable sort by area
-        image_info.sort(key=lambda x: x[0])  # sort by area
-        sorted_indices = [x[1] for x in image_info]
-        sorted_images = [x[2] for x in image_info]
+        if get_mfr_adaptive_max_new_tokens_enable():
+            budgets = predict_max_new_tokens([(x[3], x[4], x[5]) for x in image_info])
+        else:
+            budgets = [0] * len(image_info)
 
-        # Create mapping for results
-        index_mapping = {new_idx: old_idx for new_idx, old_idx in enumerate(sorted_indices)}
+        executor = ThreadPoolExecutor(max_workers=get_mfr_preprocess_threads())
+        # 出错或中途退出时同样要取消未开始的预处理并释放线程池
+        try:
+            # 预处理后完全相同的公式图片直接使用缓存的结果，只识别未命中的部分；
+            # 未命中的公式在识别前随batch预取重新预处理，峰值内存只与预取的batch数有关
+            formula_cache = get_formula_cache()
+            all_image_info = image_info
+            if formula_cache is not None:
+                crops = [x[2] for x in all_image_info]
+                cache_keys = []
+                for start in range(0, len(crops), CACHE_KEY_CHUNK_SIZE):
+                    cache_keys.extend(executor.map(self._cache_key, crops[start:start + CACHE_KEY_CHUNK_SIZE]))
+                cached_results, todo = formula_cache.lookup(cache_keys)
+                image_info = [all_image_info[i] for i in todo]
+                budgets = [budgets[i] for i in todo]
 
-        # Create dataset with sorted images
-        dataset = MathDataset(sorted_images, transform=self.model.transform)
+            # 按预测的生成长度排序，长度相近的公式分到同一个batch，面积作为次要排序依据
+            order = sorted(range(len(image_info)), key=lambda i: (budgets[i], image_info[i][0]))
+            sorted_indices = [image_info[i][1] for i in order]
+            sorted_budgets = [budgets[i] for i in order]
+            sorted_images = [image_info[i][2] for i in order]
 
-        # 如果batch_size > len(sorted_images)，则设置为不超过len(sorted_images)的2的幂
-        batch_size = min(batch_size, max(1, 2 ** (len(sorted_images).bit_length() - 1))) if sorted_images else 1
+            # Create mapping for results
+            index_mapping = {new_idx: old_idx for new_idx, old_idx in enumerate(sorted_indices)}
 
-        dataloader = DataLoader(dataset, batch_size=batch_size, num_workers=0)
+            # 如果batch_size > len(sorted_images)，则设置为不超过len(sorted_images)的2的幂
+            batch_size = min(batch_size, max(1, 2 ** (len(sorted_images).bit_length() - 1))) if sorted_images else 1
+            batch_num = math.ceil(len(sorted_images) / batch_size)
+            batches = self._iter_batches(executor, sorted_images, batch_size, self._prepare_gray)
 
-        # Process batches and store results
-        mfr_res = []
-        # for mf_img in dataloader:
+            # Process batches and store results
+            mfr_res, mfr_incomplete = [], []
+            repeat_stop = get_mfr_repeat_stop_enable()
+            truncated_num, repeat_stopped_num = 0, 0
+            wait_cost, generate_cost = 0.0, 0.0
+
+            with tqdm(total=len(sorted_images), desc="MFR Predict") as pbar:
+                for index in range(batch_num):
+                    # 等待预处理的时间即生成阶段空闲的时间
+                    start = time.time()
+                    mf_img = next(batches)
+                    wait_cost += time.time() - start
+                    start = time.time()
+                    mf_img = mf_img.to(dtype=self.model.dtype)
+                    mf_img = mf_img.to(self.device)
+                    # batch内预测长度最大的样本决定本batch的生成上限，有不限制长度的样本时整个batch不限制
+                    batch_budgets = sorted_budgets[index * batch_size:(index + 1) * batch_size]
+                    max_new_tokens = None if 0 in batch_budgets else max(batch_budgets)
+                    with torch.no_grad():
+                        output = self.model.generate(
+                            {"image": mf_img}, batch_size=batch_size, max_new_tokens=max_new_tokens, repeat_stop=repeat_stop
+                        )
+                    mfr_res.extend(output["fixed_str"])
+                    mfr_incomplete.extend(t or r for t, r in zip(output["truncated"], output["repeat_stopped"]))
+                    truncated_num += sum(output["truncated"])
+                    repeat_stopped_num += sum(output["repeat_stopped"])
+                    generate_cost += time.time() - start
 
-        with tqdm(total=len(sorted_images), desc="MFR Predict") as pbar:
-            for index, mf_img in enumerate(dataloader):
-                mf_img = mf_img.to(dtype=self.model.dtype)
-                mf_img = mf_img.to(self.device)
-                with torch.no_grad():
-                    output = self.model.generate({"image": mf_img}, batch_size=batch_size)
-                mfr_res.extend(output["fixed_str"])
+                    # 更新进度条，每次增加batch_size，但要注意最后一个batch可能不足batch_size
+                    current_batch_size = min(batch_size, len(sorted_images) - index * batch_size)
+                    pbar.update(current_batch_size)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-                # 更新进度条，每次增加batch_size，但要注意最后一个batch可能不足batch_size
-                current_batch_size = min(batch_size, len(sorted_images) - index * batch_size)
-                pbar.update(current_batch_size)
+        if batch_num > 0:
+            logger.debug(
+                f"MFR: {batch_num} batches, waiting for preprocess {round(wait_cost, 2)}s, "
+                f"generate {round(generate_cost, 2)}s"
+            )
+        if truncated_num > 0 or repeat_stopped_num > 0:
+            logger.info(
+                f"MFR: {truncated_num} of {len(sorted_images)} formulas reached max_new_tokens, "
+                f"{repeat_stopped_num} stopped on repeated tokens"
+            )
 
         # Restore original order
-        unsorted_results = [""] * len(mfr_res)
-        for new_idx, latex in enumerate(mfr_res):
+        unsorted_results = [""] * len(all_image_info)
+        unsorted_incomplete = [False] * len(all_image_info)
+        for new_idx, (latex, incomplete) in enumerate(zip(mfr_res, mfr_incomplete)):
             original_idx = index_mapping[new_idx]
             unsorted_results[original_idx] = latex
+            unsorted_incomplete[original_idx] = incomplete
+        if formula_cache is not None:
+            unsorted_results = formula_cache.fill(
+                cache_keys, cached_results, todo, [unsorted_results[i] for i in todo],
+                [unsorted_incomplete[i] for i in todo],
+            )
 
         # Fill results back
         for res, latex in zip(backfill_list, unsorted_results):
@@ -2,16 +2,19 @@ import os
 import warnings
 from typing import Optional
 
+import numpy as np
 import torch
 from ftfy import fix_text
 from loguru import logger
 
 from transformers import AutoConfig, AutoModel, AutoModelForCausalLM, AutoTokenizer, PretrainedConfig, PreTrainedModel
+from transformers import StoppingCriteria, StoppingCriteriaList
 from transformers import VisionEncoderDecoderConfig, VisionEncoderDecoderModel
 from transformers.models.vision_encoder_decoder.modeling_vision_encoder_decoder import logger as base_model_logger
 
 from .unimer_swin import UnimerSwinConfig, UnimerSwinModel, UnimerSwinImageProcessor
 from .unimer_mbart import UnimerMBartConfig, UnimerMBartForCausalLM
+from mineru.utils.weights_utils import load_weights
 from ...utils import latex_rm_whitespace
 
 AutoConfig.register(UnimerSwinConfig.model_type, UnimerSwinConfig)
@@ -57,6 +60,27 @@ class TokenizerWrapper:
                     del toks[b][i]
         return toks
 
+class RepeatedNgramStoppingCriteria(StoppingCriteria):
+    """生成结果末尾连续重复同一个n-gram时提前结束该样本，避免失控的样本拖住整个batch"""
+
+    def __init__(self, max_ngram: int = 16, min_repeats: int = 8, min_span: int = 64):
+        self.max_ngram = max_ngram
+        self.min_repeats = min_repeats
+        self.min_span = min_span
+        self.stopped = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        is_done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for ngram in range(1, self.max_ngram + 1):
+            span = max(self.min_span, ngram * self.min_repeats)
+            if input_ids.shape[1] < span + ngram:
+                break
+            # 末尾span个token以ngram为周期重复
+            is_done |= (input_ids[:, -span:] == input_ids[:, -span - ngram:-ngram]).all(dim=1)
+        self.stopped = is_done if self.stopped is None else self.stopped | is_done
+        return is_done
+
+
 class UnimernetModel(VisionEncoderDecoderModel):
     def __init__(
         self,
@@ -106,7 +130,7 @@ class UnimernetModel(VisionEncoderDecoderModel):
 
         # load model weights
         model_file_path = os.path.join(model_path, model_filename)
-        checkpoint = torch.load(model_file_path, map_location="cpu", weights_only=True)
+        checkpoint = load_weights(model_file_path)
         state_dict = checkpoint["model"] if "model" in checkpoint else checkpoint
         if not state_dict:
             raise RuntimeError("state_dict is empty.")
@@ -143,7 +167,7 @@ class UnimernetModel(VisionEncoderDecoderModel):
         ).loss
         return {"loss": loss}
 
-    def generate(self, samples, do_sample: bool = False, temperature: float = 0.2, top_p: float = 0.95, batch_size=64):
+    def generate(self, samples, do_sample: bool = False, temperature: float = 0.2, top_p: float = 0.95, batch_size=64, max_new_tokens=None, repeat_stop=False):
         pixel_values = samples["image"]
         num_channels = pixel_values.shape[1]
         if num_channels == 1:
@@ -160,17 +184,39 @@ class UnimernetModel(VisionEncoderDecoderModel):
             else:
                 self.tokenizer.tokenizer.model_max_length = 1344  # 8g
 
+        if max_new_tokens is None:
+            max_new_tokens = self.tokenizer.tokenizer.model_max_length
+        else:
+            max_new_tokens = min(max_new_tokens, self.tokenizer.tokenizer.model_max_length)
+        # 矩阵、重复的下标等合法公式也会出现长段重复，重复检测只在显式开启时使用
+        repeat_criteria = RepeatedNgramStoppingCriteria() if repeat_stop else None
+        if repeat_criteria is not None:
+            kwargs["stopping_criteria"] = StoppingCriteriaList([repeat_criteria])
+
         outputs = super().generate(
             pixel_values=pixel_values,
-            max_new_tokens=self.tokenizer.tokenizer.model_max_length, # required
+            max_new_tokens=max_new_tokens, # required
             decoder_start_token_id=self.tokenizer.tokenizer.bos_token_id,
             do_sample=do_sample,
             **kwargs,
         )
 
         outputs = outputs[:, 1:].cpu().numpy()
+        # 没有自然生成eos的样本：被重复检测提前结束(repeat_stopped)，或用完了max_new_tokens(truncated)
+        # 达到长度上限时generate可能强制补一个eos(forced_eos_token_id)，最后一位的eos不算自然结束
+        is_eos = outputs == self.tokenizer.eos_token_id
+        finished = is_eos.any(axis=1)
+        if outputs.shape[1] >= max_new_tokens:
+            finished &= is_eos[:, :-1].any(axis=1)
+        if repeat_criteria is not None and repeat_criteria.stopped is not None:
+            repeat_stopped = ~finished & repeat_criteria.stopped.cpu().numpy()
+        else:
+            repeat_stopped = np.zeros_like(finished)
+        truncated = ~finished & ~repeat_stopped
         pred_tokens = self.tokenizer.detokenize(outputs)
         pred_str = self.tokenizer.token2str(outputs)
         fixed_str = [latex_rm_whitespace(s) for s in pred_str]
-        return {"pred_ids": outputs, "pred_tokens": pred_tokens, "pred_str": pred_str, "fixed_str": fixed_str}
-
+        return {
+            "pred_ids": outputs, "pred_tokens": pred_tokens, "pred_str": pred_str, "fixed_str": fixed_str,
+            "truncated": truncated.tolist(), "repeat_stopped": repeat_stopped.tolist(),
+        }
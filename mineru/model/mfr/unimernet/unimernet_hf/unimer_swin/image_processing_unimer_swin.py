@@ -2,6 +2,7 @@ from PIL import Image, ImageOps
 from transformers.image_processing_utils import BaseImageProcessor
 import numpy as np
 import cv2
+import torch
 import albumentations as alb
 from albumentations.pytorch import ToTensorV2
 from torchvision.transforms.functional import resize
@@ -15,11 +16,14 @@ class UnimerSwinImageProcessor(BaseImageProcessor):
         ):
         self.input_size = [int(_) for _ in image_size]
         assert len(self.input_size) == 2
-    
+        self.mean = 0.7931
+        self.std = 0.1738
+
+        # ToGray默认p=0.5，推理时应固定转为灰度，否则约一半样本只取了R通道
         self.transform = alb.Compose(
             [
-                alb.ToGray(),
-                alb.Normalize((0.7931, 0.7931, 0.7931), (0.1738, 0.1738, 0.1738)),
+                alb.ToGray(p=1.0),
+                alb.Normalize((self.mean,) * 3, (self.std,) * 3),
                 # alb.Sharpen()
                 ToTensorV2(),
             ]
@@ -29,6 +33,19 @@ class UnimerSwinImageProcessor(BaseImageProcessor):
         image = self.prepare_input(item)
         return self.transform(image=image)['image'][:1]
 
+    def to_gray(self, image):
+        """把prepare_input的结果转为uint8灰度图，预处理失败(None)时返回全黑的空白图"""
+        if image is None:
+            return np.zeros(self.input_size, dtype=np.uint8)
+        if image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        return image
+
+    def normalize_batch(self, gray_images: list) -> torch.Tensor:
+        """对尺寸相同的灰度图批量归一化，结果与逐张调用transform一致，返回(N, 1, H, W)"""
+        batch = torch.from_numpy(np.stack(gray_images)).float()
+        return batch.div_(255.0).sub_(self.mean).div_(self.std).unsqueeze(1)
+
     @staticmethod
     def crop_margin(img: Image.Image) -> Image.Image:
         data = np.array(img.convert("L"))
@@ -12,6 +12,7 @@ from loguru import logger
 from mineru.utils.config_reader import get_device
 from mineru.utils.enum_class import ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
+from mineru.utils.os_env_config import get_ocr_engine
 from mineru.utils.ocr_utils import check_img, preprocess_image, sorted_boxes, merge_det_boxes, update_det_boxes, get_rotate_crop_image
 from mineru.model.utils.tools.infer.predict_system import TextSystem
 from mineru.model.utils.tools.infer import pytorchocr_utility as utility
@@ -180,6 +181,12 @@ class PytorchPaddleOCR(TextSystem):
 
         kwargs['device'] = device
 
+        ocr_engine = kwargs.get('ocr_engine') or get_ocr_engine()
+        if ocr_engine == 'onnx' and device != 'cpu':
+            logger.warning(f"ocr_engine=onnx only supports cpu, fall back to torch on {device}.")
+            ocr_engine = 'torch'
+        kwargs['ocr_engine'] = ocr_engine
+
         default_args = vars(args)
         default_args.update(kwargs)
         args = argparse.Namespace(**default_args)
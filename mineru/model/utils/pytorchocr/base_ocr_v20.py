@@ -1,6 +1,7 @@
 import os
 import torch
 from .modeling.architectures.base_model import BaseModel
+from mineru.utils.weights_utils import load_weights, load_state_dict_shared
 
 class BaseOCRV20:
     def __init__(self, config, **kwargs):
@@ -15,7 +16,8 @@ class BaseOCRV20:
     def read_pytorch_weights(self, weights_path):
         if not os.path.exists(weights_path):
             raise FileNotFoundError('{} is not existed.'.format(weights_path))
-        weights = torch.load(weights_path)
+        # 优先内存映射读取同名的.safetensors，多进程之间共享权重内存
+        weights = load_weights(weights_path)
         return weights
 
     def get_out_channels(self, weights):
@@ -26,11 +28,12 @@ class BaseOCRV20:
         return out_channels
 
     def load_state_dict(self, weights):
-        self.net.load_state_dict(weights)
+        # 直接使用内存映射的tensor作为参数，避免再拷贝一份，dtype或device不一致时先转换
+        load_state_dict_shared(self.net, weights)
         # print('weights is loaded.')
 
     def load_pytorch_weights(self, weights_path):
-        self.net.load_state_dict(torch.load(weights_path, weights_only=True))
+        load_state_dict_shared(self.net, self.read_pytorch_weights(weights_path))
         # print('model is loaded: {}'.format(weights_path))
 
     def inference(self, inputs):
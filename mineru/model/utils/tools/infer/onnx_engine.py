@@ -0,0 +1,197 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import torch
+from loguru import logger
+
+from mineru.utils.os_env_config import get_op_num_threads, get_onnx_cache_dir
+
+# det输入为任意尺寸的整页图片，rec输入高度固定、宽度随文本行长度变化
+_INPUT_NAME = 'x'
+_OUTPUT_NAMES = {'det': 'maps', 'rec': 'head_out'}
+_DYNAMIC_AXES = {
+    'det': {_INPUT_NAME: {0: 'batch', 2: 'height', 3: 'width'}, 'maps': {0: 'batch', 2: 'height', 3: 'width'}},
+    'rec': {_INPUT_NAME: {0: 'batch', 3: 'width'}, 'head_out': {0: 'batch', 1: 'length'}},
+}
+_OPSET_VERSION = 17
+# torch.onnx.export使用全局状态，同一进程内不能同时导出
+_export_lock = threading.Lock()
+
+
+def get_onnx_path(weights_path: str, kind: str) -> str:
+    """导出的onnx保存在缓存目录中，不写入可能只读或被多个进程共享的模型目录；
+    key包含权重的路径、大小和修改时间，权重更新或torch版本变化后自动重新导出"""
+    stat = os.stat(weights_path)
+    key = json.dumps({
+        'weights': os.path.abspath(weights_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'kind': kind,
+        'opset': _OPSET_VERSION,
+        'torch': torch.__version__,
+    }, sort_keys=True)
+    file_stem = os.path.splitext(os.path.basename(weights_path))[0]
+    return os.path.join(
+        get_onnx_cache_dir(), f"{file_stem}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.onnx"
+    )
+
+
+class _ExportWrapper(torch.nn.Module):
+    """det模型输出为dict，导出时只保留单个tensor"""
+
+    def __init__(self, net, output_name):
+        super().__init__()
+        self.net = net
+        self.output_name = output_name
+
+    def forward(self, x):
+        outputs = self.net(x)
+        if isinstance(outputs, dict):
+            return outputs[self.output_name]
+        return outputs
+
+
+def export_onnx(net, onnx_path: str, kind: str, sample_input: torch.Tensor):
+    """把已融合conv/bn的det/rec模型导出为动态尺寸的onnx
+
+    Args:
+        net: TextDetector/TextRecognizer中的torch模型
+        onnx_path: 导出路径
+        kind: 'det' 或 'rec'
+        sample_input: 用于trace的输入，只影响导出过程，不限制推理时的尺寸
+    """
+    try:
+        import onnx  # noqa: F401
+    except ImportError:
+        raise ImportError("Exporting the ocr models to onnx requires onnx, please run `pip install onnx`.")
+
+    output_name = _OUTPUT_NAMES[kind]
+    start = time.time()
+    # 多个进程可能同时导出同一个模型，各自写入独立的临时文件后原子替换，读取方不会看到写了一半的文件
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(onnx_path)}.", suffix='.tmp', dir=os.path.dirname(onnx_path)
+    )
+    os.close(fd)
+    try:
+        with _export_lock, torch.no_grad():
+            torch.onnx.export(
+                _ExportWrapper(net, output_name).eval(),
+                (sample_input.cpu(),),
+                tmp_path,
+                dynamo=False,
+                input_names=[_INPUT_NAME],
+                output_names=[output_name],
+                dynamic_axes=_DYNAMIC_AXES[kind],
+                opset_version=_OPSET_VERSION,
+                do_constant_folding=True,
+            )
+        os.replace(tmp_path, onnx_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"ocr {kind} model exported to {onnx_path}, cost: {round(time.time() - start, 2)}")
+    return onnx_path
+
+
+class OrtNet:
+    """用onnxruntime代替TextDetector/TextRecognizer中的self.net，输入输出与torch模型一致，前后处理无需改动"""
+
+    def __init__(self, onnx_path: str, kind: str):
+        from onnxruntime import GraphOptimizationLevel, InferenceSession, SessionOptions
+
+        sess_opt = SessionOptions()
+        sess_opt.log_severity_level = 4
+        sess_opt.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_ALL
+        intra_op_num_threads = get_op_num_threads("MINERU_INTRA_OP_NUM_THREADS")
+        if intra_op_num_threads > 0:
+            sess_opt.intra_op_num_threads = intra_op_num_threads
+        inter_op_num_threads = get_op_num_threads("MINERU_INTER_OP_NUM_THREADS")
+        if inter_op_num_threads > 0:
+            sess_opt.inter_op_num_threads = inter_op_num_threads
+
+        self.kind = kind
+        self.session = InferenceSession(onnx_path, sess_options=sess_opt, providers=['CPUExecutionProvider'])
+
+    def __call__(self, inp):
+        if isinstance(inp, torch.Tensor):
+            inp = inp.detach().cpu().numpy()
+        output = self.session.run(None, {_INPUT_NAME: np.ascontiguousarray(inp, dtype=np.float32)})[0]
+        output = torch.from_numpy(output)
+        if self.kind == 'det':
+            return {'maps': output}
+        return output
+
+
+def build_ort_net(net, weights_path: str, kind: str, sample_input: torch.Tensor):
+    """读取缓存目录中与权重对应的onnx，不存在时先导出
+
+    Returns:
+        OrtNet，onnx/onnxruntime未安装、缓存目录不可写或导出失败时给出警告并返回原来的torch模型
+    """
+    try:
+        import onnxruntime  # noqa: F401
+        onnx_path = get_onnx_path(weights_path, kind)
+        if not os.path.exists(onnx_path):
+            export_onnx(net, onnx_path, kind, sample_input)
+        return OrtNet(onnx_path, kind)
+    except Exception as e:
+        logger.warning(f"failed to run the ocr {kind} model with onnxruntime, fall back to torch: {e}")
+        return net
+
+
+if __name__ == '__main__':
+    # 导出当前语言的det/rec模型，检查onnx与torch的输出一致性并对比CPU吞吐
+    # python -m mineru.model.utils.tools.infer.onnx_engine --lang ch --rounds 10
+    import argparse
+
+    from mineru.model.ocr.pytorch_paddle import PytorchPaddleOCR
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lang', type=str, default='ch')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['MINERU_DEVICE_MODE'] = 'cpu'
+    torch_ocr = PytorchPaddleOCR(lang=args.lang, ocr_engine='torch')
+    onnx_ocr = PytorchPaddleOCR(lang=args.lang, ocr_engine='onnx')
+
+    rng = np.random.default_rng(args.seed)
+    rec_height = torch_ocr.text_recognizer.rec_image_shape[1]
+    cases = {
+        'det': [rng.random((1, 3, h, w), dtype=np.float32) for h, w in [(640, 480), (960, 736), (320, 1280)]],
+        'rec': [rng.random((b, 3, rec_height, w), dtype=np.float32) for b, w in [(1, 320), (6, 160), (6, 960)]],
+    }
+    nets = {
+        'det': (torch_ocr.text_detector.net, onnx_ocr.text_detector.net),
+        'rec': (torch_ocr.text_recognizer.net, onnx_ocr.text_recognizer.net),
+    }
+    for kind, inputs in cases.items():
+        torch_net, ort_net = nets[kind]
+        for inp in inputs:
+            with torch.no_grad():
+                torch_out = torch_net(torch.from_numpy(inp))
+            ort_out = ort_net(inp)
+            if kind == 'det':
+                torch_out, ort_out = torch_out['maps'], ort_out['maps']
+            diff = (torch_out - ort_out).abs().max().item()
+            argmax_same = ''
+            if kind == 'rec':
+                argmax_same = f", argmax agree {(torch_out.argmax(-1) == ort_out.argmax(-1)).float().mean().item():.4f}"
+            print(f"{kind} {tuple(inp.shape)}: max abs diff {diff:.2e}{argmax_same}")
+
+        for name, net in zip(['torch', 'onnx'], nets[kind]):
+            start = time.time()
+            with torch.no_grad():
+                for _ in range(args.rounds):
+                    for inp in inputs:
+                        net(torch.from_numpy(inp))
+            cost = time.time() - start
+            print(f"{kind} {name}: {args.rounds * len(inputs) / cost:.2f} batches/s")
@@ -119,6 +119,9 @@ class TextDetector(BaseOCRV20):
         for module in self.net.modules():
             if hasattr(module, 'rep'):
                 module.rep()
+        if args.ocr_engine == 'onnx':
+            from .onnx_engine import build_ort_net
+            self.net = build_ort_net(self.net, self.weights_path, 'det', torch.zeros(1, 3, 640, 640))
 
     def _batch_process_same_size(self, img_list):
         """
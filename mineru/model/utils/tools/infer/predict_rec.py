@@ -10,6 +10,7 @@ from ...pytorchocr.base_ocr_v20 import BaseOCRV20
 from . import pytorchocr_utility as utility
 from ...pytorchocr.postprocess import build_post_process
 from ...pytorchocr.modeling.backbones.rec_hgnet import ConvBNAct
+from mineru.utils.os_env_config import get_cpu_int8_quantize_enable
 
 
 class TextRecognizer(BaseOCRV20):
@@ -100,6 +101,13 @@ class TextRecognizer(BaseOCRV20):
                     torch.quantization.fuse_modules(module, ['conv', 'bn', 'act'], inplace=True)
                 else:
                     torch.quantization.fuse_modules(module, ['conv', 'bn'], inplace=True)
+        if args.ocr_engine == 'onnx':
+            from .onnx_engine import build_ort_net
+            self.net = build_ort_net(self.net, self.weights_path, 'rec', torch.zeros(1, *self.rec_image_shape))
+        elif str(self.device).startswith('cpu') and get_cpu_int8_quantize_enable():
+            # 识别模型的Linear/LSTM层较小，量化耗时远低于读取缓存，不做磁盘缓存
+            from mineru.utils.quantize_utils import quantize_dynamic_int8
+            self.net = quantize_dynamic_int8(self.net, tag='ocr_rec')
 
     def resize_norm_img(self, img, max_wh_ratio):
         imgC, imgH, imgW = self.rec_image_shape
@@ -20,6 +20,7 @@ def init_args():
     parser.add_argument("--det", type=str2bool, default=True)
     parser.add_argument("--rec", type=str2bool, default=True)
     parser.add_argument("--device", type=str, default='cpu')
+    parser.add_argument("--ocr_engine", type=str, default='torch')
     # parser.add_argument("--ir_optim", type=str2bool, default=True)
     # parser.add_argument("--use_tensorrt", type=str2bool, default=False)
     # parser.add_argument("--use_fp16", type=str2bool, default=False)
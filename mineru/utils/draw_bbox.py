@@ -1,11 +1,17 @@
 import json
+import math
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from io import BytesIO
 
 from loguru import logger
-from pypdf import PdfReader, PdfWriter, PageObject
-from reportlab.pdfgen import canvas
 
+from .check_sys_env import is_windows_environment
 from .enum_class import BlockType, ContentType, SplitFlag
+from .os_env_config import get_draw_bbox_renderer, get_draw_bbox_background, get_draw_bbox_workers
+from .pdfium_guard import get_render_mp_context
 
 
 def cal_canvas_rect(page, bbox):
@@ -20,17 +26,22 @@ def cal_canvas_rect(page, bbox):
         rect: [x0, y0, width, height] representing the rectangle coordinates on the canvas.
     """
     page_width, page_height = float(page.cropbox[2]), float(page.cropbox[3])
-    
-    actual_width = page_width    # The width of the final PDF display
-    actual_height = page_height  # The height of the final PDF display
-    
+
     rotation_obj = page.get("/Rotate", 0)
     try:
         rotation = int(rotation_obj) % 360  # cast rotation to int to handle IndirectObject
     except (ValueError, TypeError) as e:
         logger.warning(f"Invalid /Rotate value {rotation_obj!r} on page; defaulting to 0. Error: {e}")
         rotation = 0
-    
+
+    return _cal_rect(page_width, page_height, rotation, bbox)
+
+
+def _cal_rect(page_width, page_height, rotation, bbox):
+    """把页面显示坐标系(左上角为原点)下的bbox换算为PDF用户坐标系下的[x0, y0, width, height]"""
+    actual_width = page_width    # The width of the final PDF display
+    actual_height = page_height  # The height of the final PDF display
+
     if rotation in [90, 270]:
         # PDF is rotated 90 degrees or 270 degrees, and the width and height need to be swapped
         actual_width, actual_height = actual_height, actual_width
@@ -57,6 +68,18 @@ def cal_canvas_rect(page, bbox):
     return rect
 
 
+def _number_origin(rect, rotation):
+    """序号文字的锚点，与reportlab版本的translate保持一致"""
+    if rotation == 90:
+        return rect[0] + 10, rect[1] + rect[3] + 2
+    elif rotation == 180:
+        return rect[0] - 2, rect[1] + 10
+    elif rotation == 270:
+        return rect[0] + rect[2] - 10, rect[1] - 2
+    else:
+        return rect[0] + rect[2] + 2, rect[1] + rect[3] - 10
+
+
 def draw_bbox_without_number(i, bbox_list, page, c, rgb_config, fill_config):
     new_rgb = [float(color) / 255 for color in rgb_config]
     page_data = bbox_list[i]
@@ -101,15 +124,7 @@ def draw_bbox_with_number(i, bbox_list, page, c, rgb_config, fill_config, draw_b
             logger.warning(f"Invalid /Rotate value: {rotation_obj!r}, defaulting to 0")
             rotation = 0
 
-        if rotation == 0:
-            c.translate(rect[0] + rect[2] + 2, rect[1] + rect[3] - 10)
-        elif rotation == 90:
-            c.translate(rect[0] + 10, rect[1] + rect[3] + 2)
-        elif rotation == 180:
-            c.translate(rect[0] - 2, rect[1] + 10)
-        elif rotation == 270:
-            c.translate(rect[0] + rect[2] - 10, rect[1] - 2)
-            
+        c.translate(*_number_origin(rect, rotation))
         c.rotate(rotation)
         c.drawString(0, 0, str(j + 1))
         c.restoreState()
@@ -237,56 +252,25 @@ def draw_layout_bbox(pdf_info, pdf_bytes, out_path, filename):
 
         layout_bbox_list.append(page_block_list)
 
-    pdf_bytes_io = BytesIO(pdf_bytes)
-    pdf_docs = PdfReader(pdf_bytes_io)
-    output_pdf = PdfWriter()
-
-    for i, page in enumerate(pdf_docs.pages):
-        # 获取原始页面尺寸
-        page_width, page_height = float(page.cropbox[2]), float(page.cropbox[3])
-        custom_page_size = (page_width, page_height)
-
-        packet = BytesIO()
-        # 使用原始PDF的尺寸创建canvas
-        c = canvas.Canvas(packet, pagesize=custom_page_size)
-
-        c = draw_bbox_without_number(i, codes_body_list, page, c, [102, 0, 204], True)
-        c = draw_bbox_without_number(i, codes_caption_list, page, c, [204, 153, 255], True)
-        c = draw_bbox_without_number(i, dropped_bbox_list, page, c, [158, 158, 158], True)
-        c = draw_bbox_without_number(i, tables_body_list, page, c, [204, 204, 0], True)
-        c = draw_bbox_without_number(i, tables_caption_list, page, c, [255, 255, 102], True)
-        c = draw_bbox_without_number(i, tables_footnote_list, page, c, [229, 255, 204], True)
-        c = draw_bbox_without_number(i, imgs_body_list, page, c, [153, 255, 51], True)
-        c = draw_bbox_without_number(i, imgs_caption_list, page, c, [102, 178, 255], True)
-        c = draw_bbox_without_number(i, imgs_footnote_list, page, c, [255, 178, 102], True)
-        c = draw_bbox_without_number(i, titles_list, page, c, [102, 102, 255], True)
-        c = draw_bbox_without_number(i, texts_list, page, c, [153, 0, 76], True)
-        c = draw_bbox_without_number(i, interequations_list, page, c, [0, 255, 0], True)
-        c = draw_bbox_without_number(i, lists_list, page, c, [40, 169, 92], True)
-        c = draw_bbox_without_number(i, list_items_list, page, c, [40, 169, 92], False)
-        c = draw_bbox_without_number(i, indexs_list, page, c, [40, 169, 92], True)
-        c = draw_bbox_with_number(i, layout_bbox_list, page, c, [255, 0, 0], False, draw_bbox=False)
-
-        c.save()
-        packet.seek(0)
-        overlay_pdf = PdfReader(packet)
-
-        # 添加检查确保overlay_pdf.pages不为空
-        if len(overlay_pdf.pages) > 0:
-            new_page = PageObject(pdf=None)
-            new_page.update(page)
-            page = new_page
-            page.merge_page(overlay_pdf.pages[0])
-        else:
-            # 记录日志并继续处理下一个页面
-            # logger.warning(f"layout.pdf: 第{i + 1}页未能生成有效的overlay PDF")
-            pass
-
-        output_pdf.add_page(page)
-
-    # 保存结果
-    with open(f"{out_path}/{filename}", "wb") as f:
-        output_pdf.write(f)
+    layers = [
+        (codes_body_list, [102, 0, 204], True, False, True),
+        (codes_caption_list, [204, 153, 255], True, False, True),
+        (dropped_bbox_list, [158, 158, 158], True, False, True),
+        (tables_body_list, [204, 204, 0], True, False, True),
+        (tables_caption_list, [255, 255, 102], True, False, True),
+        (tables_footnote_list, [229, 255, 204], True, False, True),
+        (imgs_body_list, [153, 255, 51], True, False, True),
+        (imgs_caption_list, [102, 178, 255], True, False, True),
+        (imgs_footnote_list, [255, 178, 102], True, False, True),
+        (titles_list, [102, 102, 255], True, False, True),
+        (texts_list, [153, 0, 76], True, False, True),
+        (interequations_list, [0, 255, 0], True, False, True),
+        (lists_list, [40, 169, 92], True, False, True),
+        (list_items_list, [40, 169, 92], False, False, True),
+        (indexs_list, [40, 169, 92], True, False, True),
+        (layout_bbox_list, [255, 0, 0], False, True, False),
+    ]
+    _draw_layers(layers, pdf_bytes, out_path, filename)
 
 
 def draw_span_bbox(pdf_info, pdf_bytes, out_path, filename):
@@ -349,47 +333,15 @@ def draw_span_bbox(pdf_info, pdf_bytes, out_path, filename):
         image_list.append(page_image_list)
         table_list.append(page_table_list)
 
-    pdf_bytes_io = BytesIO(pdf_bytes)
-    pdf_docs = PdfReader(pdf_bytes_io)
-    output_pdf = PdfWriter()
-
-    for i, page in enumerate(pdf_docs.pages):
-        # 获取原始页面尺寸
-        page_width, page_height = float(page.cropbox[2]), float(page.cropbox[3])
-        custom_page_size = (page_width, page_height)
-
-        packet = BytesIO()
-        # 使用原始PDF的尺寸创建canvas
-        c = canvas.Canvas(packet, pagesize=custom_page_size)
-
-        # 获取当前页面的数据
-        draw_bbox_without_number(i, text_list, page, c,[255, 0, 0], False)
-        draw_bbox_without_number(i, inline_equation_list, page, c, [0, 255, 0], False)
-        draw_bbox_without_number(i, interline_equation_list, page, c, [0, 0, 255], False)
-        draw_bbox_without_number(i, image_list, page, c, [255, 204, 0], False)
-        draw_bbox_without_number(i, table_list, page, c, [204, 0, 255], False)
-        draw_bbox_without_number(i, dropped_list, page, c, [158, 158, 158], False)
-
-        c.save()
-        packet.seek(0)
-        overlay_pdf = PdfReader(packet)
-
-        # 添加检查确保overlay_pdf.pages不为空
-        if len(overlay_pdf.pages) > 0:
-            new_page = PageObject(pdf=None)
-            new_page.update(page)
-            page = new_page
-            page.merge_page(overlay_pdf.pages[0])
-        else:
-            # 记录日志并继续处理下一个页面
-            # logger.warning(f"span.pdf: 第{i + 1}页未能生成有效的overlay PDF")
-            pass
-
-        output_pdf.add_page(page)
-
-    # Save the PDF
-    with open(f"{out_path}/{filename}", "wb") as f:
-        output_pdf.write(f)
+    layers = [
+        (text_list, [255, 0, 0], False, False, True),
+        (inline_equation_list, [0, 255, 0], False, False, True),
+        (interline_equation_list, [0, 0, 255], False, False, True),
+        (image_list, [255, 204, 0], False, False, True),
+        (table_list, [204, 0, 255], False, False, True),
+        (dropped_list, [158, 158, 158], False, False, True),
+    ]
+    _draw_layers(layers, pdf_bytes, out_path, filename)
 
 
 def draw_line_sort_bbox(pdf_info, pdf_bytes, out_path, filename):
@@ -434,7 +386,26 @@ def draw_line_sort_bbox(pdf_info, pdf_bytes, out_path, filename):
                             index = line['index']
                             page_line_list.append({'index': index, 'bbox': bbox})
         sorted_bboxes = sorted(page_line_list, key=lambda x: x['index'])
-        layout_bbox_list.append(sorted_bbox['bbox'] for sorted_bbox in sorted_bboxes)
+        layout_bbox_list.append([sorted_bbox['bbox'] for sorted_bbox in sorted_bboxes])
+    layers = [
+        (layout_bbox_list, [255, 0, 0], False, True, True),
+    ]
+    _draw_layers(layers, pdf_bytes, out_path, filename)
+
+
+def _draw_layers(layers, pdf_bytes, out_path, filename):
+    """按图层绘制bbox并保存，layers中每一项为(bbox_list, rgb_config, fill_config, with_number, draw_bbox)"""
+    if get_draw_bbox_renderer() == "pypdf":
+        _draw_layers_by_pypdf(layers, pdf_bytes, out_path, filename)
+    else:
+        _draw_layers_by_stream(layers, pdf_bytes, out_path, filename)
+
+
+def _draw_layers_by_pypdf(layers, pdf_bytes, out_path, filename):
+    """reportlab生成overlay后用pypdf合并，纯python实现，页数多时较慢"""
+    from pypdf import PdfReader, PdfWriter, PageObject
+    from reportlab.pdfgen import canvas
+
     pdf_bytes_io = BytesIO(pdf_bytes)
     pdf_docs = PdfReader(pdf_bytes_io)
     output_pdf = PdfWriter()
@@ -448,8 +419,11 @@ def draw_line_sort_bbox(pdf_info, pdf_bytes, out_path, filename):
         # 使用原始PDF的尺寸创建canvas
         c = canvas.Canvas(packet, pagesize=custom_page_size)
 
-        # 获取当前页面的数据
-        draw_bbox_with_number(i, layout_bbox_list, page, c, [255, 0, 0], False)
+        for bbox_list, rgb_config, fill_config, with_number, draw_bbox in layers:
+            if with_number:
+                c = draw_bbox_with_number(i, bbox_list, page, c, rgb_config, fill_config, draw_bbox=draw_bbox)
+            else:
+                c = draw_bbox_without_number(i, bbox_list, page, c, rgb_config, fill_config)
 
         c.save()
         packet.seek(0)
@@ -461,18 +435,187 @@ def draw_line_sort_bbox(pdf_info, pdf_bytes, out_path, filename):
             new_page.update(page)
             page = new_page
             page.merge_page(overlay_pdf.pages[0])
-        else:
-            # 记录日志并继续处理下一个页面
-            # logger.warning(f"span.pdf: 第{i + 1}页未能生成有效的overlay PDF")
-            pass
 
         output_pdf.add_page(page)
 
-    # Save the PDF
+    # 保存结果
     with open(f"{out_path}/{filename}", "wb") as f:
         output_pdf.write(f)
 
 
+_OVERLAY_GS_NAME = "/MinerUOverlayGS"
+_OVERLAY_FONT_NAME = "/MinerUOverlayF1"
+
+
+def _get_page_rotation(page):
+    rotation_obj = page.get("/Rotate", 0)
+    try:
+        return int(rotation_obj) % 360
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid /Rotate value: {rotation_obj!r}, defaulting to 0")
+        return 0
+
+
+def _get_or_create_dict(parent, key):
+    from pypdf.generic import DictionaryObject, NameObject
+
+    if key in parent:
+        return parent[key].get_object()
+    new_dict = DictionaryObject()
+    parent[NameObject(key)] = new_dict
+    return new_dict
+
+
+def _add_overlay_resources(page):
+    """在页面资源中登记overlay用到的半透明ExtGState和Helvetica字体"""
+    from pypdf.generic import DictionaryObject, FloatObject, NameObject
+
+    resources = _get_or_create_dict(page, "/Resources")
+    ext_g_state = _get_or_create_dict(resources, "/ExtGState")
+    ext_g_state[NameObject(_OVERLAY_GS_NAME)] = DictionaryObject({
+        NameObject("/Type"): NameObject("/ExtGState"),
+        NameObject("/ca"): FloatObject(0.3),
+    })
+    fonts = _get_or_create_dict(resources, "/Font")
+    fonts[NameObject(_OVERLAY_FONT_NAME)] = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+    })
+
+
+def _append_page_content(writer, page, content: bytes):
+    """用q/Q包住原有内容流，再在其后追加overlay内容流，原有内容流不做解析"""
+    from pypdf.generic import ArrayObject, NameObject, StreamObject
+
+    begin_stream = StreamObject()
+    begin_stream.set_data(b"q\n")
+    end_stream = StreamObject()
+    end_stream.set_data(b"Q\n" + content)
+
+    contents = [writer._add_object(begin_stream)]
+    if "/Contents" in page:
+        old_contents = page.raw_get("/Contents")
+        if isinstance(old_contents.get_object(), ArrayObject):
+            contents.extend(old_contents.get_object())
+        else:
+            contents.append(old_contents)
+    contents.append(writer._add_object(end_stream))
+    page[NameObject("/Contents")] = ArrayObject(contents)
+
+
+def _layer_page_ops(i, page_width, page_height, rotation, layer):
+    bbox_list, rgb_config, fill_config, with_number, draw_bbox = layer
+    r, g, b = [float(color) / 255 for color in rgb_config]
+    cos_r, sin_r = round(math.cos(math.radians(rotation))), round(math.sin(math.radians(rotation)))
+    ops = []
+    for j, bbox in enumerate(bbox_list[i]):
+        x, y, w, h = _cal_rect(page_width, page_height, rotation, bbox)
+        if draw_bbox:
+            if fill_config:
+                ops.append(f"q {_OVERLAY_GS_NAME} gs {r:.4f} {g:.4f} {b:.4f} rg {x:.3f} {y:.3f} {w:.3f} {h:.3f} re f Q")
+            else:
+                ops.append(f"q {r:.4f} {g:.4f} {b:.4f} RG 1 w {x:.3f} {y:.3f} {w:.3f} {h:.3f} re S Q")
+        if with_number:
+            tx, ty = _number_origin([x, y, w, h], rotation)
+            ops.append(
+                f"q {r:.4f} {g:.4f} {b:.4f} rg BT {_OVERLAY_FONT_NAME} 10 Tf "
+                f"{cos_r} {sin_r} {-sin_r} {cos_r} {tx:.3f} {ty:.3f} Tm ({j + 1}) Tj ET Q"
+            )
+    return ops
+
+
+def _draw_layers_by_stream(layers, pdf_bytes, out_path, filename):
+    """直接把overlay的绘制指令写成内容流追加到原页面，不经过reportlab和merge_page"""
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter(clone_from=PdfReader(BytesIO(pdf_bytes)))
+
+    for i, page in enumerate(writer.pages):
+        page_width, page_height = float(page.cropbox[2]), float(page.cropbox[3])
+        rotation = _get_page_rotation(page)
+
+        ops = []
+        for layer in layers:
+            ops.extend(_layer_page_ops(i, page_width, page_height, rotation, layer))
+        if not ops:
+            continue
+
+        _add_overlay_resources(page)
+        _append_page_content(writer, page, "\n".join(ops).encode("latin-1"))
+
+    with open(f"{out_path}/{filename}", "wb") as f:
+        writer.write(f)
+
+
+_draw_executor = None
+_draw_lock = threading.Lock()
+
+
+def _timed_draw(draw_func, pdf_info, pdf_bytes, out_path, filename):
+    draw_start = time.time()
+    draw_func(pdf_info, pdf_bytes, out_path, filename)
+    return round(time.time() - draw_start, 2)
+
+
+def _background_draw(draw_func, pdf_info_pickle, pdf_bytes, out_path, filename):
+    return _timed_draw(draw_func, pickle.loads(pdf_info_pickle), pdf_bytes, out_path, filename)
+
+
+def submit_draw_task(draw_func, pdf_info, pdf_bytes, out_path, filename):
+    """把可视化文件的生成放到后台进程中执行
+
+    Returns:
+        (filename, future)，调用方在结束前需要用wait_draw_tasks等待自己提交的任务，
+        多个解析任务并发时各自等待，不会互相取走对方的任务
+    """
+    global _draw_executor
+    if not get_draw_bbox_background() or is_windows_environment():
+        future = Future()
+        try:
+            future.set_result(_timed_draw(draw_func, pdf_info, pdf_bytes, out_path, filename))
+        except Exception as e:
+            future.set_exception(e)
+        return filename, future
+
+    with _draw_lock:
+        if _draw_executor is None:
+            # 调用方进程中已有推理、写图片等线程，不能直接fork，与页面渲染进程池使用同样的启动方式
+            _draw_executor = ProcessPoolExecutor(
+                max_workers=get_draw_bbox_workers(), mp_context=get_render_mp_context()
+            )
+        # 提交时即序列化，避免后台序列化期间pdf_info被修改
+        future = _draw_executor.submit(
+            _background_draw, draw_func, pickle.dumps(pdf_info), pdf_bytes, out_path, filename
+        )
+    return filename, future
+
+
+def wait_draw_tasks(draw_tasks):
+    """等待submit_draw_task返回的任务全部完成，有任务失败时在全部结束后抛出第一个错误"""
+    error = None
+    for filename, future in draw_tasks:
+        try:
+            draw_cost = future.result()
+            logger.info(f"{filename} draw cost: {draw_cost}")
+        except Exception as e:
+            logger.error(f"Failed to draw {filename}: {e}")
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+
+
+def shutdown_draw_executor():
+    """关闭后台可视化进程池，等待已提交的任务结束，multiprocessing启动的子进程退出时不会自动关闭"""
+    global _draw_executor
+    with _draw_lock:
+        executor, _draw_executor = _draw_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
 if __name__ == "__main__":
     # 读取PDF文件
     pdf_path = "examples/demo1.pdf"
@@ -1,8 +1,7 @@
 from pathlib import Path
 import os
 import sys
-
-from magika import Magika
+import threading
 
 
 DEFAULT_LANG = "txt"
@@ -29,54 +28,77 @@ def _get_magika_base_dir():
     # 默认情况，让magika自己查找
     return None
 
-# 初始化magika实例
-magika = None
-try:
-    # 在打包后的环境中，magika需要能够找到models和config目录
-    if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-        meipass = Path(sys._MEIPASS)
-        magika_base = meipass / 'magika'
-        magika_models = magika_base / 'models'
-        magika_config = magika_base / 'config'
+# magika实例在第一次使用时才初始化，避免导入本模块时加载onnx模型
+_magika = None
+_magika_initialized = False
+_magika_lock = threading.Lock()
+
+
+def get_magika():
+    """返回进程内共享的magika实例，初始化失败时返回None"""
+    global _magika, _magika_initialized
+    if _magika_initialized:
+        return _magika
+    with _magika_lock:
+        if not _magika_initialized:
+            _magika = _init_magika()
+            _magika_initialized = True
+    return _magika
+
+
+def _init_magika():
+    from magika import Magika
+
+    magika = None
+    try:
+        # 在打包后的环境中，magika需要能够找到models和config目录
+        if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
+            meipass = Path(sys._MEIPASS)
+            magika_base = meipass / 'magika'
+            magika_models = magika_base / 'models'
+            magika_config = magika_base / 'config'
         
-        # 检查必要的目录是否存在
-        if magika_models.exists() and magika_config.exists():
-            # 设置环境变量指向模型目录
-            os.environ['MAGIKA_MODEL_DIR'] = str(magika_models)
-            # magika会在模型目录的父目录（即magika_base）查找config
-            # 尝试使用模型目录初始化
-            try:
-                magika = Magika(model_dir=magika_models)
-            except Exception:
-                # 如果失败，尝试默认初始化
-                magika = Magika()
-        elif magika_models.exists():
-            # 只有models目录，尝试初始化
-            os.environ['MAGIKA_MODEL_DIR'] = str(magika_models)
-            try:
-                magika = Magika(model_dir=magika_models)
-            except Exception:
+            # 检查必要的目录是否存在
+            if magika_models.exists() and magika_config.exists():
+                # 设置环境变量指向模型目录
+                os.environ['MAGIKA_MODEL_DIR'] = str(magika_models)
+                # magika会在模型目录的父目录（即magika_base）查找config
+                # 尝试使用模型目录初始化
+                try:
+                    magika = Magika(model_dir=magika_models)
+                except Exception:
+                    # 如果失败，尝试默认初始化
+                    magika = Magika()
+            elif magika_models.exists():
+                # 只有models目录，尝试初始化
+                os.environ['MAGIKA_MODEL_DIR'] = str(magika_models)
+                try:
+                    magika = Magika(model_dir=magika_models)
+                except Exception:
+                    magika = Magika()
+            else:
+                # 目录不存在，使用默认初始化
                 magika = Magika()
         else:
-            # 目录不存在，使用默认初始化
+            # 非打包环境，使用默认初始化
             magika = Magika()
-    else:
-        # 非打包环境，使用默认初始化
-        magika = Magika()
-except Exception as e:
-    # 如果初始化失败，记录警告但继续
-    import warnings
-    try:
-        warnings.warn(f"Failed to initialize magika: {e}", UserWarning)
-    except Exception:
-        pass
-    # 尝试最后一次默认初始化
-    try:
-        magika = Magika()
-    except Exception:
-        magika = None
+    except Exception as e:
+        # 如果初始化失败，记录警告但继续
+        import warnings
+        try:
+            warnings.warn(f"Failed to initialize magika: {e}", UserWarning)
+        except Exception:
+            pass
+        # 尝试最后一次默认初始化
+        try:
+            magika = Magika()
+        except Exception:
+            magika = None
+    return magika
+
 
 def guess_language_by_text(code):
+    magika = get_magika()
     if magika is None:
         return DEFAULT_LANG
     try:
@@ -87,14 +109,61 @@ def guess_language_by_text(code):
         return DEFAULT_LANG
 
 
+# 固定位置的文件头签名: (偏移, 签名, 类型)
+_FILE_SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'png'),
+    (0, b'\xff\xd8\xff', 'jpeg'),
+    (0, b'II*\x00', 'tiff'),
+    (0, b'MM\x00*', 'tiff'),
+    # BigTIFF
+    (0, b'II+\x00', 'tiff'),
+    (0, b'MM\x00+', 'tiff'),
+    (0, b'\x00\x00\x00\x0cjP  \r\n\x87\n', 'jp2'),
+    # 没有jp2封装的J2K码流
+    (0, b'\xff\x4f\xff\x51', 'jp2'),
+    (0, b'GIF87a', 'gif'),
+    (0, b'GIF89a', 'gif'),
+]
+# pdf允许文件头前有其他字节，规范要求%PDF-出现在前1024字节内
+_PDF_HEADER_RANGE = 1024
+# BITMAPCOREHEADER/BITMAPINFOHEADER及其扩展版本的头长度
+_BMP_DIB_HEADER_SIZES = {12, 16, 40, 52, 56, 64, 108, 124}
+# 签名无法判断时交给magika的前缀长度
+MAGIKA_PREFIX_SIZE = 64 * 1024
+
+
+def sniff_suffix(header: bytes) -> str | None:
+    """由文件头判断MinerU支持的文件类型，无法确定时返回None
+
+    固定偏移的签名优先，避免注释或元数据中碰巧含有%PDF-的图片被识别为pdf
+    """
+    for offset, signature, suffix in _FILE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return suffix
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    # BM只有两个字节，同时检查DIB头长度，减少误判
+    if header[:2] == b'BM' and len(header) >= 18 and int.from_bytes(header[14:18], 'little') in _BMP_DIB_HEADER_SIZES:
+        return 'bmp'
+    pdf_header_pos = header.find(b'%PDF-', 0, _PDF_HEADER_RANGE)
+    if pdf_header_pos >= 0 and header[pdf_header_pos + 5:pdf_header_pos + 6].isdigit():
+        return 'pdf'
+    return None
+
+
 def guess_suffix_by_bytes(file_bytes, file_path=None) -> str:
+    suffix = sniff_suffix(file_bytes[:_PDF_HEADER_RANGE + 16])
+    if suffix is not None:
+        return suffix
+    magika = get_magika()
     if magika is None:
         # 如果magika不可用，尝试从文件路径推断
         if file_path:
             return Path(file_path).suffix.lstrip('.') or DEFAULT_LANG
         return DEFAULT_LANG
     try:
-        suffix = magika.identify_bytes(file_bytes).prediction.output.label
+        # 签名无法判断的文件只把开头的一段交给magika
+        suffix = magika.identify_bytes(file_bytes[:MAGIKA_PREFIX_SIZE]).prediction.output.label
         if file_path and suffix in ["ai"] and Path(file_path).suffix.lower() in [".pdf"]:
             suffix = "pdf"
         return suffix
@@ -106,6 +175,14 @@ def guess_suffix_by_bytes(file_bytes, file_path=None) -> str:
 
 
 def guess_suffix_by_path(file_path) -> str:
+    try:
+        with open(file_path, 'rb') as f:
+            suffix = sniff_suffix(f.read(_PDF_HEADER_RANGE + 16))
+        if suffix is not None:
+            return suffix
+    except OSError:
+        pass
+    magika = get_magika()
     if magika is None:
         # 如果magika不可用，从文件路径推断
         if not isinstance(file_path, Path):
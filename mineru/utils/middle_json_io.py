@@ -0,0 +1,273 @@
+# Copyright (c) Opendatalab. All rights reserved.
+"""middle_json/model_json的流式写入与按页读取。
+
+写入时逐页编码，不会构造整个文件的字符串；但middle_json本身仍由result_to_middle_json在内存中完整生成，
+分段、跨页表格合并和后置OCR都需要看到全部页面，因此写入只能在整个文档处理完成后开始，
+内存峰值由页面数据本身决定，而不是编码后的字符串。
+"""
+import json
+import mmap
+import struct
+
+from mineru.utils.os_env_config import get_middle_json_format
+
+MIDDLE_JSON_FORMATS = {
+    'json': '.json',
+    'json-min': '.json',
+    'jsonl': '.jsonl',
+    'jsonl.zst': '.jsonl.zst',
+    'msgpack': '.msgpack',
+}
+
+# zstd可跳过帧的magic，解压工具会忽略该帧，用于在文件末尾保存每页的偏移
+_ZSTD_SKIPPABLE_MAGIC = 0x184D2A5E
+_INDEX_FOOTER = struct.Struct('<I')
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The 'jsonl.zst' format requires zstandard, please run `pip install zstandard`.")
+    return zstandard
+
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("The 'msgpack' format requires msgpack, please run `pip install msgpack`.")
+    return msgpack
+
+
+def _split_pages(data):
+    """把middle_json(dict)或model_json(list)拆成文件头和逐页数据"""
+    if isinstance(data, list):
+        return {}, data, None
+    pages_key = 'pdf_info'
+    header = {key: value for key, value in data.items() if key != pages_key}
+    return header, data.get(pages_key, []), pages_key
+
+
+def _iter_json_chunks(data, indent):
+    """逐页输出json，indent=4时与json.dumps(data, ensure_ascii=False, indent=4)的结果完全一致"""
+    newline = '' if indent is None else '\n'
+    key_separator = ':' if indent is None else ': '
+    separators = (',', ':') if indent is None else None
+
+    def dumps(obj, level):
+        text = json.dumps(obj, ensure_ascii=False, indent=indent, separators=separators)
+        if indent is None or level == 0:
+            return text
+        return text.replace('\n', '\n' + ' ' * (indent * level))
+
+    def iter_list(items, level):
+        if len(items) == 0:
+            yield '[]'
+            return
+        pad = '' if indent is None else ' ' * (indent * level)
+        yield '['
+        for index, item in enumerate(items):
+            yield (',' if index > 0 else '') + newline + pad + dumps(item, level)
+        yield newline + ('' if indent is None else ' ' * (indent * (level - 1))) + ']'
+
+    if isinstance(data, list):
+        yield from iter_list(data, 1)
+        return
+
+    if len(data) == 0:
+        yield '{}'
+        return
+    pad = '' if indent is None else ' ' * indent
+    yield '{'
+    for index, (key, value) in enumerate(data.items()):
+        yield (',' if index > 0 else '') + newline + pad + json.dumps(key, ensure_ascii=False) + key_separator
+        if isinstance(value, list):
+            yield from iter_list(value, 2)
+        else:
+            yield dumps(value, 1)
+    yield newline + '}'
+
+
+def _iter_encoded(chunks, batch_size=1 << 20):
+    buffer, buffer_size = [], 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        buffer_size += len(data)
+        if buffer_size >= batch_size:
+            yield b''.join(buffer)
+            buffer, buffer_size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _iter_jsonl_lines(data):
+    header, pages, _ = _split_pages(data)
+    header = dict(header, page_count=len(pages))
+    yield json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+    for page in pages:
+        yield json.dumps(page, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _iter_jsonl_zst(data):
+    zstandard = _import_zstd()
+    compressor = zstandard.ZstdCompressor(level=3)
+    offsets, offset = [], 0
+    # 每一行单独压缩成一个zstd帧，整个文件仍可直接用zstd解压为jsonl
+    for line in _iter_jsonl_lines(data):
+        frame = compressor.compress(line)
+        offsets.append(offset)
+        offset += len(frame)
+        yield frame
+    offsets.append(offset)
+    index_bytes = json.dumps(offsets, separators=(',', ':')).encode('utf-8')
+    payload = index_bytes + _INDEX_FOOTER.pack(len(index_bytes))
+    yield struct.pack('<II', _ZSTD_SKIPPABLE_MAGIC, len(payload)) + payload
+
+
+def _iter_msgpack(data):
+    msgpack = _import_msgpack()
+    packer = msgpack.Packer()
+    header, pages, _ = _split_pages(data)
+    yield packer.pack(dict(header, page_count=len(pages)))
+    for page in pages:
+        yield packer.pack(page)
+
+
+def iter_dump_chunks(data, output_format='json'):
+    """按指定格式把middle_json/model_json编码为bytes块，逐页生成，不构造完整的字符串"""
+    if output_format == 'json':
+        return _iter_encoded(_iter_json_chunks(data, indent=4))
+    elif output_format == 'json-min':
+        return _iter_encoded(_iter_json_chunks(data, indent=None))
+    elif output_format == 'jsonl':
+        return _iter_jsonl_lines(data)
+    elif output_format == 'jsonl.zst':
+        return _iter_jsonl_zst(data)
+    elif output_format == 'msgpack':
+        return _iter_msgpack(data)
+    else:
+        raise ValueError(f"Unsupported middle json format: {output_format}")
+
+
+def dump_json_output(writer, file_stem, data, output_format=None):
+    """把middle_json或model_json以流式方式写入writer，返回实际写入的文件名
+
+    Args:
+        writer: DataWriter
+        file_stem: 不带后缀的文件名，例如 demo_middle
+        data: middle_json(dict) 或 model_json(list)
+        output_format: json(默认，与原先格式一致)、json-min、jsonl、jsonl.zst、msgpack，
+            为None时读取环境变量MINERU_MIDDLE_JSON_FORMAT
+    """
+    if output_format is None:
+        output_format = get_middle_json_format()
+    file_name = f"{file_stem}{MIDDLE_JSON_FORMATS[output_format]}"
+    writer.write_chunks(file_name, iter_dump_chunks(data, output_format))
+    return file_name
+
+
+class MiddleJsonReader:
+    """按需读取单页的middle_json/model_json，jsonl、jsonl.zst、msgpack格式无需解析整个文件"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        if self.path.endswith('.jsonl.zst'):
+            self.format = 'jsonl.zst'
+        elif self.path.endswith('.jsonl'):
+            self.format = 'jsonl'
+        elif self.path.endswith('.msgpack'):
+            self.format = 'msgpack'
+        else:
+            self.format = 'json'
+        self._file = open(self.path, 'rb')
+        self._data = None
+        self._offsets = None
+        self._mmap = None
+        self._load_index()
+
+    def _load_index(self):
+        if self.format == 'json':
+            self._data = json.load(self._file)
+            self.header, self._pages, _ = _split_pages(self._data)
+            return
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.format == 'jsonl':
+            offsets, position = [0], 0
+            while True:
+                position = self._mmap.find(b'\n', position)
+                if position == -1 or position + 1 >= len(self._mmap):
+                    break
+                position += 1
+                offsets.append(position)
+            offsets.append(len(self._mmap))
+            self._offsets = offsets
+        elif self.format == 'jsonl.zst':
+            index_size = _INDEX_FOOTER.unpack(self._mmap[-_INDEX_FOOTER.size:])[0]
+            index_start = len(self._mmap) - _INDEX_FOOTER.size - index_size
+            self._offsets = json.loads(self._mmap[index_start:index_start + index_size])
+        elif self.format == 'msgpack':
+            msgpack = _import_msgpack()
+            # 只跳过对象记录偏移，不做解码
+            self._file.seek(0)
+            unpacker = msgpack.Unpacker(self._file, raw=False)
+            offsets = [0]
+            while True:
+                try:
+                    unpacker.skip()
+                except msgpack.OutOfData:
+                    break
+                offsets.append(unpacker.tell())
+            self._offsets = offsets
+        self.header = self._read_record(0)
+
+    def _read_record(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        raw = self._mmap[start:end]
+        if self.format == 'jsonl':
+            return json.loads(raw)
+        elif self.format == 'jsonl.zst':
+            return json.loads(_import_zstd().ZstdDecompressor().decompress(raw))
+        else:
+            return _import_msgpack().unpackb(raw, raw=False)
+
+    def __len__(self):
+        if self._data is not None:
+            return len(self._pages)
+        return self.header.get('page_count', len(self._offsets) - 2)
+
+    def page(self, page_index):
+        """读取第page_index页"""
+        if self._data is not None:
+            return self._pages[page_index]
+        if page_index < 0:
+            page_index += len(self)
+        if not 0 <= page_index < len(self):
+            raise IndexError(f"page index {page_index} out of range")
+        return self._read_record(page_index + 1)
+
+    def __iter__(self):
+        for page_index in range(len(self)):
+            yield self.page(page_index)
+
+    def load(self):
+        """读取全部内容，返回与json.load原始middle.json相同的结构"""
+        if self._data is not None:
+            return self._data
+        pages = list(self)
+        header = {key: value for key, value in self.header.items() if key != 'page_count'}
+        if not header:
+            return pages
+        return dict(pdf_info=pages, **header)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -7,12 +7,6 @@ import numpy as np
 
 from mineru.utils.boxbase import get_minbox_if_overlap_by_ratio
 
-try:
-    import torch
-    import torch_npu
-except ImportError:
-    pass
-
 
 def crop_img(input_res, input_img, crop_paste_x=0, crop_paste_y=0):
 
@@ -31,6 +25,10 @@ def crop_img(input_res, input_img, crop_paste_x=0, crop_paste_y=0):
         # Crop the original image using numpy slicing
         cropped_img = input_img[crop_ymin:crop_ymax, crop_xmin:crop_xmax]
 
+        if cropped_img.ndim == 2:
+            # 单通道的灰度页面，粘贴时扩展为三通道
+            cropped_img = cropped_img[..., None]
+
         # Paste the cropped image onto the white background
         return_image[crop_paste_y:crop_paste_y + (crop_ymax - crop_ymin),
         crop_paste_x:crop_paste_x + (crop_xmax - crop_xmin)] = cropped_img
@@ -415,13 +413,16 @@ def get_res_list_from_layout_res(layout_res, iou_threshold=0.7, overlap_threshol
 
 def clean_memory(device='cuda'):
     if device == 'cuda':
+        import torch
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
             torch.cuda.ipc_collect()
     elif str(device).startswith("npu"):
+        import torch_npu
         if torch_npu.npu.is_available():
             torch_npu.npu.empty_cache()
     elif str(device).startswith("mps"):
+        import torch
         torch.mps.empty_cache()
     gc.collect()
 
@@ -438,10 +439,13 @@ def clean_vram(device, vram_threshold=8):
 
 
 def get_vram(device):
-    if torch.cuda.is_available() and str(device).startswith("cuda"):
-        total_memory = torch.cuda.get_device_properties(device).total_memory / (1024 ** 3)  # 将字节转换为 GB
-        return total_memory
+    if str(device).startswith("cuda"):
+        import torch
+        if torch.cuda.is_available():
+            total_memory = torch.cuda.get_device_properties(device).total_memory / (1024 ** 3)  # 将字节转换为 GB
+            return total_memory
     elif str(device).startswith("npu"):
+        import torch_npu
         if torch_npu.npu.is_available():
             total_memory = torch_npu.npu.get_device_properties(device).total_memory / (1024 ** 3)  # 转为 GB
             return total_memory
@@ -1,17 +1,146 @@
+import hashlib
+import json
 import os
-from huggingface_hub import snapshot_download as hf_snapshot_download
-from modelscope import snapshot_download as ms_snapshot_download
+import threading
+import time
+
+from loguru import logger
 
 from mineru.utils.config_reader import get_local_models_dir
 from mineru.utils.enum_class import ModelPath
+from mineru.utils.os_env_config import get_models_manifest_path, get_model_offline
+
+MANIFEST_VERSION = 1
+
+_manifest_lock = threading.Lock()
+# 进程内已解析的模型根目录，(model_source, repo, relative_path) -> root
+_resolved_roots = {}
+
+
+def _sha256_file(file_path, chunk_size=1 << 20):
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _list_model_files(root, relative_path):
+    """列出root下relative_path对应的所有文件，返回相对root的路径"""
+    target = os.path.join(root, relative_path) if relative_path else root
+    if os.path.isfile(target):
+        return [relative_path]
+    files = []
+    for dir_path, _, file_names in os.walk(target):
+        for file_name in file_names:
+            files.append(os.path.relpath(os.path.join(dir_path, file_name), root).replace(os.sep, '/'))
+    return files
+
+
+def _get_revision(root):
+    # huggingface的缓存目录为 .../snapshots/<commit hash>
+    if os.path.basename(os.path.dirname(os.path.normpath(root))) == 'snapshots':
+        return os.path.basename(os.path.normpath(root))
+    return None
+
+
+def load_models_manifest() -> dict:
+    manifest_path = get_models_manifest_path()
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'repos': {}}
+
+
+def _save_models_manifest(manifest):
+    manifest_path = get_models_manifest_path()
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    # 先写临时文件再原子替换，读取方不会看到写了一半的清单
+    os.replace(tmp_path, manifest_path)
+
+
+def _manifest_file_lock():
+    """跨进程的清单文件锁，多个worker进程同时下载模型时不会互相覆盖对方的记录"""
+    from filelock import FileLock
+    manifest_path = get_models_manifest_path()
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    return FileLock(f"{manifest_path}.lock")
+
+
+def _file_stat(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
 
-def auto_download_and_get_model_root_path(relative_path: str, repo_mode='pipeline') -> str:
+def _same_file_stat(file_info, stat_info):
+    # 旧版本清单没有mtime，只比较大小
+    if file_info.get('size') != stat_info['size']:
+        return False
+    return file_info.get('mtime_ns', stat_info['mtime_ns']) == stat_info['mtime_ns']
+
+
+def record_model_manifest(model_source, repo, relative_path, root, with_hash=False):
+    """把已下载的模型记录到本地清单，with_hash为True时计算每个文件的sha256"""
+    with _manifest_lock, _manifest_file_lock():
+        manifest = load_models_manifest()
+        entry = manifest['repos'].get(f"{model_source}:{repo}")
+        if entry is None or entry['root'] != root:
+            entry = {'source': model_source, 'repo': repo, 'root': root, 'revision': _get_revision(root),
+                     'paths': [], 'files': {}}
+        for file_path in _list_model_files(root, relative_path):
+            file_info = _file_stat(os.path.join(root, file_path))
+            old_info = entry['files'].get(file_path, {})
+            if with_hash:
+                file_info['sha256'] = _sha256_file(os.path.join(root, file_path))
+            elif _same_file_stat(old_info, file_info) and 'sha256' in old_info:
+                file_info['sha256'] = old_info['sha256']
+            entry['files'][file_path] = file_info
+        if relative_path not in entry['paths']:
+            entry['paths'].append(relative_path)
+        entry['updated_at'] = int(time.time())
+        manifest['repos'][f"{model_source}:{repo}"] = entry
+        _save_models_manifest(manifest)
+
+
+def _resolve_from_manifest(model_source, repo, relative_path):
+    """清单中记录的文件都存在且大小、修改时间一致时返回模型根目录，否则返回None"""
+    entry = load_models_manifest()['repos'].get(f"{model_source}:{repo}")
+    if entry is None or relative_path not in entry['paths']:
+        return None
+    root = entry['root']
+    prefix = f"{relative_path}/" if relative_path else ''
+    files = [
+        (file_path, file_info) for file_path, file_info in entry['files'].items()
+        if file_path == relative_path or file_path.startswith(prefix)
+    ]
+    if len(files) == 0:
+        return None
+    for file_path, file_info in files:
+        try:
+            if not _same_file_stat(file_info, _file_stat(os.path.join(root, file_path))):
+                return None
+        except OSError:
+            return None
+    return root
+
+
+def auto_download_and_get_model_root_path(relative_path: str, repo_mode='pipeline', refresh_manifest=False) -> str:
     """
     支持文件或目录的可靠下载。
     - 如果输入文件: 返回本地文件绝对路径
     - 如果输入目录: 返回本地缓存下与 relative_path 同结构的相对路径字符串
+    优先使用本地模型清单(MINERU_MODELS_MANIFEST)，清单中缺失或文件不完整时才联网下载，
+    MINERU_MODEL_OFFLINE为true时不联网，直接报错。
     :param repo_mode: 指定仓库模式，'pipeline' 或 'vlm'
     :param relative_path: 文件或目录相对路径
+    :param refresh_manifest: 忽略清单强制联网检查，并以sha256记录到清单，供models_download使用
     :return: 本地文件绝对路径或相对路径
     """
     model_source = os.getenv('MINERU_MODEL_SOURCE', "huggingface")
@@ -44,30 +173,48 @@ def auto_download_and_get_model_root_path(relative_path: str, repo_mode='pipelin
     repo = repo_mapping[repo_mode].get(model_source, repo_mapping[repo_mode]['default'])
 
 
-    if model_source == "huggingface":
-        snapshot_download = hf_snapshot_download
-    elif model_source == "modelscope":
-        snapshot_download = ms_snapshot_download
-    else:
+    if model_source not in ["huggingface", "modelscope"]:
         raise ValueError(f"未知的仓库类型: {model_source}")
 
-    cache_dir = None
-
-    if repo_mode == 'pipeline':
+    if repo_mode == 'vlm' and relative_path == "/":
+        relative_path = ''
+    else:
         relative_path = relative_path.strip('/')
+
+    resolved_key = (model_source, repo, relative_path)
+    if not refresh_manifest:
+        if resolved_key in _resolved_roots:
+            return _resolved_roots[resolved_key]
+        cache_dir = _resolve_from_manifest(model_source, repo, relative_path)
+        if cache_dir is not None:
+            _resolved_roots[resolved_key] = cache_dir
+            return cache_dir
+        if get_model_offline():
+            raise FileNotFoundError(
+                f"Model '{relative_path or '/'}' of {repo} is not found in the local manifest "
+                f"{get_models_manifest_path()} while MINERU_MODEL_OFFLINE is set, "
+                f"please run `mineru-models-download` first."
+            )
+
+    if model_source == "huggingface":
+        from huggingface_hub import snapshot_download
+    else:
+        from modelscope import snapshot_download
+
+    if relative_path:
         cache_dir = snapshot_download(repo, allow_patterns=[relative_path, relative_path+"/*"])
-    elif repo_mode == 'vlm':
-        # VLM 模式下，根据 relative_path 的不同处理方式
-        if relative_path == "/":
-            cache_dir = snapshot_download(repo)
-        else:
-            relative_path = relative_path.strip('/')
-            cache_dir = snapshot_download(repo, allow_patterns=[relative_path, relative_path+"/*"])
+    else:
+        cache_dir = snapshot_download(repo)
 
     if not cache_dir:
         raise FileNotFoundError(f"Failed to download model: {relative_path} from {repo}")
-    return cache_dir
 
+    try:
+        record_model_manifest(model_source, repo, relative_path, cache_dir, with_hash=refresh_manifest)
+    except OSError as e:
+        logger.warning(f"Failed to update models manifest {get_models_manifest_path()}: {e}")
+    _resolved_roots[resolved_key] = cache_dir
+    return cache_dir
 
 if __name__ == '__main__':
     path1 = "models/README.md"
@@ -11,6 +11,210 @@ def get_load_images_timeout() -> int:
     return get_value_from_string(env_value, 300)
 
 
+def get_draw_bbox_renderer() -> str:
+    """可视化pdf的绘制方式，stream(默认，直接追加内容流)或pypdf(reportlab生成overlay后合并)"""
+    renderer = os.getenv('MINERU_DRAW_BBOX_RENDERER', 'stream').lower()
+    if renderer not in ['stream', 'pypdf']:
+        return 'stream'
+    return renderer
+
+
+def get_draw_bbox_background() -> bool:
+    return get_bool_from_string(os.getenv('MINERU_DRAW_BBOX_BACKGROUND', None), True)
+
+
+def get_draw_bbox_workers() -> int:
+    env_value = os.getenv('MINERU_DRAW_BBOX_WORKERS', None)
+    return get_value_from_string(env_value, 1)
+
+
+def get_image_writer_threads() -> int:
+    env_value = os.getenv('MINERU_IMAGE_WRITER_THREADS', None)
+    return get_value_from_string(env_value, 4)
+
+
+def get_image_writer_max_pending() -> int:
+    env_value = os.getenv('MINERU_IMAGE_WRITER_MAX_PENDING', None)
+    return get_value_from_string(env_value, 64)
+
+
+def get_image_format() -> str:
+    """裁剪图片的保存格式，jpeg(默认)或webp"""
+    image_format = os.getenv('MINERU_IMAGE_FORMAT', 'jpeg').lower()
+    if image_format not in ['jpeg', 'webp']:
+        return 'jpeg'
+    return image_format
+
+
+def get_image_quality() -> int | None:
+    env_value = os.getenv('MINERU_IMAGE_QUALITY', None)
+    quality = get_value_from_string(env_value, -1)
+    return min(quality, 100) if quality > 0 else None
+
+
+def get_image_max_size() -> int | None:
+    env_value = os.getenv('MINERU_IMAGE_MAX_SIZE', None)
+    max_size = get_value_from_string(env_value, -1)
+    return max_size if max_size > 0 else None
+
+
+def get_image_dedup_mode() -> str:
+    """裁剪图片按内容去重的方式，off(默认)或exact(像素完全一致)"""
+    dedup_mode = os.getenv('MINERU_IMAGE_DEDUP', 'off').lower()
+    # phash会把内容不同但缩略图相近的裁剪图合并成同一个文件，已移除，按exact处理
+    if dedup_mode == 'phash':
+        return 'exact'
+    if dedup_mode not in ['off', 'exact']:
+        return 'off'
+    return dedup_mode
+
+
+def get_middle_json_format() -> str:
+    """middle.json/model.json的输出格式，json(默认)、json-min、jsonl、jsonl.zst或msgpack"""
+    output_format = os.getenv('MINERU_MIDDLE_JSON_FORMAT', 'json').lower()
+    if output_format not in ['json', 'json-min', 'jsonl', 'jsonl.zst', 'msgpack']:
+        return 'json'
+    return output_format
+
+
+def get_models_manifest_path() -> str:
+    """本地模型清单的路径，记录已下载模型的根目录、版本和文件信息"""
+    manifest_path = os.getenv('MINERU_MODELS_MANIFEST', None)
+    if manifest_path:
+        return os.path.expanduser(manifest_path)
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mineru', 'models_manifest.json')
+
+
+def get_model_offline() -> bool:
+    """离线模式下只使用本地清单中的模型，缺失时直接报错而不访问网络"""
+    return get_bool_from_string(os.getenv('MINERU_MODEL_OFFLINE', None), False)
+
+
+def get_cpu_int8_quantize_enable() -> bool:
+    """CPU推理时对OCR识别模型和公式识别解码器的Linear/LSTM层做int8动态量化，默认关闭"""
+    return get_bool_from_string(os.getenv('MINERU_CPU_INT8_QUANTIZE', None), False)
+
+
+def get_quantize_cache_dir() -> str:
+    """量化后权重的缓存目录"""
+    cache_dir = os.getenv('MINERU_QUANTIZE_CACHE_DIR', None)
+    if cache_dir:
+        return os.path.expanduser(cache_dir)
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mineru', 'int8')
+
+
+def get_onnx_cache_dir() -> str:
+    """OCR检测和识别模型导出的onnx的缓存目录"""
+    cache_dir = os.getenv('MINERU_ONNX_CACHE_DIR', None)
+    if cache_dir:
+        return os.path.expanduser(cache_dir)
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mineru', 'onnx')
+
+
+def get_ocr_engine() -> str:
+    """OCR检测和识别模型的推理引擎，torch(默认)或onnx，onnx仅在CPU上生效"""
+    ocr_engine = os.getenv('MINERU_OCR_ENGINE', 'torch').lower()
+    if ocr_engine not in ['torch', 'onnx']:
+        return 'torch'
+    return ocr_engine
+
+
+def get_mfr_adaptive_max_new_tokens_enable() -> bool:
+    """公式识别按行内公式框尺寸估计max_new_tokens，默认关闭，关闭时使用tokenizer的model_max_length"""
+    return get_bool_from_string(os.getenv('MINERU_MFR_ADAPTIVE_MAX_NEW_TOKENS', None), False)
+
+
+def get_mfr_repeat_stop_enable() -> bool:
+    """公式识别在末尾连续重复同一段token时提前结束该公式，默认关闭"""
+    return get_bool_from_string(os.getenv('MINERU_MFR_REPEAT_STOP', None), False)
+
+
+def get_mfr_cache_enable() -> bool:
+    """按预处理后的公式图片缓存公式识别结果，默认开启"""
+    return get_bool_from_string(os.getenv('MINERU_MFR_CACHE', None), True)
+
+
+def get_mfr_cache_size() -> int:
+    env_value = os.getenv('MINERU_MFR_CACHE_SIZE', None)
+    return get_value_from_string(env_value, 10000)
+
+
+def get_mfr_cache_db() -> str | None:
+    """公式识别缓存的sqlite文件路径，设置后缓存写入磁盘，在多次运行之间共享"""
+    db_path = os.getenv('MINERU_MFR_CACHE_DB', None)
+    return os.path.expanduser(db_path) if db_path else None
+
+
+def get_mfr_preprocess_threads() -> int:
+    """公式识别预处理(裁边、缩放、填充)的线程数"""
+    env_value = os.getenv('MINERU_MFR_PREPROCESS_THREADS', None)
+    return get_value_from_string(env_value, 4)
+
+
+def get_yolo_batch_max_pixels() -> int | None:
+    """layout/mfd一个batch的letterbox像素总数上限，未设置时按显存推算"""
+    env_value = os.getenv('MINERU_YOLO_BATCH_MAX_PIXELS', None)
+    max_pixels = get_value_from_string(env_value, -1)
+    return max_pixels if max_pixels > 0 else None
+
+
+def get_async_cpu_workers() -> int:
+    """异步解析时执行pdf渲染、文件写出等CPU任务的线程数"""
+    env_value = os.getenv('MINERU_ASYNC_CPU_WORKERS', None)
+    return get_value_from_string(env_value, 4)
+
+
+def get_async_model_concurrency() -> int:
+    """异步解析时同时进行的模型推理数，其余推理请求在事件循环中排队"""
+    env_value = os.getenv('MINERU_ASYNC_MODEL_CONCURRENCY', None)
+    return get_value_from_string(env_value, 1)
+
+
+def get_async_page_batch_size() -> int:
+    """异步解析时每次送入模型的页数，较小的值让并发的多个文档更均匀地交替推理"""
+    env_value = os.getenv('MINERU_ASYNC_PAGE_BATCH_SIZE', None)
+    return get_value_from_string(env_value, 64)
+
+
+def get_inference_broker_enable() -> bool:
+    """进程内并发的解析任务把页面交给同一个调度器，合并成batch后推理，默认开启"""
+    return get_bool_from_string(os.getenv('MINERU_INFERENCE_BROKER', None), True)
+
+
+def get_inference_broker_max_wait() -> int:
+    """调度器凑batch的最长等待时间(毫秒)"""
+    env_value = os.getenv('MINERU_INFERENCE_BROKER_MAX_WAIT_MS', None)
+    return get_value_from_string(env_value, 50)
+
+
+def get_ingest_batch_pages() -> int:
+    """命令行解析目录时每批读入内存的总页数，按页数而不是文件数打包"""
+    env_value = os.getenv('MINERU_INGEST_BATCH_PAGES', None)
+    return get_value_from_string(env_value, 384)
+
+
+def get_page_pyramid_enable() -> bool:
+    """页面先以较低dpi渲染供layout/mfd使用，OCR识别、公式和表格区域按需从pdf以更高dpi重新渲染，默认关闭"""
+    return get_bool_from_string(os.getenv('MINERU_PAGE_PYRAMID', None), False)
+
+
+def get_page_pyramid_base_dpi() -> int:
+    """开启页面金字塔时整页渲染的dpi"""
+    env_value = os.getenv('MINERU_PAGE_PYRAMID_BASE_DPI', None)
+    return get_value_from_string(env_value, 144)
+
+
+def get_grayscale_pages_enable() -> bool:
+    """pipeline渲染的页面三个通道完全相同时以单通道保存，送入模型时再扩展为三通道，默认关闭"""
+    return get_bool_from_string(os.getenv('MINERU_GRAYSCALE_PAGES', None), False)
+
+
+def get_bool_from_string(env_value: str, default_value: bool) -> bool:
+    if env_value is None:
+        return default_value
+    return env_value.lower() in ['true', '1', 'yes']
+
+
 def get_value_from_string(env_value: str, default_value: int) -> int:
     if env_value is not None:
         try:
@@ -4,6 +4,8 @@ from io import BytesIO
 import numpy as np
 import pypdfium2 as pdfium
 from loguru import logger
+
+from mineru.utils.pdfium_guard import pdfium_lock
 from pdfminer.high_level import extract_text
 from pdfminer.pdfparser import PDFParser
 from pdfminer.pdfdocument import PDFDocument
@@ -27,10 +29,12 @@ def classify(pdf_bytes):
 
     # 从字节数据加载PDF
     sample_pdf_bytes = extract_pages(pdf_bytes)
-    pdf = pdfium.PdfDocument(sample_pdf_bytes)
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(sample_pdf_bytes)
     try:
         # 获取PDF页数
-        page_count = len(pdf)
+        with pdfium_lock:
+            page_count = len(pdf)
 
         # 如果PDF页数为0，直接返回OCR
         if page_count == 0:
@@ -59,7 +63,8 @@ def classify(pdf_bytes):
 
     finally:
         # 无论执行哪个路径，都确保PDF被关闭
-        pdf.close()
+        with pdfium_lock:
+            pdf.close()
 
 
 def get_avg_cleaned_chars_per_page(pdf_doc, pages_to_check):
@@ -70,9 +75,10 @@ def get_avg_cleaned_chars_per_page(pdf_doc, pages_to_check):
 
     # 检查前几页的文本
     for i in range(pages_to_check):
-        page = pdf_doc[i]
-        text_page = page.get_textpage()
-        text = text_page.get_text_bounded()
+        with pdfium_lock:
+            page = pdf_doc[i]
+            text_page = page.get_textpage()
+            text = text_page.get_text_bounded()
         total_chars += len(text)
 
         # 清理提取的文本，移除空白字符
@@ -187,40 +193,43 @@ def extract_pages(src_pdf_bytes: bytes) -> bytes:
         bytes: 提取页面后的PDF字节数据
     """
 
-    # 从字节数据加载PDF
-    pdf = pdfium.PdfDocument(src_pdf_bytes)
-
-    # 获取PDF页数
-    total_page = len(pdf)
-    if total_page == 0:
-        # 如果PDF没有页面，直接返回空文档
-        logger.warning("PDF is empty, return empty document")
-        return b''
-
-    # 选择最多10页
-    select_page_cnt = min(10, total_page)
-
-    # 从总页数中随机选择页面
-    page_indices = np.random.choice(total_page, select_page_cnt, replace=False).tolist()
-
-    # 创建一个新的PDF文档
-    sample_docs = pdfium.PdfDocument.new()
+    with pdfium_lock:
+        # 从字节数据加载PDF
+        pdf = pdfium.PdfDocument(src_pdf_bytes)
 
-    try:
-        # 将选择的页面导入新文档
-        sample_docs.import_pages(pdf, page_indices)
-        pdf.close()
-
-        # 将新PDF保存到内存缓冲区
-        output_buffer = BytesIO()
-        sample_docs.save(output_buffer)
-
-        # 获取字节数据
-        return output_buffer.getvalue()
-    except Exception as e:
-        pdf.close()
-        logger.exception(e)
-        return b''  # 出错时返回空字节
+        # 获取PDF页数
+        total_page = len(pdf)
+        if total_page == 0:
+            # 如果PDF没有页面，直接返回空文档
+            logger.warning("PDF is empty, return empty document")
+            pdf.close()
+            return b''
+
+        # 选择最多10页
+        select_page_cnt = min(10, total_page)
+
+        # 从总页数中随机选择页面
+        page_indices = np.random.choice(total_page, select_page_cnt, replace=False).tolist()
+
+        # 创建一个新的PDF文档
+        sample_docs = pdfium.PdfDocument.new()
+
+        try:
+            # 将选择的页面导入新文档
+            sample_docs.import_pages(pdf, page_indices)
+
+            # 将新PDF保存到内存缓冲区
+            output_buffer = BytesIO()
+            sample_docs.save(output_buffer)
+
+            # 获取字节数据
+            return output_buffer.getvalue()
+        except Exception as e:
+            logger.exception(e)
+            return b''  # 出错时返回空字节
+        finally:
+            pdf.close()
+            sample_docs.close()
 
 
 def detect_invalid_chars(sample_pdf_bytes: bytes) -> bool:
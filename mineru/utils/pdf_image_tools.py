@@ -1,35 +1,41 @@
 # Copyright (c) Opendatalab. All rights reserved.
 import os
+from collections import OrderedDict
 from io import BytesIO
 
 import numpy as np
 import pypdfium2 as pdfium
 from loguru import logger
-from PIL import Image
+from PIL import Image, ImageSequence, TiffImagePlugin
 
-from mineru.data.data_reader_writer import FileBasedDataWriter
+from mineru.data.data_reader_writer import AsyncImageWriter, FileBasedDataWriter
 from mineru.utils.check_sys_env import is_windows_environment
 from mineru.utils.os_env_config import get_load_images_timeout
 from mineru.utils.pdf_reader import image_to_b64str, image_to_bytes, page_to_image
 from mineru.utils.enum_class import ImageType
+from mineru.utils.guess_suffix_or_lang import sniff_suffix
 from mineru.utils.hash_utils import str_sha256
 from mineru.utils.pdf_page_id import get_end_page_id
+from mineru.utils.pdfium_guard import pdfium_lock, get_render_mp_context
 
 from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
 
 
-def pdf_page_to_image(page: pdfium.PdfPage, dpi=200, image_type=ImageType.PIL) -> dict:
+def pdf_page_to_image(page: pdfium.PdfPage, dpi=200, image_type=ImageType.PIL, grayscale=False) -> dict:
     """Convert pdfium.PdfDocument to image, Then convert the image to base64.
 
     Args:
         page (_type_): pdfium.PdfPage
         dpi (int, optional): reset the dpi of dpi. Defaults to 200.
         image_type (ImageType, optional): The type of image to return. Defaults to ImageType.PIL.
+        grayscale (bool, optional): 渲染结果为灰度时转为单通道图片. Defaults to False.
 
     Returns:
         dict:  {'img_base64': str, 'img_pil': pil_img, 'scale': float }
     """
     pil_img, scale = page_to_image(page, dpi=dpi)
+    if grayscale:
+        pil_img = reduce_to_grayscale(pil_img)
     image_dict = {
         "scale": scale,
     }
@@ -41,9 +47,9 @@ def pdf_page_to_image(page: pdfium.PdfPage, dpi=200, image_type=ImageType.PIL) -
     return image_dict
 
 
-def _load_images_from_pdf_worker(pdf_bytes, dpi, start_page_id, end_page_id, image_type):
+def _load_images_from_pdf_worker(pdf_bytes, dpi, start_page_id, end_page_id, image_type, grayscale):
     """用于进程池的包装函数"""
-    return load_images_from_pdf_core(pdf_bytes, dpi, start_page_id, end_page_id, image_type)
+    return load_images_from_pdf_core(pdf_bytes, dpi, start_page_id, end_page_id, image_type, grayscale)
 
 
 def load_images_from_pdf(
@@ -54,6 +60,7 @@ def load_images_from_pdf(
         image_type=ImageType.PIL,
         timeout=None,
         threads=4,
+        grayscale=False,
 ):
     """带超时控制的 PDF 转图片函数,支持多进程加速
 
@@ -65,24 +72,28 @@ def load_images_from_pdf(
         image_type (ImageType, optional): 图片类型. Defaults to ImageType.PIL.
         timeout (int | None, optional): 超时时间(秒)。如果为 None，则从环境变量 MINERU_PDF_LOAD_IMAGES_TIMEOUT 读取，若未设置则默认为 300 秒。
         threads (int): 进程数,默认 4
+        grayscale (bool): 渲染结果为灰度的页面转为单通道图片,默认 False
 
     Raises:
         TimeoutError: 当转换超时时抛出
     """
-    pdf_doc = pdfium.PdfDocument(pdf_bytes)
+    with pdfium_lock:
+        pdf_doc = pdfium.PdfDocument(pdf_bytes)
+        page_count = len(pdf_doc)
     if is_windows_environment():
         # Windows 环境下不使用多进程
         return load_images_from_pdf_core(
             pdf_bytes,
             dpi,
             start_page_id,
-            get_end_page_id(end_page_id, len(pdf_doc)),
-            image_type
+            get_end_page_id(end_page_id, page_count),
+            image_type,
+            grayscale,
         ), pdf_doc
     else:
         if timeout is None:
             timeout = get_load_images_timeout()
-        end_page_id = get_end_page_id(end_page_id, len(pdf_doc))
+        end_page_id = get_end_page_id(end_page_id, page_count)
 
         # 计算总页数
         total_pages = end_page_id - start_page_id + 1
@@ -106,7 +117,8 @@ def load_images_from_pdf(
 
         # logger.debug(f"PDF to images using {actual_threads} processes, page ranges: {page_ranges}")
 
-        with ProcessPoolExecutor(max_workers=actual_threads) as executor:
+        # 渲染进程由forkserver创建，不从多线程的主进程直接fork
+        with ProcessPoolExecutor(max_workers=actual_threads, mp_context=get_render_mp_context()) as executor:
             # 提交所有任务
             futures = []
             for range_start, range_end in page_ranges:
@@ -116,7 +128,8 @@ def load_images_from_pdf(
                     dpi,
                     range_start,
                     range_end,
-                    image_type
+                    image_type,
+                    grayscale,
                 )
                 futures.append((range_start, future))
 
@@ -135,7 +148,8 @@ def load_images_from_pdf(
 
                 return images_list, pdf_doc
             except FuturesTimeoutError:
-                pdf_doc.close()
+                with pdfium_lock:
+                    pdf_doc.close()
                 executor.shutdown(wait=False, cancel_futures=True)
                 raise TimeoutError(f"PDF to images conversion timeout after {timeout}s")
 
@@ -146,19 +160,22 @@ def load_images_from_pdf_core(
     start_page_id=0,
     end_page_id=None,
     image_type=ImageType.PIL,  # PIL or BASE64
+    grayscale=False,
 ):
     images_list = []
-    pdf_doc = pdfium.PdfDocument(pdf_bytes)
-    pdf_page_num = len(pdf_doc)
-    end_page_id = get_end_page_id(end_page_id, pdf_page_num)
-
-    for index in range(start_page_id, end_page_id + 1):
-        # logger.debug(f"Converting page {index}/{pdf_page_num} to image")
-        page = pdf_doc[index]
-        image_dict = pdf_page_to_image(page, dpi=dpi, image_type=image_type)
-        images_list.append(image_dict)
-
-    pdf_doc.close()
+    with pdfium_lock:
+        pdf_doc = pdfium.PdfDocument(pdf_bytes)
+        try:
+            pdf_page_num = len(pdf_doc)
+            end_page_id = get_end_page_id(end_page_id, pdf_page_num)
+
+            for index in range(start_page_id, end_page_id + 1):
+                # logger.debug(f"Converting page {index}/{pdf_page_num} to image")
+                page = pdf_doc[index]
+                image_dict = pdf_page_to_image(page, dpi=dpi, image_type=image_type, grayscale=grayscale)
+                images_list.append(image_dict)
+        finally:
+            pdf_doc.close()
 
     return images_list
 
@@ -175,11 +192,16 @@ def cut_image(bbox: tuple, page_num: int, page_pil_img, return_path, image_write
     img_path = f"{return_path}_{filename}" if return_path is not None else None
 
     # 新版本生成平铺路径
-    img_hash256_path = f"{str_sha256(img_path)}.jpg"
+    img_hash256 = str_sha256(img_path)
     # img_hash256_path = f'{img_path}.jpg'
 
     crop_img = get_crop_img(bbox, page_pil_img, scale=scale)
 
+    if isinstance(image_writer, AsyncImageWriter):
+        # 编码和写入交给后台线程池，路径立即返回
+        return image_writer.write_image(img_hash256, crop_img)
+
+    img_hash256_path = f"{img_hash256}.jpg"
     img_bytes = image_to_bytes(crop_img, image_format="JPEG")
 
     image_writer.write(img_hash256_path, img_bytes)
@@ -196,6 +218,28 @@ def get_crop_img(bbox: tuple, pil_img, scale=2):
     return pil_img.crop(scale_bbox)
 
 
+def reduce_to_grayscale(pil_img):
+    """RGB图片三个通道完全相同时无损转为单通道的L图片，否则原样返回
+
+    扫描件等黑白页面的页面图片和裁剪图片因此只占三分之一的内存，送入模型前由expand_to_rgb还原
+    """
+    if pil_img.mode != "RGB":
+        return pil_img
+    np_img = np.asarray(pil_img)
+    # 先隔行抽样检查，彩色页面通常在这里就能排除
+    for rows in [np_img[::16], np_img]:
+        if not (np.array_equal(rows[..., 0], rows[..., 1]) and np.array_equal(rows[..., 1], rows[..., 2])):
+            return pil_img
+    return Image.fromarray(np.ascontiguousarray(np_img[..., 0]), mode="L")
+
+
+def expand_to_rgb(np_img: np.ndarray) -> np.ndarray:
+    """单通道页面的图片在送入模型前扩展为三通道，三通道图片原样返回"""
+    if np_img.ndim == 2:
+        return np.repeat(np_img[..., None], 3, axis=2)
+    return np_img
+
+
 def get_crop_np_img(bbox: tuple, input_img, scale=2):
 
     if isinstance(input_img, Image.Image):
@@ -218,13 +262,231 @@ def images_bytes_to_pdf_bytes(image_bytes):
     # 内存缓冲区
     pdf_buffer = BytesIO()
 
-    # 载入并转换所有图像为 RGB 模式
-    image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    # 载入并转换所有图像为 RGB 模式，多帧tiff的每一帧为一页
+    with Image.open(BytesIO(image_bytes)) as image:
+        frames = [frame.convert("RGB") for frame in ImageSequence.Iterator(image)]
 
     # 第一张图保存为 PDF，其余追加
-    image.save(pdf_buffer, format="PDF", save_all=True)
+    frames[0].save(pdf_buffer, format="PDF", save_all=True, append_images=frames[1:])
 
     # 获取 PDF bytes 并重置指针（可选）
     pdf_bytes = pdf_buffer.getvalue()
     pdf_buffer.close()
     return pdf_bytes
+
+
+def is_pdf_bytes(file_bytes) -> bool:
+    return sniff_suffix(file_bytes[:2048]) == "pdf"
+
+
+class ImagePage:
+    """图片输入的页面，与pdfium.PdfPage一样通过get_size返回页面尺寸"""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def get_size(self):
+        return self.width, self.height
+
+    def close(self):
+        pass
+
+
+class ImageDocument:
+    """图片输入的文档，代替pdfium.PdfDocument提供页面尺寸，没有文本层"""
+    def __init__(self, page_sizes):
+        self.pages = [ImagePage(width, height) for width, height in page_sizes]
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __getitem__(self, index):
+        return self.pages[index]
+
+    def close(self):
+        pass
+
+
+def get_image_frame_count(image_bytes) -> int:
+    with Image.open(BytesIO(image_bytes)) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def slice_image_frames(image_bytes, start_page_id=0, end_page_id=None):
+    """截取多帧图片的一段帧，以无损的多帧tiff返回，选中全部帧时返回原始数据
+
+    逐帧解码后立即写入tiff，内存中只保留当前一帧
+
+    Raises:
+        ValueError: start_page_id超出帧数，截取结果为空
+    """
+    start_page_id = max(start_page_id, 0)
+    with Image.open(BytesIO(image_bytes)) as image:
+        frame_count = getattr(image, "n_frames", 1)
+        end_page_id = get_end_page_id(end_page_id, frame_count)
+        if start_page_id > end_page_id:
+            raise ValueError(f"start_page_id {start_page_id} is out of range, the image has {frame_count} frames")
+        if start_page_id == 0 and end_page_id >= frame_count - 1:
+            return image_bytes
+        buffer = BytesIO()
+        with TiffImagePlugin.AppendingTiffWriter(buffer) as tiff_writer:
+            for index in range(start_page_id, end_page_id + 1):
+                image.seek(index)
+                image.convert("RGB").save(tiff_writer, format="TIFF", compression="tiff_deflate")
+                tiff_writer.newFrame()
+    return buffer.getvalue()
+
+
+def load_images_from_image(
+        image_bytes: bytes,
+        start_page_id=0,
+        end_page_id=None,
+        image_type=ImageType.PIL,
+        max_width_or_height=3500,
+        grayscale=False,
+):
+    """不经过pdf直接把图片解码为页面，多帧tiff逐帧解码
+
+    页面尺寸与图片转为pdf(72dpi)后的尺寸一致，即页面坐标等于像素坐标，scale为1，
+    只有超过max_width_or_height的图片会缩小，grayscale为True时灰度页面转为单通道图片
+
+    Returns:
+        images_list, ImageDocument
+    """
+    images_list = []
+    page_sizes = []
+    with Image.open(BytesIO(image_bytes)) as image:
+        frame_count = getattr(image, "n_frames", 1)
+        end_page_id = get_end_page_id(end_page_id, frame_count)
+        for index in range(start_page_id, end_page_id + 1):
+            image.seek(index)
+            pil_img = image.convert("RGB")
+            width, height = pil_img.size
+            scale = 1.0
+            if max(width, height) > max_width_or_height:
+                scale = max_width_or_height / max(width, height)
+                pil_img = pil_img.resize(
+                    (max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.LANCZOS
+                )
+            if grayscale:
+                pil_img = reduce_to_grayscale(pil_img)
+            image_dict = {"scale": scale}
+            if image_type == ImageType.BASE64:
+                image_dict["img_base64"] = image_to_b64str(pil_img)
+            else:
+                image_dict["img_pil"] = pil_img
+            images_list.append(image_dict)
+            page_sizes.append((width, height))
+    return images_list, ImageDocument(page_sizes)
+
+
+# 公式、表格等区域重新渲染的dpi，与默认的整页渲染dpi一致
+REGION_RENDER_DPI = 200
+
+
+class PdfRegionSource:
+    def __init__(self, pdf_bytes: bytes, start_page_id=0, cache_size=64):
+        """从pdf按需重新渲染页面区域，第一次渲染时才打开pdf，页面对象和渲染结果都会缓存
+
+        渲染结果在多处共用，调用方不能原地修改
+
+        Args:
+            pdf_bytes (bytes): pdf文件的bytes
+            start_page_id (int): 页面图片列表中第一页在pdf中的页码
+            cache_size (int): 缓存的区域图片数量
+        """
+        self.pdf_bytes = pdf_bytes
+        self.start_page_id = start_page_id
+        self.cache_size = cache_size
+        self._pdf_doc = None
+        self._pages = {}
+        self._cache = OrderedDict()
+        self._closed = False
+
+    def renderer(self, page_index: int, scale: float) -> "PageRegionRenderer":
+        return PageRegionRenderer(self, self.start_page_id + page_index, scale)
+
+    def render(self, page_id: int, bbox, scale: float, dpi: float) -> np.ndarray:
+        """按dpi渲染页面图片上bbox(像素坐标，页面图片每pt为scale像素)对应的区域，返回RGB图片"""
+        key = (page_id, tuple(bbox), scale, dpi)
+        with pdfium_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if self._closed:
+                # 任务取消后仍在执行的推理：临时打开文档渲染后立即关闭，不再缓存
+                pdf_doc = pdfium.PdfDocument(self.pdf_bytes)
+                try:
+                    page = pdf_doc[page_id]
+                    try:
+                        return self._render_region(page, bbox, scale, dpi)
+                    finally:
+                        page.close()
+                finally:
+                    pdf_doc.close()
+            if self._pdf_doc is None:
+                self._pdf_doc = pdfium.PdfDocument(self.pdf_bytes)
+            page = self._pages.get(page_id)
+            if page is None:
+                page = self._pages[page_id] = self._pdf_doc[page_id]
+            region_img = self._render_region(page, bbox, scale, dpi)
+            self._cache[key] = region_img
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return region_img
+
+    @staticmethod
+    def _render_region(page, bbox, scale: float, dpi: float) -> np.ndarray:
+        page_w, page_h = page.get_size()
+        x0, y0, x1, y1 = [v / scale for v in bbox]
+        # crop是从页面四边(左、下、右、上)裁掉的宽度，单位为pt
+        crop = (max(x0, 0), max(page_h - y1, 0), max(page_w - x1, 0), max(y0, 0))
+        bitmap = page.render(scale=dpi / 72, crop=crop, rev_byteorder=True)
+        try:
+            return bitmap.to_numpy().copy()
+        finally:
+            bitmap.close()
+
+    def close(self):
+        with pdfium_lock:
+            self._closed = True
+            self._cache.clear()
+            for page in self._pages.values():
+                page.close()
+            self._pages.clear()
+            if self._pdf_doc is not None:
+                self._pdf_doc.close()
+                self._pdf_doc = None
+
+
+class PageRegionRenderer:
+    """一页的区域渲染入口，坐标使用该页页面图片的像素坐标"""
+    def __init__(self, source: PdfRegionSource, page_id: int, scale: float):
+        self.source = source
+        self.page_id = page_id
+        self.scale = scale
+
+    @property
+    def dpi(self) -> float:
+        """页面图片的dpi"""
+        return self.scale * 72
+
+    def render(self, bbox, dpi: float, max_width_or_height=4000) -> tuple[np.ndarray, float]:
+        """按dpi渲染bbox区域，区域过大时降低dpi
+
+        Returns:
+            (RGB图片, 区域图片相对页面图片的缩放比例)
+        """
+        x0, y0, x1, y1 = max(int(bbox[0]), 0), max(int(bbox[1]), 0), int(bbox[2]), int(bbox[3])
+        long_side = max(x1 - x0, y1 - y0, 1) / self.scale
+        dpi = min(dpi, max_width_or_height * 72 / long_side)
+        region_img = self.source.render(self.page_id, (x0, y0, x1, y1), self.scale, dpi)
+        return region_img, dpi / self.dpi
+
+
+def get_region_np_img(bbox: tuple, np_img, renderer: PageRegionRenderer = None, dpi=REGION_RENDER_DPI):
+    """裁剪页面图片上的bbox区域作为模型输入，有renderer且dpi高于页面图片时改为从pdf重新渲染"""
+    if renderer is not None and dpi > renderer.dpi:
+        return renderer.render(bbox, dpi)[0]
+    x0, y0, x1, y1 = [int(v) for v in bbox]
+    return expand_to_rgb(np_img[y0:y1, x0:x1])
@@ -0,0 +1,36 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import multiprocessing
+import threading
+
+# pdfium不是线程安全的，同一进程内对pdfium的所有调用(打开、页数、取页、渲染、文本提取、关闭)都要持有这把锁；
+# 可重入，持有锁的函数可以调用同样加锁的函数
+pdfium_lock = threading.RLock()
+
+_render_mp_context = None
+_render_mp_context_lock = threading.Lock()
+
+
+def get_render_mp_context():
+    """渲染进程池使用的multiprocessing上下文
+
+    主进程中有推理、写图片等多个线程，fork出的子进程可能继承其他线程持有的锁(包括pdfium内部状态)而死锁，
+    因此使用forkserver：子进程由单线程的forkserver进程fork出来，预先导入渲染模块，启动开销很小。
+    与spawn相同，子进程会导入调用方的主模块，直接调用do_parse等接口的脚本需要放在 if __name__ == '__main__': 下
+    """
+    global _render_mp_context
+    with _render_mp_context_lock:
+        if _render_mp_context is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                _render_mp_context = multiprocessing.get_context('forkserver')
+                _render_mp_context.set_forkserver_preload(['mineru.utils.pdf_image_tools'])
+            else:
+                _render_mp_context = multiprocessing.get_context('spawn')
+        return _render_mp_context
+
+
+def close_pdf_doc(pdf_doc) -> None:
+    """持有pdfium锁关闭文档，重复关闭或传入None时什么都不做"""
+    if pdf_doc is None:
+        return
+    with pdfium_lock:
+        pdf_doc.close()
@@ -0,0 +1,122 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import hashlib
+import json
+import os
+import time
+import warnings
+
+from loguru import logger
+
+from mineru.utils.os_env_config import get_quantize_cache_dir
+
+
+def _linear_skeleton_builders():
+    import torch
+    from torch import nn
+    import torch.ao.nn.quantized.dynamic as nnqd
+
+    def linear(module):
+        return nnqd.Linear(module.in_features, module.out_features, bias_=module.bias is not None, dtype=torch.qint8)
+
+    return {nn.Linear: linear}
+
+
+def _source_fingerprint(source_path):
+    if os.path.isdir(source_path):
+        paths = sorted(
+            os.path.join(source_path, name) for name in os.listdir(source_path)
+            if os.path.isfile(os.path.join(source_path, name))
+        )
+    else:
+        paths = [source_path]
+    return [[os.path.basename(path), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths]
+
+
+def get_quantize_cache_path(source_path: str, tag: str) -> str:
+    """量化结果的缓存路径，原始权重、torch版本或量化后端变化时缓存自动失效"""
+    import torch
+
+    key = json.dumps({
+        'source': os.path.abspath(source_path),
+        'files': _source_fingerprint(source_path),
+        'tag': tag,
+        'torch': torch.__version__,
+        'engine': torch.backends.quantized.engine,
+    }, sort_keys=True)
+    return os.path.join(get_quantize_cache_dir(), f"{tag}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.pt")
+
+
+def _replace_with_skeleton(module, builders, replaced):
+    for name, child in module.named_children():
+        # 与quantize_dynamic一致，只替换类型完全相同的模块
+        builder = builders.get(type(child))
+        if builder is not None:
+            setattr(module, name, builder(child))
+            replaced.append((module, name, child))
+        else:
+            _replace_with_skeleton(child, builders, replaced)
+
+
+def _load_cached(model, cache_path):
+    import torch
+
+    state_dict = torch.load(cache_path, map_location='cpu', weights_only=True)
+    # 直接构造量化模块再读取缓存，省去逐层统计和量化权重的开销
+    replaced = []
+    try:
+        _replace_with_skeleton(model, _linear_skeleton_builders(), replaced)
+        model.load_state_dict(state_dict)
+    except Exception:
+        # 缓存与模型结构不一致时恢复原来的浮点模块
+        for module, name, child in replaced:
+            setattr(module, name, child)
+        raise
+    return model
+
+
+def quantize_dynamic_int8(model, source_path: str = None, tag: str = 'model'):
+    """对模型的Linear/LSTM层做int8动态量化，仅用于CPU推理，模型会被原地修改
+
+    Args:
+        model: 已加载权重并处于eval模式的torch模型
+        source_path: 原始权重文件或目录，用于生成缓存的key，为None时不缓存
+        tag: 缓存文件名前缀
+    """
+    import torch
+    from torch import nn
+    import torch.ao.nn.quantized.dynamic as nnqd
+
+    if torch.backends.quantized.engine == 'none':
+        logger.warning("no quantized engine is available, skip int8 quantization")
+        return model
+
+    with warnings.catch_warnings():
+        # torch.ao.quantization在新版本中会提示迁移到torchao，这里不影响结果
+        warnings.simplefilter("ignore", category=DeprecationWarning)
+        warnings.simplefilter("ignore", category=UserWarning)
+        start = time.time()
+        cache_path = get_quantize_cache_path(source_path, tag) if source_path is not None else None
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                model = _load_cached(model, cache_path)
+                logger.info(f"{tag} int8 weights loaded from {cache_path}, cost: {round(time.time() - start, 2)}")
+                return model
+            except Exception as e:
+                logger.warning(f"failed to load int8 cache {cache_path}, quantize again: {e}")
+
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {nn.Linear, nn.LSTM}, dtype=torch.qint8, inplace=True
+        )
+        logger.info(f"{tag} int8 dynamic quantization cost: {round(time.time() - start, 2)}")
+
+        # 量化后的LSTM权重是ScriptObject，无法以weights_only方式读取，含LSTM的模型不缓存
+        if cache_path is not None and not any(isinstance(module, nnqd.LSTM) for module in model.modules()):
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                torch.save(model.state_dict(), tmp_path)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                logger.warning(f"failed to write int8 cache {cache_path}: {e}")
+    return model
+
@@ -1,7 +1,12 @@
 import asyncio
+import functools
 import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
-from typing import Any, AsyncIterable, Coroutine, Iterable, TypeVar
+from typing import Any, AsyncIterable, Callable, Coroutine, Iterable, TypeVar
+
+from mineru.utils.os_env_config import get_async_cpu_workers, get_async_model_concurrency
 
 T = TypeVar("T")
 
@@ -50,3 +55,61 @@ def iter_async(iterable: AsyncIterable[T]) -> Iterable[T]:
         yield chunk
 
     thread.join()
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+_model_semaphores = weakref.WeakKeyDictionary()
+
+
+def _get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"mineru-async-{name}")
+        return _executors[name]
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    """异步解析中执行pdf渲染、文件写出等CPU任务的线程池"""
+    return _get_executor("cpu", get_async_cpu_workers())
+
+
+def _get_model_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _model_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _model_semaphores[loop] = asyncio.Semaphore(get_async_model_concurrency())
+    return semaphore
+
+
+async def run_in_cpu_executor(func: Callable[..., T], *args, **kwargs) -> T:
+    """在CPU线程池中执行同步函数，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_in_model_executor(func: Callable[..., T], *args, **kwargs) -> T:
+    """在模型线程池中执行模型推理
+
+    同时提交到线程池的推理数不超过MINERU_ASYNC_MODEL_CONCURRENCY，其余调用在事件循环中按顺序排队。
+    排队中的调用被取消时直接放弃，已开始的推理会执行完毕，完成后才让出名额
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _get_model_semaphore()
+    await semaphore.acquire()
+
+    def release(_):
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    try:
+        executor = _get_executor("model", get_async_model_concurrency())
+        future = executor.submit(func, *args, **kwargs)
+    except BaseException:
+        semaphore.release()
+        raise
+    future.add_done_callback(release)
+    return await asyncio.wrap_future(future)
@@ -0,0 +1,157 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from loguru import logger
+
+# safetensors不保证key的顺序，部分模型依赖state_dict最后一项推断输出通道数，因此把原顺序记录在元数据中
+KEY_ORDER_METADATA = 'mineru_key_order'
+# safetensors不能保存共享存储的tensor，完全相同的别名(共享权重)只保存一份，在元数据中记录 别名 -> 实际保存的key
+ALIAS_METADATA = 'mineru_aliases'
+
+
+_fingerprints = {}
+
+
+def weights_fingerprint(*paths: str) -> str:
+    """按文件内容计算模型文件的指纹，用于区分不同版本的权重，不存在的文件跳过
+
+    同一进程内按(路径, 大小, 修改时间)缓存，文件未变化时不重复读取
+    """
+    hasher = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in _fingerprints:
+            file_hasher = hashlib.blake2b(digest_size=16)
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    file_hasher.update(chunk)
+            _fingerprints[memo_key] = file_hasher.hexdigest()
+        hasher.update(_fingerprints[memo_key].encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def get_safetensors_path(weights_path: str) -> str:
+    return os.path.splitext(weights_path)[0] + '.safetensors'
+
+
+def _is_fresh(safetensors_path, weights_path):
+    if not os.path.exists(safetensors_path):
+        return False
+    if safetensors_path == weights_path or not os.path.exists(weights_path):
+        return True
+    return os.path.getmtime(safetensors_path) >= os.path.getmtime(weights_path)
+
+
+def _extract_state_dict(checkpoint):
+    if isinstance(checkpoint, dict) and isinstance(checkpoint.get('model'), dict):
+        return checkpoint['model']
+    return checkpoint
+
+
+def _tensor_view_key(tensor):
+    """存储、偏移、形状和步长都相同的tensor互为别名，例如state_dict()中共享权重的多个key"""
+    return (
+        tensor.device, tensor.untyped_storage().data_ptr(), tensor.storage_offset(),
+        tensor.dtype, tuple(tensor.shape), tensor.stride(),
+    )
+
+
+def convert_to_safetensors(weights_path: str, overwrite: bool = False):
+    """把torch.save保存的state_dict转换为同目录下同名的.safetensors文件，返回转换后的路径，无法转换时返回None"""
+    import torch
+    from safetensors.torch import save_file
+
+    safetensors_path = get_safetensors_path(weights_path)
+    if not overwrite and _is_fresh(safetensors_path, weights_path):
+        return safetensors_path
+
+    state_dict = _extract_state_dict(torch.load(weights_path, map_location='cpu', weights_only=True))
+    if not isinstance(state_dict, dict) or not all(isinstance(v, torch.Tensor) for v in state_dict.values()):
+        logger.warning(f"{weights_path} is not a plain state_dict, skip converting to safetensors")
+        return None
+    tensors, aliases, seen_views, seen_storages = OrderedDict(), {}, {}, set()
+    for key, value in state_dict.items():
+        value = value.detach()
+        view = _tensor_view_key(value)
+        if view in seen_views:
+            # 同一个tensor的别名(例如共享的embedding和输出层)，载入时恢复为同一个tensor
+            aliases[key] = seen_views[view]
+            continue
+        seen_views[view] = key
+        storage_ptr = value.untyped_storage().data_ptr()
+        # 与已保存的tensor部分重叠的视图只能拷贝为独立的连续内存
+        if storage_ptr in seen_storages or not value.is_contiguous():
+            value = value.contiguous().clone()
+        seen_storages.add(storage_ptr)
+        tensors[key] = value
+    metadata = {KEY_ORDER_METADATA: json.dumps(list(state_dict.keys()))}
+    if aliases:
+        metadata[ALIAS_METADATA] = json.dumps(aliases)
+    tmp_path = f"{safetensors_path}.{os.getpid()}.tmp"
+    save_file(tensors, tmp_path, metadata=metadata)
+    # 与原权重文件保持相同的权限，共享的模型缓存目录中其他用户也可以读取
+    os.chmod(tmp_path, os.stat(weights_path).st_mode & 0o777)
+    os.replace(tmp_path, safetensors_path)
+    return safetensors_path
+
+
+def load_weights(weights_path: str):
+    """读取模型权重，优先以内存映射方式读取同名的.safetensors，否则以mmap方式torch.load
+
+    内存映射的权重在多进程之间共享物理页，不会在每个进程中完整反序列化一份
+    """
+    import torch
+
+    safetensors_path = get_safetensors_path(weights_path)
+    if _is_fresh(safetensors_path, weights_path):
+        try:
+            from safetensors import safe_open
+            from safetensors.torch import load_file
+        except ImportError:
+            pass
+        else:
+            with safe_open(safetensors_path, framework='pt') as f:
+                metadata = f.metadata() or {}
+            tensors = load_file(safetensors_path, device='cpu')
+            for alias, key in json.loads(metadata.get(ALIAS_METADATA, '{}')).items():
+                tensors[alias] = tensors[key]
+            if KEY_ORDER_METADATA in metadata:
+                return OrderedDict((key, tensors[key]) for key in json.loads(metadata[KEY_ORDER_METADATA]))
+            return tensors
+
+    try:
+        return torch.load(weights_path, map_location='cpu', weights_only=True, mmap=True)
+    except RuntimeError:
+        # 旧的非zip格式不支持mmap
+        return torch.load(weights_path, map_location='cpu', weights_only=True)
+
+
+def load_state_dict_shared(module, state_dict, strict: bool = True):
+    """把权重载入module，尽量直接使用state_dict中的tensor作为参数，不再拷贝一份
+
+    dtype和device与模型参数一致的tensor以assign方式直接使用(内存映射的权重在多进程之间共享物理页)，
+    不一致的先转换为模型参数的dtype和device，模型的精度和设备不会被权重文件改变；
+    同一个tensor的多个别名只转换一次，共享权重载入后仍然共享存储
+    """
+    import torch
+
+    targets = module.state_dict(keep_vars=True)
+    converted, prepared = {}, OrderedDict()
+    for key, value in state_dict.items():
+        target = targets.get(key)
+        if (
+            isinstance(value, torch.Tensor) and target is not None
+            and (value.dtype != target.dtype or value.device != target.device)
+        ):
+            cache_key = (_tensor_view_key(value), target.dtype, target.device)
+            if cache_key not in converted:
+                converted[cache_key] = value.to(device=target.device, dtype=target.dtype)
+            value = converted[cache_key]
+        prepared[key] = value
+    return module.load_state_dict(prepared, strict=strict, assign=True)
@@ -0,0 +1,119 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import math
+from collections import defaultdict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from mineru.utils.pdf_image_tools import expand_to_rgb
+
+YOLO_STRIDE = 32
+
+
+def get_image_shape(image) -> tuple:
+    """返回(height, width)，兼容PIL.Image和numpy数组"""
+    if isinstance(image, Image.Image):
+        return image.height, image.width
+    return tuple(np.asarray(image).shape[:2])
+
+
+def _get_resized_shape(height: int, width: int, imgsz: int) -> tuple:
+    ratio = min(imgsz / height, imgsz / width)
+    return int(round(height * ratio)), int(round(width * ratio))
+
+
+def get_letterbox_shape(height: int, width: int, imgsz: int, stride: int = YOLO_STRIDE) -> tuple:
+    """单张推理时的矩形letterbox尺寸：长边缩放到imgsz，短边补齐到stride的整数倍"""
+    new_height, new_width = _get_resized_shape(height, width, imgsz)
+    return math.ceil(new_height / stride) * stride, math.ceil(new_width / stride) * stride
+
+
+def plan_batches(images: list, imgsz: int, max_batch_size: int, max_batch_pixels: int = None) -> list:
+    """按letterbox后的尺寸把页面分桶，每个桶内按显存预算切分batch
+
+    ultralytics只在batch内图片尺寸完全相同时使用矩形letterbox，尺寸不同时会统一填充为imgsz x imgsz的正方形，
+    计算量变大且结果与单张推理不一致，因此同一个batch只放letterbox尺寸相同的页面
+
+    Args:
+        images: 页面图片列表
+        imgsz: 模型的输入尺寸
+        max_batch_size: batch的最大页数
+        max_batch_pixels: 一个batch的letterbox像素总数上限，为None时不限制
+
+    Returns:
+        (页面下标列表, letterbox尺寸(height, width)) 的列表
+    """
+    buckets = defaultdict(list)
+    for index, image in enumerate(images):
+        buckets[get_letterbox_shape(*get_image_shape(image), imgsz)].append(index)
+
+    batches = []
+    for letterbox_shape, indices in buckets.items():
+        batch_size = max(1, max_batch_size)
+        if max_batch_pixels:
+            batch_size = max(1, min(batch_size, max_batch_pixels // (letterbox_shape[0] * letterbox_shape[1])))
+        # 尺寸相同的页面排在一起，尽量让整个batch原图尺寸一致
+        indices = sorted(indices, key=lambda index: get_image_shape(images[index]))
+        for start in range(0, len(indices), batch_size):
+            batches.append((indices[start:start + batch_size], letterbox_shape))
+    return batches
+
+
+def letterbox(image, letterbox_shape: tuple, imgsz: int):
+    """与ultralytics相同的矩形letterbox(缩放后居中填充114)
+
+    结果的尺寸即letterbox_shape，ultralytics再处理时既不缩放也不填充
+
+    Returns:
+        letterbox后的BGR图片, 还原到原图坐标的(left, top, x方向比例, y方向比例)
+    """
+    if isinstance(image, Image.Image):
+        # 与ultralytics读取PIL图片的方式一致，转为BGR
+        image = cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    height, width = image.shape[:2]
+    new_height, new_width = _get_resized_shape(height, width, imgsz)
+    if (new_height, new_width) != (height, width):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    delta_height = (letterbox_shape[0] - new_height) / 2
+    delta_width = (letterbox_shape[1] - new_width) / 2
+    top, bottom = int(round(delta_height - 0.1)), int(round(delta_height + 0.1))
+    left, right = int(round(delta_width - 0.1)), int(round(delta_width + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, (left, top, width / new_width, height / new_height)
+
+
+def restore_boxes(prediction, transform: tuple, orig_shape: tuple):
+    """把letterbox后图片上的检测框还原到原图坐标"""
+    left, top, x_scale, y_scale = transform
+    data = prediction.boxes.data.clone()
+    data[:, [0, 2]] = (data[:, [0, 2]] - left) * x_scale
+    data[:, [1, 3]] = (data[:, [1, 3]] - top) * y_scale
+    prediction.orig_shape = tuple(orig_shape)
+    prediction.update(boxes=data)
+    return prediction
+
+
+def bucketed_predict(images: list, predict_fn, imgsz: int, max_batch_size: int, max_batch_pixels: int = None, pbar=None) -> list:
+    """按letterbox尺寸分桶后批量推理，返回与images顺序一致的ultralytics Results
+
+    Args:
+        predict_fn: 输入一个batch的图片列表，返回对应的Results列表
+    """
+    results = [None] * len(images)
+    for indices, letterbox_shape in plan_batches(images, imgsz, max_batch_size, max_batch_pixels):
+        # 单通道页面在这里扩展为三通道，PIL图片由letterbox或ultralytics转为RGB
+        batch = [expand_to_rgb(images[index]) if isinstance(images[index], np.ndarray) else images[index]
+                 for index in indices]
+        transforms = [None] * len(batch)
+        if len({get_image_shape(image) for image in batch}) > 1:
+            # 原图尺寸不一致时先按同一个letterbox尺寸处理，避免ultralytics退化为正方形填充
+            batch, transforms = zip(*(letterbox(image, letterbox_shape, imgsz) for image in batch))
+        predictions = predict_fn(list(batch))
+        for index, prediction, transform in zip(indices, predictions, transforms):
+            if transform is not None:
+                prediction = restore_boxes(prediction, transform, get_image_shape(images[index]))
+            results[index] = prediction
+        if pbar is not None:
+            pbar.update(len(indices))
+    return results
@@ -0,0 +1,166 @@
+# Copyright (c) Opendatalab. All rights reserved.
+"""比较CPU上fp32与int8动态量化(MINERU_CPU_INT8_QUANTIZE)的OCR识别和公式识别精度与耗时
+
+    python scripts/benchmark_int8_quantize.py --ocr-samples 200 --mfr-samples 40 --font /path/to/simfang.ttf
+
+文本行由PIL渲染随机字符，公式由matplotlib mathtext渲染随机组合，报告：
+    ocr rec: 相对标注的CER、int8相对fp32输出的CER
+    mfr: 相对标注的完全匹配率、int8相对fp32输出的字符级CER
+以及两者的耗时和输出完全相同的样本数
+"""
+import argparse
+import os
+import random
+import string
+import time
+from io import BytesIO
+
+
+def edit_distance(source, target):
+    previous = list(range(len(target) + 1))
+    for i, source_char in enumerate(source, 1):
+        current = [i]
+        for j, target_char in enumerate(target, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (source_char != target_char)))
+        previous = current
+    return previous[-1]
+
+
+def char_error_rate(references, hypotheses):
+    errors = sum(edit_distance(reference, hypothesis) for reference, hypothesis in zip(references, hypotheses))
+    return errors / max(sum(len(reference) for reference in references), 1)
+
+
+def render_text_lines(count, font_path, rng):
+    """用指定字体渲染随机文本行，未指定字体时只使用ASCII字符"""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    if font_path:
+        import mineru
+
+        font = ImageFont.truetype(font_path, 32)
+        dict_path = os.path.join(
+            os.path.dirname(mineru.__file__), 'model', 'utils', 'pytorchocr', 'utils', 'resources', 'dict',
+            'ppocrv5_dict.txt'
+        )
+        with open(dict_path, encoding='utf-8') as f:
+            charset = [line.rstrip('\n') for line in f if line.strip()]
+    else:
+        font = ImageFont.load_default(32)
+        charset = list(string.ascii_letters + string.digits)
+
+    samples = []
+    for _ in range(count):
+        words = [''.join(rng.choice(charset) for _ in range(rng.randint(2, 8))) for _ in range(rng.randint(1, 5))]
+        text = ' '.join(words)
+        left, top, right, bottom = font.getbbox(text)
+        image = Image.new('RGB', (right - left + 16, bottom - top + 16), (255, 255, 255))
+        ImageDraw.Draw(image).text((8 - left, 8 - top), text, font=font, fill=(0, 0, 0))
+        samples.append((np.array(image)[:, :, ::-1].copy(), text))
+    return samples
+
+
+def render_latex(count, rng):
+    """用matplotlib mathtext渲染随机组合的公式"""
+    import numpy as np
+    from PIL import Image
+    from matplotlib import mathtext
+
+    letters = list('abcdxyzn')
+    templates = [
+        '{a}^{{{n}}}+{b}^{{{n}}}={c}^{{{n}}}',
+        '\\frac{{{a}}}{{{b}+{n}}}',
+        '\\sqrt{{{a}^{{2}}+{b}^{{2}}}}',
+        '\\sum_{{{a}=1}}^{{{n}}}{b}_{{{a}}}',
+        '\\int_{{0}}^{{{n}}}{a}\\,d{b}',
+        '{a}_{{{b}}}\\leq{c}_{{{n}}}',
+        '\\alpha{a}+\\beta{b}={n}',
+        '({a}+{b})^{{{n}}}',
+    ]
+    samples = []
+    for _ in range(count):
+        a, b, c = rng.sample(letters, 3)
+        latex = rng.choice(templates).format(a=a, b=b, c=c, n=rng.randint(2, 9))
+        with BytesIO() as buffer:
+            mathtext.math_to_image(f'${latex}$', buffer, dpi=200, format='png')
+            image = Image.open(buffer).convert('RGB')
+            samples.append((np.array(image), latex))
+    return samples
+
+
+def eval_ocr(samples):
+    from mineru.model.ocr.pytorch_paddle import PytorchPaddleOCR
+
+    ocr = PytorchPaddleOCR(lang='ch')
+    images = [image for image, _ in samples]
+    start = time.time()
+    results = ocr.ocr(images, det=False)[0]
+    return [result[0] for result in results], time.time() - start
+
+
+def eval_mfr(samples):
+    import torch
+    from mineru.model.mfr.unimernet.Unimernet import UnimernetModel
+    from mineru.utils.enum_class import ModelPath
+    from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
+
+    weight_dir = os.path.join(
+        auto_download_and_get_model_root_path(ModelPath.unimernet_small), ModelPath.unimernet_small
+    )
+    model = UnimernetModel(weight_dir, 'cpu')
+    images = [image for image, _ in samples]
+    start = time.time()
+    outputs = []
+    for index in range(0, len(images), 8):
+        batch = torch.stack([model.model.transform(image) for image in images[index:index + 8]])
+        outputs.extend(model.model.generate({'image': batch.to(dtype=model.model.dtype)})['fixed_str'])
+    return outputs, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ocr-samples', type=int, default=200)
+    parser.add_argument('--mfr-samples', type=int, default=40)
+    parser.add_argument('--font', type=str, default=None, help='a ttf font to render chinese text lines')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['MINERU_DEVICE_MODE'] = 'cpu'
+    ocr_samples = render_text_lines(args.ocr_samples, args.font, random.Random(args.seed))
+    mfr_samples = render_latex(args.mfr_samples, random.Random(args.seed))
+
+    report = {}
+    for quantize in ['false', 'true']:
+        os.environ['MINERU_CPU_INT8_QUANTIZE'] = quantize
+        report[quantize] = {}
+        if ocr_samples:
+            report[quantize]['ocr'] = eval_ocr(ocr_samples)
+        if mfr_samples:
+            report[quantize]['mfr'] = eval_mfr(mfr_samples)
+
+    fp32, int8 = report['false'], report['true']
+    if ocr_samples:
+        labels = [text for _, text in ocr_samples]
+        (fp32_texts, fp32_cost), (int8_texts, int8_cost) = fp32['ocr'], int8['ocr']
+        same = sum(a == b for a, b in zip(fp32_texts, int8_texts))
+        print(f"ocr rec: CER fp32 {char_error_rate(labels, fp32_texts):.4f} / int8 {char_error_rate(labels, int8_texts):.4f}, "
+              f"int8 vs fp32 CER {char_error_rate(fp32_texts, int8_texts):.4f}, "
+              f"cost fp32 {fp32_cost:.2f}s / int8 {int8_cost:.2f}s (x{fp32_cost / max(int8_cost, 1e-6):.2f}), "
+              f"identical outputs {same}/{len(ocr_samples)}")
+    if mfr_samples:
+        labels = [latex.replace(' ', '') for _, latex in mfr_samples]
+        (fp32_latex, fp32_cost), (int8_latex, int8_cost) = fp32['mfr'], int8['mfr']
+        fp32_latex = [latex.replace(' ', '') for latex in fp32_latex]
+        int8_latex = [latex.replace(' ', '') for latex in int8_latex]
+        fp32_match = sum(a == b for a, b in zip(labels, fp32_latex)) / len(labels)
+        int8_match = sum(a == b for a, b in zip(labels, int8_latex)) / len(labels)
+        same = sum(a == b for a, b in zip(fp32_latex, int8_latex))
+        print(f"mfr: exact match fp32 {fp32_match:.4f} / int8 {int8_match:.4f}, "
+              f"int8 vs fp32 CER {char_error_rate(fp32_latex, int8_latex):.4f}, "
+              f"cost fp32 {fp32_cost:.2f}s / int8 {int8_cost:.2f}s (x{fp32_cost / max(int8_cost, 1e-6):.2f}), "
+              f"identical outputs {same}/{len(mfr_samples)}")
+
+
+if __name__ == '__main__':
+    main()
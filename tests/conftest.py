@@ -0,0 +1,66 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import io
+
+import pytest
+
+# 推理和阅读顺序模型在测试环境中无法下载，用假模型替换：每页返回一个覆盖正文区域的文本块和每行的检测框，
+# 文本由pdf文本层提取
+PAGE_SIZE = (595, 842)
+
+
+def _make_pdf(tag, pages=3):
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=PAGE_SIZE)
+    for page in range(pages):
+        for line in range(3):
+            pdf.drawString(72, PAGE_SIZE[1] - 100 - line * 20, f"{tag} page {page} line {line} with enough text to classify")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _poly(x0, y0, x1, y1, scale):
+    x0, y0, x1, y1 = x0 * scale, y0 * scale, x1 * scale, y1 * scale
+    return [x0, y0, x1, y0, x1, y1, x0, y1]
+
+
+def _text_block_layout(images_with_extra_info):
+    results = []
+    for image, _ocr_enable, _lang, _renderer in images_with_extra_info:
+        scale = image.size[0] / PAGE_SIZE[0]
+        page_result = [{'category_id': 1, 'poly': _poly(40, 60, 555, 180, scale), 'score': 0.95}]
+        for line in range(3):
+            top = 88 + line * 20
+            page_result.append({'category_id': 15, 'poly': _poly(70, top, 520, top + 16, scale), 'score': 1.0, 'text': ''})
+        results.append(page_result)
+    return results
+
+
+@pytest.fixture
+def make_pdf():
+    """生成每页三行文本的pdf，文本为 "<tag> page <页码> line <行号> ..." """
+    pytest.importorskip("reportlab")
+    return _make_pdf
+
+
+@pytest.fixture
+def text_block_layout():
+    """假的batch_image_analyze输出，与make_pdf生成的文本位置对应"""
+    return _text_block_layout
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """替换版面推理和layoutreader，解析make_pdf生成的pdf时不加载任何模型"""
+    pytest.importorskip("pypdfium2")
+    from mineru.backend.pipeline import pipeline_analyze
+    from mineru.utils import block_sort
+
+    monkeypatch.setattr(block_sort, "sort_lines_by_model", lambda *args, **kwargs: None)
+
+    def fake_batch_image_analyze(images_with_extra_info, formula_enable=True, table_enable=True):
+        return _text_block_layout(images_with_extra_info)
+
+    monkeypatch.setattr(pipeline_analyze, "batch_image_analyze", fake_batch_image_analyze)
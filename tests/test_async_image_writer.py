@@ -0,0 +1,94 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from mineru.data.data_reader_writer import AsyncImageWriter
+from mineru.data.data_reader_writer.base import DataWriter
+
+
+class SlowWriter(DataWriter):
+    """每次写入sleep一段时间的假writer，记录写入顺序和同时进行的写入数"""
+
+    def __init__(self, delay=0.05, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.written = {}
+        self.order = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def write(self, path: str, data: bytes) -> None:
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if path == self.fail_on:
+                raise OSError(f"cannot write {path}")
+            with self._lock:
+                self.written[path] = data
+                self.order.append(path)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _image(color):
+    return Image.new("RGB", (32, 32), color)
+
+
+def test_write_image_returns_before_slow_writes_finish():
+    writer = SlowWriter(delay=0.2)
+    image_writer = AsyncImageWriter(writer, max_workers=4, dedup_registry=None)
+    start = time.time()
+    paths = [image_writer.write_image(f"img{i}", _image((i, i, i))) for i in range(4)]
+    assert time.time() - start < 0.2
+    image_writer.close()
+    assert sorted(writer.written) == sorted(paths)
+    assert all(path.endswith(".jpg") for path in paths)
+
+
+def test_pending_queue_is_bounded():
+    writer = SlowWriter(delay=0.05)
+    with AsyncImageWriter(writer, max_workers=1, max_pending=2) as image_writer:
+        for i in range(6):
+            image_writer.write(f"f{i}", b"x")
+            # 提交在队列满时阻塞，排队的写入数不超过max_pending
+            assert len(image_writer._pending) <= 2
+    assert writer.max_active == 1
+    assert len(writer.written) == 6
+
+
+def test_writes_to_the_same_path_keep_submit_order():
+    writer = SlowWriter(delay=0.01)
+    with AsyncImageWriter(writer, max_workers=4) as image_writer:
+        for i in range(5):
+            image_writer.write("same", str(i).encode())
+    assert writer.written["same"] == b"4"
+
+
+def test_write_error_is_raised_on_close():
+    writer = SlowWriter(delay=0.01, fail_on="bad")
+    image_writer = AsyncImageWriter(writer, max_workers=2)
+    image_writer.write("good", b"1")
+    image_writer.write("bad", b"2")
+    with pytest.raises(OSError, match="cannot write bad"):
+        image_writer.close()
+    assert "good" in writer.written
+    # 再次关闭不会重复抛出
+    image_writer.close()
+
+
+def test_context_manager_finishes_writes_without_masking_the_original_error():
+    writer = SlowWriter(delay=0.05, fail_on="bad")
+    with pytest.raises(ValueError, match="parse failed"):
+        with AsyncImageWriter(writer, max_workers=2) as image_writer:
+            image_writer.write("good", b"1")
+            image_writer.write("bad", b"2")
+            raise ValueError("parse failed")
+    assert "good" in writer.written
+    assert image_writer._executor._shutdown
@@ -0,0 +1,180 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("pypdfium2")
+pytest.importorskip("reportlab")
+
+from mineru.backend.pipeline import pipeline_analyze
+from mineru.cli.common import aio_do_parse, convert_pdf_bytes_to_bytes_by_pypdfium2, do_parse
+from mineru.utils import block_sort
+from mineru.utils.pdf_classify import classify
+from mineru.utils.pdf_image_tools import load_images_from_pdf, load_images_from_pdf_core
+from mineru.utils.pdfium_guard import get_render_mp_context
+
+OUTPUT_FLAGS = dict(
+    f_draw_layout_bbox=False, f_draw_span_bbox=False, f_dump_middle_json=False,
+    f_dump_model_output=False, f_dump_orig_pdf=False, f_dump_content_list=False,
+)
+
+
+@pytest.fixture
+def opened_docs(monkeypatch):
+    """记录解析过程中打开的pdf文档"""
+    docs = []
+    real_load_pdf = pipeline_analyze._load_pdf
+
+    def tracked_load_pdf(*args, **kwargs):
+        result = real_load_pdf(*args, **kwargs)
+        docs.append(result[1])
+        return result
+
+    monkeypatch.setattr(pipeline_analyze, "_load_pdf", tracked_load_pdf)
+    return docs
+
+
+def _wait_closed(docs, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(doc.raw is None for doc in docs):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.parametrize("broker", ["true", "false"])
+def test_concurrent_aio_parse_matches_sync(tmp_path, monkeypatch, fake_models, opened_docs, make_pdf, broker):
+    monkeypatch.setenv("MINERU_INFERENCE_BROKER", broker)
+    monkeypatch.setenv("MINERU_ASYNC_MODEL_CONCURRENCY", "2")
+    names = [f"doc{i}" for i in range(4)]
+    pdfs = [make_pdf(name) for name in names]
+
+    sync_dir = tmp_path / "sync"
+    do_parse(str(sync_dir), names, pdfs, ["en"] * len(names), **OUTPUT_FLAGS)
+
+    async def main():
+        # 两个请求并发解析，各自包含两个文档
+        await asyncio.gather(
+            aio_do_parse(str(tmp_path / "aio"), names[:2], pdfs[:2], ["en"] * 2, **OUTPUT_FLAGS),
+            aio_do_parse(str(tmp_path / "aio"), names[2:], pdfs[2:], ["en"] * 2, **OUTPUT_FLAGS),
+        )
+
+    asyncio.run(main())
+    for name in names:
+        expected = (sync_dir / name / "auto" / f"{name}.md").read_text(encoding="utf-8")
+        actual = (tmp_path / "aio" / name / "auto" / f"{name}.md").read_text(encoding="utf-8")
+        assert f"{name} page 2 line 2" in expected
+        assert actual == expected
+    assert _wait_closed(opened_docs)
+
+
+@pytest.mark.parametrize("broker", ["true", "false"])
+def test_cancelled_parse_closes_documents(tmp_path, monkeypatch, opened_docs, make_pdf, text_block_layout, broker):
+    monkeypatch.setenv("MINERU_INFERENCE_BROKER", broker)
+    monkeypatch.setattr(block_sort, "sort_lines_by_model", lambda *args, **kwargs: None)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def blocking_batch_image_analyze(images_with_extra_info, formula_enable=True, table_enable=True):
+        entered.set()
+        release.wait(30)
+        return text_block_layout(images_with_extra_info)
+
+    monkeypatch.setattr(pipeline_analyze, "batch_image_analyze", blocking_batch_image_analyze)
+
+    async def main():
+        task = asyncio.ensure_future(
+            aio_do_parse(str(tmp_path), ["cancelled"], [make_pdf("cancelled")], ["en"], **OUTPUT_FLAGS)
+        )
+        assert await asyncio.get_running_loop().run_in_executor(None, entered.wait, 30)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+    assert len(opened_docs) == 1
+    assert _wait_closed(opened_docs)
+    assert not (tmp_path / "cancelled" / "auto" / "cancelled.md").exists()
+
+
+def test_middle_json_is_built_outside_the_model_slot(tmp_path, monkeypatch, fake_models, make_pdf):
+    """生成middle_json在CPU线程池中执行，只有后置ocr占用模型线程池"""
+    from mineru.backend.pipeline import model_json_to_middle_json
+
+    threads = {}
+    real_build_page_infos = model_json_to_middle_json.build_page_infos
+    real_finish_middle_json = model_json_to_middle_json.finish_middle_json
+
+    def recording(name, func):
+        def wrapper(*args, **kwargs):
+            threads.setdefault(name, set()).add(threading.current_thread().name)
+            return func(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(model_json_to_middle_json, "build_page_infos", recording("build", real_build_page_infos))
+    monkeypatch.setattr(model_json_to_middle_json, "finish_middle_json", recording("finish", real_finish_middle_json))
+    # 假装每份文档都有需要ocr的span
+    monkeypatch.setattr(model_json_to_middle_json, "get_post_ocr_spans", lambda pdf_info: [{}])
+    monkeypatch.setattr(model_json_to_middle_json, "post_ocr", recording("post_ocr", lambda pdf_info, lang=None: None))
+
+    names = ["slot0", "slot1"]
+    asyncio.run(aio_do_parse(str(tmp_path), names, [make_pdf(name) for name in names], ["en"] * 2, **OUTPUT_FLAGS))
+
+    assert all(name.startswith("mineru-async-cpu") for name in threads["build"] | threads["finish"])
+    assert all(name.startswith("mineru-async-model") for name in threads["post_ocr"])
+    for name in names:
+        assert f"{name} page 2 line 2" in (tmp_path / name / "auto" / f"{name}.md").read_text(encoding="utf-8")
+
+
+def test_threaded_pdfium_access_is_serialized(make_pdf):
+    """多个线程同时打开、分类、渲染不同的pdf，结果与单线程一致"""
+    pdfs = [make_pdf(f"thread{i}", pages=2) for i in range(4)]
+
+    def work(pdf_bytes):
+        outputs = []
+        for _ in range(3):
+            images_list = load_images_from_pdf_core(pdf_bytes, dpi=72)
+            outputs.append((
+                classify(pdf_bytes),
+                [img_dict['img_pil'].tobytes() for img_dict in images_list],
+                len(convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, 1, 1)),
+            ))
+        return outputs
+
+    expected = [work(pdf_bytes)[0] for pdf_bytes in pdfs]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(work, pdfs))
+    for outputs, single in zip(results, expected):
+        assert all(output == single for output in outputs)
+
+
+def test_render_pool_uses_forkserver_and_matches_inline(make_pdf):
+    import multiprocessing
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        assert get_render_mp_context().get_start_method() == "forkserver"
+
+    pdf_bytes = make_pdf("pool", pages=6)
+    inline_images = load_images_from_pdf_core(pdf_bytes, dpi=72)
+    # 后台线程持续使用pdfium时创建渲染进程池，子进程不会继承被持有的pdfium锁
+    stop = threading.Event()
+
+    def keep_classifying():
+        while not stop.is_set():
+            classify(pdf_bytes)
+
+    background = threading.Thread(target=keep_classifying)
+    background.start()
+    try:
+        images_list, pdf_doc = load_images_from_pdf(pdf_bytes, dpi=72, threads=2)
+    finally:
+        stop.set()
+        background.join()
+    assert [img_dict['img_pil'].tobytes() for img_dict in images_list] == [img_dict['img_pil'].tobytes() for img_dict in inline_images]
+    pdf_doc.close()
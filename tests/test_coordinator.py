@@ -0,0 +1,100 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+import signal
+import struct
+import time
+
+import pytest
+
+from mineru.cli import coordinator
+from mineru.cli.coordinator import ParseCoordinator, ParseTask
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+
+_result_conn = None
+
+
+def _fake_do_parse(output_dir, pdf_file_names, **kwargs):
+    """按任务名模拟不同的情况：slow_* 耗时较长，crash_once 第一次执行时worker被杀死，
+    crash_always 每次都被杀死，torn 写入半条结果后被杀死，error 抛出异常"""
+    name = pdf_file_names[0]
+    marker = os.path.join(output_dir, f"{name}.attempt")
+    first_attempt = not os.path.exists(marker)
+    with open(marker, "a") as f:
+        f.write(f"{os.getpid()}\n")
+    if name.startswith("slow"):
+        time.sleep(0.5)
+    elif name == "error":
+        raise ValueError("bad document")
+    elif name == "crash_always" or (name == "crash_once" and first_attempt):
+        os.kill(os.getpid(), signal.SIGKILL)
+    elif name == "torn" and first_attempt:
+        # 结果消息只写出长度头和一部分内容
+        os.write(_result_conn.fileno(), struct.pack("!i", 64) + b"partial")
+        os.kill(os.getpid(), signal.SIGKILL)
+    with open(os.path.join(output_dir, f"{name}.done"), "w") as f:
+        f.write("ok")
+
+
+def _fake_worker_main(worker_id, device, cpus, output_dir, lang, parse_kwargs, task_queue, result_conn):
+    """在spawn启动的worker中替换do_parse后执行真正的worker循环"""
+    global _result_conn
+    _result_conn = result_conn
+    from mineru.cli import common
+    common.do_parse = _fake_do_parse
+    coordinator._worker_main(worker_id, device, cpus, output_dir, lang, parse_kwargs, task_queue, result_conn)
+
+
+class _FakeCoordinator(ParseCoordinator):
+    worker_main = staticmethod(_fake_worker_main)
+
+
+def _run(tmp_path, names, max_retries=1):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir(exist_ok=True)
+    tasks = []
+    for index, name in enumerate(names):
+        path = input_dir / f"{name}.pdf"
+        path.write_bytes(b"%PDF-1.4\n%%EOF\n")
+        tasks.append(ParseTask(index, str(path), name, pages=index + 1))
+    done_order = []
+    results = _FakeCoordinator(str(tmp_path), "en", {}, workers=2, max_retries=max_retries).run(
+        tasks, on_task_done=lambda task, result: done_order.append(task.name)
+    )
+    return results, done_order
+
+
+def _attempts(tmp_path, name):
+    with open(tmp_path / f"{name}.attempt") as f:
+        return len(f.read().splitlines())
+
+
+def test_results_follow_task_order(tmp_path):
+    names = ["slow_a", "b", "slow_c", "d", "e", "error"]
+    results, done_order = _run(tmp_path, names)
+    assert [result.name for result in results] == names
+    assert sorted(done_order) == sorted(names)
+    assert [result.status for result in results] == ["ok"] * 5 + ["failed"]
+    assert "bad document" in results[-1].error
+    assert {result.worker for result in results} == {0, 1}
+    assert all((tmp_path / f"{name}.done").exists() for name in names[:-1])
+
+
+def test_crashed_worker_is_restarted_and_task_retried(tmp_path):
+    names = ["a", "crash_once", "torn", "b", "slow_c", "d"]
+    results, _ = _run(tmp_path, names)
+    # 被杀死的worker写了半条结果，其他worker的结果不受影响
+    assert [result.status for result in results] == ["ok"] * len(names), [result.error for result in results]
+    assert _attempts(tmp_path, "crash_once") == 2
+    assert _attempts(tmp_path, "torn") == 2
+    assert results[1].attempts == 2
+    assert all((tmp_path / f"{name}.done").exists() for name in names)
+
+
+def test_retries_are_exhausted(tmp_path):
+    names = ["crash_always", "a", "b"]
+    results, _ = _run(tmp_path, names, max_retries=1)
+    assert results[0].status == "failed"
+    assert "worker exited" in results[0].error
+    assert _attempts(tmp_path, "crash_always") == 2
+    assert [result.status for result in results[1:]] == ["ok", "ok"]
@@ -0,0 +1,57 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+import time
+
+import pytest
+
+from mineru.utils import draw_bbox
+from mineru.utils.draw_bbox import submit_draw_task, wait_draw_tasks
+
+
+def _slow_draw(pdf_info, pdf_bytes, out_path, filename):
+    time.sleep(pdf_info["delay"])
+    with open(os.path.join(out_path, filename), "wb") as f:
+        f.write(pdf_bytes)
+
+
+def _failing_draw(pdf_info, pdf_bytes, out_path, filename):
+    raise RuntimeError("draw failed")
+
+
+@pytest.fixture(params=["true", "false"], ids=["background", "inline"])
+def draw_mode(request, monkeypatch):
+    monkeypatch.setenv("MINERU_DRAW_BBOX_BACKGROUND", request.param)
+    yield request.param
+    draw_bbox.shutdown_draw_executor()
+
+
+def test_each_caller_waits_for_its_own_tasks(draw_mode, tmp_path):
+    slow = submit_draw_task(_slow_draw, {"delay": 1.0}, b"slow", str(tmp_path), "slow.pdf")
+    fast = submit_draw_task(_slow_draw, {"delay": 0.0}, b"fast", str(tmp_path), "fast.pdf")
+
+    wait_draw_tasks([fast])
+    assert (tmp_path / "fast.pdf").read_bytes() == b"fast"
+
+    # 另一个调用方的任务没有被取走，仍由提交者自己等待
+    wait_draw_tasks([slow])
+    assert (tmp_path / "slow.pdf").read_bytes() == b"slow"
+
+
+def test_draw_errors_are_raised_after_all_tasks_finish(draw_mode, tmp_path):
+    tasks = [
+        submit_draw_task(_failing_draw, {}, b"", str(tmp_path), "bad.pdf"),
+        submit_draw_task(_slow_draw, {"delay": 0.2}, b"ok", str(tmp_path), "ok.pdf"),
+    ]
+    with pytest.raises(RuntimeError, match="draw failed"):
+        wait_draw_tasks(tasks)
+    assert (tmp_path / "ok.pdf").read_bytes() == b"ok"
+
+
+def test_background_pool_does_not_fork_the_caller(monkeypatch, tmp_path):
+    monkeypatch.setenv("MINERU_DRAW_BBOX_BACKGROUND", "true")
+    try:
+        wait_draw_tasks([submit_draw_task(_slow_draw, {"delay": 0.0}, b"ok", str(tmp_path), "ok.pdf")])
+        assert draw_bbox._draw_executor._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        draw_bbox.shutdown_draw_executor()
+    assert (tmp_path / "ok.pdf").read_bytes() == b"ok"
@@ -0,0 +1,144 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import numpy as np
+
+from mineru.model.mfr.formula_cache import FormulaCache
+from mineru.utils.weights_utils import weights_fingerprint
+
+
+def _image(value):
+    return np.full((8, 16), value, dtype=np.uint8)
+
+
+def test_incomplete_outputs_are_not_cached(tmp_path):
+    db_path = str(tmp_path / "mfr.sqlite")
+    cache = FormulaCache(db_path=db_path)
+    keys = [FormulaCache.make_key("ns", _image(value)) for value in (1, 2, 2)]
+    results, todo = cache.lookup(keys)
+    assert todo == [0, 1]
+
+    results = cache.fill(keys, results, todo, ["x^2", "\\begin{matrix}"], incomplete=[False, True])
+    # 本次调用中相同key的样本仍然得到结果
+    assert results == ["x^2", "\\begin{matrix}", "\\begin{matrix}"]
+
+    # 新进程打开同一个sqlite文件，只有完整的结果被复用
+    results, todo = FormulaCache(db_path=db_path).lookup(keys)
+    assert results == ["x^2", None, None]
+    assert todo == [1]
+
+
+def test_namespace_separates_models():
+    assert FormulaCache.make_key("a", _image(1)) != FormulaCache.make_key("b", _image(1))
+
+
+def test_weights_fingerprint_follows_file_content(tmp_path):
+    weights = tmp_path / "model.safetensors"
+    config = tmp_path / "config.json"
+    weights.write_bytes(b"v1")
+    config.write_bytes(b"{}")
+    first = weights_fingerprint(str(weights), str(config), str(tmp_path / "missing.bin"))
+    assert first == weights_fingerprint(str(weights), str(config))
+
+    weights.write_bytes(b"v2-longer")
+    assert weights_fingerprint(str(weights), str(config)) != first
+
+
+class _TrackingTransform:
+    """记录预处理调用次数和同时存活的预处理结果数的假预处理，结果为与公式区域像素值相同的大图"""
+
+    def __init__(self):
+        import threading
+        self.lock = threading.Lock()
+        self.prepared = 0
+        self.alive = 0
+        self.max_alive = 0
+
+    def _released(self):
+        with self.lock:
+            self.alive -= 1
+
+    def prepare_input(self, image):
+        import weakref
+        prepared = np.full((192, 672), image[0, 0, 0], dtype=np.uint8)
+        with self.lock:
+            self.prepared += 1
+            self.alive += 1
+            self.max_alive = max(self.max_alive, self.alive)
+        weakref.finalize(prepared, self._released)
+        return prepared
+
+    def to_gray(self, image):
+        return image
+
+    def normalize_batch(self, images):
+        import torch
+        return torch.tensor([float(image[0, 0]) for image in images])
+
+
+class _EchoModel:
+    """按输入像素值输出latex的假模型"""
+
+    def __init__(self):
+        import torch
+        self.dtype = torch.float32
+        self.transform = _TrackingTransform()
+        self.generated = 0
+
+    def generate(self, samples, **kwargs):
+        values = samples["image"].tolist()
+        self.generated += len(values)
+        return {
+            "fixed_str": [f"x_{{{int(value)}}}" for value in values],
+            "truncated": [False] * len(values),
+            "repeat_stopped": [False] * len(values),
+        }
+
+
+class _MfdResult:
+    def __init__(self, boxes):
+        import torch
+        self.boxes = type("Boxes", (), {
+            "xyxy": torch.tensor(boxes, dtype=torch.float32),
+            "conf": torch.full((len(boxes),), 0.9),
+            "cls": torch.zeros(len(boxes)),
+        })()
+
+
+def test_cache_keys_do_not_hold_every_prepared_crop(monkeypatch):
+    import pytest
+    pytest.importorskip("torch")
+    from mineru.model.mfr import formula_cache
+    from mineru.model.mfr.unimernet import Unimernet
+
+    monkeypatch.setenv("MINERU_MFR_CACHE", "true")
+    monkeypatch.delenv("MINERU_MFR_CACHE_DB", raising=False)
+    monkeypatch.setattr(formula_cache, "_formula_cache", None)
+    model = Unimernet.UnimernetModel.__new__(Unimernet.UnimernetModel)
+    model.model = _EchoModel()
+    model.device = "cpu"
+    model.cache_namespace = "test"
+
+    # 300个公式，像素值只有100种
+    page = np.zeros((600, 900, 3), dtype=np.uint8)
+    boxes, expected = [], []
+    for index in range(300):
+        x0, y0 = (index % 30) * 30, (index // 30) * 30
+        value = index % 100 + 1
+        page[y0:y0 + 20, x0:x0 + 20] = value
+        boxes.append([x0, y0, x0 + 20, y0 + 20])
+        expected.append(f"x_{{{value}}}")
+
+    batch_size = 16
+    results = model.batch_predict([_MfdResult(boxes)], [page], batch_size=batch_size)
+    assert [item["latex"] for item in results[0]] == expected
+    transform = model.model.transform
+    # 计算key时每个公式预处理一次，未命中的100个公式在识别前再预处理一次
+    assert transform.prepared == 300 + 100
+    assert model.model.generated == 100
+    # 同时存在的预处理结果不超过一个计算key的分块加上预取的batch
+    assert transform.max_alive <= Unimernet.CACHE_KEY_CHUNK_SIZE + (Unimernet.PREFETCH_BATCHES + 1) * batch_size
+
+    # 全部命中时只计算key，不再识别
+    results = model.batch_predict([_MfdResult(boxes)], [page], batch_size=batch_size)
+    assert [item["latex"] for item in results[0]] == expected
+    assert transform.prepared == 400 + 300
+    assert model.model.generated == 100
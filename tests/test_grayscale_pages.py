@@ -0,0 +1,137 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("pypdfium2")
+pytest.importorskip("reportlab")
+
+from reportlab.lib.colors import Color
+from reportlab.pdfgen import canvas
+
+from mineru.cli.common import do_parse
+from mineru.utils.model_utils import crop_img
+from mineru.utils.pdf_image_tools import (
+    expand_to_rgb, get_crop_np_img, get_region_np_img, load_images_from_image, load_images_from_pdf_core,
+    reduce_to_grayscale,
+)
+from mineru.utils.yolo_batch_utils import bucketed_predict
+
+
+def _synthetic_pdf(page_colors):
+    """每页一段文字、一条灰色渐变和一个填充矩形，矩形颜色由page_colors给出"""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(595, 842))
+    for page, fill in enumerate(page_colors):
+        pdf.setFont("Helvetica", 14)
+        pdf.drawString(72, 742, f"synthetic page {page} with enough text to be classified as txt")
+        pdf.drawString(72, 722, "the quick brown fox jumps over the lazy dog 0123456789")
+        for step in range(32):
+            pdf.setFillColor(Color(step / 31, step / 31, step / 31))
+            pdf.rect(72 + step * 14, 600, 14, 60, stroke=0, fill=1)
+        pdf.setFillColor(Color(*fill))
+        pdf.rect(120, 300, 300, 200, stroke=1, fill=1)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+GRAY = (0.4, 0.4, 0.4)
+RED = (0.9, 0.1, 0.1)
+
+
+def _render(pdf_bytes, grayscale):
+    return [img_dict["img_pil"] for img_dict in load_images_from_pdf_core(pdf_bytes, dpi=100, grayscale=grayscale)]
+
+
+def test_grayscale_pages_are_lossless():
+    pdf_bytes = _synthetic_pdf([GRAY, RED, GRAY])
+    rgb_pages = _render(pdf_bytes, grayscale=False)
+    reduced_pages = _render(pdf_bytes, grayscale=True)
+
+    assert [page.mode for page in rgb_pages] == ["RGB"] * 3
+    # 只有三个通道完全相同的页面转为单通道，彩色页面保持不变
+    assert [page.mode for page in reduced_pages] == ["L", "RGB", "L"]
+    for rgb_page, reduced_page in zip(rgb_pages, reduced_pages):
+        assert np.array_equal(expand_to_rgb(np.asarray(reduced_page)), np.asarray(rgb_page))
+    assert np.asarray(reduced_pages[0]).nbytes * 3 == np.asarray(rgb_pages[0]).nbytes
+
+
+def test_full_check_after_sampled_rows():
+    np_img = np.full((64, 64, 3), 200, dtype=np.uint8)
+    # 抽样检查的是第0、16、32、48行，只有其他行带颜色的页面也要保持RGB
+    np_img[17, 5] = (200, 10, 10)
+    assert reduce_to_grayscale(Image.fromarray(np_img)).mode == "RGB"
+    np_img[17, 5] = (10, 10, 10)
+    assert reduce_to_grayscale(Image.fromarray(np_img)).mode == "L"
+    for mode in ["L", "RGBA", "1"]:
+        image = Image.new(mode, (8, 8))
+        assert reduce_to_grayscale(image) is image
+
+
+def test_model_inputs_match_rgb_pages():
+    pdf_bytes = _synthetic_pdf([GRAY])
+    rgb_np = np.asarray(_render(pdf_bytes, grayscale=False)[0])
+    gray_np = np.asarray(_render(pdf_bytes, grayscale=True)[0])
+    assert gray_np.ndim == 2
+
+    # 表格裁剪
+    bbox = (100, 280, 440, 520)
+    scale = 100 / 72
+    assert np.array_equal(
+        expand_to_rgb(get_crop_np_img(bbox, gray_np, scale=scale)), get_crop_np_img(bbox, rgb_np, scale=scale)
+    )
+    # 公式裁剪(没有区域渲染器时从页面图片裁剪)
+    pixel_bbox = (90, 800, 700, 930)
+    assert np.array_equal(get_region_np_img(pixel_bbox, gray_np), get_region_np_img(pixel_bbox, rgb_np))
+    # ocr检测的画布
+    res = {"poly": [90, 800, 700, 800, 700, 930, 90, 930]}
+    gray_crop, gray_info = crop_img(res, gray_np, crop_paste_x=50, crop_paste_y=50)
+    rgb_crop, rgb_info = crop_img(res, rgb_np, crop_paste_x=50, crop_paste_y=50)
+    assert gray_crop.shape == rgb_crop.shape
+    assert np.array_equal(gray_crop, rgb_crop)
+    assert gray_info == rgb_info
+
+    # yolo的batch输入
+    batches = []
+
+    def predict_fn(batch):
+        batches.append(batch)
+        return [None] * len(batch)
+
+    bucketed_predict([gray_np, rgb_np], predict_fn, imgsz=1024, max_batch_size=4)
+    inputs = [image for batch in batches for image in batch]
+    assert len(inputs) == 2
+    assert all(image.shape == rgb_np.shape for image in inputs)
+    assert np.array_equal(inputs[0], inputs[1])
+
+
+def test_grayscale_image_input():
+    buffer = io.BytesIO()
+    Image.fromarray(np.tile(np.arange(256, dtype=np.uint8), (40, 1))).convert("RGB").save(buffer, format="PNG")
+    rgb_images, _ = load_images_from_image(buffer.getvalue())
+    gray_images, _ = load_images_from_image(buffer.getvalue(), grayscale=True)
+    assert gray_images[0]["img_pil"].mode == "L"
+    assert np.array_equal(expand_to_rgb(np.asarray(gray_images[0]["img_pil"])), np.asarray(rgb_images[0]["img_pil"]))
+
+
+def test_pipeline_output_is_unchanged(tmp_path, monkeypatch, fake_models):
+    pdf_bytes = _synthetic_pdf([GRAY, RED])
+    outputs = {}
+    for enable in ["false", "true"]:
+        monkeypatch.setenv("MINERU_GRAYSCALE_PAGES", enable)
+        output_dir = tmp_path / enable
+        do_parse(
+            str(output_dir), ["doc"], [pdf_bytes], ["en"], parse_method="txt",
+            f_draw_layout_bbox=False, f_draw_span_bbox=False, f_dump_orig_pdf=False, f_dump_middle_json=False,
+        )
+        result_dir = output_dir / "doc" / "txt"
+        outputs[enable] = (
+            (result_dir / "doc.md").read_text(encoding="utf-8"),
+            (result_dir / "doc_content_list.json").read_text(encoding="utf-8"),
+            (result_dir / "doc_model.json").read_text(encoding="utf-8"),
+        )
+    assert "synthetic page 1" in outputs["true"][0]
+    assert outputs["true"] == outputs["false"]
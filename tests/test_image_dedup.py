@@ -0,0 +1,107 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+
+from PIL import Image
+
+from mineru.data.data_reader_writer import AsyncImageWriter, FileBasedDataWriter, ImageDedupRegistry
+
+
+def _image(color, size=(64, 48)):
+    return Image.new("RGB", size, color)
+
+
+def test_exact_key_separates_near_identical_crops():
+    registry = ImageDedupRegistry()
+    base = _image((200, 200, 200))
+    # 只差一个像素的裁剪图不能共用同一个文件
+    near = base.copy()
+    near.putpixel((10, 10), (201, 200, 200))
+    assert registry.content_key(base) == registry.content_key(base.copy())
+    assert registry.content_key(base) != registry.content_key(near)
+
+
+def test_identical_crops_share_one_file(tmp_path):
+    registry = ImageDedupRegistry()
+    with AsyncImageWriter(FileBasedDataWriter(str(tmp_path)), dedup_registry=registry) as writer:
+        first = writer.write_image("a", _image((10, 20, 30)))
+        second = writer.write_image("b", _image((10, 20, 30)))
+        third = writer.write_image("c", _image((30, 20, 10)))
+    assert first == second != third
+    assert sorted(os.listdir(tmp_path)) == sorted([first, third])
+    summary = writer.dedup_summary()
+    assert summary["crops"] == 3
+    assert summary["unique"] == 2
+    assert summary["encoded_writes"] == 2
+    assert summary["saved_bytes"] == os.path.getsize(tmp_path / first)
+
+
+def test_summary_is_per_writer_and_hard_links_across_documents(tmp_path):
+    registry = ImageDedupRegistry()
+    doc_a, doc_b = tmp_path / "a", tmp_path / "b"
+    with AsyncImageWriter(FileBasedDataWriter(str(doc_a)), dedup_registry=registry) as writer_a:
+        path = writer_a.write_image("x", _image((1, 2, 3)))
+    with AsyncImageWriter(FileBasedDataWriter(str(doc_b)), dedup_registry=registry) as writer_b:
+        assert writer_b.write_image("y", _image((1, 2, 3))) == path
+
+    assert os.path.samefile(doc_a / path, doc_b / path)
+    # 第二个文档的统计不包含第一个文档的图片
+    assert writer_a.dedup_summary()["crops"] == 1
+    summary_b = writer_b.dedup_summary()
+    assert summary_b["crops"] == 1
+    assert summary_b["hard_links"] == 1
+    assert summary_b["encoded_writes"] == 0
+
+
+def test_registry_is_bounded(tmp_path):
+    registry = ImageDedupRegistry(max_entries=2)
+    with AsyncImageWriter(FileBasedDataWriter(str(tmp_path)), dedup_registry=registry) as writer:
+        for value in range(5):
+            writer.write_image(str(value), _image((value, value, value)))
+    assert len(registry) == 2
+
+
+def test_file_writer_parent_dir(tmp_path):
+    assert FileBasedDataWriter(str(tmp_path)).parent_dir == str(tmp_path)
+
+
+def test_reference_count_spans_documents(tmp_path):
+    registry = ImageDedupRegistry()
+    with AsyncImageWriter(FileBasedDataWriter(str(tmp_path / "a")), dedup_registry=registry) as writer_a:
+        path = writer_a.write_image("x", _image((5, 5, 5)))
+        writer_a.write_image("y", _image((5, 5, 5)))
+    with AsyncImageWriter(FileBasedDataWriter(str(tmp_path / "b")), dedup_registry=registry) as writer_b:
+        writer_b.write_image("z", _image((5, 5, 5)))
+        writer_b.write_image("w", _image((6, 6, 6)))
+    assert registry.ref_count(path.rsplit(".", 1)[0]) == 3
+    assert writer_b.dedup_summary()["max_refs"] == 3
+
+
+def test_encode_settings_are_part_of_the_key(tmp_path):
+    registry = ImageDedupRegistry()
+    image = _image((90, 120, 150), size=(400, 300))
+    writers = {
+        "jpeg": dict(image_format="jpeg"),
+        "webp": dict(image_format="webp"),
+        "low_quality": dict(image_format="jpeg", quality=20),
+        "small": dict(image_format="jpeg", max_size=100),
+    }
+    paths = {}
+    for name, kwargs in writers.items():
+        with AsyncImageWriter(FileBasedDataWriter(str(tmp_path / name)), dedup_registry=registry, **kwargs) as writer:
+            paths[name] = writer.write_image("x", image)
+        assert writer.dedup_summary()["hard_links"] == 0
+
+    # 编码参数不同的writer不会硬链接其他writer的文件
+    assert len(set(paths.values())) == len(writers)
+    assert paths["webp"].endswith(".webp")
+    with Image.open(tmp_path / "webp" / paths["webp"]) as saved:
+        assert saved.format == "WEBP"
+    with Image.open(tmp_path / "small" / paths["small"]) as saved:
+        assert max(saved.size) == 100
+    with Image.open(tmp_path / "jpeg" / paths["jpeg"]) as saved:
+        assert saved.size == (400, 300)
+
+    # 编码参数相同时仍然复用
+    with AsyncImageWriter(FileBasedDataWriter(str(tmp_path / "again")), dedup_registry=registry, image_format="jpeg") as writer:
+        assert writer.write_image("x", image) == paths["jpeg"]
+    assert writer.dedup_summary()["hard_links"] == 1
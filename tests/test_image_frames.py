@@ -0,0 +1,64 @@
+# Copyright (c) Opendatalab. All rights reserved.
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from mineru.cli.common import _prepare_pdf_bytes
+from mineru.utils.pdf_image_tools import load_images_from_image, slice_image_frames
+
+FRAME_COLORS = [(200, 0, 0), (0, 200, 0), (0, 0, 200), (90, 90, 90)]
+
+
+def _multi_frame_tiff():
+    frames = [Image.new("RGB", (64, 48), color) for color in FRAME_COLORS]
+    # 不同模式的帧都转换为RGB
+    frames[3] = frames[3].convert("L")
+    buffer = BytesIO()
+    frames[0].save(buffer, format="TIFF", save_all=True, append_images=frames[1:])
+    return buffer.getvalue()
+
+
+def _frame_colors(image_bytes):
+    colors = []
+    with Image.open(BytesIO(image_bytes)) as image:
+        for index in range(getattr(image, "n_frames", 1)):
+            image.seek(index)
+            colors.append(image.convert("RGB").getpixel((10, 10)))
+    return colors
+
+
+def test_slice_keeps_selected_frames_lossless():
+    image_bytes = _multi_frame_tiff()
+    assert _frame_colors(slice_image_frames(image_bytes, 1, 2)) == FRAME_COLORS[1:3]
+    assert _frame_colors(slice_image_frames(image_bytes, 3)) == FRAME_COLORS[3:]
+    # end_page_id超出帧数时截取到最后一帧
+    assert _frame_colors(slice_image_frames(image_bytes, 2, 100)) == FRAME_COLORS[2:]
+
+
+def test_full_range_returns_original_bytes():
+    image_bytes = _multi_frame_tiff()
+    assert slice_image_frames(image_bytes) is image_bytes
+    assert slice_image_frames(image_bytes, 0, 3) is image_bytes
+    assert slice_image_frames(image_bytes, -1, None) is image_bytes
+
+
+@pytest.mark.parametrize("start_page_id", [4, 10])
+def test_start_beyond_last_frame_is_rejected(start_page_id):
+    with pytest.raises(ValueError, match="out of range"):
+        slice_image_frames(_multi_frame_tiff(), start_page_id)
+
+
+def test_single_frame_image_range():
+    buffer = BytesIO()
+    Image.new("RGB", (20, 20), (1, 2, 3)).save(buffer, format="PNG")
+    assert slice_image_frames(buffer.getvalue(), 0, 0) == buffer.getvalue()
+    with pytest.raises(ValueError):
+        _prepare_pdf_bytes([buffer.getvalue()], 1, None)
+
+
+def test_sliced_frames_load_as_pages():
+    sliced = _prepare_pdf_bytes([_multi_frame_tiff()], 1, 2)[0]
+    images_list, image_doc = load_images_from_image(sliced)
+    assert len(images_list) == len(image_doc) == 2
+    assert [img_dict["img_pil"].getpixel((10, 10)) for img_dict in images_list] == FRAME_COLORS[1:3]
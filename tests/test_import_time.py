@@ -0,0 +1,49 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import subprocess
+import sys
+
+# 命令行入口只允许导入轻量依赖，重量级依赖在真正使用时才导入
+HEAVY_MODULES = [
+    "torch", "torchvision", "transformers", "ultralytics", "doclayout_yolo", "cv2",
+    "magika", "onnxruntime", "reportlab", "pypdf", "pdfminer", "boto3",
+]
+# 冷启动导入预算，单位秒，留出足够余量以免慢速CI误报
+IMPORT_BUDGET_SECONDS = 2.0
+
+
+def _import_in_subprocess(module):
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "cost = time.perf_counter() - start\n"
+        "print(json.dumps({'cost': cost, 'modules': sorted(sys.modules)}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1]), output.stderr
+
+
+def _cumulative_import_us(importtime_log, module):
+    for line in importtime_log.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return None
+
+
+def test_cli_client_does_not_import_heavy_modules():
+    result, _ = _import_in_subprocess("mineru.cli.client")
+    imported = {name.split(".")[0] for name in result["modules"]}
+    assert sorted(imported & set(HEAVY_MODULES)) == []
+
+
+def test_cli_client_import_budget():
+    result, importtime_log = _import_in_subprocess("mineru.cli.client")
+    cumulative_us = _cumulative_import_us(importtime_log, "mineru.cli.client")
+    assert cumulative_us is not None
+    assert cumulative_us / 1e6 < IMPORT_BUDGET_SECONDS, importtime_log
+    assert result["cost"] < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,149 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+
+import pytest
+
+from mineru.backend.pipeline import pipeline_analyze
+from mineru.backend.pipeline.inference_broker import InferenceBroker
+
+
+def _pages(name, count):
+    return [(f"{name}{index}", False, "en", None) for index in range(count)]
+
+
+class _FakeAnalyze:
+    """假的batch_image_analyze：记录每个batch的页面和开关，遇到blocker页时等待放行"""
+
+    def __init__(self, fail=None):
+        self.batches = []
+        self.fail = fail
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, images_with_extra_info, formula_enable=True, table_enable=True):
+        names = [page[0] for page in images_with_extra_info]
+        self.batches.append((names, formula_enable, table_enable))
+        if "blocker0" in names:
+            self.entered.set()
+            assert self.release.wait(30)
+        if self.fail is not None:
+            self.fail(names)
+        return [f"result:{name}" for name in names]
+
+
+@pytest.fixture
+def analyze(monkeypatch):
+    fake = _FakeAnalyze()
+    monkeypatch.setattr(pipeline_analyze, "batch_image_analyze", fake)
+    return fake
+
+
+def _hold(broker, analyze):
+    """提交一个阻塞的请求占住调度线程，之后提交的请求在队列中等待"""
+    future = broker.submit(_pages("blocker", 1), True, True)
+    assert analyze.entered.wait(30)
+    return future
+
+
+def test_pages_are_grouped_by_flags(analyze):
+    broker = InferenceBroker(max_batch_size=8, max_wait=0)
+    blocker = _hold(broker, analyze)
+    requests = {"a": (2, True), "b": (1, False), "c": (3, True), "d": (2, False)}
+    futures = {name: broker.submit(_pages(name, count), formula, True) for name, (count, formula) in requests.items()}
+    analyze.release.set()
+
+    assert blocker.result(timeout=30) == ["result:blocker0"]
+    for name, (count, _) in requests.items():
+        assert futures[name].result(timeout=30) == [f"result:{name}{index}" for index in range(count)]
+    # 开关相同的请求合并成一个batch，不同开关的页面不会混在一起
+    assert sorted(analyze.batches[1:]) == [
+        (["a0", "a1", "c0", "c1", "c2"], True, True),
+        (["b0", "d0", "d1"], False, True),
+    ]
+
+
+def test_request_is_split_across_batches(analyze):
+    broker = InferenceBroker(max_batch_size=3, max_wait=0)
+    blocker = _hold(broker, analyze)
+    first = broker.submit(_pages("a", 7), True, True)
+    second = broker.submit(_pages("b", 2), True, True)
+    analyze.release.set()
+
+    blocker.result(timeout=30)
+    assert first.result(timeout=30) == [f"result:a{index}" for index in range(7)]
+    assert second.result(timeout=30) == ["result:b0", "result:b1"]
+    assert [names for names, _, _ in analyze.batches[1:]] == [
+        ["a0", "a1", "a2"], ["a3", "a4", "a5"], ["a6", "b0", "b1"],
+    ]
+
+
+def test_failed_merged_batch_is_retried_per_request(analyze):
+    def fail(names):
+        if "bad0" in names:
+            raise ValueError("bad page")
+
+    analyze.fail = fail
+    broker = InferenceBroker(max_batch_size=8, max_wait=0)
+    blocker = _hold(broker, analyze)
+    good = broker.submit(_pages("good", 2), True, True)
+    bad = broker.submit(_pages("bad", 1), True, True)
+    later = broker.submit(_pages("later", 1), True, True)
+    analyze.release.set()
+
+    blocker.result(timeout=30)
+    assert good.result(timeout=30) == ["result:good0", "result:good1"]
+    assert later.result(timeout=30) == ["result:later0"]
+    with pytest.raises(ValueError, match="bad page"):
+        bad.result(timeout=30)
+    # 合并的batch失败后，每个请求单独重试一次
+    assert [names for names, _, _ in analyze.batches[1:]] == [
+        ["good0", "good1", "bad0", "later0"], ["good0", "good1"], ["bad0"], ["later0"],
+    ]
+
+
+def test_cancelled_request_is_not_analyzed(analyze):
+    broker = InferenceBroker(max_batch_size=8, max_wait=0)
+    blocker = _hold(broker, analyze)
+    cancelled = broker.submit(_pages("cancelled", 2), True, True)
+    kept = broker.submit(_pages("kept", 1), True, True)
+    assert cancelled.cancel()
+    analyze.release.set()
+
+    blocker.result(timeout=30)
+    assert kept.result(timeout=30) == ["result:kept0"]
+    assert cancelled.cancelled()
+    assert [names for names, _, _ in analyze.batches[1:]] == [["kept0"]]
+    # 已经开始推理的请求不能取消
+    assert not blocker.cancel()
+
+
+def test_unexpected_error_fails_only_its_batch(analyze, monkeypatch):
+    broker = InferenceBroker(max_batch_size=8, max_wait=0)
+    # 模型返回的结果数量不对时，分发结果出错
+    monkeypatch.setattr(pipeline_analyze, "batch_image_analyze", lambda images, *args: None)
+    with pytest.raises(TypeError):
+        broker.submit(_pages("broken", 2), True, True).result(timeout=30)
+
+    monkeypatch.setattr(pipeline_analyze, "batch_image_analyze", analyze)
+    assert broker.submit(_pages("next", 1), True, True).result(timeout=30) == ["result:next0"]
+
+
+def test_stopped_thread_fails_pending_requests_and_restarts(analyze):
+    def stop(names):
+        if "blocker0" in names:
+            raise SystemExit("stopped")
+
+    analyze.fail = stop
+    broker = InferenceBroker(max_batch_size=8, max_wait=0)
+    blocker = _hold(broker, analyze)
+    queued = broker.submit(_pages("queued", 1), False, False)
+    analyze.release.set()
+
+    # 调度线程退出时，正在推理和排队中的请求都得到异常，不会一直等待
+    with pytest.raises(SystemExit):
+        blocker.result(timeout=30)
+    with pytest.raises(SystemExit):
+        queued.result(timeout=30)
+
+    analyze.fail = None
+    assert broker.submit(_pages("after", 2), True, True).result(timeout=30) == ["result:after0", "result:after1"]
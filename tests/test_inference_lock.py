@@ -0,0 +1,89 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("torch")
+
+from mineru.backend.pipeline import batch_analyze, pipeline_analyze
+from mineru.backend.pipeline.inference_broker import InferenceBroker
+from mineru.backend.pipeline.model_init import AtomModelSingleton
+from mineru.backend.pipeline.model_json_to_middle_json import post_ocr
+
+
+class _SharedModel:
+    """记录同时处于推理中的线程数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+
+    def run(self):
+        with self._lock:
+            self.active += 1
+            self.calls += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self._lock:
+            self.active -= 1
+
+
+@pytest.fixture
+def shared_model(monkeypatch):
+    model = _SharedModel()
+
+    class FakeBatchAnalyze:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __call__(self, images_with_extra_info):
+            model.run()
+            return [[] for _ in images_with_extra_info]
+
+    class FakeOcr:
+        def ocr(self, img_crop_list, det=True, rec=True, tqdm_enable=False):
+            model.run()
+            return [[("text", 0.99) for _ in img_crop_list]]
+
+    monkeypatch.setattr(batch_analyze, "BatchAnalyze", FakeBatchAnalyze)
+    monkeypatch.setattr(AtomModelSingleton, "get_atom_model", lambda self, **kwargs: FakeOcr())
+    return model
+
+
+def _pdf_info_with_ocr_span():
+    span = {"type": "text", "bbox": [0, 0, 10, 10], "np_img": np.zeros((8, 32, 3), dtype=np.uint8)}
+    block = {"type": "text", "lines": [{"spans": [span]}]}
+    return [{"preproc_blocks": [block], "discarded_blocks": []}], span
+
+
+def test_broker_and_post_ocr_do_not_share_model_concurrently(shared_model):
+    broker = InferenceBroker(max_batch_size=1, max_wait=0)
+    page = (Image.new("RGB", (32, 32)), False, "en", None)
+    spans = []
+
+    def run_post_ocr():
+        for _ in range(20):
+            pdf_info, span = _pdf_info_with_ocr_span()
+            post_ocr(pdf_info, lang="en")
+            spans.append(span)
+
+    threads = [threading.Thread(target=run_post_ocr) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    futures = [broker.submit([page], True, True) for _ in range(20)]
+    # 未开启调度器时多个任务在模型线程池中直接调用batch_image_analyze
+    direct = threading.Thread(target=lambda: [pipeline_analyze.batch_image_analyze([page]) for _ in range(10)])
+    direct.start()
+    for future in futures:
+        assert future.result(timeout=60) == [[]]
+    for thread in [*threads, direct]:
+        thread.join()
+
+    assert shared_model.calls == 20 + 40 + 10
+    assert shared_model.max_active == 1
+    assert all(span["content"] == "text" and "np_img" not in span for span in spans)
@@ -0,0 +1,136 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import os
+
+import pytest
+
+from mineru.cli import client
+from mineru.cli.ingest import MANIFEST_FILE_NAME, ParseManifest, pack_by_pages
+
+
+def test_pack_by_pages():
+    pages = {"a": 3, "b": 4, "c": 1, "d": 20, "e": 2, "f": 5}
+    batches = pack_by_pages(list(pages), 8, pages.get)
+    assert batches == [(["a", "b", "c"], [3, 4, 1]), (["d"], [20]), (["e", "f"], [2, 5])]
+    # 每个batch不超过max_pages，超过的单个文件独占一个batch，文件顺序不变
+    assert [path for paths, _ in batches for path in paths] == list(pages)
+    assert pack_by_pages([], 8, pages.get) == []
+    assert pack_by_pages(["a", "b"], 1, pages.get) == [(["a"], [3]), (["b"], [4])]
+
+
+def test_manifest_skips_finished_files_after_reload(tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    docs = {name: tmp_path / f"{name}.pdf" for name in ["ok", "failed", "moved", "unrecorded", "new", "retried"]}
+
+    def md_dir(name):
+        return str(output_dir / name / "auto")
+
+    for name in ["ok", "moved", "unrecorded", "retried"]:
+        os.makedirs(md_dir(name))
+    (output_dir / "unrecorded" / "auto" / "unrecorded.md").write_text("done", encoding="utf-8")
+
+    manifest = ParseManifest(str(output_dir))
+    manifest.record(docs["ok"], "ok", elapsed=1.5, pages=3)
+    manifest.record(docs["failed"], "failed", error="ValueError: broken", pages=2)
+    manifest.record(docs["moved"], "ok", pages=1)
+    manifest.record(docs["retried"], "failed", error="ValueError: broken", pages=1)
+    manifest.record(docs["retried"], "ok", pages=1)
+    # 中断时留下的不完整行
+    with open(manifest.path, "a", encoding="utf-8") as f:
+        f.write('{"path": "trunc')
+    os.rename(md_dir("moved"), str(output_dir / "moved" / "elsewhere"))
+
+    manifest = ParseManifest(str(output_dir))
+    done = {name: manifest.is_done(path, md_dir(name)) for name, path in docs.items()}
+    assert done == {
+        "ok": True, "failed": False, "moved": False, "unrecorded": True, "new": False, "retried": True,
+    }
+    assert manifest.summary(list(docs.values())) == {"ok": 3, "failed": 1, "skipped": 0}
+
+
+@pytest.fixture
+def fake_do_parse(monkeypatch):
+    """替换命令行使用的do_parse：名字含bad的文件解析失败，其余文件写出markdown"""
+    calls = []
+
+    def do_parse(output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method="auto", **kwargs):
+        calls.append(list(pdf_file_names))
+        if any(name.startswith("bad") for name in pdf_file_names):
+            raise RuntimeError("broken file")
+        for name in pdf_file_names:
+            md_dir = os.path.join(output_dir, name, parse_method)
+            os.makedirs(md_dir, exist_ok=True)
+            with open(os.path.join(md_dir, f"{name}.md"), "w", encoding="utf-8") as f:
+                f.write(name)
+
+    for name, value in [("MINERU_DEVICE_MODE", "cpu"), ("MINERU_VIRTUAL_VRAM_SIZE", "1"), ("MINERU_MODEL_SOURCE", "local")]:
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("MINERU_INGEST_BATCH_PAGES", "100")
+    monkeypatch.setattr(client, "do_parse", do_parse)
+    return calls
+
+
+def _read_manifest(output_dir):
+    entries = {}
+    with open(os.path.join(output_dir, MANIFEST_FILE_NAME), encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            entries.setdefault(os.path.basename(entry["path"]), []).append(entry)
+    return entries
+
+
+def test_failed_batch_is_retried_one_file_at_a_time(tmp_path, fake_do_parse, make_pdf):
+    from click.testing import CliRunner
+
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name, pages in [("a", 2), ("bad", 1), ("c", 3)]:
+        (input_dir / f"{name}.pdf").write_bytes(make_pdf(name, pages=pages))
+    output_dir = tmp_path / "out"
+
+    result = CliRunner().invoke(client.main, ["-p", str(input_dir), "-o", str(output_dir)])
+    assert result.exit_code == 0, result.output
+    # 整个batch失败后逐个文件重新解析，只有出错的文件记为失败
+    assert fake_do_parse == [["a", "bad", "c"], ["a"], ["bad"], ["c"]]
+    entries = _read_manifest(output_dir)
+    assert [(entry["status"], entry["pages"]) for entry in entries["a.pdf"]] == [("ok", 2)]
+    assert [(entry["status"], entry["pages"]) for entry in entries["c.pdf"]] == [("ok", 3)]
+    assert [(entry["status"], entry["pages"]) for entry in entries["bad.pdf"]] == [("failed", 1)]
+    assert "RuntimeError: broken file" in entries["bad.pdf"][0]["error"]
+
+    # 重新运行时跳过已完成的文件，只重试失败的文件
+    fake_do_parse.clear()
+    result = CliRunner().invoke(client.main, ["-p", str(input_dir), "-o", str(output_dir)])
+    assert result.exit_code == 0, result.output
+    assert fake_do_parse == [["bad"]]
+    entries = _read_manifest(output_dir)
+    assert [entry["status"] for entry in entries["a.pdf"]] == ["ok", "skipped"]
+    assert [entry["status"] for entry in entries["bad.pdf"]] == ["failed", "failed"]
+
+
+def test_worker_results_record_pages(tmp_path, fake_do_parse, make_pdf, monkeypatch):
+    from click.testing import CliRunner
+    from mineru.cli import coordinator
+
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name, pages in [("a", 2), ("b", 3)]:
+        (input_dir / f"{name}.pdf").write_bytes(make_pdf(name, pages=pages))
+
+    class _InlineCoordinator:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def run(self, tasks, on_task_done):
+            for task in tasks:
+                on_task_done(task, coordinator.TaskResult(task.name, task.path, status="ok"))
+
+    monkeypatch.setattr(coordinator, "ParseCoordinator", _InlineCoordinator)
+    output_dir = tmp_path / "out"
+    result = CliRunner().invoke(client.main, ["-p", str(input_dir), "-o", str(output_dir), "-w", "2"])
+    assert result.exit_code == 0, result.output
+    # 多worker与单进程的清单记录格式相同
+    entries = _read_manifest(output_dir)
+    assert [(entry["status"], entry["pages"]) for entry in entries["a.pdf"]] == [("ok", 2)]
+    assert [(entry["status"], entry["pages"]) for entry in entries["b.pdf"]] == [("ok", 3)]
@@ -0,0 +1,111 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mineru.backend.pipeline import model_init
+from mineru.backend.pipeline.model_init import AtomModelSingleton, MineruPipelineModel
+from mineru.backend.pipeline.model_list import AtomicModel
+
+
+class _StubModel:
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.kwargs = kwargs
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    """替换各子模型的构造函数，记录每个模型被构造的次数，构造时稍作等待以便并发访问重叠"""
+    constructed = Counter()
+    lock = threading.Lock()
+
+    def stub(name, nested_ocr=False):
+        def init(*args, **kwargs):
+            if nested_ocr:
+                # 表格等模型初始化时会在持有单例锁的情况下再获取ocr模型
+                AtomModelSingleton().get_atom_model(
+                    atom_model_name=AtomicModel.OCR, det_db_box_thresh=0.5, det_db_unclip_ratio=1.6,
+                    lang=kwargs.get("lang", args[0] if args else None), enable_merge_det_boxes=False,
+                )
+            time.sleep(0.05)
+            with lock:
+                constructed[name] += 1
+            return _StubModel(name, args=args, **kwargs)
+        return init
+
+    monkeypatch.setattr(AtomModelSingleton, "_models", {})
+    monkeypatch.setattr(model_init, "auto_download_and_get_model_root_path", lambda path: "/models")
+    monkeypatch.setattr(model_init, "doclayout_yolo_model_init", stub("layout"))
+    monkeypatch.setattr(model_init, "mfd_model_init", stub("mfd"))
+    monkeypatch.setattr(model_init, "mfr_model_init", stub("mfr"))
+    monkeypatch.setattr(model_init, "ocr_model_init", stub("ocr"))
+    monkeypatch.setattr(model_init, "wired_table_model_init", stub("wired_table", nested_ocr=True))
+    monkeypatch.setattr(model_init, "wireless_table_model_init", stub("wireless_table", nested_ocr=True))
+    monkeypatch.setattr(model_init, "table_cls_model_init", stub("table_cls"))
+    monkeypatch.setattr(model_init, "img_orientation_cls_model_init", stub("img_orientation_cls"))
+    return constructed
+
+
+def _pipeline_model(formula=True, table=True):
+    return MineruPipelineModel(
+        formula_config={"enable": formula}, table_config={"enable": table}, lang="ch", device="cpu"
+    )
+
+
+def test_models_load_on_first_use(stub_models):
+    model = _pipeline_model()
+    assert stub_models == Counter()
+
+    layout_model = model.layout_model
+    assert layout_model.name == "layout"
+    assert stub_models == Counter({"layout": 1})
+    assert model.layout_model is layout_model
+    assert stub_models == Counter({"layout": 1})
+
+    # 另一个实例共享已加载的模型
+    assert _pipeline_model().layout_model is layout_model
+    assert stub_models == Counter({"layout": 1})
+
+
+def test_concurrent_first_use_loads_once(stub_models):
+    model = _pipeline_model()
+    start = threading.Barrier(8)
+
+    def use(attr):
+        start.wait()
+        return getattr(model, attr)
+
+    attrs = ["mfr_model", "wired_table_model", "mfr_model", "wired_table_model"] * 2
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(use, attrs))
+
+    assert len({id(result) for result, attr in zip(results, attrs) if attr == "mfr_model"}) == 1
+    assert len({id(result) for result, attr in zip(results, attrs) if attr == "wired_table_model"}) == 1
+    # 表格模型初始化时获取的ocr模型也只加载一次
+    assert stub_models == Counter({"mfr": 1, "wired_table": 1, "ocr": 1})
+
+
+def test_preload_loads_enabled_models(stub_models):
+    model = _pipeline_model()
+    assert model.preload() is model
+    assert set(stub_models) == {
+        "layout", "mfd", "mfr", "ocr", "wired_table", "wireless_table", "table_cls", "img_orientation_cls",
+    }
+    # 版面ocr与表格使用的ocr参数不同，是两个模型
+    assert stub_models["ocr"] == 2
+    assert all(count == 1 for name, count in stub_models.items() if name != "ocr")
+    loaded = dict(stub_models)
+
+    # 预热后再次访问不会重新加载
+    _ = model.mfd_model, model.wireless_table_model, model.ocr_model
+    model.preload()
+    assert dict(stub_models) == loaded
+
+
+def test_preload_skips_disabled_models(stub_models):
+    _pipeline_model(formula=False, table=False).preload()
+    assert stub_models == Counter({"layout": 1, "ocr": 1})
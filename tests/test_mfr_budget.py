@@ -0,0 +1,100 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import pytest
+
+pytest.importorskip("torch")
+
+from mineru.model.mfr.unimernet.Unimernet import MIN_NEW_TOKENS, predict_max_new_tokens
+from mineru.utils.os_env_config import get_mfr_adaptive_max_new_tokens_enable, get_mfr_repeat_stop_enable
+
+
+def test_adaptive_budget_and_repeat_stop_are_opt_in(monkeypatch):
+    monkeypatch.delenv("MINERU_MFR_ADAPTIVE_MAX_NEW_TOKENS", raising=False)
+    monkeypatch.delenv("MINERU_MFR_REPEAT_STOP", raising=False)
+    assert get_mfr_adaptive_max_new_tokens_enable() is False
+    assert get_mfr_repeat_stop_enable() is False
+    monkeypatch.setenv("MINERU_MFR_ADAPTIVE_MAX_NEW_TOKENS", "true")
+    monkeypatch.setenv("MINERU_MFR_REPEAT_STOP", "1")
+    assert get_mfr_adaptive_max_new_tokens_enable() is True
+    assert get_mfr_repeat_stop_enable() is True
+
+
+def test_interline_formulas_get_full_length():
+    # 多行的行间公式和矩阵：面积与字号之比无法反映token数，不能按行内公式的比例估计
+    boxes = [(20, 80, 13), (20, 40, 13), (240, 600, 14), (20, 30, 14)]
+    budgets = predict_max_new_tokens(boxes)
+    assert budgets[2] == 0
+    assert budgets[3] == 0
+    assert budgets[0] >= budgets[1] >= MIN_NEW_TOKENS
+
+
+def test_inline_budget_scales_with_area():
+    budgets = predict_max_new_tokens([(20, 40, 13), (20, 400, 13), (20, 2000, 13)])
+    assert budgets[0] == MIN_NEW_TOKENS
+    assert budgets[0] < budgets[1] < budgets[2]
+    assert predict_max_new_tokens([]) == []
+
+
+class _Boxes:
+    def __init__(self, boxes):
+        import torch
+        self.xyxy = torch.tensor([box[:4] for box in boxes], dtype=torch.float32)
+        self.conf = torch.tensor([0.9] * len(boxes))
+        self.cls = torch.tensor([box[4] for box in boxes], dtype=torch.float32)
+
+
+class _MfdResult:
+    def __init__(self, boxes):
+        self.boxes = _Boxes(boxes)
+
+
+class _FailingModel:
+    """预处理正常、生成阶段抛出异常的假模型"""
+
+    def __init__(self):
+        import torch
+        self.dtype = torch.float32
+        self.transform = self
+
+    def prepare_input(self, image):
+        return image
+
+    def to_gray(self, image):
+        return image
+
+    def normalize_batch(self, images):
+        import torch
+        return torch.zeros(len(images), 1, 4, 4)
+
+    def generate(self, *args, **kwargs):
+        raise RuntimeError("CUDA out of memory")
+
+
+def test_preprocess_executor_is_released_on_failure(monkeypatch):
+    import numpy as np
+    from mineru.model.mfr.unimernet import Unimernet
+
+    executors = []
+    real_executor = Unimernet.ThreadPoolExecutor
+
+    class TrackedExecutor(real_executor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.shutdown_called = False
+            executors.append(self)
+
+        def shutdown(self, *args, **kwargs):
+            self.shutdown_called = True
+            super().shutdown(*args, **kwargs)
+
+    monkeypatch.setattr(Unimernet, "ThreadPoolExecutor", TrackedExecutor)
+    monkeypatch.setenv("MINERU_MFR_CACHE", "false")
+    model = Unimernet.UnimernetModel.__new__(Unimernet.UnimernetModel)
+    model.model = _FailingModel()
+    model.device = "cpu"
+    model.cache_namespace = "test"
+
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    with pytest.raises(RuntimeError):
+        model.batch_predict([_MfdResult([(0, 0, 40, 20, 0), (10, 30, 90, 60, 1)])], [image], batch_size=1)
+    assert len(executors) == 1
+    assert executors[0].shutdown_called
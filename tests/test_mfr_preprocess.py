@@ -0,0 +1,49 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import cv2
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("albumentations")
+pytest.importorskip("transformers")
+
+from mineru.model.mfr.unimernet.unimernet_hf.unimer_swin.image_processing_unimer_swin import UnimerSwinImageProcessor
+
+
+def _color_formula():
+    rng = np.random.default_rng(0)
+    image = np.full((60, 200, 3), 255, dtype=np.uint8)
+    image[10:50, 20:180] = rng.integers(0, 255, (40, 160, 3), dtype=np.uint8)
+    # 红色和蓝色笔画，R通道与灰度差别很大
+    image[20:40, 30:60] = (230, 20, 20)
+    image[20:40, 100:130] = (20, 20, 230)
+    return image
+
+
+def test_model_input_is_always_grayscale():
+    processor = UnimerSwinImageProcessor()
+    image = _color_formula()
+    first = processor(image)
+    assert first.shape == (1, 192, 672)
+    # ToGray的默认概率为0.5，固定为1后每次调用的输入完全相同
+    for _ in range(20):
+        assert torch.equal(processor(image), first)
+
+    prepared = processor.prepare_input(image)
+    gray = cv2.cvtColor(prepared, cv2.COLOR_RGB2GRAY)
+    expected = (torch.from_numpy(gray).float() / 255.0 - processor.mean) / processor.std
+    assert (first[0] - expected).abs().max().item() < 1e-5
+    # 不是只取了R通道
+    red_only = (torch.from_numpy(prepared[:, :, 0].copy()).float() / 255.0 - processor.mean) / processor.std
+    assert (first[0] - red_only).abs().max().item() > 1.0
+
+
+def test_batched_preprocess_matches_per_item_transform():
+    processor = UnimerSwinImageProcessor()
+    images = [_color_formula(), np.full((30, 80, 3), 128, dtype=np.uint8), None]
+    batch = processor.normalize_batch([processor.to_gray(processor.prepare_input(image)) for image in images])
+    assert batch.shape == (3, 1, 192, 672)
+    for index, image in enumerate(images[:2]):
+        assert (batch[index] - processor(image)).abs().max().item() < 1e-5
+    # 预处理失败的图片为全黑的空白图
+    assert torch.allclose(batch[2], torch.full_like(batch[2], -processor.mean / processor.std))
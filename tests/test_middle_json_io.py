@@ -0,0 +1,81 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import importlib.util
+import io
+import json
+
+import pytest
+
+from mineru.data.data_reader_writer import FileBasedDataWriter
+from mineru.utils.middle_json_io import dump_json_output, iter_dump_chunks, MiddleJsonReader
+
+
+def _has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def _middle_json(page_count=3):
+    return {
+        "pdf_info": [
+            {"page_idx": i, "page_size": [612, 792], "para_blocks": [{"type": "text", "text": f"第{i}页", "bbox": [1, 2, 3, 4]}]}
+            for i in range(page_count)
+        ],
+        "_backend": "pipeline",
+        "_version_name": "test",
+    }
+
+
+@pytest.mark.parametrize("data", [
+    _middle_json(),
+    _middle_json(0),
+    [{"type": "text", "text": "a"}, {"type": "image", "img_path": "images/x.jpg", "page_idx": 1}],
+    [],
+])
+def test_json_chunks_match_json_dumps(data):
+    assert b"".join(iter_dump_chunks(data, "json")).decode("utf-8") == json.dumps(data, ensure_ascii=False, indent=4)
+    assert json.loads(b"".join(iter_dump_chunks(data, "json-min"))) == data
+
+
+@pytest.mark.parametrize("output_format", [
+    "json", "json-min", "jsonl",
+    pytest.param("jsonl.zst", marks=pytest.mark.skipif(not _has_module("zstandard"), reason="zstandard not installed")),
+    pytest.param("msgpack", marks=pytest.mark.skipif(not _has_module("msgpack"), reason="msgpack not installed")),
+])
+def test_reader_round_trip(tmp_path, output_format):
+    data = _middle_json(5)
+    file_name = dump_json_output(FileBasedDataWriter(str(tmp_path)), "demo_middle", data, output_format)
+    with MiddleJsonReader(tmp_path / file_name) as reader:
+        assert len(reader) == 5
+        assert reader.page(3) == data["pdf_info"][3]
+        assert reader.load() == data
+        assert [page["page_idx"] for page in reader] == list(range(5))
+
+
+@pytest.mark.parametrize("output_format", ["jsonl.zst", "msgpack"])
+def test_compact_formats_random_access_empty_and_unicode(tmp_path, output_format):
+    pytest.importorskip("zstandard" if output_format == "jsonl.zst" else "msgpack")
+    data = _middle_json(40)
+    data["pdf_info"][17]["para_blocks"][0]["text"] = "公式 $x^2$ 😀 \\n \u0000"
+    file_name = dump_json_output(FileBasedDataWriter(str(tmp_path)), "demo_middle", data, output_format)
+    with MiddleJsonReader(tmp_path / file_name) as reader:
+        # 倒序随机读取单页
+        for index in [39, 17, 0, 17]:
+            assert reader.page(index) == data["pdf_info"][index]
+        assert reader.load() == data
+
+    empty = _middle_json(0)
+    file_name = dump_json_output(FileBasedDataWriter(str(tmp_path)), "empty_middle", empty, output_format)
+    with MiddleJsonReader(tmp_path / file_name) as reader:
+        assert len(reader) == 0
+        assert reader.load() == empty
+
+
+def test_jsonl_zst_decompresses_to_plain_jsonl(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    data = _middle_json(3)
+    file_name = dump_json_output(FileBasedDataWriter(str(tmp_path)), "demo_middle", data, "jsonl.zst")
+    jsonl_name = dump_json_output(FileBasedDataWriter(str(tmp_path)), "demo_middle", data, "jsonl")
+    # 通用的zstd解压工具会跳过保存偏移的帧，得到与jsonl格式相同的内容
+    with open(tmp_path / file_name, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        decompressed = io.BufferedReader(reader).read()
+    assert decompressed == (tmp_path / jsonl_name).read_bytes()
@@ -0,0 +1,71 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import multiprocessing
+import os
+
+import pytest
+
+from mineru.utils import models_download_utils
+from mineru.utils.models_download_utils import load_models_manifest, record_model_manifest, _resolve_from_manifest
+
+
+@pytest.fixture
+def model_root(tmp_path, monkeypatch):
+    monkeypatch.setenv("MINERU_MODELS_MANIFEST", str(tmp_path / "manifest" / "models_manifest.json"))
+    root = tmp_path / "models"
+    (root / "layout").mkdir(parents=True)
+    (root / "layout" / "model.pt").write_bytes(b"weights-v1")
+    (root / "layout" / "config.yaml").write_bytes(b"name: layout")
+    return root
+
+
+def test_resolve_recorded_model(model_root):
+    assert _resolve_from_manifest("huggingface", "org/repo", "layout") is None
+    record_model_manifest("huggingface", "org/repo", "layout", str(model_root))
+    assert _resolve_from_manifest("huggingface", "org/repo", "layout") == str(model_root)
+
+
+def test_same_size_rewrite_is_stale(model_root):
+    record_model_manifest("huggingface", "org/repo", "layout", str(model_root), with_hash=True)
+    weights = model_root / "layout" / "model.pt"
+    stat = weights.stat()
+    # 大小不变但内容被替换(例如下载中断后重写)，修改时间不同，清单应视为过期
+    weights.write_bytes(b"weights-v2")
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert _resolve_from_manifest("huggingface", "org/repo", "layout") is None
+
+    # 重新记录时不能沿用旧文件的sha256
+    record_model_manifest("huggingface", "org/repo", "layout", str(model_root))
+    file_info = load_models_manifest()["repos"]["huggingface:org/repo"]["files"]["layout/model.pt"]
+    assert "sha256" not in file_info
+    assert _resolve_from_manifest("huggingface", "org/repo", "layout") == str(model_root)
+
+
+def test_missing_file_is_stale(model_root):
+    record_model_manifest("huggingface", "org/repo", "layout", str(model_root))
+    (model_root / "layout" / "config.yaml").unlink()
+    assert _resolve_from_manifest("huggingface", "org/repo", "layout") is None
+
+
+def _record_repos(manifest_path, root, worker_id, repo_count):
+    os.environ["MINERU_MODELS_MANIFEST"] = manifest_path
+    for index in range(repo_count):
+        models_download_utils.record_model_manifest("huggingface", f"org/repo-{worker_id}-{index}", "layout", root)
+
+
+def test_concurrent_processes_keep_all_records(model_root):
+    manifest_path = os.environ["MINERU_MODELS_MANIFEST"]
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=_record_repos, args=(manifest_path, str(model_root), worker_id, 5))
+        for worker_id in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    repos = load_models_manifest()["repos"]
+    assert sorted(repos) == sorted(
+        f"huggingface:org/repo-{worker_id}-{index}" for worker_id in range(4) for index in range(5)
+    )
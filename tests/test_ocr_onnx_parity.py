@@ -0,0 +1,95 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("omegaconf")
+
+from mineru.model.utils.pytorchocr.modeling.architectures.base_model import BaseModel
+from mineru.model.utils.pytorchocr.modeling.backbones.rec_hgnet import ConvBNAct
+from mineru.model.utils.tools.infer.onnx_engine import build_ort_net
+from mineru.model.utils.tools.infer.pytorchocr_utility import get_arch_config
+
+# 模型权重无法在测试环境下载，使用固定随机种子初始化的同结构模型，检查导出后的计算图与torch一致
+DET_ARCH = "ch_PP-OCRv5_det_infer.pth"
+REC_ARCH = "ch_PP-OCRv5_rec_infer.pth"
+REC_OUT_CHANNELS = 200
+DET_DB_THRESH = 0.3
+
+
+@pytest.fixture(autouse=True)
+def onnx_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("MINERU_ONNX_CACHE_DIR", str(tmp_path / "onnx"))
+
+
+def _randomize_bn(net):
+    # 默认初始化的BN是恒等变换，随机化统计量才能覆盖conv/bn融合后的数值
+    generator = torch.Generator().manual_seed(0)
+    for module in net.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.copy_(torch.randn(module.running_mean.shape, generator=generator) * 0.1)
+            module.running_var.copy_(torch.rand(module.running_var.shape, generator=generator) + 0.5)
+
+
+def _build_det(tmp_path):
+    torch.manual_seed(0)
+    net = BaseModel(get_arch_config(DET_ARCH))
+    with torch.no_grad():
+        _randomize_bn(net)
+    net.eval()
+    for module in net.modules():
+        if hasattr(module, "rep"):
+            module.rep()
+    weights_path = tmp_path / DET_ARCH
+    weights_path.write_bytes(b"")
+    return net, build_ort_net(net, str(weights_path), "det", torch.zeros(1, 3, 640, 640))
+
+
+def _build_rec(tmp_path):
+    torch.manual_seed(0)
+    net = BaseModel(get_arch_config(REC_ARCH), out_channels=REC_OUT_CHANNELS)
+    with torch.no_grad():
+        _randomize_bn(net)
+    net.eval()
+    for module in net.modules():
+        if isinstance(module, ConvBNAct):
+            if module.use_act:
+                torch.quantization.fuse_modules(module, ["conv", "bn", "act"], inplace=True)
+            else:
+                torch.quantization.fuse_modules(module, ["conv", "bn"], inplace=True)
+    weights_path = tmp_path / REC_ARCH
+    weights_path.write_bytes(b"")
+    return net, build_ort_net(net, str(weights_path), "rec", torch.zeros(1, 3, 48, 320))
+
+
+def test_det_onnx_matches_torch(tmp_path):
+    torch_net, ort_net = _build_det(tmp_path)
+    rng = np.random.default_rng(0)
+    # 导出时的输入是640x640，动态尺寸需要覆盖其他宽高和batch
+    for shape in [(1, 3, 640, 640), (1, 3, 320, 960), (2, 3, 480, 352)]:
+        inp = rng.random(shape, dtype=np.float32)
+        with torch.no_grad():
+            expected = torch_net(torch.from_numpy(inp))["maps"]
+        actual = ort_net(inp)["maps"]
+        assert actual.shape == expected.shape
+        # 深层网络fp32累积误差在1e-4量级
+        assert (actual - expected).abs().max().item() < 1e-3
+        # 后处理按det_db_thresh二值化，二值图应几乎完全一致
+        agree = ((actual > DET_DB_THRESH) == (expected > DET_DB_THRESH)).float().mean().item()
+        assert agree > 0.9999
+
+
+def test_rec_onnx_matches_torch(tmp_path):
+    torch_net, ort_net = _build_rec(tmp_path)
+    rng = np.random.default_rng(0)
+    for shape in [(1, 3, 48, 320), (6, 3, 48, 160), (3, 3, 48, 960)]:
+        inp = rng.random(shape, dtype=np.float32)
+        with torch.no_grad():
+            expected = torch_net(torch.from_numpy(inp))
+        actual = ort_net(torch.from_numpy(inp))
+        assert actual.shape == expected.shape
+        assert (actual - expected).abs().max().item() < 1e-4
+        # 识别结果由逐帧argmax决定，必须完全一致
+        assert torch.equal(actual.argmax(-1), expected.argmax(-1))
@@ -0,0 +1,117 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from mineru.model.utils.tools.infer import onnx_engine
+from mineru.model.utils.tools.infer.onnx_engine import OrtNet, build_ort_net, export_onnx, get_onnx_path
+
+
+class _TinyRec(torch.nn.Module):
+    """输出(batch, length, classes)，与识别模型的输出形状一致"""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.conv = torch.nn.Conv2d(3, 8, 3, padding=1)
+
+    def forward(self, x):
+        return self.conv(x).mean(dim=2).permute(0, 2, 1)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("MINERU_ONNX_CACHE_DIR", str(tmp_path / "onnx"))
+    return tmp_path / "onnx"
+
+
+@pytest.fixture
+def weights(tmp_path):
+    model_dir = tmp_path / "models"
+    model_dir.mkdir()
+    weights_path = model_dir / "rec.pth"
+    weights_path.write_bytes(b"weights")
+    return weights_path
+
+
+def test_export_goes_to_the_cache_dir(cache_dir, weights):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    net = _TinyRec().eval()
+    ort_net = build_ort_net(net, str(weights), "rec", torch.zeros(1, 3, 48, 64))
+    assert isinstance(ort_net, OrtNet)
+    # 模型目录可能只读或被多个进程共享，不在其中写入任何文件
+    assert os.listdir(weights.parent) == ["rec.pth"]
+    assert os.listdir(cache_dir) == [os.path.basename(get_onnx_path(str(weights), "rec"))]
+
+    inp = np.random.default_rng(0).random((2, 3, 48, 96), dtype=np.float32)
+    with torch.no_grad():
+        expected = net(torch.from_numpy(inp))
+    assert (ort_net(inp) - expected).abs().max().item() < 1e-5
+
+
+def test_cache_key_follows_the_weights(cache_dir, weights):
+    onnx_path = get_onnx_path(str(weights), "rec")
+    assert get_onnx_path(str(weights), "det") != onnx_path
+    weights.write_bytes(b"updated weights")
+    assert get_onnx_path(str(weights), "rec") != onnx_path
+
+
+def test_concurrent_exports_never_expose_a_partial_file(cache_dir, weights):
+    onnx = pytest.importorskip("onnx")
+    onnx_path = get_onnx_path(str(weights), "rec")
+    start = threading.Barrier(4)
+    errors = []
+
+    def export():
+        try:
+            start.wait()
+            export_onnx(_TinyRec().eval(), onnx_path, "rec", torch.zeros(1, 3, 48, 64))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=export) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    onnx.checker.check_model(onnx.load(onnx_path))
+    # 临时文件都已替换或清理
+    assert os.listdir(cache_dir) == [os.path.basename(onnx_path)]
+
+
+def test_missing_onnxruntime_falls_back_to_torch(cache_dir, weights, monkeypatch):
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    net = _TinyRec().eval()
+    assert build_ort_net(net, str(weights), "rec", torch.zeros(1, 3, 48, 64)) is net
+    assert not cache_dir.exists()
+
+
+def test_unwritable_cache_falls_back_to_torch(tmp_path, weights, monkeypatch):
+    pytest.importorskip("onnxruntime")
+    # 缓存目录的位置上是一个普通文件，无法创建目录
+    blocker = tmp_path / "blocker"
+    blocker.write_bytes(b"")
+    monkeypatch.setenv("MINERU_ONNX_CACHE_DIR", str(blocker / "onnx"))
+    net = _TinyRec().eval()
+    assert build_ort_net(net, str(weights), "rec", torch.zeros(1, 3, 48, 64)) is net
+
+
+def test_failed_export_cleans_up_and_falls_back(cache_dir, weights, monkeypatch):
+    pytest.importorskip("onnxruntime")
+
+    def broken_export(*args, **kwargs):
+        with open(args[2], "wb") as f:
+            f.write(b"partial")
+        raise RuntimeError("export failed")
+
+    monkeypatch.setattr(onnx_engine.torch.onnx, "export", broken_export)
+    net = _TinyRec().eval()
+    assert build_ort_net(net, str(weights), "rec", torch.zeros(1, 3, 48, 64)) is net
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,114 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import copy
+import os
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import torch.ao.nn.quantized.dynamic as nnqd
+from torch import nn
+
+from mineru.utils import quantize_utils
+from mineru.utils.quantize_utils import get_quantize_cache_path, quantize_dynamic_int8
+
+
+class _Head(nn.Module):
+    def __init__(self, with_lstm=False):
+        super().__init__()
+        self.conv = nn.Conv1d(8, 8, 3, padding=1)
+        self.lstm = nn.LSTM(8, 16, batch_first=True) if with_lstm else None
+        self.proj = nn.Sequential(nn.Linear(16 if with_lstm else 8, 64), nn.ReLU(), nn.Linear(64, 32))
+
+    def forward(self, x):
+        x = self.conv(x).transpose(1, 2)
+        if self.lstm is not None:
+            x = self.lstm(x)[0]
+        return self.proj(x)
+
+
+def _model(with_lstm=False):
+    torch.manual_seed(0)
+    return _Head(with_lstm).eval()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("MINERU_QUANTIZE_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def weights(tmp_path):
+    path = tmp_path / "head.pth"
+    path.write_bytes(b"weights")
+    return str(path)
+
+
+def _relative_error(model, reference, x):
+    with torch.no_grad():
+        expected, actual = reference(x), model(x)
+    return ((actual - expected).norm() / expected.norm()).item()
+
+
+@pytest.mark.parametrize("with_lstm", [False, True])
+def test_linear_and_lstm_layers_are_quantized(with_lstm):
+    reference = _model(with_lstm)
+    model = quantize_dynamic_int8(copy.deepcopy(reference))
+    assert isinstance(model.proj[0], nnqd.Linear) and isinstance(model.proj[2], nnqd.Linear)
+    # 卷积不在动态量化范围内
+    assert type(model.conv) is nn.Conv1d
+    if with_lstm:
+        assert isinstance(model.lstm, nnqd.LSTM)
+    assert _relative_error(model, reference, torch.randn(4, 8, 20)) < 0.05
+
+
+def test_cached_weights_skip_quantization(cache_dir, weights, monkeypatch):
+    reference = _model()
+    x = torch.randn(4, 8, 20)
+    first = quantize_dynamic_int8(copy.deepcopy(reference), weights, tag="head")
+    cache_path = get_quantize_cache_path(weights, "head")
+    assert os.path.exists(cache_path)
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(".tmp")]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("quantize_dynamic should not run on a cache hit")
+
+    monkeypatch.setattr(torch.ao.quantization, "quantize_dynamic", fail)
+    second = quantize_dynamic_int8(copy.deepcopy(reference), weights, tag="head")
+    assert isinstance(second.proj[0], nnqd.Linear)
+    with torch.no_grad():
+        assert torch.equal(first(x), second(x))
+
+
+def test_cache_key_follows_the_source_weights(cache_dir, weights):
+    cache_path = get_quantize_cache_path(weights, "head")
+    assert get_quantize_cache_path(weights, "other") != cache_path
+    with open(weights, "ab") as f:
+        f.write(b"changed")
+    assert get_quantize_cache_path(weights, "head") != cache_path
+
+
+def test_mismatched_cache_falls_back_to_quantizing(cache_dir, weights):
+    cache_path = get_quantize_cache_path(weights, "head")
+    os.makedirs(cache_dir, exist_ok=True)
+    torch.save({"unrelated.weight": torch.zeros(1)}, cache_path)
+
+    reference = _model()
+    model = quantize_dynamic_int8(copy.deepcopy(reference), weights, tag="head")
+    assert isinstance(model.proj[0], nnqd.Linear)
+    assert _relative_error(model, reference, torch.randn(2, 8, 20)) < 0.05
+
+
+def test_models_with_lstm_are_not_cached(cache_dir, weights):
+    quantize_dynamic_int8(_model(with_lstm=True), weights, tag="head")
+    assert not os.path.exists(get_quantize_cache_path(weights, "head"))
+
+
+def test_no_quantized_engine(monkeypatch):
+    # 没有可用量化后端的平台上保持浮点模型
+    monkeypatch.setattr(torch.backends, "quantized", SimpleNamespace(engine="none"))
+    model = _model()
+    assert quantize_utils.quantize_dynamic_int8(model) is model
+    assert type(model.proj[0]) is nn.Linear
@@ -0,0 +1,85 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import threading
+import time
+
+from mineru.cli import coordinator
+from mineru.cli.common import do_parse, do_parse_range, merge_range_outputs
+from mineru.utils.middle_json_io import MiddleJsonReader, MIDDLE_JSON_FORMATS
+from mineru.utils.os_env_config import get_middle_json_format
+
+OUTPUT_FLAGS = dict(f_draw_layout_bbox=False, f_draw_span_bbox=False, f_dump_orig_pdf=False, f_dump_model_output=False)
+
+
+def _read_outputs(result_dir, name):
+    middle_json_path = result_dir / f"{name}_middle{MIDDLE_JSON_FORMATS[get_middle_json_format()]}"
+    with MiddleJsonReader(middle_json_path) as reader:
+        middle_json = reader.load()
+    return {
+        "md": (result_dir / f"{name}.md").read_text(encoding="utf-8"),
+        "content_list": json.loads((result_dir / f"{name}_content_list.json").read_text(encoding="utf-8")),
+        "pdf_info": middle_json["pdf_info"],
+    }
+
+
+def test_split_parse_matches_serial(tmp_path, fake_models, make_pdf):
+    pdf_bytes = make_pdf("split", pages=5)
+    do_parse(str(tmp_path / "serial"), ["doc"], [pdf_bytes], ["en"], parse_method="txt", **OUTPUT_FLAGS)
+
+    split_dir = str(tmp_path / "split")
+    page_id_offsets = []
+    for start, end in [(0, 1), (2, 2), (3, 4)]:
+        do_parse_range(
+            split_dir, "doc", pdf_bytes, p_lang="en", parse_method="txt",
+            start_page_id=start, end_page_id=end, page_id_offset=start, f_dump_model_output=False,
+        )
+        page_id_offsets.append(start)
+    merge_range_outputs(split_dir, "doc", pdf_bytes, page_id_offsets, parse_method="txt", **OUTPUT_FLAGS)
+
+    serial = _read_outputs(tmp_path / "serial" / "doc" / "txt", "doc")
+    split = _read_outputs(tmp_path / "split" / "doc" / "txt", "doc")
+    assert "split page 4 line 2" in serial["md"]
+    assert split == serial
+
+
+class _InlineCoordinator:
+    """在当前线程中依次完成任务的协调器，用于检查合并不会阻塞结果循环"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def run(self, tasks, on_task_done):
+        callback_times = []
+        for task in tasks:
+            start = time.monotonic()
+            on_task_done(task, coordinator.TaskResult(task.name, task.path, status='ok'))
+            callback_times.append(time.monotonic() - start)
+        _InlineCoordinator.callback_times = callback_times
+
+
+def test_merge_runs_outside_the_result_loop(tmp_path, monkeypatch, make_pdf):
+    merge_threads = []
+
+    def slow_merge(path, name, *args):
+        merge_threads.append(threading.current_thread())
+        time.sleep(0.5)
+
+    monkeypatch.setattr(coordinator, "ParseCoordinator", _InlineCoordinator)
+    monkeypatch.setattr(coordinator, "_merge_doc", slow_merge)
+    monkeypatch.setattr(coordinator, "_split_doc", lambda path, doc_index, name, start, end, split_pages, method, task_index: [
+        coordinator.ParseTask(task_index + i, str(path), name, 1, i, i, doc_index=doc_index, page_id_offset=i)
+        for i in range(2)
+    ])
+    paths = []
+    for name in ["first", "second"]:
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(make_pdf(name, pages=2))
+        paths.append(str(path))
+
+    results = coordinator.run_parse_tasks(paths, str(tmp_path / "out"), "en", {}, workers=2, split_pages=1)
+    assert [result.status for result in results] == ["ok", "ok"]
+    assert [result.pages for result in results] == [2, 2]
+    assert len(merge_threads) == 2
+    assert threading.current_thread() not in merge_threads
+    # 两次合并共需约1秒，结果回调本身立即返回
+    assert max(_InlineCoordinator.callback_times) < 0.25
@@ -0,0 +1,87 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pypdfium2")
+
+import pypdfium2 as pdfium
+
+from mineru.utils.pdf_classify import classify
+from mineru.utils.pdf_image_tools import PdfRegionSource, load_images_from_pdf_core
+from mineru.utils.pdf_reader import page_to_image
+from mineru.utils.pdfium_guard import close_pdf_doc, pdfium_lock
+
+# 页面图片按72dpi渲染(scale为1)，区域按200dpi重新渲染
+BBOXES = [(60, 80, 520, 150), (0, 0, 300, 300), (100, 400, 595, 842)]
+
+
+def test_render_waits_for_the_shared_pdfium_lock(make_pdf):
+    source = PdfRegionSource(make_pdf("lock", pages=1))
+    rendered = threading.Event()
+
+    def render():
+        source.render(0, BBOXES[0], 1.0, 200)
+        rendered.set()
+
+    with pdfium_lock:
+        thread = threading.Thread(target=render)
+        thread.start()
+        # 其他代码持有pdfium锁时区域渲染不能进行
+        assert not rendered.wait(0.3)
+    assert rendered.wait(10)
+    thread.join()
+    source.close()
+
+
+def test_render_after_close_does_not_reopen_the_document(make_pdf):
+    source = PdfRegionSource(make_pdf("closed", pages=2))
+    expected = source.renderer(1, 1.0).render(BBOXES[0], 200)[0]
+    source.close()
+    assert source._pdf_doc is None
+
+    # 任务被取消后仍在执行的推理还会调用渲染，结果相同且不再持有打开的文档
+    region_img, factor = source.renderer(1, 1.0).render(BBOXES[0], 200)
+    assert np.array_equal(region_img, expected)
+    assert factor == pytest.approx(200 / 72)
+    assert source._pdf_doc is None
+    assert source._pages == {}
+
+
+def test_concurrent_region_renders_match_serial(make_pdf):
+    pdf_bytes = make_pdf("regions", pages=3)
+    serial_source = PdfRegionSource(pdf_bytes)
+    expected = {
+        (page_id, bbox): serial_source.render(page_id, bbox, 1.0, 200) for page_id in range(3) for bbox in BBOXES
+    }
+    serial_source.close()
+
+    source = PdfRegionSource(pdf_bytes, cache_size=2)
+    pdf_doc = pdfium.PdfDocument(pdf_bytes)
+
+    def render_regions(page_id):
+        return {(page_id, bbox): source.render(page_id, bbox, 1.0, 200) for bbox in BBOXES for _ in range(3)}
+
+    def use_pdfium_elsewhere(index):
+        # 同时进行的整页渲染、文本提取和重新渲染页面，与区域渲染共用同一把锁
+        classify(pdf_bytes)
+        load_images_from_pdf_core(pdf_bytes, dpi=72)
+        with pdfium_lock:
+            page = pdf_doc[index % 3]
+        page_to_image(page, dpi=100)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        others = [executor.submit(use_pdfium_elsewhere, index) for index in range(6)]
+        results = {}
+        for rendered in executor.map(render_regions, [0, 1, 2, 0, 1, 2]):
+            results.update(rendered)
+        for future in others:
+            future.result()
+    source.close()
+    close_pdf_doc(pdf_doc)
+
+    assert results.keys() == expected.keys()
+    for key, region_img in results.items():
+        assert np.array_equal(region_img, expected[key]), key
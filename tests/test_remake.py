@@ -0,0 +1,71 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import os
+import shutil
+
+import pytest
+
+from mineru.backend import utils as backend_utils
+from mineru.cli import remake
+from mineru.cli.common import do_parse, do_remake
+
+OUTPUT_FLAGS = dict(f_draw_layout_bbox=False, f_draw_span_bbox=False)
+
+
+def _outputs(result_dir, name="doc"):
+    return {
+        "md": (result_dir / f"{name}.md").read_text(encoding="utf-8"),
+        "content_list": json.loads((result_dir / f"{name}_content_list.json").read_text(encoding="utf-8")),
+    }
+
+
+@pytest.fixture
+def parsed(tmp_path, fake_models, make_pdf):
+    do_parse(str(tmp_path / "parse"), ["doc"], [make_pdf("remake", pages=3)], ["en"], parse_method="txt", **OUTPUT_FLAGS)
+    return tmp_path / "parse" / "doc" / "txt"
+
+
+def test_remake_from_middle_json_matches_parse(parsed, tmp_path):
+    expected = _outputs(parsed)
+    assert "remake page 2 line 2" in expected["md"]
+
+    do_remake(parsed / "doc_middle.json", output_dir=str(tmp_path / "middle"))
+    assert _outputs(tmp_path / "middle") == expected
+
+
+def test_remake_from_model_json_matches_parse(parsed, tmp_path):
+    expected = _outputs(parsed)
+    do_remake(parsed / "doc_model.json", output_dir=str(tmp_path / "model"), parse_method="txt")
+    assert _outputs(tmp_path / "model") == expected
+
+
+def test_resplit_is_idempotent(parsed, tmp_path):
+    expected = _outputs(parsed)
+    middle_json = json.loads((parsed / "doc_middle.json").read_text(encoding="utf-8"))
+
+    # 在原目录上连续重新分段两次，每次都从上一次写出的middle json开始
+    work_dir = tmp_path / "resplit"
+    shutil.copytree(parsed, work_dir)
+    results = []
+    for _ in range(2):
+        results.append(do_remake(work_dir / "doc_middle.json", resplit=True, f_dump_middle_json=True))
+        assert _outputs(work_dir) == expected
+    assert results[0]["pdf_info"] == results[1]["pdf_info"] == middle_json["pdf_info"]
+
+
+def test_table_merge_option_does_not_touch_the_environment(parsed, monkeypatch):
+    from click.testing import CliRunner
+
+    merge_calls = []
+    monkeypatch.setattr(backend_utils, "merge_table", lambda pdf_info: merge_calls.append(len(pdf_info)))
+    monkeypatch.setenv("MINERU_TABLE_MERGE_ENABLE", "true")
+
+    result = CliRunner().invoke(remake.main, ["-p", str(parsed / "doc_middle.json"), "--resplit", "--table-merge", "false"])
+    assert result.exit_code == 0, result.output
+    assert merge_calls == []
+    assert os.environ["MINERU_TABLE_MERGE_ENABLE"] == "true"
+
+    # 不传--table-merge时仍按环境变量执行
+    result = CliRunner().invoke(remake.main, ["-p", str(parsed / "doc_middle.json"), "--resplit"])
+    assert result.exit_code == 0, result.output
+    assert merge_calls == [3]
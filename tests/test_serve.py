@@ -0,0 +1,183 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+from mineru.cli import serve
+from mineru.cli.serve import ParseService, RequestError, create_server, sanitize_name
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    """在本机随机端口启动服务，返回 request(method, path, body, headers) -> (status, json)"""
+    servers = []
+
+    def start(local_path_root=None, allowed_hosts=None, **service_kwargs):
+        work_dir = tmp_path / f"work{len(servers)}"
+        work_dir.mkdir()
+        service = ParseService(str(work_dir), **service_kwargs)
+        server = create_server("127.0.0.1", 0, service, 0, local_path_root, allowed_hosts)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+        def request(method, path, body=None, headers=None):
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=60)
+            headers = dict(headers or {})
+            if isinstance(body, dict):
+                body = json.dumps(body).encode("utf-8")
+                headers.setdefault("Content-Type", "application/json")
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = json.loads(response.read() or b"{}")
+            connection.close()
+            return response.status, data
+
+        request.service = service
+        return request
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def blocking_parse(monkeypatch):
+    """替换do_parse：写出固定的markdown，release被set之前一直阻塞"""
+    release = threading.Event()
+    started = []
+
+    def fake_do_parse(output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method="auto", **kwargs):
+        started.append(pdf_file_names[0])
+        release.wait(30)
+        result_dir = os.path.join(output_dir, pdf_file_names[0], parse_method)
+        os.makedirs(result_dir, exist_ok=True)
+        with open(os.path.join(result_dir, f"{pdf_file_names[0]}.md"), "w", encoding="utf-8") as f:
+            f.write("# parsed")
+
+    monkeypatch.setattr(serve, "do_parse", fake_do_parse)
+    release.started = started
+    return release
+
+
+def _upload_path(**params):
+    return "/parse?" + urlencode({"return": "md", **params})
+
+
+def _wait_started(blocking_parse, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while len(blocking_parse.started) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return len(blocking_parse.started) >= count
+
+
+def test_parse_upload_end_to_end(start_server, fake_models, make_pdf):
+    request = start_server()
+    status, data = request("POST", _upload_path(name="report.pdf"), make_pdf("served", pages=2))
+    assert status == 200, data
+    assert data["status"] == "done"
+    assert data["name"] == "report"
+    assert "served page 1 line 2" in data["md"]
+
+    status, data = request("GET", f"/jobs/{data['job_id']}")
+    assert status == 200 and data["status"] == "done"
+    status, data = request("GET", "/health")
+    assert status == 200 and data["queued"] == 0 and data["running"] == 0
+
+
+@pytest.mark.parametrize("name", ["..", ".", "...pdf", "a/..", "dir\\..", "bad\x01name"])
+def test_names_that_escape_the_job_dir_are_rejected(name):
+    with pytest.raises(RequestError):
+        sanitize_name(name)
+
+
+def test_names_are_reduced_to_a_file_stem():
+    assert sanitize_name("../../etc/passwd.pdf") == "passwd"
+    assert sanitize_name("C:\\docs\\report.v2.pdf") == "report.v2"
+
+
+def test_bad_request_parameters_return_400(start_server, blocking_parse):
+    request = start_server()
+    status, data = request("POST", _upload_path(name="..", timeout=5), b"%PDF-1.4")
+    assert status == 400, data
+    status, data = request("POST", _upload_path(name="doc.pdf", timeout="soon"), b"%PDF-1.4")
+    assert status == 400
+    assert "timeout" in data["error"]
+    assert blocking_parse.started == []
+
+
+def test_local_paths_are_opt_in_and_confined(start_server, blocking_parse, tmp_path, make_pdf):
+    root = tmp_path / "shared"
+    root.mkdir()
+    (root / "inside.pdf").write_bytes(make_pdf("inside", pages=1))
+    (tmp_path / "outside.pdf").write_bytes(make_pdf("outside", pages=1))
+    blocking_parse.set()
+
+    request = start_server()
+    status, _ = request("POST", "/parse", {"path": str(root / "inside.pdf")})
+    assert status == 403
+
+    request = start_server(local_path_root=str(root))
+    status, data = request("POST", "/parse", {"path": "inside.pdf", "return": ["md"]})
+    assert status == 200, data
+    assert data["md"] == "# parsed"
+    status, data = request("POST", "/parse", {"path": str(root / "inside.pdf"), "return": ["md"]})
+    assert status == 200, data
+    for path in ["../outside.pdf", str(tmp_path / "outside.pdf")]:
+        status, _ = request("POST", "/parse", {"path": path})
+        assert status == 403
+    os.symlink(tmp_path / "outside.pdf", root / "link.pdf")
+    status, _ = request("POST", "/parse", {"path": "link.pdf"})
+    assert status == 403
+
+
+def test_host_header_is_validated_on_loopback(start_server, blocking_parse):
+    request = start_server()
+    status, _ = request("GET", "/health", headers={"Host": "attacker.example:8000"})
+    assert status == 403
+    for host in ["localhost:8000", "127.0.0.1", "[::1]:8000"]:
+        status, _ = request("GET", "/health", headers={"Host": host})
+        assert status == 200, host
+
+    request = start_server(allowed_hosts=["mineru.internal"])
+    assert request("GET", "/health", headers={"Host": "mineru.internal:8000"})[0] == 200
+    assert request("GET", "/health", headers={"Host": "localhost"})[0] == 403
+
+
+def test_cancelled_and_expired_jobs_release_queue_slots(start_server, blocking_parse):
+    request = start_server(workers=1, queue_size=1)
+    pdf = b"%PDF-1.4"
+    status, running = request("POST", _upload_path(name="running.pdf", **{"async": "true"}), pdf)
+    assert status == 202
+    assert _wait_started(blocking_parse, 1)
+
+    status, queued = request("POST", _upload_path(name="queued.pdf", **{"async": "true"}), pdf)
+    assert status == 202
+    assert request("POST", _upload_path(name="full.pdf", **{"async": "true"}), pdf)[0] == 429
+
+    # 取消排队中的任务后名额立即释放
+    status, data = request("DELETE", f"/jobs/{queued['job_id']}")
+    assert status == 200 and data["status"] == "cancelled"
+    status, short = request("POST", _upload_path(name="short.pdf", timeout=0.2, **{"async": "true"}), pdf)
+    assert status == 202
+
+    # 排队超时的任务同样不再占用名额
+    time.sleep(0.3)
+    status, data = request("GET", f"/jobs/{short['job_id']}")
+    assert data["status"] == "expired"
+    status, last = request("POST", _upload_path(name="last.pdf", **{"async": "true"}), pdf)
+    assert status == 202
+    assert request("GET", "/health")[1]["queued"] == 1
+
+    blocking_parse.set()
+    for job in [running, last]:
+        deadline = time.monotonic() + 10
+        while request("GET", f"/jobs/{job['job_id']}")[1]["status"] != "done" and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert request("GET", f"/jobs/{job['job_id']}")[1]["md"] == "# parsed"
+    assert blocking_parse.started == ["running", "last"]
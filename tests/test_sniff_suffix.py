@@ -0,0 +1,119 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image, PngImagePlugin, features
+
+from mineru.utils import guess_suffix_or_lang
+from mineru.utils.guess_suffix_or_lang import MAGIKA_PREFIX_SIZE, guess_suffix_by_bytes, guess_suffix_by_path, sniff_suffix
+from mineru.utils.pdf_image_tools import is_pdf_bytes
+
+MINIMAL_PDF = b"%PDF-1.7\n1 0 obj\n<< /Type /Catalog >>\nendobj\ntrailer\n<< /Root 1 0 R >>\n%%EOF\n"
+
+
+def _image_bytes(image_format, **save_kwargs):
+    buffer = BytesIO()
+    Image.new("RGB", (32, 32), (10, 120, 200)).save(buffer, format=image_format, **save_kwargs)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def no_magika(monkeypatch):
+    """签名能够判断的输入不应调用magika"""
+    def fail():
+        raise AssertionError("magika should not be used")
+    monkeypatch.setattr(guess_suffix_or_lang, "get_magika", fail)
+
+
+@pytest.mark.parametrize("image_format, suffix", [
+    ("PNG", "png"), ("JPEG", "jpeg"), ("TIFF", "tiff"), ("GIF", "gif"), ("BMP", "bmp"),
+    ("WEBP", "webp"), ("JPEG2000", "jp2"),
+])
+def test_image_signatures(image_format, suffix, no_magika):
+    if image_format == "WEBP" and not features.check("webp"):
+        pytest.skip("pillow without webp")
+    if image_format == "JPEG2000" and not features.check("jpg_2000"):
+        pytest.skip("pillow without openjpeg")
+    image_bytes = _image_bytes(image_format)
+    assert sniff_suffix(image_bytes) == suffix
+    assert guess_suffix_by_bytes(image_bytes) == suffix
+    assert not is_pdf_bytes(image_bytes)
+
+
+def test_pdf_marker_in_exif_is_still_jpeg(no_magika):
+    exif = Image.Exif()
+    exif[0x010E] = "%PDF-1.7 scanned with an office printer"
+    image_bytes = _image_bytes("JPEG", exif=exif.tobytes())
+    assert b"%PDF-1" in image_bytes[:1024]
+    assert guess_suffix_by_bytes(image_bytes) == "jpeg"
+    assert not is_pdf_bytes(image_bytes)
+
+
+def test_pdf_marker_in_png_text_chunk_is_still_png(no_magika):
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "%PDF-1.4")
+    image_bytes = _image_bytes("PNG", pnginfo=info)
+    assert b"%PDF-1.4" in image_bytes[:1024]
+    assert sniff_suffix(image_bytes) == "png"
+
+
+def test_pdf_with_leading_garbage(no_magika):
+    # 规范允许%PDF-出现在前1024字节内，例如带MacBinary头或邮件封装残留的文件
+    assert sniff_suffix(b"\x00" * 128 + MINIMAL_PDF) == "pdf"
+    assert sniff_suffix(b"x" * 1000 + MINIMAL_PDF) == "pdf"
+    assert is_pdf_bytes(b"junk\r\n" + MINIMAL_PDF)
+
+
+def test_pdf_marker_too_late_or_malformed():
+    assert sniff_suffix(b"x" * 1100 + MINIMAL_PDF) is None
+    assert sniff_suffix(b"%PDF-x.y\n") is None
+    # %PDF-后必须紧跟版本号数字
+    assert sniff_suffix(b"<html>%PDF-</html>") is None
+
+
+@pytest.mark.parametrize("header", [
+    b"", b"\x89PN", b"\xff\xd8", b"II*", b"GIF8", b"RIFF\x00\x00\x00\x00WEB", b"BM", b"BM\x00\x00", b"%PDF-",
+])
+def test_truncated_headers_are_unknown(header):
+    assert sniff_suffix(header) is None
+
+
+def test_truncated_files_keep_their_type(tmp_path, no_magika):
+    for image_format, suffix in [("PNG", "png"), ("JPEG", "jpeg"), ("TIFF", "tiff")]:
+        truncated = _image_bytes(image_format)[:24]
+        assert guess_suffix_by_bytes(truncated) == suffix
+        path = tmp_path / f"truncated.{suffix}"
+        path.write_bytes(truncated)
+        assert guess_suffix_by_path(path) == suffix
+    path = tmp_path / "short.pdf"
+    path.write_bytes(MINIMAL_PDF[:12])
+    assert guess_suffix_by_path(path) == "pdf"
+
+
+def test_bmp_signature_requires_a_dib_header():
+    assert sniff_suffix(b"BM" + b"\x00" * 12 + (40).to_bytes(4, "little")) == "bmp"
+    # 以BM开头的文本文件
+    assert sniff_suffix(b"BMW owners manual, chapter 1") is None
+
+
+def test_large_inputs_only_read_a_prefix(monkeypatch):
+    large_pdf = MINIMAL_PDF + b"\x00" * (64 * 1024 * 1024)
+    start = time.perf_counter()
+    for _ in range(100):
+        assert guess_suffix_by_bytes(large_pdf) == "pdf"
+        assert is_pdf_bytes(large_pdf)
+    # 只检查文件头，耗时与文件大小无关
+    assert time.perf_counter() - start < 0.5
+
+    seen_sizes = []
+
+    class FakeMagika:
+        def identify_bytes(self, data):
+            seen_sizes.append(len(data))
+            prediction = type("Prediction", (), {"output": type("Output", (), {"label": "txt"})()})()
+            return type("Result", (), {"prediction": prediction})()
+
+    monkeypatch.setattr(guess_suffix_or_lang, "get_magika", lambda: FakeMagika())
+    assert guess_suffix_by_bytes(b"plain text " * (8 * 1024 * 1024)) == "txt"
+    assert seen_sizes == [MAGIKA_PREFIX_SIZE]
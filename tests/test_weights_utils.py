@@ -0,0 +1,114 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+
+from mineru.utils.weights_utils import convert_to_safetensors, load_state_dict_shared, load_weights
+
+
+class TiedNet(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(16, 8)
+        self.head = torch.nn.Linear(8, 16, bias=False)
+        self.head.weight = self.embed.weight
+        self.norm = torch.nn.BatchNorm1d(8)
+
+
+def _save_checkpoint(tmp_path, module, dtype=None):
+    state_dict = module.state_dict()
+    if dtype is not None:
+        converted = {}
+        for key, value in state_dict.items():
+            if value.is_floating_point():
+                # 共享权重只转换一次，保持别名关系
+                value = converted.setdefault(value.data_ptr(), value.to(dtype))
+            state_dict[key] = value
+    weights_path = tmp_path / "model.pth"
+    torch.save(state_dict, weights_path)
+    return str(weights_path)
+
+
+def test_conversion_preserves_tied_weights(tmp_path):
+    source = TiedNet()
+    weights_path = _save_checkpoint(tmp_path, source)
+    assert convert_to_safetensors(weights_path) is not None
+
+    weights = load_weights(weights_path)
+    assert list(weights.keys()) == list(source.state_dict().keys())
+    assert weights["embed.weight"] is weights["head.weight"]
+
+    target = TiedNet()
+    load_state_dict_shared(target, weights)
+    assert target.embed.weight.data_ptr() == target.head.weight.data_ptr()
+    for key, value in source.state_dict().items():
+        assert torch.equal(target.state_dict()[key], value)
+
+
+def test_loaded_parameters_keep_model_dtype(tmp_path):
+    source = TiedNet()
+    weights = load_weights(_save_checkpoint(tmp_path, source, dtype=torch.float16))
+    assert weights["embed.weight"].dtype == torch.float16
+
+    target = TiedNet()
+    load_state_dict_shared(target, weights)
+    # 权重文件是fp16时模型参数仍然是fp32，不会被悄悄改变精度
+    assert target.embed.weight.dtype == torch.float32
+    assert target.norm.num_batches_tracked.dtype == torch.int64
+    assert target.embed.weight.data_ptr() == target.head.weight.data_ptr()
+    assert torch.equal(target.embed.weight, source.embed.weight.half().float())
+
+
+def test_matching_weights_are_used_without_copy(tmp_path):
+    weights_path = _save_checkpoint(tmp_path, TiedNet())
+    convert_to_safetensors(weights_path)
+    weights = load_weights(weights_path)
+    target = TiedNet()
+    load_state_dict_shared(target, weights)
+    assert target.norm.weight.data_ptr() == weights["norm.weight"].data_ptr()
+
+
+_MEMORY_SCRIPT = textwrap.dedent("""
+    import json, sys
+    import torch
+    from mineru.utils.weights_utils import load_state_dict_shared, load_weights
+
+    def anonymous_kb():
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Anonymous:'):
+                    return int(line.split()[1])
+
+    net = torch.nn.Sequential(*[torch.nn.Linear(1024, 1024, bias=False) for _ in range(16)])
+    before = anonymous_kb()
+    load_state_dict_shared(net, load_weights(sys.argv[1]))
+    # 读取全部参数，确保页面已经映射进来
+    total = sum(float(p.sum()) for p in net.parameters())
+    print(json.dumps({'anonymous_kb': anonymous_kb() - before}))
+""")
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs /proc/self/smaps_rollup")
+def test_workers_share_weight_pages(tmp_path):
+    """模拟多个worker进程载入同一份64MB权重，参数应当是文件映射页(可在进程间共享)而不是各自的匿名内存"""
+    net = torch.nn.Sequential(*[torch.nn.Linear(1024, 1024, bias=False) for _ in range(16)])
+    weights_path = _save_checkpoint(tmp_path, net)
+    convert_to_safetensors(weights_path)
+    weights_mb = 16 * 1024 * 1024 * 4 / 1024 / 1024
+
+    workers = [
+        subprocess.Popen([sys.executable, "-c", _MEMORY_SCRIPT, weights_path], stdout=subprocess.PIPE, text=True)
+        for _ in range(2)
+    ]
+    for worker in workers:
+        output, _ = worker.communicate(timeout=120)
+        assert worker.returncode == 0
+        anonymous_mb = json.loads(output.strip().splitlines()[-1])["anonymous_kb"] / 1024
+        # 每个worker新增的私有内存远小于权重本身的大小
+        assert anonymous_mb < weights_mb / 4, anonymous_mb
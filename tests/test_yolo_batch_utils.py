@@ -0,0 +1,137 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import numpy as np
+import pytest
+from PIL import Image
+
+from mineru.utils.yolo_batch_utils import (
+    bucketed_predict, get_image_shape, get_letterbox_shape, letterbox, plan_batches, restore_boxes,
+)
+
+IMGSZ = 1280
+# (height, width)：A4、少一列像素的A4、Letter、横向A4、小图、单通道A4
+PAGE_SHAPES = [(2339, 1654), (2339, 1653), (2200, 1700), (1654, 2339), (600, 800), (2339, 1654)]
+# 每页一个深色矩形(x0, y0, x1, y1)，用于检查坐标还原
+RECTS = [(100, 200, 700, 500), (300, 1500, 1200, 1900), (50, 50, 1600, 400), (1000, 300, 2200, 1200),
+         (10, 20, 300, 150), (400, 900, 1300, 1000)]
+
+
+def _pages():
+    pages = []
+    for index, ((height, width), (x0, y0, x1, y1)) in enumerate(zip(PAGE_SHAPES, RECTS)):
+        page = np.full((height, width, 3), 255, dtype=np.uint8)
+        page[y0:y1, x0:x1] = 0
+        if index == 5:
+            pages.append(page[:, :, 0].copy())
+        elif index == 1:
+            pages.append(Image.fromarray(page))
+        else:
+            pages.append(page)
+    return pages
+
+
+def test_letterbox_shape():
+    for height, width in PAGE_SHAPES:
+        shape = get_letterbox_shape(height, width, IMGSZ)
+        assert shape[0] % 32 == 0 and shape[1] % 32 == 0
+        assert max(shape) == IMGSZ
+    # 原图尺寸略有差别的页面letterbox尺寸相同，可以放在同一个batch
+    assert get_letterbox_shape(2339, 1654, IMGSZ) == get_letterbox_shape(2339, 1653, IMGSZ) == (1280, 928)
+    assert get_letterbox_shape(1654, 2339, IMGSZ) == (928, 1280)
+
+
+@pytest.mark.parametrize("max_batch_size, max_batch_pixels", [(1, None), (2, None), (8, None), (8, 1280 * 928 * 2)])
+def test_plan_batches(max_batch_size, max_batch_pixels):
+    pages = _pages()
+    batches = plan_batches(pages, IMGSZ, max_batch_size, max_batch_pixels)
+    planned = sorted(index for indices, _ in batches for index in indices)
+    assert planned == list(range(len(pages)))
+    for indices, letterbox_shape in batches:
+        assert 1 <= len(indices) <= max_batch_size
+        assert all(get_letterbox_shape(*get_image_shape(pages[index]), IMGSZ) == letterbox_shape for index in indices)
+        if max_batch_pixels:
+            assert len(indices) * letterbox_shape[0] * letterbox_shape[1] <= max_batch_pixels
+    if max_batch_size == 8 and max_batch_pixels is None:
+        # 三张A4(其中一张少一列像素)同一个batch，Letter、横向A4和小图各自一个batch
+        assert sorted(sorted(indices) for indices, _ in batches) == [[0, 1, 5], [2], [3], [4]]
+
+
+def test_plan_batches_budget_smaller_than_one_page():
+    batches = plan_batches(_pages(), IMGSZ, 8, max_batch_pixels=1)
+    assert all(len(indices) == 1 for indices, _ in batches)
+
+
+def test_letterbox_matches_ultralytics():
+    augment = pytest.importorskip("ultralytics.data.augment")
+    page = _pages()[0]
+    shape = get_letterbox_shape(*page.shape[:2], IMGSZ)
+    expected = augment.LetterBox((IMGSZ, IMGSZ), auto=True, stride=32)(image=page)
+    actual, _ = letterbox(page, shape, IMGSZ)
+    assert actual.shape[:2] == shape
+    assert np.array_equal(actual, expected)
+
+
+class _Boxes:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Prediction:
+    """只包含restore_boxes用到的字段的检测结果"""
+
+    def __init__(self, data, orig_shape):
+        self.boxes = _Boxes(data)
+        self.orig_shape = orig_shape
+
+    def update(self, boxes):
+        self.boxes = _Boxes(boxes)
+
+
+def _detect_dark_rect(image):
+    """假的检测模型：返回图片中深色区域的外接框"""
+    torch = pytest.importorskip("torch")
+    gray = image if image.ndim == 2 else image.mean(axis=2)
+    ys, xs = np.nonzero(gray < 60)
+    data = torch.tensor([[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1, 0.9, 0]], dtype=torch.float32)
+    return _Prediction(data, image.shape[:2])
+
+
+def test_restore_boxes_round_trip():
+    torch = pytest.importorskip("torch")
+    for (height, width), (x0, y0, x1, y1) in zip(PAGE_SHAPES, RECTS):
+        shape = get_letterbox_shape(height, width, IMGSZ)
+        _, transform = letterbox(np.zeros((height, width, 3), dtype=np.uint8), shape, IMGSZ)
+        left, top, x_scale, y_scale = transform
+        boxed = torch.tensor([[x0 / x_scale + left, y0 / y_scale + top, x1 / x_scale + left, y1 / y_scale + top, 0.9, 1]])
+        prediction = restore_boxes(_Prediction(boxed, shape), transform, (height, width))
+        assert prediction.orig_shape == (height, width)
+        assert torch.allclose(prediction.boxes.data[0, :4], torch.tensor([x0, y0, x1, y1], dtype=torch.float32), atol=1e-3)
+        # 置信度和类别不变
+        assert prediction.boxes.data[0, 4:].tolist() == pytest.approx([0.9, 1])
+
+
+@pytest.mark.parametrize("max_batch_size", [1, 8])
+def test_bucketed_predict_restores_boxes_across_page_sizes(max_batch_size):
+    pytest.importorskip("torch")
+    pages = _pages()
+    batch_shapes = []
+
+    def predict_fn(batch):
+        shapes = {get_image_shape(image) for image in batch}
+        batch_shapes.append(shapes)
+        predictions = []
+        for image in batch:
+            if isinstance(image, Image.Image):
+                image = np.asarray(image)
+            assert image.ndim == 3
+            predictions.append(_detect_dark_rect(image))
+        return predictions
+
+    results = bucketed_predict(pages, predict_fn, IMGSZ, max_batch_size)
+    # 每个batch传给模型的图片尺寸一致
+    assert all(len(shapes) == 1 for shapes in batch_shapes)
+    # 原图尺寸一致的batch直接在原图上检测；不一致时在letterbox后的图上检测，再还原到原图坐标，误差在缩放的一两个像素内
+    for index, (result, rect) in enumerate(zip(results, RECTS)):
+        assert result.orig_shape == PAGE_SHAPES[index]
+        height, width = PAGE_SHAPES[index]
+        tolerance = max(height, width) / IMGSZ * 2
+        assert np.allclose(result.boxes.data[0, :4].numpy(), rect, atol=tolerance), index